@@ -54,7 +54,14 @@ do_backup() {
 
   log "pg_dump (custom format)…"
   # PGHOST/PGUSER/PGDATABASE/PGPASSWORD берутся из окружения (libpq).
-  pg_dump -Fc -f "${TMP_DIR}/db.dump"
+  # Схема archive — отцепленные секции журналов аудита (AUDIT_PARTITION_DETACH):
+  # они не меняются, их выгружают один раз вручную. BACKUP_INCLUDE_ARCHIVE=1 —
+  # дампить и их.
+  local dump_opts=()
+  if [ "${BACKUP_INCLUDE_ARCHIVE:-0}" != "1" ]; then
+    dump_opts+=(--exclude-schema=archive)
+  fi
+  pg_dump -Fc ${dump_opts[@]+"${dump_opts[@]}"} -f "${TMP_DIR}/db.dump"
 
   log "архив загрузок…"
   if [ -d "${UPLOADS_DIR}" ]; then
@@ -99,6 +99,12 @@ export default function ChatScreen({ route, navigation }: Props) {
                   : m,
               ),
             );
+          } else if (payload.type === "message_attachments_updated") {
+            setMessages((prev) =>
+              prev.map((m) =>
+                m.id === payload.message_id ? { ...m, attachments: payload.attachments } : m,
+              ),
+            );
           }
         } catch {}
       };
@@ -0,0 +1,71 @@
+"""Леджер балансов участников (member_balances) + заполнение из истории.
+
+Бэкфилл считает суммы теми же правилами, что и прежний пересчёт в роутерах:
+бюджет — только транзакции со splits и известным плательщиком; расходы — все.
+"""
+
+import sqlalchemy as sa
+from alembic import op
+from sqlalchemy.dialects import postgresql
+
+
+revision = "039_member_balances"
+down_revision = "038_e2ee_signal"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "member_balances",
+        sa.Column(
+            "family_id",
+            postgresql.UUID(as_uuid=True),
+            sa.ForeignKey("families.id", ondelete="CASCADE"),
+            primary_key=True,
+        ),
+        sa.Column(
+            "user_id",
+            postgresql.UUID(as_uuid=True),
+            sa.ForeignKey("users.id", ondelete="CASCADE"),
+            primary_key=True,
+        ),
+        sa.Column("budget_balance", sa.Numeric(14, 2), nullable=False, server_default="0"),
+        sa.Column("expense_balance", sa.Numeric(14, 2), nullable=False, server_default="0"),
+        sa.Column(
+            "updated_at",
+            sa.DateTime(timezone=True),
+            server_default=sa.text("now()"),
+            nullable=False,
+        ),
+    )
+
+    op.execute(
+        """
+        INSERT INTO member_balances (family_id, user_id, budget_balance, expense_balance)
+        SELECT family_id, user_id, SUM(budget), SUM(expense)
+        FROM (
+            SELECT t.family_id, t.paid_by AS user_id, t.amount AS budget, 0 AS expense
+            FROM budget_transactions t
+            WHERE t.paid_by IS NOT NULL
+              AND EXISTS (SELECT 1 FROM budget_transaction_splits s WHERE s.transaction_id = t.id)
+            UNION ALL
+            SELECT t.family_id, s.user_id, -s.share, 0
+            FROM budget_transaction_splits s
+            JOIN budget_transactions t ON t.id = s.transaction_id
+            WHERE t.paid_by IS NOT NULL
+            UNION ALL
+            SELECT e.family_id, e.paid_by, 0, e.amount
+            FROM expenses e
+            UNION ALL
+            SELECT e.family_id, s.user_id, 0, -s.share
+            FROM expense_splits s
+            JOIN expenses e ON e.id = s.expense_id
+        ) AS parts
+        GROUP BY family_id, user_id
+        """
+    )
+
+
+def downgrade() -> None:
+    op.drop_table("member_balances")
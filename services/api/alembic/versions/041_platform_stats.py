@@ -0,0 +1,49 @@
+"""Снимки статистики платформы и учёт объёма хранилища (storage_usage).
+
+storage_usage стартует с нуля: существующие файлы учитываются фоновой
+пересчётной задачей (POST /admin/maintenance/storage/recount).
+"""
+
+import sqlalchemy as sa
+from alembic import op
+from sqlalchemy.dialects import postgresql
+
+
+revision = "041_platform_stats"
+down_revision = "040_background_jobs"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "platform_stats_snapshots",
+        sa.Column("id", postgresql.UUID(as_uuid=True), primary_key=True),
+        sa.Column(
+            "taken_at", sa.DateTime(timezone=True), nullable=False, server_default=sa.func.now()
+        ),
+        sa.Column("users", sa.BigInteger(), nullable=False),
+        sa.Column("families", sa.BigInteger(), nullable=False),
+        sa.Column("messages", sa.BigInteger(), nullable=False),
+        sa.Column("banned_users", sa.BigInteger(), nullable=False),
+        sa.Column("uploads_bytes", sa.BigInteger(), nullable=False),
+        sa.Column("uploads_objects", sa.BigInteger(), nullable=False),
+    )
+    op.create_index(
+        "ix_platform_stats_snapshots_taken_at", "platform_stats_snapshots", ["taken_at"]
+    )
+    op.create_table(
+        "storage_usage",
+        sa.Column("area", sa.String(length=32), primary_key=True),
+        sa.Column("bytes", sa.BigInteger(), nullable=False, server_default="0"),
+        sa.Column("objects", sa.BigInteger(), nullable=False, server_default="0"),
+        sa.Column(
+            "updated_at", sa.DateTime(timezone=True), nullable=False, server_default=sa.func.now()
+        ),
+    )
+
+
+def downgrade() -> None:
+    op.drop_table("storage_usage")
+    op.drop_index("ix_platform_stats_snapshots_taken_at", table_name="platform_stats_snapshots")
+    op.drop_table("platform_stats_snapshots")
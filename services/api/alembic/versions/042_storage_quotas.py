@@ -0,0 +1,106 @@
+"""Учёт хранилища по семьям и пользователям: реестр storage_objects и
+счётчики storage_owner_usage для квот.
+
+Реестр заполняется из уже известных размеров: gallery_items.file_size и
+``file_size`` во вложениях сообщений и записей капсул. Аватары размера в БД
+не хранят — они учитываются со следующей загрузки.
+"""
+
+import sqlalchemy as sa
+from alembic import op
+from sqlalchemy.dialects import postgresql
+
+
+revision = "042_storage_quotas"
+down_revision = "041_platform_stats"
+branch_labels = None
+depends_on = None
+
+_PREFIX = "/static/uploads/"
+
+
+def upgrade() -> None:
+    op.create_table(
+        "storage_objects",
+        sa.Column("key", sa.String(length=1024), primary_key=True),
+        sa.Column(
+            "family_id",
+            postgresql.UUID(as_uuid=True),
+            sa.ForeignKey("families.id", ondelete="CASCADE"),
+            nullable=True,
+        ),
+        sa.Column(
+            "user_id",
+            postgresql.UUID(as_uuid=True),
+            sa.ForeignKey("users.id", ondelete="SET NULL"),
+            nullable=True,
+        ),
+        sa.Column("size", sa.BigInteger(), nullable=False),
+        sa.Column(
+            "created_at", sa.DateTime(timezone=True), nullable=False, server_default=sa.func.now()
+        ),
+    )
+    op.create_index("ix_storage_objects_family_id", "storage_objects", ["family_id"])
+    op.create_index("ix_storage_objects_user_id", "storage_objects", ["user_id"])
+    op.create_table(
+        "storage_owner_usage",
+        sa.Column("owner_type", sa.String(length=8), primary_key=True),
+        sa.Column("owner_id", postgresql.UUID(as_uuid=True), primary_key=True),
+        sa.Column("bytes", sa.BigInteger(), nullable=False, server_default="0"),
+        sa.Column("objects", sa.BigInteger(), nullable=False, server_default="0"),
+        sa.Column(
+            "updated_at", sa.DateTime(timezone=True), nullable=False, server_default=sa.func.now()
+        ),
+    )
+
+    n = len(_PREFIX)
+    op.execute(
+        f"""
+        INSERT INTO storage_objects (key, family_id, user_id, size)
+        SELECT substr(url, {n + 1}), family_id, uploaded_by, file_size
+        FROM gallery_items
+        WHERE url LIKE '{_PREFIX}%' AND file_size IS NOT NULL
+        ON CONFLICT (key) DO NOTHING
+        """
+    )
+    op.execute(
+        f"""
+        INSERT INTO storage_objects (key, family_id, user_id, size)
+        SELECT substr(a->>'url', {n + 1}), c.family_id, m.author_id, (a->>'file_size')::bigint
+        FROM messages m
+        JOIN chats c ON c.id = m.chat_id
+        CROSS JOIN LATERAL jsonb_array_elements(m.attachments) a
+        WHERE jsonb_typeof(m.attachments) = 'array'
+          AND a->>'url' LIKE '{_PREFIX}%' AND a->>'file_size' ~ '^[0-9]+$'
+        ON CONFLICT (key) DO NOTHING
+        """
+    )
+    op.execute(
+        f"""
+        INSERT INTO storage_objects (key, family_id, user_id, size)
+        SELECT substr(a->>'url', {n + 1}), t.family_id, e.author_id, (a->>'file_size')::bigint
+        FROM time_capsule_entries e
+        JOIN time_capsules t ON t.id = e.capsule_id
+        CROSS JOIN LATERAL jsonb_array_elements(e.attachments) a
+        WHERE jsonb_typeof(e.attachments) = 'array'
+          AND a->>'url' LIKE '{_PREFIX}%' AND a->>'file_size' ~ '^[0-9]+$'
+        ON CONFLICT (key) DO NOTHING
+        """
+    )
+    op.execute(
+        """
+        INSERT INTO storage_owner_usage (owner_type, owner_id, bytes, objects)
+        SELECT 'family', family_id, sum(size), count(*)
+        FROM storage_objects WHERE family_id IS NOT NULL GROUP BY family_id
+        UNION ALL
+        SELECT 'user', user_id, sum(size), count(*)
+        FROM storage_objects WHERE user_id IS NOT NULL GROUP BY user_id
+        """
+    )
+
+
+def downgrade() -> None:
+    op.drop_table("storage_owner_usage")
+    op.drop_index("ix_storage_objects_user_id", table_name="storage_objects")
+    op.drop_index("ix_storage_objects_family_id", table_name="storage_objects")
+    op.drop_table("storage_objects")
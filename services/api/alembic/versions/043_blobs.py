@@ -0,0 +1,48 @@
+"""Контентно-адресуемые тела загрузок (blobs) и ссылка на них из storage_objects.
+
+Существующие файлы остаются по своим ключам (blob_hash = NULL).
+"""
+
+import sqlalchemy as sa
+from alembic import op
+
+
+revision = "043_blobs"
+down_revision = "042_storage_quotas"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "blobs",
+        sa.Column("hash", sa.String(length=64), primary_key=True),
+        sa.Column("size", sa.BigInteger(), nullable=False),
+        sa.Column("refcount", sa.Integer(), nullable=False, server_default="0"),
+        sa.Column(
+            "created_at", sa.DateTime(timezone=True), nullable=False, server_default=sa.func.now()
+        ),
+    )
+    op.create_index(
+        "ix_blobs_unreferenced",
+        "blobs",
+        ["hash"],
+        postgresql_where=sa.text("refcount <= 0"),
+    )
+    op.add_column(
+        "storage_objects",
+        sa.Column(
+            "blob_hash",
+            sa.String(length=64),
+            sa.ForeignKey("blobs.hash", name="fk_storage_objects_blob_hash"),
+            nullable=True,
+        ),
+    )
+    op.create_index("ix_storage_objects_blob_hash", "storage_objects", ["blob_hash"])
+
+
+def downgrade() -> None:
+    op.drop_index("ix_storage_objects_blob_hash", table_name="storage_objects")
+    op.drop_column("storage_objects", "blob_hash")
+    op.drop_index("ix_blobs_unreferenced", table_name="blobs")
+    op.drop_table("blobs")
@@ -0,0 +1,26 @@
+"""Превью картинок галереи (gallery_items.preview).
+
+Для уже загруженных картинок превью не строятся — клиент падает обратно на
+оригинал, пока ``preview`` = NULL.
+"""
+
+import sqlalchemy as sa
+from alembic import op
+from sqlalchemy.dialects import postgresql
+
+
+revision = "044_gallery_previews"
+down_revision = "043_blobs"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column(
+        "gallery_items",
+        sa.Column("preview", postgresql.JSONB(astext_type=sa.Text()), nullable=True),
+    )
+
+
+def downgrade() -> None:
+    op.drop_column("gallery_items", "preview")
@@ -0,0 +1,31 @@
+"""Индексы для keyset-пагинации и таймлайна галереи.
+
+(family_id, created_at, id) заменяет ix_gallery_family_id: лента и подсчёт
+по месяцам читают только нужный диапазон семьи, без сортировки.
+"""
+
+from alembic import op
+
+
+revision = "045_gallery_keyset"
+down_revision = "044_gallery_previews"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_index(
+        "ix_gallery_family_created", "gallery_items", ["family_id", "created_at", "id"]
+    )
+    op.create_index(
+        "ix_gallery_family_type_created",
+        "gallery_items",
+        ["family_id", "media_type", "created_at", "id"],
+    )
+    op.drop_index("ix_gallery_family_id", table_name="gallery_items")
+
+
+def downgrade() -> None:
+    op.create_index("ix_gallery_family_id", "gallery_items", ["family_id"])
+    op.drop_index("ix_gallery_family_type_created", table_name="gallery_items")
+    op.drop_index("ix_gallery_family_created", table_name="gallery_items")
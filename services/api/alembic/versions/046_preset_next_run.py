@@ -0,0 +1,33 @@
+"""preset_bots.next_run_at и частичный индекс для шедулера.
+
+Существующим пресетам ставится ``now()``: шедулер заберёт их на первом тике,
+пересчитает момент по ``hour``/``tz_offset_minutes``/``last_run_at`` и
+запустит только те, что действительно должны отработать сегодня.
+"""
+
+import sqlalchemy as sa
+from alembic import op
+
+
+revision = "046_preset_next_run"
+down_revision = "045_gallery_keyset"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column(
+        "preset_bots", sa.Column("next_run_at", sa.DateTime(timezone=True), nullable=True)
+    )
+    op.execute("UPDATE preset_bots SET next_run_at = now()")
+    op.create_index(
+        "ix_preset_bots_due",
+        "preset_bots",
+        ["next_run_at"],
+        postgresql_where=sa.text("enabled AND target_chat_id IS NOT NULL"),
+    )
+
+
+def downgrade() -> None:
+    op.drop_index("ix_preset_bots_due", table_name="preset_bots")
+    op.drop_column("preset_bots", "next_run_at")
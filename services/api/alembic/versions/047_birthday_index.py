@@ -0,0 +1,40 @@
+"""users.birthday_md (MMDD, вычисляемый) и частичный индекс по нему.
+
+Пресет birthday ищет именинников по ``birthday_md IN (…)`` одним запросом на
+все семьи вместо ``extract(month)``/``extract(day)`` со сканом участников.
+"""
+
+import sqlalchemy as sa
+from alembic import op
+
+
+revision = "047_birthday_index"
+down_revision = "046_preset_next_run"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column(
+        "users",
+        sa.Column(
+            "birthday_md",
+            sa.SmallInteger(),
+            sa.Computed(
+                "(EXTRACT(MONTH FROM birthday) * 100 + EXTRACT(DAY FROM birthday))::smallint",
+                persisted=True,
+            ),
+            nullable=True,
+        ),
+    )
+    op.create_index(
+        "ix_users_birthday_md",
+        "users",
+        ["birthday_md"],
+        postgresql_where=sa.text("birthday IS NOT NULL AND NOT is_bot"),
+    )
+
+
+def downgrade() -> None:
+    op.drop_index("ix_users_birthday_md", table_name="users")
+    op.drop_column("users", "birthday_md")
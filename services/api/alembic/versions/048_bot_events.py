@@ -0,0 +1,52 @@
+"""Журнал событий ботов (bot_events) и счётчик bots.event_seq.
+
+Long-poll ``GET /bot/events`` и resume gateway по ``last_seq``.
+"""
+
+import sqlalchemy as sa
+from alembic import op
+from sqlalchemy.dialects import postgresql
+
+
+revision = "048_bot_events"
+down_revision = "047_birthday_index"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column(
+        "bots",
+        sa.Column("event_seq", sa.BigInteger(), nullable=False, server_default="0"),
+    )
+    op.create_table(
+        "bot_events",
+        sa.Column(
+            "bot_user_id",
+            postgresql.UUID(as_uuid=True),
+            sa.ForeignKey("users.id", ondelete="CASCADE"),
+            primary_key=True,
+        ),
+        sa.Column("seq", sa.BigInteger(), primary_key=True),
+        sa.Column(
+            "family_id",
+            postgresql.UUID(as_uuid=True),
+            sa.ForeignKey("families.id", ondelete="CASCADE"),
+            nullable=True,
+        ),
+        sa.Column("chat_id", postgresql.UUID(as_uuid=True), nullable=True),
+        sa.Column("payload", postgresql.JSONB(), nullable=False),
+        sa.Column(
+            "created_at",
+            sa.DateTime(timezone=True),
+            nullable=False,
+            server_default=sa.func.now(),
+        ),
+    )
+    op.create_index("ix_bot_events_created_at", "bot_events", ["created_at"])
+
+
+def downgrade() -> None:
+    op.drop_index("ix_bot_events_created_at", table_name="bot_events")
+    op.drop_table("bot_events")
+    op.drop_column("bots", "event_seq")
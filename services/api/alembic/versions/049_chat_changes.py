@@ -0,0 +1,44 @@
+"""Журнал изменений сообщений (chat_changes) и счётчик chats.change_seq.
+
+Дельта-синхронизация ``GET /families/{id}/chats/{id}/changes?since=seq``.
+"""
+
+import sqlalchemy as sa
+from alembic import op
+from sqlalchemy.dialects import postgresql
+
+
+revision = "049_chat_changes"
+down_revision = "048_bot_events"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column(
+        "chats",
+        sa.Column("change_seq", sa.BigInteger(), nullable=False, server_default="0"),
+    )
+    op.create_table(
+        "chat_changes",
+        sa.Column(
+            "chat_id",
+            postgresql.UUID(as_uuid=True),
+            sa.ForeignKey("chats.id", ondelete="CASCADE"),
+            primary_key=True,
+        ),
+        sa.Column("seq", sa.BigInteger(), primary_key=True),
+        sa.Column("message_id", postgresql.UUID(as_uuid=True), nullable=False),
+        sa.Column("kind", sa.String(16), nullable=False),
+        sa.Column(
+            "created_at",
+            sa.DateTime(timezone=True),
+            nullable=False,
+            server_default=sa.func.now(),
+        ),
+    )
+
+
+def downgrade() -> None:
+    op.drop_table("chat_changes")
+    op.drop_column("chats", "change_seq")
@@ -0,0 +1,28 @@
+"""Журнал аудита: составной индекс (family_id, created_at DESC, id DESC).
+
+Под keyset-курсор ``GET /families/{id}/audit-log?cursor=``. Отдельный индекс
+по family_id больше не нужен — его покрывает префикс нового.
+"""
+
+import sqlalchemy as sa
+from alembic import op
+
+
+revision = "050_audit_log_cursor"
+down_revision = "049_chat_changes"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_index(
+        "ix_audit_log_family_cursor",
+        "audit_log",
+        ["family_id", sa.text("created_at DESC"), sa.text("id DESC")],
+    )
+    op.drop_index("ix_audit_log_family_id", table_name="audit_log")
+
+
+def downgrade() -> None:
+    op.create_index("ix_audit_log_family_id", "audit_log", ["family_id"])
+    op.drop_index("ix_audit_log_family_cursor", table_name="audit_log")
@@ -0,0 +1,125 @@
+"""Помесячное секционирование audit_log и platform_audit_log.
+
+Обе таблицы пересоздаются как ``PARTITION BY RANGE (created_at)``: секции
+``<таблица>_pYYYY_MM`` от месяца самой старой записи до трёх месяцев вперёд
+плюс ``<таблица>_default`` для строк вне диапазона. Дальше секции создаёт и
+удаляет по сроку хранения планировщик (app.services.audit_partitions).
+Первичный ключ становится (id, created_at) — ключ секционированной таблицы
+обязан включать ключ секционирования.
+
+Данные копируются под эксклюзивной блокировкой — на больших журналах
+миграцию стоит запускать в окно обслуживания.
+
+Заодно — ``family_moderation_settings.audit_retention_days``: срок хранения
+журнала семьи (0 — платформенный AUDIT_RETENTION_DAYS).
+"""
+
+import sqlalchemy as sa
+from alembic import op
+
+
+revision = "051_audit_log_partitions"
+down_revision = "050_audit_log_cursor"
+branch_labels = None
+depends_on = None
+
+_PREMAKE_MONTHS = 3
+
+# Таблица → (внешние ключи, индексы) в том виде, в каком они были до 051.
+_TABLES = {
+    "audit_log": (
+        [
+            ("audit_log_family_id_fkey", "family_id", "families", "CASCADE"),
+            ("audit_log_actor_id_fkey", "actor_id", "users", "SET NULL"),
+        ],
+        [
+            ("ix_audit_log_action", "action"),
+            ("ix_audit_log_created_at", "created_at"),
+            ("ix_audit_log_family_cursor", "family_id, created_at DESC, id DESC"),
+        ],
+    ),
+    "platform_audit_log": (
+        [("platform_audit_log_actor_id_fkey", "actor_id", "users", "SET NULL")],
+        [
+            ("ix_platform_audit_log_action", "action"),
+            ("ix_platform_audit_log_created_at", "created_at"),
+        ],
+    ),
+}
+
+
+def _add_constraints(table: str, pk: str) -> None:
+    fks, indexes = _TABLES[table]
+    op.execute(f"ALTER TABLE {table} ADD CONSTRAINT {table}_pkey PRIMARY KEY ({pk})")
+    for name, column, target, on_delete in fks:
+        op.execute(
+            f"ALTER TABLE {table} ADD CONSTRAINT {name} FOREIGN KEY ({column}) "
+            f"REFERENCES {target} (id) ON DELETE {on_delete}"
+        )
+    for name, columns in indexes:
+        op.execute(f"CREATE INDEX {name} ON {table} ({columns})")
+
+
+def _partition(table: str) -> None:
+    old = f"{table}_unpartitioned"
+    op.execute(f"ALTER TABLE {table} RENAME TO {old}")
+    op.execute(
+        f"CREATE TABLE {table} (LIKE {old} INCLUDING DEFAULTS) "
+        "PARTITION BY RANGE (created_at)"
+    )
+    op.execute(f"CREATE TABLE {table}_default PARTITION OF {table} DEFAULT")
+    # Секции по UTC-месяцам: от самой старой записи до _PREMAKE_MONTHS вперёд.
+    op.execute(
+        f"""
+        DO $$
+        DECLARE
+            m timestamp;
+        BEGIN
+            FOR m IN
+                SELECT generate_series(
+                    date_trunc('month', coalesce(
+                        (SELECT min(created_at) FROM {old}), now()
+                    ) AT TIME ZONE 'UTC'),
+                    date_trunc('month', now() AT TIME ZONE 'UTC')
+                        + interval '{_PREMAKE_MONTHS} months',
+                    interval '1 month'
+                )
+            LOOP
+                EXECUTE format(
+                    'CREATE TABLE %I PARTITION OF {table} FOR VALUES FROM (%L) TO (%L)',
+                    '{table}_p' || to_char(m, 'YYYY_MM'),
+                    m AT TIME ZONE 'UTC',
+                    (m + interval '1 month') AT TIME ZONE 'UTC'
+                );
+            END LOOP;
+        END $$
+        """
+    )
+    op.execute(f"INSERT INTO {table} SELECT * FROM {old}")
+    op.execute(f"DROP TABLE {old}")
+    _add_constraints(table, "id, created_at")
+
+
+def _unpartition(table: str) -> None:
+    old = f"{table}_partitioned"
+    op.execute(f"ALTER TABLE {table} RENAME TO {old}")
+    op.execute(f"CREATE TABLE {table} (LIKE {old} INCLUDING DEFAULTS)")
+    op.execute(f"INSERT INTO {table} SELECT * FROM {old}")
+    # Секции уходят вместе с родителем.
+    op.execute(f"DROP TABLE {old}")
+    _add_constraints(table, "id")
+
+
+def upgrade() -> None:
+    for table in _TABLES:
+        _partition(table)
+    op.add_column(
+        "family_moderation_settings",
+        sa.Column("audit_retention_days", sa.Integer(), nullable=False, server_default="0"),
+    )
+
+
+def downgrade() -> None:
+    op.drop_column("family_moderation_settings", "audit_retention_days")
+    for table in _TABLES:
+        _unpartition(table)
@@ -0,0 +1,21 @@
+"""Журнал изменений чатов: индекс по created_at.
+
+Под очистку chat_changes по сроку хранения (CHAT_CHANGE_RETENTION_DAYS) —
+планировщик выбирает старые записи пачками, не сканируя весь журнал.
+"""
+
+from alembic import op
+
+
+revision = "052_chat_changes_created_at"
+down_revision = "051_audit_log_partitions"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_index("ix_chat_changes_created_at", "chat_changes", ["created_at"])
+
+
+def downgrade() -> None:
+    op.drop_index("ix_chat_changes_created_at", table_name="chat_changes")
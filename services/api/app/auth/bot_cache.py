@@ -0,0 +1,159 @@
+"""Кэш аутентификации ботов: bot-токен → identity-`User` и его членства.
+
+Бот-клиенты дёргают REST в цикле (poll, send), и каждый запрос раньше стоил
+трёх обращений к БД ещё до бизнес-логики: Bot по token_hash, User по user_id
+и Membership в `_require_member`. Здесь — LRU с коротким TTL по хэшу токена:
+промах резолвится ОДНИМ запросом (users ⋈ bots ⟕ memberships), попадание не
+ходит в БД вовсе.
+
+В кэше лежат не ORM-объекты, а снимки колонок: каждому запросу выдаётся свой
+экземпляр, присоединённый к его сессии через ``merge(load=False)`` — без
+SELECT и без общего изменяемого состояния между запросами.
+
+Инвалидация (по user_id бота) — локальная; на все инстансы её разносит
+ws_manager через Redis: отдельным событием при смене токена/удалении бота и
+попутно с уже существующими force_logout (бан), kick и family_close
+(потеря членства). TTL страхует всё остальное (например, смену роли).
+Забаненные боты не кэшируются: проверку и ленивое снятие истёкшего бана
+делает enforce_not_banned по свежей строке.
+"""
+
+from __future__ import annotations
+
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from uuid import UUID
+
+from sqlalchemy import inspect, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import make_transient_to_detached
+
+from app.core.config import settings
+from app.models.bot import Bot
+from app.models.membership import Membership
+from app.models.user import User
+
+_Snapshot = dict[str, object]
+
+
+def _snapshot(obj) -> _Snapshot:
+    return {attr.key: getattr(obj, attr.key) for attr in inspect(type(obj)).column_attrs}
+
+
+async def _attach(db: AsyncSession, model, snap: _Snapshot):
+    """Снимок → экземпляр в сессии запроса (persistent, без SELECT). Если
+    сессия уже держит этот объект, merge вернёт его."""
+    obj = model(**snap)
+    make_transient_to_detached(obj)
+    return await db.merge(obj, load=False)
+
+
+@dataclass(slots=True)
+class _Entry:
+    user: _Snapshot
+    memberships: dict[UUID, _Snapshot]
+    expires: float
+
+
+class BotAuthCache:
+    def __init__(self, max_size: int, ttl_seconds: float) -> None:
+        self.max_size = max_size
+        self.ttl = ttl_seconds
+        self._entries: OrderedDict[str, _Entry] = OrderedDict()
+        # user_id бота → хэши его токенов в кэше (инвалидация идёт по user_id).
+        self._by_user: dict[UUID, set[str]] = {}
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_size > 0 and self.ttl > 0
+
+    def _get(self, token_hash: str) -> _Entry | None:
+        entry = self._entries.get(token_hash)
+        if entry is None:
+            return None
+        if entry.expires <= time.monotonic():
+            self._drop(token_hash)
+            return None
+        self._entries.move_to_end(token_hash)
+        return entry
+
+    def _put(self, token_hash: str, entry: _Entry) -> None:
+        if token_hash in self._entries:
+            self._drop(token_hash)
+        self._entries[token_hash] = entry
+        self._by_user.setdefault(entry.user["id"], set()).add(token_hash)
+        while len(self._entries) > self.max_size:
+            self._drop(next(iter(self._entries)))
+
+    def _drop(self, token_hash: str) -> None:
+        entry = self._entries.pop(token_hash, None)
+        if entry is None:
+            return
+        hashes = self._by_user.get(entry.user["id"])
+        if hashes is not None:
+            hashes.discard(token_hash)
+            if not hashes:
+                del self._by_user[entry.user["id"]]
+
+    # ── Чтение ──────────────────────────────────────────────────────────────
+
+    async def resolve(self, db: AsyncSession, token_hash: str) -> User | None:
+        """token_hash → identity-`User` бота, присоединённый к `db` (или None)."""
+        if self.enabled:
+            entry = self._get(token_hash)
+            if entry is not None:
+                return await _attach(db, User, entry.user)
+
+        rows = (
+            await db.execute(
+                select(User, Membership)
+                .join(Bot, Bot.user_id == User.id)
+                .outerjoin(Membership, Membership.user_id == User.id)
+                .where(Bot.token_hash == token_hash, User.is_bot.is_(True))
+            )
+        ).all()
+        if not rows:
+            return None
+        user = rows[0][0]
+        if self.enabled and not user.is_banned:
+            self._put(
+                token_hash,
+                _Entry(
+                    user=_snapshot(user),
+                    memberships={m.family_id: _snapshot(m) for _, m in rows if m is not None},
+                    expires=time.monotonic() + self.ttl,
+                ),
+            )
+        return user
+
+    async def membership(
+        self, db: AsyncSession, user_id: UUID, family_id: UUID
+    ) -> Membership | None:
+        """Членство бота из кэша (присоединённое к `db`) или None, если в кэше
+        его нет — тогда вызывающий идёт в БД. Отрицательный ответ не кэшируется:
+        бота могли только что добавить в семью."""
+        # _get() выкидывает истёкшие записи из того же множества — обходим копию.
+        for token_hash in tuple(self._by_user.get(user_id, ())):
+            entry = self._get(token_hash)
+            if entry is not None and family_id in entry.memberships:
+                return await _attach(db, Membership, entry.memberships[family_id])
+        return None
+
+    # ── Инвалидация (локальная; на все инстансы — через ws_manager) ─────────
+
+    def invalidate_user(self, user_id: UUID) -> None:
+        for token_hash in list(self._by_user.get(user_id, ())):
+            self._drop(token_hash)
+
+    def invalidate_family(self, family_id: UUID) -> None:
+        stale = [h for h, e in self._entries.items() if family_id in e.memberships]
+        for token_hash in stale:
+            self._drop(token_hash)
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self._by_user.clear()
+
+
+bot_auth_cache = BotAuthCache(settings.bot_auth_cache_size, settings.bot_auth_cache_ttl_seconds)
@@ -12,12 +12,11 @@ JWT, поэтому он не пройдёт `get_current_user` (человеч
 from __future__ import annotations
 
 from fastapi import Depends, Header, HTTPException, WebSocket, status
-from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
 
+from app.auth.bot_cache import bot_auth_cache
 from app.core.bot_tokens import TOKEN_PREFIX, hash_bot_token
 from app.db.deps import get_db
-from app.models.bot import Bot
 from app.models.user import User
 
 
@@ -32,16 +31,11 @@ def _extract_bearer(authorization: str | None) -> str | None:
 
 async def resolve_bot_user(db: AsyncSession, token: str | None) -> User | None:
     """Токен → identity-`User` бота (или None). Бан НЕ проверяется здесь —
-    REST делает это через enforce_not_banned, WS-gateway — через is_banned_now."""
+    REST делает это через enforce_not_banned, WS-gateway — через is_banned_now.
+    Попадание в кэш (app.auth.bot_cache) обходится без БД, промах — один запрос."""
     if not token or not token.startswith(TOKEN_PREFIX):
         return None
-    bot = await db.scalar(select(Bot).where(Bot.token_hash == hash_bot_token(token)))
-    if bot is None:
-        return None
-    user = await db.get(User, bot.user_id)
-    if user is None or not user.is_bot:
-        return None
-    return user
+    return await bot_auth_cache.resolve(db, hash_bot_token(token))
 
 
 def extract_ws_bot_token(websocket: WebSocket) -> str | None:
@@ -0,0 +1,161 @@
+"""Декларативные лимиты и квоты для дорогих эндпоинтов.
+
+    @router.get("/search", dependencies=[user_rate_limit("search_messages")])
+
+Каждый запрос списывает вес маршрута (`settings.route_costs`) из бюджетов:
+  * ``user_rate_limit`` — пользователь + семья из пути (если есть ``family_id``);
+  * ``bot_rate_limit``  — бот (один токен на бота, так что это и per-token
+    bucket; перевыпуск токена квоту не обнуляет) + семья;
+  * ``anon_rate_limit`` — IP клиента (публичные эндпоинты без auth).
+
+Семейный bucket общий для всех участников и ботов семьи — один «разогнавшийся»
+бот не выест пул БД за всех остальных. Списывается он только с участников
+семьи: иначе кто угодно мог бы выжечь чужой семье квоту запросами на
+``/families/<чужая>/…`` (эндпоинт ответит 403 сам). Сначала все бюджеты
+проверяются и только потом списываются — отказ по одному не тратит остальные.
+Отказ — 429 с ``Retry-After``.
+
+Зависимости аутентификации внутри кэшируются FastAPI на запрос, поэтому
+повторного resolve пользователя/бота в самом эндпоинте не происходит.
+"""
+
+from __future__ import annotations
+
+import logging
+import math
+from uuid import UUID
+
+from fastapi import Depends, HTTPException, Request, status
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.auth.bot_cache import bot_auth_cache
+from app.auth.bot_deps import get_current_bot
+from app.auth.deps import get_current_user
+from app.core.config import settings
+from app.core.rate_limit import (
+    SlidingWindowLimiter,
+    route_anon_limiter,
+    route_bot_limiter,
+    route_family_limiter,
+    route_user_limiter,
+)
+from app.db.deps import get_db
+from app.models.membership import Membership
+from app.models.user import User
+
+logger = logging.getLogger("lentik.security")
+
+_MB = 1024 * 1024
+
+
+def _route_cost(route: str, request: Request, per_mb: int) -> int:
+    cost = settings.route_costs.get(route, 1)
+    if per_mb:
+        # Загрузки дороже пропорционально объёму. Content-Length — подсказка
+        # клиента, но занизить её нельзя: сервер не дочитает тело дальше.
+        try:
+            size = int(request.headers.get("content-length") or 0)
+        except ValueError:
+            size = 0
+        cost += per_mb * (max(size, 0) // _MB)
+    return cost
+
+
+async def _family_bucket(
+    request: Request, db: AsyncSession, user: User
+) -> list[tuple[SlidingWindowLimiter, str]]:
+    """Бюджет семьи из пути — только если `user` в ней состоит."""
+    raw = request.path_params.get("family_id")
+    if not raw or not settings.route_limits_enabled:
+        return []
+    try:
+        family_id = UUID(str(raw))
+    except ValueError:
+        return []
+    # Членства ботов уже лежат в кэше аутентификации.
+    cached = await bot_auth_cache.membership(db, user.id, family_id) if user.is_bot else None
+    is_member = cached is not None or await db.scalar(
+        select(Membership.id).where(
+            Membership.family_id == family_id, Membership.user_id == user.id
+        )
+    ) is not None
+    return [(route_family_limiter, f"family:{family_id}")] if is_member else []
+
+
+def _too_many(retry_after: float) -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+        detail="Слишком много запросов, попробуйте позже",
+        headers={"Retry-After": str(max(1, math.ceil(retry_after)))},
+    )
+
+
+async def _enforce(
+    request: Request,
+    route: str,
+    buckets: list[tuple[SlidingWindowLimiter, str]],
+    per_mb: int,
+) -> None:
+    if not settings.route_limits_enabled:
+        return
+    cost = _route_cost(route, request, per_mb)
+    for limiter, key in buckets:
+        allowed, retry_after = await limiter.check(key, cost)
+        if not allowed:
+            logger.info("Route quota exceeded: route=%s bucket=%s key=%s", route, limiter.name, key)
+            raise _too_many(retry_after)
+    for limiter, key in buckets:
+        # Между проверкой и списанием бюджет мог выбрать параллельный запрос.
+        allowed, retry_after = await limiter.hit(key, cost)
+        if not allowed:
+            raise _too_many(retry_after)
+
+
+def user_rate_limit(route: str, *, per_mb: int = 0):
+    """Квота пользователя (+ семьи из пути). ``per_mb`` — доп. вес за каждый МБ тела."""
+
+    async def dependency(
+        request: Request,
+        db: AsyncSession = Depends(get_db),
+        user: User = Depends(get_current_user),
+    ) -> None:
+        await _enforce(
+            request,
+            route,
+            [(route_user_limiter, f"user:{user.id}"), *await _family_bucket(request, db, user)],
+            per_mb,
+        )
+
+    return Depends(dependency)
+
+
+def bot_rate_limit(route: str, *, per_mb: int = 0):
+    """Квота бота (+ семьи из пути)."""
+
+    async def dependency(
+        request: Request,
+        db: AsyncSession = Depends(get_db),
+        bot_user: User = Depends(get_current_bot),
+    ) -> None:
+        await _enforce(
+            request,
+            route,
+            [
+                (route_bot_limiter, f"bot:{bot_user.id}"),
+                *await _family_bucket(request, db, bot_user),
+            ],
+            per_mb,
+        )
+
+    return Depends(dependency)
+
+
+def anon_rate_limit(route: str):
+    """Квота по IP для публичных эндпоинтов без аутентификации."""
+
+    async def dependency(request: Request) -> None:
+        ip = request.client.host if request.client else "unknown"
+        await _enforce(request, route, [(route_anon_limiter, f"ip:{ip}")], 0)
+
+    return Depends(dependency)
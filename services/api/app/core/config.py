@@ -20,10 +20,102 @@ class Settings(BaseSettings):
     ]
 
     # ── Масштабирование (prod-readiness) ────────────────────────────────────
-    # Общий брокер для WS-fan-out (P1) и общих rate-лимитеров (P3).
+    # Общий брокер для WS-fan-out (P1), общих rate-лимитеров (P3), а также
+    # WS-тикетов и pending-интеракций ботов (нужны без sticky sessions).
     # Пусто → single-process режим (как раньше): без Redis, всё в памяти.
     redis_url: str | None = None
 
+    # ── Presence (online/offline) ───────────────────────────────────────────
+    # Сколько ждать переподключения, прежде чем объявить пользователя offline
+    # (мобильные сети «моргают»), и как часто писать is_online/last_seen_at в БД.
+    presence_grace_seconds: int = 15
+    presence_flush_interval_seconds: int = 5
+    # Heartbeat инстанса в Redis и через сколько без heartbeat инстанс считается
+    # упавшим: его соединения вычитаются из счётчиков присутствия.
+    presence_heartbeat_seconds: int = 5
+    presence_instance_timeout_seconds: int = 20
+
+    # ── Формат и сжатие WS-кадров ───────────────────────────────────────────
+    # permessage-deflate (uvicorn --ws app.ws.deflate:DeflateWebSocketProtocol):
+    # окно компрессора 2^bits байт (9–15) и memLevel zlib (1–9) на соединение.
+    ws_deflate_window_bits: int = 12
+    ws_deflate_mem_level: int = 5
+    # MessagePack-кадры по подпротоколу lentik.msgpack или ?format=msgpack
+    # (нужен пакет msgpack; без него сокет остаётся на JSON).
+    ws_msgpack_enabled: bool = True
+
+    # ── Журнал аудита ───────────────────────────────────────────────────────
+    # Копить записи аудита до commit и вставлять их одним INSERT вместо
+    # flush на каждое действие.
+    audit_buffered_writes: bool = True
+    # audit_log и platform_audit_log секционированы по месяцам (created_at).
+    # Планировщик создаёт секции на audit_partition_premake_months вперёд и
+    # убирает целиком те, что старше срока хранения (дней; 0 — хранить всё).
+    # По умолчанию срок 0: DROP старых секций необратим и включается только
+    # явным AUDIT_RETENTION_DAYS. Семья может задать срок короче в настройках
+    # модерации — её старые записи удаляются пачками внутри секций.
+    # audit_partition_detach=true — секции не удаляются, а отцепляются в схему
+    # archive (вне бэкапа).
+    audit_partition_maintenance_enabled: bool = True
+    audit_partition_premake_months: int = 3
+    audit_retention_days: int = 0
+    platform_audit_retention_days: int = 0
+    audit_partition_detach: bool = False
+
+    # ── Кэш аутентификации ботов ────────────────────────────────────────────
+    # LRU по хэшу bot-токена: identity бота и его членства в семьях. Смена
+    # токена, удаление, бан и kick сбрасывают запись на всех инстансах (через
+    # Redis), TTL ограничивает прочую устарелость. 0 в любом поле — без кэша.
+    bot_auth_cache_size: int = 10_000
+    bot_auth_cache_ttl_seconds: int = 30
+
+    # ── Журнал событий ботов (long-poll /bot/events, resume gateway) ────────
+    # Рассылки в семьи с ботами пишутся в bot_events; хранятся столько часов
+    # (очистку делает планировщик, SCHEDULER_ENABLED).
+    bot_event_log_enabled: bool = True
+    bot_event_retention_hours: int = 24
+
+    # ── Журнал изменений чатов (/changes?since=) ────────────────────────────
+    # Сколько дней хранятся записи chat_changes (0 — не очищать). Клиент,
+    # отставший сильнее, получает resync_required и перечитывает историю.
+    chat_change_retention_days: int = 30
+
+    # ── Хэширование PIN (PBKDF2) вне event loop ─────────────────────────────
+    # Сколько хэшей считается параллельно в выделенном пуле потоков и сколько
+    # запросов может ждать в очереди; сверх очереди — 503 с Retry-After.
+    pin_hash_workers: int = 2
+    pin_hash_max_pending: int = 256
+
+    # ── Превью картинок (миниатюры WebP + blurhash, нужен Pillow) ───────────
+    # Строятся фоновой задачей в пуле процессов: сколько процессов и предел
+    # пикселей оригинала (защита от «декомпрессионных бомб»).
+    previews_enabled: bool = True
+    preview_workers: int = 2
+    preview_max_pixels: int = 80_000_000
+
+    # ── Лимиты дорогих эндпоинтов (квоты в «единицах») ──────────────────────
+    # Помеченный эндпоинт списывает `route_costs[<route>]` единиц (по умолчанию
+    # 1) из бюджета каждого своего bucket'а за окно: пользователя, бот-токена,
+    # семьи (общий на всех её участников и ботов) или анонимного IP. Отказ —
+    # 429 с Retry-After. Бэкенд — те же лимитеры, что у auth (Redis/in-memory).
+    route_limits_enabled: bool = True
+    route_limit_window_seconds: int = 60
+    route_limit_user_budget: int = 600
+    route_limit_bot_budget: int = 300
+    route_limit_family_budget: int = 3000
+    route_limit_anon_budget: int = 120
+    route_costs: dict[str, int] = {
+        "search_messages": 10,
+        "upload_attachments": 20,
+        "gallery_upload": 20,
+        "calendar_feed": 20,
+        "list_balances": 10,
+        "expense_balances": 10,
+        "bot_poll_messages": 5,
+        "bot_send_message": 2,
+        "bot_list_chats": 5,
+    }
+
     # ── Аккаунт разработчика (god-mode + админ-панель) ──────────────────────
     # Username единственного платформенного администратора. На старте этому
     # пользователю проставляется is_developer=True, у остальных снимается.
@@ -35,6 +127,24 @@ class Settings(BaseSettings):
     # (SELECT ... FOR UPDATE SKIP LOCKED), так что несколько включённых безопасны.
     scheduler_enabled: bool = True
 
+    # Период фоновой сверки леджера балансов (member_balances) с пересчётом
+    # с нуля, секунды. 0 → сверка выключена (остаётся ручная из /admin).
+    balance_reconcile_interval_seconds: int = 6 * 3600
+
+    # Очередь фоновых задач (background_jobs): как часто воркер проверяет
+    # очередь, на сколько «арендует» задачу (после — её заберёт другой воркер)
+    # и базовая задержка перед повтором (удваивается с каждой попыткой).
+    job_poll_interval_seconds: int = 5
+    job_lease_seconds: int = 300
+    job_retry_base_seconds: int = 30
+
+    # Снимки статистики для /admin/stats (COUNT по таблицам), секунды.
+    # 0 → фоновых снимков нет, /admin/stats снимает их сам при устаревании.
+    stats_snapshot_interval_seconds: int = 600
+    # Как часто накопленные в памяти изменения объёма хранилища пишутся в
+    # storage_usage. Работает на всех инстансах (не зависит от SCHEDULER_ENABLED).
+    storage_usage_flush_seconds: int = 10
+
     # Применять ли `alembic upgrade heads` на старте приложения (P2). В проде
     # рекомендуется false + отдельный шаг деплоя, чтобы реплики не гонялись.
     auto_migrate: bool = True
@@ -56,6 +166,13 @@ class Settings(BaseSettings):
     s3_access_key_id: str | None = None
     s3_secret_access_key: str | None = None
     s3_addressing_style: str = "virtual"
+    # Квоты хранилища, байты (0 — без ограничения): на семью (галерея, капсулы,
+    # вложения её чатов) и на пользователя (всё загруженное им, включая аватар).
+    family_storage_quota_bytes: int = 0
+    user_storage_quota_bytes: int = 0
+    # Контентно-адресуемое хранение загрузок: одинаковые файлы (пересланное
+    # фото, мем в нескольких чатах) хранятся один раз под blobs/<sha256>.
+    storage_dedup_enabled: bool = False
 
     @field_validator("jwt_secret")
     @classmethod
@@ -83,6 +200,74 @@ class Settings(BaseSettings):
             raise ValueError("cors_origins содержит пустое значение origin.")
         return cleaned
 
+    @field_validator(
+        "route_limit_window_seconds",
+        "route_limit_user_budget",
+        "route_limit_bot_budget",
+        "route_limit_family_budget",
+        "route_limit_anon_budget",
+        "pin_hash_workers",
+        "pin_hash_max_pending",
+        "preview_workers",
+        "preview_max_pixels",
+        "presence_flush_interval_seconds",
+        "presence_heartbeat_seconds",
+        "presence_instance_timeout_seconds",
+        "job_poll_interval_seconds",
+        "job_lease_seconds",
+        "job_retry_base_seconds",
+        "storage_usage_flush_seconds",
+        "bot_event_retention_hours",
+        "audit_partition_premake_months",
+    )
+    @classmethod
+    def validate_positive(cls, v: int) -> int:
+        if v <= 0:
+            raise ValueError("Значение должно быть > 0.")
+        return v
+
+    @field_validator("ws_deflate_window_bits")
+    @classmethod
+    def validate_ws_deflate_window_bits(cls, v: int) -> int:
+        if not 9 <= v <= 15:
+            raise ValueError("WS_DEFLATE_WINDOW_BITS должно быть от 9 до 15.")
+        return v
+
+    @field_validator("ws_deflate_mem_level")
+    @classmethod
+    def validate_ws_deflate_mem_level(cls, v: int) -> int:
+        if not 1 <= v <= 9:
+            raise ValueError("WS_DEFLATE_MEM_LEVEL должно быть от 1 до 9.")
+        return v
+
+    @field_validator(
+        "bot_auth_cache_size",
+        "bot_auth_cache_ttl_seconds",
+        "audit_retention_days",
+        "platform_audit_retention_days",
+        "chat_change_retention_days",
+    )
+    @classmethod
+    def validate_non_negative(cls, v: int) -> int:
+        if v < 0:
+            raise ValueError("Значение должно быть ≥ 0 (0 — выключено).")
+        return v
+
+    @field_validator("family_storage_quota_bytes", "user_storage_quota_bytes")
+    @classmethod
+    def validate_storage_quota(cls, v: int) -> int:
+        if v < 0:
+            raise ValueError("Квота хранилища не может быть отрицательной (0 — без ограничения).")
+        return v
+
+    @field_validator("route_costs")
+    @classmethod
+    def validate_route_costs(cls, v: dict[str, int]) -> dict[str, int]:
+        bad = [name for name, cost in v.items() if cost < 1]
+        if bad:
+            raise ValueError(f"route_costs: вес должен быть ≥ 1 ({', '.join(bad)}).")
+        return v
+
     @field_validator("storage_backend")
     @classmethod
     def validate_storage_backend(cls, v: str) -> str:
@@ -0,0 +1,142 @@
+"""Превью картинок: миниатюры, blurhash и доминирующий цвет.
+
+Чистые CPU-функции без зависимостей от приложения — ``render_previews``
+выполняется в дочерних процессах пула (services/previews.py), которые
+импортируют только этот модуль. Pillow импортируется лениво: без него превью
+просто не строятся.
+"""
+
+from __future__ import annotations
+
+import io
+import math
+from collections.abc import Sequence
+
+_B83 = "0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz#$%*+,-.:;=?@[]^_{|}~"
+# Компоненты blurhash по осям (4×3 — рекомендация авторов формата).
+_BLUR_X, _BLUR_Y = 4, 3
+# Сторона картинки, по которой считается blurhash и цвет: больше не нужно.
+_SAMPLE_EDGE = 32
+_WEBP_QUALITY = 80
+
+
+def _encode83(value: int, length: int) -> str:
+    return "".join(_B83[(value // 83 ** (length - i)) % 83] for i in range(1, length + 1))
+
+
+def _srgb_to_linear(v: int) -> float:
+    c = v / 255
+    return c / 12.92 if c <= 0.04045 else ((c + 0.055) / 1.055) ** 2.4
+
+
+def _linear_to_srgb(v: float) -> int:
+    c = min(max(v, 0.0), 1.0)
+    if c <= 0.0031308:
+        return int(c * 12.92 * 255 + 0.5)
+    return int((1.055 * c ** (1 / 2.4) - 0.055) * 255 + 0.5)
+
+
+def _sign_pow(v: float, exp: float) -> float:
+    return math.copysign(abs(v) ** exp, v)
+
+
+def encode_blurhash(
+    pixels: Sequence[tuple[int, int, int]],
+    width: int,
+    height: int,
+    components_x: int = _BLUR_X,
+    components_y: int = _BLUR_Y,
+) -> str:
+    """Blurhash (https://blurha.sh) по RGB-пикселям в построчном порядке."""
+    linear = [tuple(_srgb_to_linear(c) for c in px) for px in pixels]
+    cos_x = [[math.cos(math.pi * i * x / width) for x in range(width)] for i in range(components_x)]
+    cos_y = [[math.cos(math.pi * j * y / height) for y in range(height)] for j in range(components_y)]
+    factors: list[tuple[float, float, float]] = []
+    for j in range(components_y):
+        for i in range(components_x):
+            norm = (1 if i == 0 and j == 0 else 2) / (width * height)
+            r = g = b = 0.0
+            for y in range(height):
+                cy = cos_y[j][y] * norm
+                row = y * width
+                for x in range(width):
+                    basis = cos_x[i][x] * cy
+                    pr, pg, pb = linear[row + x]
+                    r += basis * pr
+                    g += basis * pg
+                    b += basis * pb
+            factors.append((r, g, b))
+
+    dc, ac = factors[0], factors[1:]
+    out = _encode83((components_x - 1) + (components_y - 1) * 9, 1)
+    if ac:
+        actual_max = max(abs(v) for f in ac for v in f)
+        quant_max = max(0, min(82, math.floor(actual_max * 166 - 0.5)))
+        max_value = (quant_max + 1) / 166
+        out += _encode83(quant_max, 1)
+    else:
+        max_value = 1.0
+        out += _encode83(0, 1)
+    out += _encode83(
+        (_linear_to_srgb(dc[0]) << 16) + (_linear_to_srgb(dc[1]) << 8) + _linear_to_srgb(dc[2]), 4
+    )
+    for f in ac:
+        q = [max(0, min(18, math.floor(_sign_pow(v / max_value, 0.5) * 9 + 9.5))) for v in f]
+        out += _encode83(q[0] * 19 * 19 + q[1] * 19 + q[2], 2)
+    return out
+
+
+def dominant_color(pixels: Sequence[tuple[int, int, int]]) -> str:
+    """Самый частый цвет после грубой квантизации (по 32 уровня на канал) → ``#rrggbb``."""
+    buckets: dict[tuple[int, int, int], list[int]] = {}
+    for r, g, b in pixels:
+        acc = buckets.setdefault((r >> 3, g >> 3, b >> 3), [0, 0, 0, 0])
+        acc[0] += r
+        acc[1] += g
+        acc[2] += b
+        acc[3] += 1
+    r, g, b, n = max(buckets.values(), key=lambda acc: acc[3])
+    return f"#{r // n:02x}{g // n:02x}{b // n:02x}"
+
+
+def render_previews(data: bytes, sizes: dict[str, int], max_pixels: int) -> dict:
+    """Построить превью. Выполняется в процессе пула.
+
+    → ``{"width", "height", "blurhash", "color", "variants": {имя: webp-байты}}``.
+    Вариант строится, только если картинка больше его стороны — иначе клиенту
+    хватит оригинала. Битые/слишком большие картинки → исключение Pillow.
+    """
+    from PIL import Image, ImageOps
+
+    Image.MAX_IMAGE_PIXELS = max_pixels
+    with Image.open(io.BytesIO(data)) as src:
+        width, height = src.size
+        if (src.getexif() or {}).get(0x0112) in (5, 6, 7, 8):  # поворот на 90°
+            width, height = height, width
+        # JPEG декодируется сразу в уменьшенном масштабе (1/2…1/8) — в разы
+        # быстрее полного декодирования 20-мегапиксельного кадра.
+        src.draft("RGB", (max(sizes.values()), max(sizes.values())))
+        img = ImageOps.exif_transpose(src)
+        has_alpha = img.mode in ("RGBA", "LA", "PA") or "transparency" in img.info
+        img = img.convert("RGBA" if has_alpha else "RGB")
+
+    variants: dict[str, bytes] = {}
+    for name, edge in sorted(sizes.items(), key=lambda kv: -kv[1]):
+        if max(img.size) <= edge:
+            continue
+        thumb = img.copy()
+        thumb.thumbnail((edge, edge), Image.Resampling.LANCZOS, reducing_gap=3.0)
+        buf = io.BytesIO()
+        thumb.save(buf, "WEBP", quality=_WEBP_QUALITY, method=4)
+        variants[name] = buf.getvalue()
+
+    sample = img.convert("RGB")
+    sample.thumbnail((_SAMPLE_EDGE, _SAMPLE_EDGE), Image.Resampling.BILINEAR)
+    pixels = list(sample.getdata())
+    return {
+        "width": width,
+        "height": height,
+        "blurhash": encode_blurhash(pixels, *sample.size),
+        "color": dominant_color(pixels),
+        "variants": variants,
+    }
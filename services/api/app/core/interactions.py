@@ -1,25 +1,34 @@
-"""In-memory стор pending-интеракций (Phase 3).
+"""Стор pending-интеракций (Phase 3).
 
 Человек кликнул компонент → создаём запись с TTL и шлём событие боту. Бот
 отвечает по interaction_id → запись потребляется. Если бот не ответил за TTL,
 запись истекает (клиент сам снимает «загрузку» по своему таймауту).
 
-Стор локальный для процесса — у одного инстанса этого достаточно. При нескольких
-репликах нужен общий стор (Redis), т.к. интеракция могла создаться на одном
-инстансе, а ответ бота прийти на другой — вне MVP.
+С `REDIS_URL` записи общие для всех реплик (SET PX + атомарный GETDEL): клик
+мог прийти на один инстанс, а ответ бота — на другой, и интеракция всё равно
+найдётся ровно один раз. Истечение — нативный TTL Redis. Без Redis — локальный
+dict процесса (как раньше, для single-instance этого достаточно).
 """
 
 from __future__ import annotations
 
+import json
+import logging
 import time
 import uuid
-from dataclasses import dataclass
+from dataclasses import asdict, dataclass
 from uuid import UUID
 
+from app.core import redis_client
+
+logger = logging.getLogger(__name__)
+
 _TTL_SECONDS = 15.0
 # Модалку человек заполняет руками — 15с мало, даём 5 минут на отправку формы.
 MODAL_REPLY_TTL_SECONDS = 300.0
 _MAX_ITEMS = 5000
+_REDIS_PREFIX = "interaction:"
+_UUID_FIELDS = ("message_id", "chat_id", "family_id", "bot_id", "user_id")
 
 
 @dataclass
@@ -37,11 +46,31 @@ class PendingInteraction:
     modal_custom_id: str | None = None
 
 
+def _dumps(p: PendingInteraction) -> str:
+    data = asdict(p)
+    for f in _UUID_FIELDS:
+        data[f] = str(data[f])
+    # expires_at монотонного времени одного процесса в Redis бессмыслен —
+    # срок там держит TTL ключа.
+    data.pop("expires_at")
+    return json.dumps(data)
+
+
+def _loads(raw: str) -> PendingInteraction | None:
+    try:
+        data = json.loads(raw)
+        for f in _UUID_FIELDS:
+            data[f] = UUID(data[f])
+        return PendingInteraction(expires_at=time.monotonic(), **data)
+    except (ValueError, TypeError, KeyError):
+        return None
+
+
 class InteractionStore:
     def __init__(self) -> None:
         self._items: dict[str, PendingInteraction] = {}
 
-    def create(
+    async def create(
         self,
         *,
         message_id: UUID,
@@ -53,9 +82,8 @@ class InteractionStore:
         modal_custom_id: str | None = None,
         ttl: float = _TTL_SECONDS,
     ) -> str:
-        self._sweep()
         iid = uuid.uuid4().hex
-        self._items[iid] = PendingInteraction(
+        pending = PendingInteraction(
             id=iid,
             message_id=message_id,
             chat_id=chat_id,
@@ -66,10 +94,29 @@ class InteractionStore:
             kind=kind,
             modal_custom_id=modal_custom_id,
         )
+        r = await redis_client.get_redis()
+        if r is not None:
+            try:
+                await r.set(_REDIS_PREFIX + iid, _dumps(pending), px=int(ttl * 1000))
+                return iid
+            except Exception:  # noqa: BLE001
+                logger.exception("interaction create failed in redis; using local store")
+        self._sweep()
+        self._items[iid] = pending
         return iid
 
-    def consume(self, iid: str) -> PendingInteraction | None:
+    async def consume(self, iid: str) -> PendingInteraction | None:
         """Достать и удалить запись. None — нет или истекла."""
+        r = await redis_client.get_redis()
+        if r is not None:
+            try:
+                raw = await r.getdel(_REDIS_PREFIX + iid)
+            except Exception:  # noqa: BLE001
+                logger.exception("interaction consume failed in redis; using local store")
+            else:
+                if raw:
+                    return _loads(raw)
+                # Нет в Redis — запись могла создаться локально при сбое Redis.
         p = self._items.pop(iid, None)
         if p is None or p.expires_at < time.monotonic():
             return None
@@ -1,84 +1,279 @@
+import math
+import secrets
 import time
 from asyncio import Lock
 from collections import defaultdict, deque
 
 from app.core import redis_client
+from app.core.config import settings
+
+# ── Lua-скрипты (атомарно, один round trip) ─────────────────────────────────
+# Время берём у Redis (TIME), а не у инстанса: окно одно на весь кластер и не
+# зависит от расхождения часов между репликами.
+#
+# ARGV: window_ms, limit, mode, nonce, cost.
+# mode: 0 — только посчитать, 1 — allow (проверить и записать, если есть место),
+#       2 — record (записать безусловно), 3 — check (проверить, не записывая).
+# cost — вес запроса в «единицах» лимита (дорогие эндпоинты тратят больше).
+# Возвращает {allowed (0/1), count_after, retry_after_ms}.
+
+_SLIDING_LUA = """
+local key = KEYS[1]
+local window = tonumber(ARGV[1])
+local limit = tonumber(ARGV[2])
+local mode = tonumber(ARGV[3])
+local cost = tonumber(ARGV[5])
+local t = redis.call('TIME')
+local now = tonumber(t[1]) * 1000 + math.floor(tonumber(t[2]) / 1000)
+redis.call('ZREMRANGEBYSCORE', key, 0, now - window)
+local count = redis.call('ZCARD', key)
+if mode == 0 then
+  return {1, count, 0}
+end
+if (mode == 1 or mode == 3) and count + cost > limit then
+  local need = count + cost - limit
+  if need > count then
+    return {0, count, window}
+  end
+  local oldest = redis.call('ZRANGE', key, need - 1, need - 1, 'WITHSCORES')
+  return {0, count, tonumber(oldest[2]) + window - now}
+end
+if mode == 3 then
+  return {1, count, 0}
+end
+for i = 1, cost do
+  redis.call('ZADD', key, now, now .. ':' .. ARGV[4] .. ':' .. i)
+end
+redis.call('PEXPIRE', key, window + 1000)
+return {1, count + cost, 0}
+"""
+
+# Приближённое окно: два фиксированных окна (текущее + предыдущее) в одном hash,
+# оценка = prev * (1 - доля_прошедшего_окна) + cur. O(1) памяти на ключ вместо
+# sorted set со всеми событиями. Формула retry — та же, что в `_approx_retry`.
+_APPROX_LUA = """
+local key = KEYS[1]
+local window = tonumber(ARGV[1])
+local limit = tonumber(ARGV[2])
+local mode = tonumber(ARGV[3])
+local cost = tonumber(ARGV[5])
+local t = redis.call('TIME')
+local now = tonumber(t[1]) * 1000 + math.floor(tonumber(t[2]) / 1000)
+local idx = math.floor(now / window)
+local h = redis.call('HMGET', key, 'w', 'c', 'p')
+local w = tonumber(h[1])
+local cur = tonumber(h[2]) or 0
+local prev = tonumber(h[3]) or 0
+if w == nil then
+  cur = 0
+  prev = 0
+elseif w ~= idx then
+  if w == idx - 1 then prev = cur else prev = 0 end
+  cur = 0
+end
+local elapsed = now % window
+local est = prev * (1 - elapsed / window) + cur
+if mode == 0 then
+  return {1, math.ceil(est), 0}
+end
+if (mode == 1 or mode == 3) and est + cost > limit then
+  local retry
+  local room = limit - cost - cur
+  if room >= 0 and prev > 0 then
+    retry = (1 - room / prev) * window - elapsed
+  elseif cur > 0 and limit >= cost then
+    retry = window - elapsed + (1 - (limit - cost) / cur) * window
+  else
+    retry = window - elapsed
+  end
+  return {0, math.ceil(est), math.ceil(retry)}
+end
+if mode == 3 then
+  return {1, math.ceil(est), 0}
+end
+cur = cur + cost
+redis.call('HSET', key, 'w', idx, 'c', cur, 'p', prev)
+redis.call('PEXPIRE', key, window * 2 + 1000)
+return {1, math.ceil(est + cost), 0}
+"""
+
+_MODE_COUNT, _MODE_ALLOW, _MODE_RECORD, _MODE_CHECK = 0, 1, 2, 3
+# Порог, после которого in-memory приближённый режим выметает устаревшие ключи.
+_MAX_INMEMORY_KEYS = 10_000
+
+# Скрипты регистрируются на клиенте один раз: redis-py шлёт EVALSHA и сам
+# догружает тело при NOSCRIPT (например, после рестарта Redis).
+_scripts: dict[int, tuple[object, object]] = {}
+
+
+def _registered(r) -> tuple[object, object]:
+    pair = _scripts.get(id(r))
+    if pair is None:
+        _scripts.clear()  # клиент пересоздан — старые объекты не нужны
+        pair = (r.register_script(_SLIDING_LUA), r.register_script(_APPROX_LUA))
+        _scripts[id(r)] = pair
+    return pair
+
+
+async def preload_scripts() -> None:
+    """SCRIPT LOAD на старте, чтобы первый же EVALSHA попал в кэш Redis.
+    No-op без REDIS_URL."""
+    r = await redis_client.get_redis()
+    if r is None:
+        return
+    await r.script_load(_SLIDING_LUA)
+    await r.script_load(_APPROX_LUA)
+    _registered(r)
+
+
+def _approx_retry(
+    prev: float, cur: float, elapsed: float, window: float, limit: int, cost: int
+) -> float:
+    """Через сколько секунд оценка prev*(1-f)+cur опустится до limit-cost."""
+    room = limit - cost - cur
+    if room >= 0 and prev > 0:
+        # Хватит «выветривания» прошлого окна внутри текущего.
+        return (1 - room / prev) * window - elapsed
+    if cur > 0 and limit >= cost:
+        # Ждём следующего окна, где текущий счётчик станет «прошлым».
+        return window - elapsed + (1 - (limit - cost) / cur) * window
+    return window - elapsed
 
 
 class SlidingWindowLimiter:
     """Sliding-window counter.
 
     Если сконфигурирован Redis (`REDIS_URL`) — счётчик общий для всех инстансов
-    и переживает рестарт (P3). Иначе — in-memory per-process защитный «пол»
-    против неаутентифицированного перебора.
+    и переживает рестарт (P3). Каждая операция — один атомарный EVALSHA, так что
+    параллельные запросы не «проскакивают» лимит. Иначе — in-memory per-process
+    защитный «пол» против неаутентифицированного перебора.
+
+    ``approximate=True`` — вместо точного журнала событий держим два счётчика
+    фиксированных окон и интерполируем (как у Cloudflare). Погрешность — доли
+    лимита на границе окна, зато O(1) памяти на ключ: для per-IP лимитеров под
+    распылённым трафиком это важнее точности.
     """
 
-    def __init__(self, limit: int, window_seconds: float, *, name: str) -> None:
+    def __init__(
+        self,
+        limit: int,
+        window_seconds: float,
+        *,
+        name: str,
+        approximate: bool = False,
+    ) -> None:
         self.limit = limit
         self.window = window_seconds
         self.name = name
-        self._events: dict[str, deque[float]] = defaultdict(deque)
+        self.approximate = approximate
+        # exact: key → журнал (время, вес) и сумма весов в окне.
+        self._events: dict[str, deque[tuple[float, int]]] = defaultdict(deque)
+        self._totals: dict[str, int] = defaultdict(int)
+        # approximate: key → [индекс окна, cur, prev]
+        self._windows: dict[str, list[float]] = {}
         self._lock = Lock()
 
-    # ── Redis-бэкенд (sorted set как скользящее окно) ───────────────────────
+    # ── Redis-бэкенд ────────────────────────────────────────────────────────
 
     def _rkey(self, key: str) -> str:
-        return f"rl:{self.name}:{key}"
-
-    async def _redis_count(self, r, key: str) -> int:
-        now = time.time()
-        rk = self._rkey(key)
-        await r.zremrangebyscore(rk, 0, now - self.window)
-        return int(await r.zcard(rk))
-
-    async def _redis_record(self, r, key: str) -> int:
-        now = time.time()
-        rk = self._rkey(key)
-        pipe = r.pipeline()
-        pipe.zremrangebyscore(rk, 0, now - self.window)
-        # member уникален, чтобы одинаковые таймстемпы не схлопывались.
-        pipe.zadd(rk, {f"{now}:{id(object())}": now})
-        pipe.zcard(rk)
-        pipe.expire(rk, int(self.window) + 1)
-        res = await pipe.execute()
-        return int(res[2])
+        # Разные префиксы: sorted set и hash под одним ключом дали бы WRONGTYPE
+        # при переключении режима между деплоями.
+        prefix = "rla" if self.approximate else "rl"
+        return f"{prefix}:{self.name}:{key}"
+
+    async def _redis_eval(
+        self, r, key: str, mode: int, cost: int = 1
+    ) -> tuple[bool, int, float]:
+        sliding, approx = _registered(r)
+        script = approx if self.approximate else sliding
+        res = await script(
+            keys=[self._rkey(key)],
+            args=[int(self.window * 1000), self.limit, mode, secrets.token_hex(6), cost],
+            client=r,
+        )
+        return bool(int(res[0])), int(res[1]), max(0, int(res[2])) / 1000
 
     # ── Публичный интерфейс (не меняется для вызывающих) ────────────────────
 
-    async def allow(self, key: str) -> bool:
+    async def hit(self, key: str, cost: int = 1) -> tuple[bool, float]:
+        """Списать `cost` единиц, если они помещаются в лимит.
+
+        Возвращает (пропущен, через_сколько_секунд_повторить). Второе значение
+        имеет смысл только при отказе — для заголовка Retry-After.
+        """
+        return await self._hit(key, cost, _MODE_ALLOW)
+
+    async def check(self, key: str, cost: int = 1) -> tuple[bool, float]:
+        """Как `hit`, но ничего не списывает — чтобы проверить все бюджеты
+        запроса до того, как тратить любой из них."""
+        return await self._hit(key, cost, _MODE_CHECK)
+
+    async def _hit(self, key: str, cost: int, mode: int) -> tuple[bool, float]:
         r = await redis_client.get_redis()
         if r is not None:
-            count = await self._redis_count(r, key)
-            if count >= self.limit:
-                return False
-            await self._redis_record(r, key)
-            return True
+            allowed, _, retry = await self._redis_eval(r, key, mode, cost)
+            return allowed, retry
+        charge = mode == _MODE_ALLOW
         async with self._lock:
             now = time.monotonic()
+            if self.approximate:
+                est = self._estimate(key, now)
+                state = self._windows[key]
+                if est + cost > self.limit:
+                    return False, _approx_retry(
+                        state[2], state[1], now % self.window, self.window, self.limit, cost
+                    )
+                if charge:
+                    state[1] += cost
+                return True, 0.0
             dq = self._trim(key, now)
-            if len(dq) >= self.limit:
-                return False
-            dq.append(now)
-            return True
+            total = self._totals.get(key, 0)
+            if total + cost > self.limit:
+                need = total + cost - self.limit
+                if need > total:
+                    return False, self.window
+                # Ждём, пока истечёт столько старых записей, чтобы освободить need.
+                freed = 0
+                for ts, weight in dq:
+                    freed += weight
+                    if freed >= need:
+                        return False, ts + self.window - now
+            if charge:
+                dq.append((now, cost))
+                self._totals[key] = total + cost
+            return True, 0.0
+
+    async def allow(self, key: str) -> bool:
+        allowed, _ = await self.hit(key)
+        return allowed
 
     async def record(self, key: str) -> int:
         r = await redis_client.get_redis()
         if r is not None:
-            return await self._redis_record(r, key)
+            _, count, _ = await self._redis_eval(r, key, _MODE_RECORD)
+            return count
         async with self._lock:
             now = time.monotonic()
+            if self.approximate:
+                est = self._estimate(key, now)
+                self._windows[key][1] += 1
+                return math.ceil(est + 1)
             dq = self._trim(key, now)
-            dq.append(now)
-            return len(dq)
+            dq.append((now, 1))
+            self._totals[key] += 1
+            return self._totals[key]
 
     async def count(self, key: str) -> int:
         r = await redis_client.get_redis()
         if r is not None:
-            return await self._redis_count(r, key)
+            _, count, _ = await self._redis_eval(r, key, _MODE_COUNT)
+            return count
         async with self._lock:
             now = time.monotonic()
-            dq = self._trim(key, now)
-            return len(dq)
+            if self.approximate:
+                return math.ceil(self._estimate(key, now))
+            self._trim(key, now)
+            return self._totals.get(key, 0)
 
     async def reset(self, key: str) -> None:
         r = await redis_client.get_redis()
@@ -87,25 +282,48 @@ class SlidingWindowLimiter:
             return
         async with self._lock:
             self._events.pop(key, None)
+            self._totals.pop(key, None)
+            self._windows.pop(key, None)
 
-    # ── In-memory helper ────────────────────────────────────────────────────
+    # ── In-memory helpers ───────────────────────────────────────────────────
 
-    def _trim(self, key: str, now: float) -> deque[float]:
+    def _trim(self, key: str, now: float) -> deque[tuple[float, int]]:
         dq = self._events[key]
-        while dq and dq[0] <= now - self.window:
-            dq.popleft()
+        while dq and dq[0][0] <= now - self.window:
+            self._totals[key] -= dq.popleft()[1]
         if not dq and key in self._events:
             del self._events[key]
+            self._totals.pop(key, None)
             dq = self._events[key]
         return dq
 
+    def _estimate(self, key: str, now: float) -> float:
+        """Сдвигает окна ключа к текущему моменту и возвращает оценку счётчика."""
+        idx = int(now // self.window)
+        if len(self._windows) >= _MAX_INMEMORY_KEYS:
+            # Ключи старше предыдущего окна ничего не добавляют к оценке.
+            for k in [k for k, st in self._windows.items() if st[0] < idx - 1]:
+                del self._windows[k]
+        state = self._windows.get(key)
+        if state is None:
+            state = self._windows[key] = [idx, 0, 0]
+        elif state[0] != idx:
+            state[2] = state[1] if state[0] == idx - 1 else 0
+            state[1] = 0
+            state[0] = idx
+        frac = (now % self.window) / self.window
+        return state[2] * (1 - frac) + state[1]
+
 
 # /auth/pin: max 5 неудач за 15 минут per-username, 20 — per-IP
 pin_failure_limiter = SlidingWindowLimiter(limit=5, window_seconds=15 * 60, name="pin_user")
 pin_failure_ip_limiter = SlidingWindowLimiter(limit=20, window_seconds=15 * 60, name="pin_ip")
 
-# /auth/check-username: max 30 запросов в минуту per-IP
-check_username_limiter = SlidingWindowLimiter(limit=30, window_seconds=60, name="check_username")
+# /auth/check-username: max 30 запросов в минуту per-IP. Приближённый режим:
+# ключей (IP) много, а точность на границе окна тут не критична.
+check_username_limiter = SlidingWindowLimiter(
+    limit=30, window_seconds=60, name="check_username", approximate=True
+)
 
 # /auth/register: max 10 регистраций за час с одного IP
 register_ip_limiter = SlidingWindowLimiter(limit=10, window_seconds=3600, name="register_ip")
@@ -115,3 +333,19 @@ register_ip_limiter = SlidingWindowLimiter(limit=10, window_seconds=3600, name="
 # засыпать чужие устройства бесконечным потоком key-exchange мусора (DoS на
 # чтение: жертва не успевает ack'ать быстрее, чем прилетает новое).
 e2ee_mailbox_limiter = SlidingWindowLimiter(limit=30, window_seconds=300, name="e2ee_mailbox")
+
+# Квоты дорогих эндпоинтов (см. auth/rate_limit_deps.py). Приближённый режим:
+# ключей много (по пользователю/боту/семье/IP), а запросы «весят» по-разному.
+_route_window = settings.route_limit_window_seconds
+route_user_limiter = SlidingWindowLimiter(
+    settings.route_limit_user_budget, _route_window, name="route_user", approximate=True
+)
+route_bot_limiter = SlidingWindowLimiter(
+    settings.route_limit_bot_budget, _route_window, name="route_bot", approximate=True
+)
+route_family_limiter = SlidingWindowLimiter(
+    settings.route_limit_family_budget, _route_window, name="route_family", approximate=True
+)
+route_anon_limiter = SlidingWindowLimiter(
+    settings.route_limit_anon_budget, _route_window, name="route_anon", approximate=True
+)
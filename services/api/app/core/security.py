@@ -1,5 +1,15 @@
+import asyncio
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass
+
 from passlib.context import CryptContext
 
+from app.core.config import settings
+
+logger = logging.getLogger("lentik.security")
+
 pwd_context = CryptContext(
     schemes=["pbkdf2_sha256"],
     deprecated="auto",
@@ -23,4 +33,99 @@ _DUMMY_HASH = pwd_context.hash("0000")
 
 def dummy_verify() -> None:
     """Выполнить фиктивную проверку PIN, чтобы выровнять время ответа."""
-    pwd_context.verify("0000", _DUMMY_HASH)
\ No newline at end of file
+    pwd_context.verify("0000", _DUMMY_HASH)
+
+
+# ── Асинхронные обёртки: PBKDF2 вне event loop ──────────────────────────────
+# Один verify/hash — десятки миллисекунд CPU. Синхронно внутри эндпоинта это
+# замораживает весь воркер, включая доставку по WebSocket. Поэтому в async-коде
+# хэшируем в отдельном ограниченном пуле потоков: hashlib.pbkdf2_hmac (на нём
+# работает passlib) отпускает GIL, так что потоки реально параллельны, а loop
+# остаётся отзывчивым. Семафор держит не больше `pin_hash_workers` задач в
+# работе, остальные ждут в очереди длиной до `pin_hash_max_pending` — сверх
+# неё сразу отказываем (PinHasherBusy), а не копим бесконечный backlog.
+
+
+class PinHasherBusy(Exception):
+    """Очередь хэширования переполнена — запрос стоит повторить позже."""
+
+
+@dataclass
+class PinHashStats:
+    calls: int = 0
+    rejected: int = 0
+    pending: int = 0
+    queue_seconds_total: float = 0.0
+    queue_seconds_max: float = 0.0
+    run_seconds_total: float = 0.0
+
+    def snapshot(self) -> dict:
+        data = asdict(self)
+        data["queue_seconds_avg"] = self.queue_seconds_total / self.calls if self.calls else 0.0
+        data["run_seconds_avg"] = self.run_seconds_total / self.calls if self.calls else 0.0
+        data["workers"] = settings.pin_hash_workers
+        data["max_pending"] = settings.pin_hash_max_pending
+        return data
+
+
+pin_hash_stats = PinHashStats()
+
+# Если ожидание в очереди дольше — пишем warning: пул не справляется.
+_SLOW_QUEUE_SECONDS = 1.0
+
+_executor: ThreadPoolExecutor | None = None
+_slots: asyncio.Semaphore | None = None
+
+
+def _pool() -> tuple[ThreadPoolExecutor, asyncio.Semaphore]:
+    global _executor, _slots
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=settings.pin_hash_workers, thread_name_prefix="pin-hash"
+        )
+    if _slots is None:
+        _slots = asyncio.Semaphore(settings.pin_hash_workers)
+    return _executor, _slots
+
+
+async def _run_hashing(fn, *args):
+    if pin_hash_stats.pending >= settings.pin_hash_max_pending:
+        pin_hash_stats.rejected += 1
+        raise PinHasherBusy()
+    executor, slots = _pool()
+    pin_hash_stats.pending += 1
+    enqueued = time.perf_counter()
+    try:
+        async with slots:
+            started = time.perf_counter()
+            waited = started - enqueued
+            pin_hash_stats.calls += 1
+            pin_hash_stats.queue_seconds_total += waited
+            pin_hash_stats.queue_seconds_max = max(pin_hash_stats.queue_seconds_max, waited)
+            if waited > _SLOW_QUEUE_SECONDS:
+                logger.warning("PIN hashing queue wait %.2fs (pending=%d)", waited, pin_hash_stats.pending)
+            result = await asyncio.get_running_loop().run_in_executor(executor, fn, *args)
+            pin_hash_stats.run_seconds_total += time.perf_counter() - started
+            return result
+    finally:
+        pin_hash_stats.pending -= 1
+
+
+async def hash_pin_async(pin: str) -> str:
+    return await _run_hashing(hash_pin, pin)
+
+
+async def verify_pin_async(pin: str, secret_hash: str) -> bool:
+    return await _run_hashing(verify_pin, pin, secret_hash)
+
+
+async def dummy_verify_async() -> None:
+    await _run_hashing(dummy_verify)
+
+
+def shutdown_pin_hasher() -> None:
+    global _executor, _slots
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+    _executor = None
+    _slots = None
@@ -8,11 +8,25 @@
   ``chat_files/<chat_id>/<name>``, ``avatars/<name>``, ``<family_id>/<name>``.
 Публичный URL остаётся ``/static/uploads/<key>`` и проходит те же проверки
 доступа в routers/uploads.py.
+
+Каждое сохранение/удаление сообщается учёту объёма (``set_usage_recorder``;
+подключает services/storage_usage.py) — объём загрузок известен без обхода
+файлов. Перезапись существующего ключа учитывается разницей размеров.
+Обработчики запросов пишут и удаляют файлы через services/storage_quota.py —
+там же учёт по семьям/пользователям и проверка квот.
+
+``delete_prefix`` удаляет всё под префиксом (``<family_id>/``,
+``chat_files/<chat_id>/``), ``delete_urls`` — список файлов пачкой (одним
+клиентом S3 и DeleteObjects, локально — в пуле потоков). Их вызывают фоновые
+задачи очистки (services/storage_cleanup.py), а не обработчики запросов.
 """
 
 from __future__ import annotations
 
+import asyncio
 import logging
+import shutil
+from collections.abc import Awaitable, Callable
 from pathlib import Path
 from typing import AsyncIterator
 
@@ -25,6 +39,43 @@ from app.core.uploads import (
 
 logger = logging.getLogger(__name__)
 
+# Колбэк прогресса delete_prefix: сколько объектов уже удалено.
+ProgressCallback = Callable[[int], Awaitable[None]]
+# Предел DeleteObjects в S3 API.
+_S3_DELETE_BATCH = 1000
+# Параллельных HEAD при удалении пачкой (размер неизвестен) в S3.
+_S3_HEAD_CONCURRENCY = 16
+# Файлов на один поток при локальном удалении пачкой.
+_LOCAL_DELETE_CHUNK = 64
+# Файл к удалению пачкой: URL и размер, если он известен (реестр storage_objects).
+DeleteItem = tuple[str, int | None]
+# Итог scan_usage: область → (байт, объектов).
+UsageByArea = dict[str, tuple[int, int]]
+# Ключ → область учёта (services/storage_usage.usage_area).
+AreaOf = Callable[[str], str]
+# Учёт объёма: (ключ, Δбайт, Δобъектов).
+UsageRecorder = Callable[[str, int, int], None]
+
+_usage_recorder: UsageRecorder | None = None
+
+
+def set_usage_recorder(recorder: UsageRecorder | None) -> None:
+    """Подключить учёт объёма. Ядро не знает о сервисах — учёт
+    регистрирует себя сам (services/storage_usage.py)."""
+    global _usage_recorder
+    _usage_recorder = recorder
+
+
+def _record_usage(key: str, bytes_delta: int, objects_delta: int) -> None:
+    if _usage_recorder is not None:
+        _usage_recorder(key, bytes_delta, objects_delta)
+
+
+def _add_usage(usage: UsageByArea, area_of: AreaOf, key: str, size: int) -> None:
+    area = area_of(key)
+    b, n = usage.get(area, (0, 0))
+    usage[area] = (b + size, n + 1)
+
 
 def url_to_key(stored_url: str) -> str | None:
     """`/static/uploads/<key>` → `<key>` с защитой от traversal."""
@@ -36,6 +87,16 @@ def url_to_key(stored_url: str) -> str | None:
     return rel
 
 
+def _normalize_prefix(prefix: str) -> str:
+    """``a/b`` или ``a/b/`` → ``a/b/``. Пустой префикс (= всё хранилище) запрещён."""
+    if not isinstance(prefix, str):
+        raise ValueError("Invalid storage prefix")
+    rel = prefix.strip("/")
+    if not rel or "\\" in rel or any(part in ("", ".", "..") for part in rel.split("/")):
+        raise ValueError("Invalid storage prefix")
+    return rel + "/"
+
+
 class LocalStorage:
     """Запись/чтение с локального диска под upload-root."""
 
@@ -66,18 +127,57 @@ class LocalStorage:
     async def save(self, key: str, data: bytes, content_type: str | None = None) -> None:
         dest = self._safe_dest_for_key(key)
         dest.parent.mkdir(parents=True, exist_ok=True)
+        try:
+            previous = dest.stat().st_size
+        except OSError:
+            previous = None
         dest.write_bytes(data)
+        if previous is None:
+            _record_usage(key, len(data), 1)
+        else:
+            _record_usage(key, len(data) - previous, 0)
 
     def local_path_for_url(self, stored_url: str) -> Path | None:
         return resolve_upload_path(stored_url)
 
-    async def delete_by_url(self, stored_url: str) -> None:
+    async def delete_by_url(self, stored_url: str, size: int | None = None) -> None:
+        """Удалить файл. Размер для учёта берётся с диска, `size` не нужен."""
         p = resolve_upload_path(stored_url)
         if p:
             try:
-                p.unlink(missing_ok=True)
+                size = p.stat().st_size
+                p.unlink()
             except OSError:
-                pass
+                return
+            _record_usage(url_to_key(stored_url) or "", -size, -1)
+
+    async def delete_urls(self, items: list[DeleteItem]) -> int:
+        """Удалить файлы пачкой: stat+unlink кусками по потокам пула.
+        Размер берётся с диска — переданный не нужен. → сколько удалено."""
+        paths = [(url_to_key(url), resolve_upload_path(url)) for url, _ in items]
+        paths = [(key, p) for key, p in paths if key and p]
+        chunks = [
+            paths[i : i + _LOCAL_DELETE_CHUNK] for i in range(0, len(paths), _LOCAL_DELETE_CHUNK)
+        ]
+        results = await asyncio.gather(*(asyncio.to_thread(self._unlink_many, c) for c in chunks))
+        deleted = 0
+        for removed in results:
+            for key, size in removed:
+                _record_usage(key, -size, -1)
+            deleted += len(removed)
+        return deleted
+
+    @staticmethod
+    def _unlink_many(paths: list[tuple[str, Path]]) -> list[tuple[str, int]]:
+        removed: list[tuple[str, int]] = []
+        for key, p in paths:
+            try:
+                size = p.stat().st_size
+                p.unlink()
+            except OSError:
+                continue  # уже удалён
+            removed.append((key, size))
+        return removed
 
     async def open_stream_for_url(
         self, stored_url: str
@@ -89,6 +189,48 @@ class LocalStorage:
         p = resolve_upload_path(stored_url)
         return bool(p and p.is_file())
 
+    async def read_by_url(self, stored_url: str) -> bytes | None:
+        p = resolve_upload_path(stored_url)
+        if not p:
+            return None
+        try:
+            return await asyncio.to_thread(p.read_bytes)
+        except OSError:
+            return None
+
+    async def delete_prefix(
+        self, prefix: str, on_progress: ProgressCallback | None = None
+    ) -> int:
+        prefix = _normalize_prefix(prefix)
+        root = self._safe_dest_for_key(prefix.rstrip("/"))
+        deleted, size = await asyncio.to_thread(self._delete_tree, root)
+        _record_usage(prefix, -size, -deleted)
+        if on_progress and deleted:
+            await on_progress(deleted)
+        return deleted
+
+    @staticmethod
+    def _delete_tree(root: Path) -> tuple[int, int]:
+        if not root.is_dir():
+            return 0, 0
+        files = [p for p in root.rglob("*") if p.is_file()]
+        size = sum(p.stat().st_size for p in files)
+        shutil.rmtree(root, ignore_errors=True)
+        return len(files), size
+
+    async def scan_usage(self, area_of: AreaOf) -> UsageByArea:
+        """Полный обход upload-root — только для фонового пересчёта."""
+        return await asyncio.to_thread(self._scan_tree, get_upload_root().resolve(), area_of)
+
+    @staticmethod
+    def _scan_tree(root: Path, area_of: AreaOf) -> UsageByArea:
+        usage: UsageByArea = {}
+        if root.is_dir():
+            for p in root.rglob("*"):
+                if p.is_file():
+                    _add_usage(usage, area_of, p.relative_to(root).as_posix(), p.stat().st_size)
+        return usage
+
 
 class S3Storage:
     """S3-совместимое хранилище (boto3/aioboto3)."""
@@ -116,16 +258,39 @@ class S3Storage:
         )
 
     async def save(self, key: str, data: bytes, content_type: str | None = None) -> None:
+        """Новый ключ пишется условным PUT (If-None-Match: *) — без HEAD.
+        Ключ уже есть (повтор превью, тело блоба ждало сборщика) → узнаём
+        прежний размер и перезаписываем: учёт получает разницу, а не +объект.
+        Хранилища без условной записи игнорируют заголовок — перезапись там
+        считается новым объектом до пересчёта."""
+        from botocore.exceptions import ClientError
+
         kwargs = {"Bucket": settings.s3_bucket, "Key": key, "Body": data}
         if content_type:
             kwargs["ContentType"] = content_type
         async with self._client() as s3:
+            try:
+                await s3.put_object(IfNoneMatch="*", **kwargs)
+            except ClientError as exc:
+                if exc.response.get("Error", {}).get("Code") not in (
+                    "PreconditionFailed",
+                    "ConditionalRequestConflict",
+                ):
+                    raise
+            else:
+                _record_usage(key, len(data), 1)
+                return
+            head = await s3.head_object(Bucket=settings.s3_bucket, Key=key)
             await s3.put_object(**kwargs)
+        _record_usage(key, len(data) - int(head.get("ContentLength", 0) or 0), 0)
 
     def local_path_for_url(self, stored_url: str) -> Path | None:
         return None  # нет локального пути — отдаётся стримом
 
-    async def delete_by_url(self, stored_url: str) -> None:
+    async def delete_by_url(self, stored_url: str, size: int | None = None) -> None:
+        """Удалить объект одним DeleteObject. `size` — размер из реестра для
+        учёта объёма; без него списывается только объект (байты поправит
+        пересчёт ``storage.recount_usage``)."""
         key = url_to_key(stored_url)
         if not key:
             return
@@ -134,6 +299,56 @@ class S3Storage:
                 await s3.delete_object(Bucket=settings.s3_bucket, Key=key)
         except Exception:  # noqa: BLE001
             logger.exception("S3 delete failed for %s", key)
+            return
+        _record_usage(key, -(size or 0), -1)
+
+    async def delete_urls(self, items: list[DeleteItem]) -> int:
+        """Удалить файлы пачками DeleteObjects (до 1000 ключей) одним клиентом.
+
+        Для ключей без известного размера размер (и само существование)
+        узнаётся параллельными HEAD — отсутствующие пропускаются. Ошибки по
+        отдельным ключам пробрасываются после учёта удалённых. → сколько удалено."""
+        sizes: dict[str, int | None] = {}
+        for url, size in items:
+            key = url_to_key(url)
+            if key:
+                sizes[key] = size
+        if not sizes:
+            return 0
+        deleted = 0
+        async with self._client() as s3:
+            unknown = [key for key, size in sizes.items() if size is None]
+            if unknown:
+                slots = asyncio.Semaphore(_S3_HEAD_CONCURRENCY)
+
+                async def _head(key: str) -> None:
+                    async with slots:
+                        try:
+                            head = await s3.head_object(Bucket=settings.s3_bucket, Key=key)
+                        except Exception:  # noqa: BLE001
+                            del sizes[key]  # объекта нет — удалять и учитывать нечего
+                            return
+                    sizes[key] = int(head.get("ContentLength", 0) or 0)
+
+                await asyncio.gather(*(_head(key) for key in unknown))
+            keys = list(sizes)
+            for i in range(0, len(keys), _S3_DELETE_BATCH):
+                batch = keys[i : i + _S3_DELETE_BATCH]
+                resp = await s3.delete_objects(
+                    Bucket=settings.s3_bucket,
+                    Delete={"Objects": [{"Key": key} for key in batch], "Quiet": True},
+                )
+                errors = resp.get("Errors") or []
+                failed = {e.get("Key") for e in errors}
+                for key in batch:
+                    if key not in failed:
+                        _record_usage(key, -(sizes[key] or 0), -1)
+                deleted += len(batch) - len(failed)
+                if errors:
+                    raise RuntimeError(
+                        f"S3 delete failed for {len(errors)} key(s): {errors[0].get('Code')}"
+                    )
+        return deleted
 
     async def open_stream_for_url(
         self, stored_url: str
@@ -172,6 +387,60 @@ class S3Storage:
         except Exception:  # noqa: BLE001
             return False
 
+    async def read_by_url(self, stored_url: str) -> bytes | None:
+        key = url_to_key(stored_url)
+        if not key:
+            return None
+        try:
+            async with self._client() as s3:
+                obj = await s3.get_object(Bucket=settings.s3_bucket, Key=key)
+                return await obj["Body"].read()
+        except Exception:  # noqa: BLE001
+            return None
+
+    async def delete_prefix(
+        self, prefix: str, on_progress: ProgressCallback | None = None
+    ) -> int:
+        """Постранично перечислить ключи под префиксом и удалить пачками
+        DeleteObjects (до 1000 ключей за вызов). Ошибки по отдельным ключам
+        пробрасываются — задача очистки перезапустится и доудалит остаток."""
+        prefix = _normalize_prefix(prefix)
+        deleted = 0
+        async with self._client() as s3:
+            paginator = s3.get_paginator("list_objects_v2")
+            async for page in paginator.paginate(Bucket=settings.s3_bucket, Prefix=prefix):
+                contents = page.get("Contents") or []
+                for i in range(0, len(contents), _S3_DELETE_BATCH):
+                    chunk = contents[i : i + _S3_DELETE_BATCH]
+                    batch = [{"Key": obj["Key"]} for obj in chunk]
+                    resp = await s3.delete_objects(
+                        Bucket=settings.s3_bucket,
+                        Delete={"Objects": batch, "Quiet": True},
+                    )
+                    errors = resp.get("Errors") or []
+                    if errors:
+                        raise RuntimeError(
+                            f"S3 delete failed for {len(errors)} key(s) under {prefix}: "
+                            f"{errors[0].get('Code')}"
+                        )
+                    deleted += len(batch)
+                    _record_usage(
+                        prefix, -sum(int(obj.get("Size", 0) or 0) for obj in chunk), -len(batch)
+                    )
+                    if on_progress:
+                        await on_progress(deleted)
+        return deleted
+
+    async def scan_usage(self, area_of: AreaOf) -> UsageByArea:
+        """Листинг всего бакета — только для фонового пересчёта."""
+        usage: UsageByArea = {}
+        async with self._client() as s3:
+            paginator = s3.get_paginator("list_objects_v2")
+            async for page in paginator.paginate(Bucket=settings.s3_bucket):
+                for obj in page.get("Contents") or []:
+                    _add_usage(usage, area_of, obj["Key"], int(obj.get("Size", 0) or 0))
+        return usage
+
 
 def _build_storage():
     if settings.storage_backend == "s3":
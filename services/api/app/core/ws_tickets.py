@@ -1,9 +1,15 @@
+import logging
 import secrets
 import time
 from asyncio import Lock
 from uuid import UUID
 
+from app.core import redis_client
+
+logger = logging.getLogger(__name__)
+
 TICKET_TTL_SECONDS = 60
+_REDIS_PREFIX = "ws:ticket:"
 
 
 class WsTicketStore:
@@ -11,27 +17,54 @@ class WsTicketStore:
 
     Issued by an authenticated REST call, consumed once at WS handshake.
     Keeps the long-lived JWT out of URLs (logs, history, Referer).
-    Single-process; for multi-instance use Redis.
+
+    With `REDIS_URL` tickets live in Redis (SET EX + atomic GETDEL), so a
+    ticket issued on one replica can be consumed on another and expiry is
+    handled by Redis TTLs. Without Redis — per-process dict.
     """
 
     def __init__(self) -> None:
+        # Insertion order == expiry order (TTL is constant), so GC only has to
+        # look at the head of the dict instead of scanning every ticket.
         self._tickets: dict[str, tuple[UUID, float]] = {}
         self._lock = Lock()
 
     def _gc_locked(self, now: float) -> None:
-        expired = [k for k, (_, exp) in self._tickets.items() if exp <= now]
-        for k in expired:
-            del self._tickets[k]
+        while self._tickets:
+            ticket, (_, exp) = next(iter(self._tickets.items()))
+            if exp > now:
+                break
+            del self._tickets[ticket]
 
     async def issue(self, user_id: UUID) -> tuple[str, int]:
+        ticket = secrets.token_urlsafe(32)
+        r = await redis_client.get_redis()
+        if r is not None:
+            try:
+                await r.set(_REDIS_PREFIX + ticket, str(user_id), ex=TICKET_TTL_SECONDS)
+                return ticket, TICKET_TTL_SECONDS
+            except Exception:  # noqa: BLE001
+                logger.exception("ws ticket issue failed in redis; using local store")
         async with self._lock:
             now = time.monotonic()
             self._gc_locked(now)
-            ticket = secrets.token_urlsafe(32)
             self._tickets[ticket] = (user_id, now + TICKET_TTL_SECONDS)
             return ticket, TICKET_TTL_SECONDS
 
     async def consume(self, ticket: str) -> UUID | None:
+        r = await redis_client.get_redis()
+        if r is not None:
+            try:
+                raw = await r.getdel(_REDIS_PREFIX + ticket)
+            except Exception:  # noqa: BLE001
+                logger.exception("ws ticket consume failed in redis; using local store")
+            else:
+                if raw:
+                    try:
+                        return UUID(raw)
+                    except ValueError:
+                        return None
+                # Not in Redis: may have been issued locally during a Redis outage.
         async with self._lock:
             now = time.monotonic()
             self._gc_locked(now)
@@ -1,15 +1,19 @@
 import logging
 
-from fastapi import FastAPI
+from fastapi import FastAPI, Request, status
+from fastapi.responses import JSONResponse
 from fastapi.middleware.cors import CORSMiddleware
 from sqlalchemy import select, update, func
 
 from app.core.config import settings
+from app.core.rate_limit import preload_scripts
+from app.core.security import PinHasherBusy, shutdown_pin_hasher
 from app.core.redis_client import close_redis
 from app.core.uploads import get_upload_root
 from app.db.session import AsyncSessionLocal
 from app.models.user import User
 from app.ws.manager import ws_manager
+from app.ws.presence import presence_tracker
 from app.routers.auth import router as auth_router
 from app.routers.budget import family_router as budget_family_router, tx_router as budget_tx_router
 from app.routers.calendar import router as calendar_router
@@ -19,6 +23,7 @@ from app.routers.chats import bot_router as bot_action_router
 from app.routers.channels import bot_router as bot_channels_router
 from app.routers.bots import router as bots_router
 from app.routers.bot_gateway import router as bot_gateway_router
+from app.routers.bot_events import router as bot_events_router
 from app.routers.presets import router as presets_router
 from app.routers.e2ee import router as e2ee_router
 from app.routers.expenses import router as expenses_router
@@ -36,6 +41,7 @@ from app.routers.family_tree import (
     relation_router as family_tree_relation_router,
 )
 from app.routers.gallery import router as gallery_router
+from app.routers.gateway import router as gateway_router
 from app.routers.invites import router as invites_router
 from app.routers.me import router as me_router
 from app.routers.notes import family_router as notes_family_router, note_router as notes_note_router
@@ -56,6 +62,25 @@ from app.services.capsule_dispatcher import (
     start_capsule_scheduler,
     stop_capsule_scheduler,
 )
+from app.services.balance_ledger import (
+    start_balance_reconciler,
+    stop_balance_reconciler,
+)
+from app.services.audit_partitions import (
+    start_audit_partition_maintenance,
+    stop_audit_partition_maintenance,
+)
+from app.services.bot_events import (
+    broadcast_recorder,
+    start_bot_event_pruner,
+    stop_bot_event_pruner,
+)
+from app.services.chat_changes import start_chat_change_pruner, stop_chat_change_pruner
+from app.services.jobs import start_job_worker, stop_job_worker
+from app.services.previews import shutdown_preview_pool
+from app.services.platform_stats import start_stats_scheduler, stop_stats_scheduler
+from app.services.storage_cleanup import ensure_storage_usage_seeded
+from app.services.storage_usage import start_storage_usage_flusher, stop_storage_usage_flusher
 from app.services.preset_dispatcher import (
     start_preset_scheduler,
     stop_preset_scheduler,
@@ -218,6 +243,16 @@ def create_app() -> FastAPI:
             )
         return response
 
+    @app_.exception_handler(PinHasherBusy)
+    async def pin_hasher_busy(_request: Request, _exc: PinHasherBusy):
+        # Очередь PBKDF2 переполнена (шторм логинов) — просим повторить, а не
+        # копим бесконечный backlog, замораживающий воркер.
+        return JSONResponse(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            content={"detail": "Сервер перегружен, повторите попытку"},
+            headers={"Retry-After": "1"},
+        )
+
     app_.include_router(uploads_router)
     app_.include_router(auth_router)
     app_.include_router(invites_router)
@@ -236,6 +271,8 @@ def create_app() -> FastAPI:
     app_.include_router(channels_router)
     app_.include_router(bot_channels_router)
     app_.include_router(bot_gateway_router)
+    app_.include_router(bot_events_router)
+    app_.include_router(gateway_router)
     app_.include_router(presets_router)
     app_.include_router(gallery_router)
     app_.include_router(calendar_router)
@@ -267,12 +304,28 @@ def create_app() -> FastAPI:
             await db.commit()
         # Подписка на Redis fan-out (no-op, если REDIS_URL не задан).
         await ws_manager.start()
+        if settings.bot_event_log_enabled:
+            ws_manager.set_event_recorder(broadcast_recorder)
+        await presence_tracker.start()
+        # Пустой storage_usage заполняет пересчёт — до первых дельт.
+        await ensure_storage_usage_seeded()
+        await start_storage_usage_flusher()
+        try:
+            await preload_scripts()
+        except Exception as exc:  # noqa: BLE001
+            logger.warning("Rate-limit Lua preload failed (non-fatal): %s", exc)
         # Планировщики можно отключить на web-инстансах (отдельный worker).
         if settings.scheduler_enabled:
             await start_reminder_scheduler()
             await start_calendar_reminder_scheduler()
             await start_capsule_scheduler()
             await start_preset_scheduler()
+            await start_balance_reconciler()
+            await start_job_worker()
+            await start_stats_scheduler()
+            await start_bot_event_pruner()
+            await start_chat_change_pruner()
+            await start_audit_partition_maintenance()
 
     @app_.on_event("shutdown")
     async def on_shutdown() -> None:
@@ -280,8 +333,18 @@ def create_app() -> FastAPI:
         await stop_reminder_scheduler()
         await stop_capsule_scheduler()
         await stop_preset_scheduler()
+        await stop_balance_reconciler()
+        await stop_job_worker()
+        await stop_stats_scheduler()
+        await stop_bot_event_pruner()
+        await stop_chat_change_pruner()
+        await stop_audit_partition_maintenance()
+        await stop_storage_usage_flusher()
+        await presence_tracker.stop()
         await ws_manager.stop()
         await close_redis()
+        shutdown_pin_hasher()
+        shutdown_preview_pool()
 
     return app_
 
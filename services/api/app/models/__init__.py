@@ -1,7 +1,9 @@
+from .background_job import BackgroundJob
 from .budget_transaction import BudgetTransaction, BudgetTransactionSplit, BudgetTxType
 from .calendar_event import CalendarEvent
 from .channel import Channel
 from .chat import Chat
+from .chat_change import ChatChange
 from .e2ee import E2EEDevice, E2EEMailboxItem, E2EEOneTimePrekey
 from .expense import Expense, ExpenseSplit
 from .family import Family
@@ -14,6 +16,8 @@ from .family_tree import (
 from .gallery_item import GalleryItem, MediaType
 from .invite import Invite
 from .bot import Bot
+from .bot_event import BotEvent
+from .member_balance import MemberBalance
 from .membership import Membership, Role
 from .message import Message
 from .message_read import MessageRead
@@ -27,12 +31,16 @@ from .role import FamilyRole, MemberRole
 from .permission_override import ChannelPermissionOverride, ChatPermissionOverride
 from .audit_log import AuditLogEntry
 from .platform_audit_log import PlatformAuditLogEntry
+from .platform_stats import PlatformStatsSnapshot, StorageUsage
+from .storage_object import Blob, StorageOwnerUsage, StoredObject
 from .time_capsule import TimeCapsule, TimeCapsuleEntry
 from .family_moderation_settings import FamilyModerationSettings
 from .login_throttle import LoginThrottle
 from .user import User
 
 __all__ = [
+    "BackgroundJob",
+    "Blob",
     "BudgetTransaction",
     "BudgetTransactionSplit",
     "BudgetTxType",
@@ -40,10 +48,13 @@ __all__ = [
     "Family",
     "User",
     "Membership",
+    "MemberBalance",
     "Role",
     "Bot",
+    "BotEvent",
     "Invite",
     "Chat",
+    "ChatChange",
     "E2EEDevice",
     "E2EEMailboxItem",
     "E2EEOneTimePrekey",
@@ -71,6 +82,10 @@ __all__ = [
     "ChatPermissionOverride",
     "AuditLogEntry",
     "PlatformAuditLogEntry",
+    "PlatformStatsSnapshot",
+    "StorageOwnerUsage",
+    "StorageUsage",
+    "StoredObject",
     "TimeCapsule",
     "TimeCapsuleEntry",
     "FamilyModerationSettings",
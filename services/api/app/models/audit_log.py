@@ -6,7 +6,7 @@ import uuid
 from datetime import datetime
 from typing import TYPE_CHECKING
 
-from sqlalchemy import DateTime, ForeignKey, String, func
+from sqlalchemy import DDL, DateTime, ForeignKey, Index, String, event, func
 from sqlalchemy.dialects.postgresql import JSONB, UUID
 from sqlalchemy.orm import Mapped, mapped_column
 
@@ -23,9 +23,14 @@ class AuditLogEntry(Base):
     ``target_type`` / ``target_id`` — необязательный объект, к которому
     относится действие (``chat``, ``role``, ``member`` и т.д.).
     ``metadata_json`` — произвольная JSONB-полезная нагрузка для деталей UI.
+
+    Таблица секционирована по месяцам ``created_at`` (RANGE), поэтому
+    ``created_at`` входит в первичный ключ. Секции создаёт и удаляет по сроку
+    хранения app.services.audit_partitions.
     """
 
     __tablename__ = "audit_log"
+    __table_args__ = {"postgresql_partition_by": "RANGE (created_at)"}
 
     id: Mapped[uuid.UUID] = mapped_column(
         UUID(as_uuid=True), primary_key=True, default=uuid.uuid4
@@ -34,7 +39,6 @@ class AuditLogEntry(Base):
         UUID(as_uuid=True),
         ForeignKey("families.id", ondelete="CASCADE"),
         nullable=False,
-        index=True,
     )
     # Может быть NULL, если actor был удалён.
     actor_id: Mapped[uuid.UUID | None] = mapped_column(
@@ -53,6 +57,25 @@ class AuditLogEntry(Base):
     created_at: Mapped[datetime] = mapped_column(
         DateTime(timezone=True),
         server_default=func.now(),
-        nullable=False,
+        primary_key=True,
         index=True,
     )
+
+
+# Лента семьи и keyset-курсор (created_at, id) — одним индексом; он же
+# покрывает поиск по family_id (каскадное удаление семьи).
+Index(
+    "ix_audit_log_family_cursor",
+    AuditLogEntry.family_id,
+    AuditLogEntry.created_at.desc(),
+    AuditLogEntry.id.desc(),
+)
+
+# Секция по умолчанию для create_all (тесты, свежая БД без миграций): без неё
+# в секционированную таблицу нельзя вставить ни строки. Помесячные секции
+# в проде создаёт миграция 051 и планировщик.
+event.listen(
+    AuditLogEntry.__table__,
+    "after_create",
+    DDL("CREATE TABLE IF NOT EXISTS audit_log_default PARTITION OF audit_log DEFAULT"),
+)
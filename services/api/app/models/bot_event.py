@@ -0,0 +1,41 @@
+"""Журнал событий бота: то, что gateway доставил бы ему по WebSocket.
+
+Боты без постоянного сокета забирают события long-poll'ом
+(``GET /bot/events?after=seq``), а gateway после переподключения досылает
+пропущенное по ``last_seq``. ``seq`` — сквозной номер события У ЭТОГО бота:
+выдаётся счётчиком ``bots.event_seq`` под блокировкой строки бота, поэтому без
+дыр и в порядке коммита. Видимость (VIEW_CHANNEL) проверяется при чтении.
+"""
+
+import uuid
+from datetime import datetime
+
+from sqlalchemy import BigInteger, DateTime, ForeignKey, Index, func
+from sqlalchemy.dialects.postgresql import JSONB, UUID
+from sqlalchemy.orm import Mapped, mapped_column
+
+from app.db.base import Base
+
+
+class BotEvent(Base):
+    __tablename__ = "bot_events"
+    __table_args__ = (Index("ix_bot_events_created_at", "created_at"),)
+
+    bot_user_id: Mapped[uuid.UUID] = mapped_column(
+        UUID(as_uuid=True), ForeignKey("users.id", ondelete="CASCADE"), primary_key=True
+    )
+    seq: Mapped[int] = mapped_column(BigInteger, primary_key=True)
+    # Семья события (None — личное событие бота, например interaction).
+    family_id: Mapped[uuid.UUID | None] = mapped_column(
+        UUID(as_uuid=True), ForeignKey("families.id", ondelete="CASCADE"), nullable=True
+    )
+    # Чат события (None — событие уровня семьи). Без FK: удаление чата не
+    # должно стирать уже записанные события о нём.
+    chat_id: Mapped[uuid.UUID | None] = mapped_column(UUID(as_uuid=True), nullable=True)
+    payload: Mapped[dict] = mapped_column(JSONB, nullable=False)
+    created_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True), nullable=False, server_default=func.now()
+    )
+
+    def __repr__(self) -> str:
+        return f"<BotEvent bot={self.bot_user_id} seq={self.seq}>"
@@ -0,0 +1,41 @@
+"""Журнал изменений сообщений чата: новое, правка, удаление, реакции.
+
+``seq`` — монотонный номер изменения В ЭТОМ ЧАТЕ, выдаётся счётчиком
+``chats.change_seq`` в транзакции самого изменения (блокировка строки чата),
+поэтому без дыр и в порядке коммита. Переподключившийся клиент спрашивает
+``/changes?since=seq`` и получает дельту за пропущенное — по индексу (PK),
+а не перечитыванием истории. Старше CHAT_CHANGE_RETENTION_DAYS записи
+удаляются (индекс по ``created_at``).
+"""
+
+import uuid
+from datetime import datetime
+
+from sqlalchemy import BigInteger, DateTime, ForeignKey, String, func
+from sqlalchemy.dialects.postgresql import UUID
+from sqlalchemy.orm import Mapped, mapped_column
+
+from app.db.base import Base
+
+CHANGE_NEW = "new"
+CHANGE_EDIT = "edit"
+CHANGE_DELETE = "delete"
+CHANGE_REACTION = "reaction"
+
+
+class ChatChange(Base):
+    __tablename__ = "chat_changes"
+
+    chat_id: Mapped[uuid.UUID] = mapped_column(
+        UUID(as_uuid=True), ForeignKey("chats.id", ondelete="CASCADE"), primary_key=True
+    )
+    seq: Mapped[int] = mapped_column(BigInteger, primary_key=True)
+    # Без FK: запись об удалении переживает само сообщение.
+    message_id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), nullable=False)
+    kind: Mapped[str] = mapped_column(String(16), nullable=False)
+    created_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True), nullable=False, server_default=func.now(), index=True
+    )
+
+    def __repr__(self) -> str:
+        return f"<ChatChange chat={self.chat_id} seq={self.seq} {self.kind}>"
@@ -23,7 +23,9 @@ class FamilyModerationSettings(Base):
       * invite_max_active — макс. число одновременно активных приглашений (0 = без лимита);
       * slowmode_default_seconds — дефолтный медленный режим для новых чатов/каналов;
       * banned_words — список стоп-слов (регистронезависимо, по словам);
-      * max_message_length — доп. лимит длины сообщения поверх 4000 (0 = дефолт 4000).
+      * max_message_length — доп. лимит длины сообщения поверх 4000 (0 = дефолт 4000);
+      * audit_retention_days — срок хранения журнала аудита семьи, не дольше
+        платформенного AUDIT_RETENTION_DAYS (0 = платформенный).
     """
 
     __tablename__ = "family_moderation_settings"
@@ -45,6 +47,9 @@ class FamilyModerationSettings(Base):
     max_message_length: Mapped[int] = mapped_column(
         Integer, nullable=False, default=0, server_default="0"
     )
+    audit_retention_days: Mapped[int] = mapped_column(
+        Integer, nullable=False, default=0, server_default="0"
+    )
     created_at: Mapped[datetime] = mapped_column(
         DateTime(timezone=True), server_default=func.now(), nullable=False
     )
@@ -3,8 +3,8 @@ import uuid
 from datetime import datetime
 from typing import TYPE_CHECKING
 
-from sqlalchemy import BigInteger, DateTime, Enum, ForeignKey, String, Text, func
-from sqlalchemy.dialects.postgresql import UUID
+from sqlalchemy import BigInteger, DateTime, Enum, ForeignKey, Index, String, Text, func
+from sqlalchemy.dialects.postgresql import JSONB, UUID
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 
 from app.db.base import Base
@@ -22,6 +22,12 @@ class MediaType(str, enum.Enum):
 
 class GalleryItem(Base):
     __tablename__ = "gallery_items"
+    __table_args__ = (
+        # Лента галереи — keyset по (created_at, id) от новых к старым
+        # (обратный проход индекса); фильтр по типу — своим индексом.
+        Index("ix_gallery_family_created", "family_id", "created_at", "id"),
+        Index("ix_gallery_family_type_created", "family_id", "media_type", "created_at", "id"),
+    )
 
     id: Mapped[uuid.UUID] = mapped_column(
         UUID(as_uuid=True), primary_key=True, default=uuid.uuid4
@@ -41,6 +47,9 @@ class GalleryItem(Base):
     file_name: Mapped[str | None] = mapped_column(String(256), nullable=True)
     file_size: Mapped[int | None] = mapped_column(BigInteger, nullable=True)
     caption: Mapped[str | None] = mapped_column(Text, nullable=True)
+    # Превью картинки (services/previews.py): размеры оригинала, blurhash,
+    # цвет-заглушка и список построенных вариантов. NULL — ещё не готово.
+    preview: Mapped[dict | None] = mapped_column(JSONB, nullable=True)
     created_at: Mapped[datetime] = mapped_column(
         DateTime(timezone=True), server_default=func.now()
     )
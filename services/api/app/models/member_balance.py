@@ -0,0 +1,59 @@
+"""Инкрементальный леджер балансов участников семьи.
+
+Одна строка на (семья, пользователь). Обновляется в той же транзакции, что и
+создание/изменение/удаление записи бюджета или общего расхода (см.
+services/balance_ledger.py), так что /balances читает готовые суммы вместо
+пересчёта всей истории семьи.
+
+    budget_balance  — баланс по транзакциям бюджета со splits
+                      (+amount плательщику, −share каждому участнику доли);
+    expense_balance — то же по общим расходам (expenses).
+
+Источник правды — сами транзакции: фоновая сверка пересчитывает суммы с нуля
+и исправляет дрейф (например, после каскадов при удалении пользователя).
+"""
+
+from __future__ import annotations
+
+import uuid
+from datetime import datetime
+from decimal import Decimal
+
+from sqlalchemy import DateTime, ForeignKey, Numeric, func, text
+from sqlalchemy.dialects.postgresql import UUID
+from sqlalchemy.orm import Mapped, mapped_column
+
+from app.db.base import Base
+
+
+class MemberBalance(Base):
+    __tablename__ = "member_balances"
+
+    family_id: Mapped[uuid.UUID] = mapped_column(
+        UUID(as_uuid=True),
+        ForeignKey("families.id", ondelete="CASCADE"),
+        primary_key=True,
+    )
+    user_id: Mapped[uuid.UUID] = mapped_column(
+        UUID(as_uuid=True),
+        ForeignKey("users.id", ondelete="CASCADE"),
+        primary_key=True,
+    )
+    budget_balance: Mapped[Decimal] = mapped_column(
+        Numeric(14, 2), nullable=False, default=Decimal("0"), server_default=text("0")
+    )
+    expense_balance: Mapped[Decimal] = mapped_column(
+        Numeric(14, 2), nullable=False, default=Decimal("0"), server_default=text("0")
+    )
+    updated_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True),
+        server_default=func.now(),
+        onupdate=func.now(),
+        nullable=False,
+    )
+
+    def __repr__(self) -> str:
+        return (
+            f"<MemberBalance family={self.family_id} user={self.user_id} "
+            f"budget={self.budget_balance} expense={self.expense_balance}>"
+        )
@@ -9,7 +9,7 @@ from __future__ import annotations
 import uuid
 from datetime import datetime
 
-from sqlalchemy import DateTime, ForeignKey, String, func
+from sqlalchemy import DDL, DateTime, ForeignKey, String, event, func
 from sqlalchemy.dialects.postgresql import JSONB, UUID
 from sqlalchemy.orm import Mapped, mapped_column
 
@@ -22,9 +22,12 @@ class PlatformAuditLogEntry(Base):
     ``action`` — машинное имя события (например, ``user.banned``).
     ``target_type`` / ``target_id`` — объект действия (``user``, ``family`` и т.д.).
     ``metadata_json`` — произвольная JSONB-нагрузка (причина, срок и пр.).
+
+    Секционирована по месяцам ``created_at``, как и ``audit_log``.
     """
 
     __tablename__ = "platform_audit_log"
+    __table_args__ = {"postgresql_partition_by": "RANGE (created_at)"}
 
     id: Mapped[uuid.UUID] = mapped_column(
         UUID(as_uuid=True), primary_key=True, default=uuid.uuid4
@@ -44,6 +47,16 @@ class PlatformAuditLogEntry(Base):
     created_at: Mapped[datetime] = mapped_column(
         DateTime(timezone=True),
         server_default=func.now(),
-        nullable=False,
+        primary_key=True,
         index=True,
     )
+
+
+event.listen(
+    PlatformAuditLogEntry.__table__,
+    "after_create",
+    DDL(
+        "CREATE TABLE IF NOT EXISTS platform_audit_log_default "
+        "PARTITION OF platform_audit_log DEFAULT"
+    ),
+)
@@ -0,0 +1,63 @@
+"""Статистика платформы для /admin/stats без полного сканирования на запрос.
+
+``platform_stats_snapshots`` — периодические снимки счётчиков (services/
+platform_stats.py). Прирост за период — разница двух снимков, поэтому
+``COUNT(*)`` по messages больше не выполняется на каждый запрос админки.
+
+``storage_usage`` — объём загрузок по областям хранилища (``families``,
+``chat_files``, ``avatars``). Обновляется на сохранении/удалении файла
+(core/storage.py) атомарным ``bytes = bytes + delta`` — обход upload-root
+через rglob больше не нужен.
+"""
+
+from __future__ import annotations
+
+import uuid
+from datetime import datetime
+
+from sqlalchemy import BigInteger, DateTime, String, func
+from sqlalchemy.dialects.postgresql import UUID
+from sqlalchemy.orm import Mapped, mapped_column
+
+from app.db.base import Base
+
+
+class PlatformStatsSnapshot(Base):
+    __tablename__ = "platform_stats_snapshots"
+
+    id: Mapped[uuid.UUID] = mapped_column(
+        UUID(as_uuid=True), primary_key=True, default=uuid.uuid4
+    )
+    taken_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True), server_default=func.now(), nullable=False, index=True
+    )
+    users: Mapped[int] = mapped_column(BigInteger, nullable=False)
+    families: Mapped[int] = mapped_column(BigInteger, nullable=False)
+    messages: Mapped[int] = mapped_column(BigInteger, nullable=False)
+    banned_users: Mapped[int] = mapped_column(BigInteger, nullable=False)
+    uploads_bytes: Mapped[int] = mapped_column(BigInteger, nullable=False)
+    uploads_objects: Mapped[int] = mapped_column(BigInteger, nullable=False)
+
+    def __repr__(self) -> str:
+        return f"<PlatformStatsSnapshot {self.taken_at} users={self.users} messages={self.messages}>"
+
+
+class StorageUsage(Base):
+    __tablename__ = "storage_usage"
+
+    area: Mapped[str] = mapped_column(String(32), primary_key=True)
+    bytes: Mapped[int] = mapped_column(
+        BigInteger, nullable=False, default=0, server_default="0"
+    )
+    objects: Mapped[int] = mapped_column(
+        BigInteger, nullable=False, default=0, server_default="0"
+    )
+    updated_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True),
+        server_default=func.now(),
+        onupdate=func.now(),
+        nullable=False,
+    )
+
+    def __repr__(self) -> str:
+        return f"<StorageUsage {self.area} bytes={self.bytes} objects={self.objects}>"
@@ -6,9 +6,11 @@ from sqlalchemy import (
     Boolean,
     DateTime,
     ForeignKey,
+    Index,
     String,
     UniqueConstraint,
     func,
+    text,
 )
 from sqlalchemy.dialects.postgresql import JSONB, UUID
 from sqlalchemy.orm import Mapped, mapped_column, relationship
@@ -31,6 +33,12 @@ class PresetBot(Base):
     __tablename__ = "preset_bots"
     __table_args__ = (
         UniqueConstraint("family_id", "preset_key", name="uq_family_preset"),
+        # Выборка шедулера: только активные пресеты, по времени срабатывания.
+        Index(
+            "ix_preset_bots_due",
+            "next_run_at",
+            postgresql_where=text("enabled AND target_chat_id IS NOT NULL"),
+        ),
     )
 
     id: Mapped[uuid.UUID] = mapped_column(
@@ -66,6 +74,11 @@ class PresetBot(Base):
     last_run_at: Mapped[datetime | None] = mapped_column(
         DateTime(timezone=True), nullable=True
     )
+    # Когда отработать в следующий раз (services/preset_bots.next_run_at).
+    # Пересчитывается при каждом изменении настроек и после каждого прогона.
+    next_run_at: Mapped[datetime | None] = mapped_column(
+        DateTime(timezone=True), nullable=True
+    )
     created_at: Mapped[datetime] = mapped_column(
         DateTime(timezone=True), server_default=func.now()
     )
@@ -0,0 +1,101 @@
+"""Учёт хранилища по владельцам: реестр файлов и счётчики для квот.
+
+``storage_objects`` — по строке на загруженный файл: ключ в хранилище, семья,
+загрузивший и размер. Удаление файла списывает байты тем же владельцам без
+stat/HEAD, а удаление семьи снимает доли участников одним GROUP BY.
+
+``blobs`` — контентно-адресуемые файлы (``STORAGE_DEDUP_ENABLED``): одно
+физическое тело на sha256, ``refcount`` — сколько записей storage_objects на
+него ссылается (``blob_hash``). Публичный URL и ключ в storage_objects
+остаются прежними (``chat_files/<chat>/<uuid>.png``), поэтому проверки доступа
+в routers/uploads.py не меняются; тело лежит под ``blobs/``.
+
+``storage_owner_usage`` — счётчики байт/объектов на семью (``family``) и на
+пользователя (``user``); по ним проверяются квоты (services/storage_quota.py).
+Обновляются в транзакции запроса вместе со строкой, ссылающейся на файл.
+"""
+
+from __future__ import annotations
+
+import uuid
+from datetime import datetime
+
+from sqlalchemy import BigInteger, DateTime, ForeignKey, Index, Integer, String, func, text
+from sqlalchemy.dialects.postgresql import UUID
+from sqlalchemy.orm import Mapped, mapped_column
+
+from app.db.base import Base
+
+OWNER_FAMILY = "family"
+OWNER_USER = "user"
+
+
+class Blob(Base):
+    __tablename__ = "blobs"
+    __table_args__ = (
+        # Сборщик мусора ищет только тела без ссылок — их единицы.
+        Index("ix_blobs_unreferenced", "hash", postgresql_where=text("refcount <= 0")),
+    )
+
+    hash: Mapped[str] = mapped_column(String(64), primary_key=True)
+    size: Mapped[int] = mapped_column(BigInteger, nullable=False)
+    refcount: Mapped[int] = mapped_column(
+        Integer, nullable=False, default=0, server_default="0"
+    )
+    created_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True), server_default=func.now(), nullable=False
+    )
+
+    def __repr__(self) -> str:
+        return f"<Blob {self.hash[:12]} refs={self.refcount}>"
+
+
+class StoredObject(Base):
+    __tablename__ = "storage_objects"
+
+    key: Mapped[str] = mapped_column(String(1024), primary_key=True)
+    family_id: Mapped[uuid.UUID | None] = mapped_column(
+        UUID(as_uuid=True),
+        ForeignKey("families.id", ondelete="CASCADE"),
+        nullable=True,
+        index=True,
+    )
+    user_id: Mapped[uuid.UUID | None] = mapped_column(
+        UUID(as_uuid=True),
+        ForeignKey("users.id", ondelete="SET NULL"),
+        nullable=True,
+        index=True,
+    )
+    size: Mapped[int] = mapped_column(BigInteger, nullable=False)
+    # NULL — файл лежит по собственному ключу (без дедупликации).
+    blob_hash: Mapped[str | None] = mapped_column(
+        String(64), ForeignKey("blobs.hash"), nullable=True, index=True
+    )
+    created_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True), server_default=func.now(), nullable=False
+    )
+
+    def __repr__(self) -> str:
+        return f"<StoredObject {self.key} size={self.size}>"
+
+
+class StorageOwnerUsage(Base):
+    __tablename__ = "storage_owner_usage"
+
+    owner_type: Mapped[str] = mapped_column(String(8), primary_key=True)
+    owner_id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), primary_key=True)
+    bytes: Mapped[int] = mapped_column(
+        BigInteger, nullable=False, default=0, server_default="0"
+    )
+    objects: Mapped[int] = mapped_column(
+        BigInteger, nullable=False, default=0, server_default="0"
+    )
+    updated_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True),
+        server_default=func.now(),
+        onupdate=func.now(),
+        nullable=False,
+    )
+
+    def __repr__(self) -> str:
+        return f"<StorageOwnerUsage {self.owner_type}:{self.owner_id} bytes={self.bytes}>"
@@ -2,7 +2,19 @@ import uuid
 from datetime import date, datetime
 from typing import TYPE_CHECKING
 
-from sqlalchemy import Boolean, Date, DateTime, ForeignKey, String, Text, func, text
+from sqlalchemy import (
+    Boolean,
+    Computed,
+    Date,
+    DateTime,
+    ForeignKey,
+    Index,
+    SmallInteger,
+    String,
+    Text,
+    func,
+    text,
+)
 from sqlalchemy.dialects.postgresql import UUID
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 
@@ -14,6 +26,15 @@ if TYPE_CHECKING:
 
 class User(Base):
     __tablename__ = "users"
+    __table_args__ = (
+        # «У кого сегодня день рождения» (пресет birthday) — по месяцу-дню,
+        # без скана всех участников семьи.
+        Index(
+            "ix_users_birthday_md",
+            "birthday_md",
+            postgresql_where=text("birthday IS NOT NULL AND NOT is_bot"),
+        ),
+    )
 
     id: Mapped[uuid.UUID] = mapped_column(
         UUID(as_uuid=True), primary_key=True, default=uuid.uuid4
@@ -24,6 +45,15 @@ class User(Base):
     avatar_url: Mapped[str | None] = mapped_column(String(1024), nullable=True)
     bio: Mapped[str | None] = mapped_column(Text, nullable=True)
     birthday: Mapped[date | None] = mapped_column(Date, nullable=True)
+    # Месяц и день рождения как MMDD (0229, 1231) — вычисляется БД.
+    birthday_md: Mapped[int | None] = mapped_column(
+        SmallInteger,
+        Computed(
+            "(EXTRACT(MONTH FROM birthday) * 100 + EXTRACT(DAY FROM birthday))::smallint",
+            persisted=True,
+        ),
+        nullable=True,
+    )
     is_online: Mapped[bool] = mapped_column(
         Boolean, nullable=False, default=False, server_default=text("false")
     )
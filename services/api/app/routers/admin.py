@@ -7,6 +7,7 @@ Read-only обзор (пользователи, семьи, статистика
 from __future__ import annotations
 
 import uuid
+from dataclasses import asdict
 from datetime import datetime, timedelta, timezone
 
 from fastapi import APIRouter, Depends, HTTPException, Query, status
@@ -14,18 +15,23 @@ from sqlalchemy import func, select
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.auth.deps import require_developer
-from app.core.uploads import get_upload_root
+from app.core.security import pin_hash_stats
+from app.core.config import settings
 from app.db.deps import get_db
+from app.models.background_job import JOB_FAILED, JOB_QUEUED, BackgroundJob
 from app.models.family import Family
 from app.models.membership import Membership
-from app.models.message import Message
 from app.models.platform_audit_log import PlatformAuditLogEntry
 from app.models.user import User
 from app.schemas.admin import (
     AdminAuditRow,
+    AdminBalanceDrift,
+    AdminBalanceReconcileReport,
     AdminFamilyDetail,
     AdminFamilyMember,
     AdminFamilyRow,
+    AdminJobRow,
+    AdminPinHashStats,
     AdminStats,
     AdminUserDetail,
     AdminUserFamily,
@@ -33,6 +39,12 @@ from app.schemas.admin import (
     BanRequest,
 )
 from app.services.audit import log_platform_action
+from app.services.audit_partitions import retention_cutoff
+from app.services.balance_ledger import reconcile_balances
+from app.services.jobs import wake_job_worker
+from app.services.platform_stats import baseline_snapshot, latest_snapshot, take_snapshot
+from app.services.storage_cleanup import enqueue_storage_recount
+from app.services.storage_usage import flush_storage_usage
 from app.ws.manager import ws_manager
 
 router = APIRouter(prefix="/admin", tags=["admin"], dependencies=[Depends(require_developer)])
@@ -117,63 +129,166 @@ async def list_families(
     ]
 
 
-@router.get("/stats", response_model=AdminStats)
-async def get_stats(db: AsyncSession = Depends(get_db)):
-    users = await db.scalar(select(func.count(User.id))) or 0
-    families = await db.scalar(select(func.count(Family.id))) or 0
-    messages = await db.scalar(select(func.count(Message.id))) or 0
-    banned = await db.scalar(
-        select(func.count(User.id)).where(User.is_banned == True)
-    ) or 0
-
-    uploads_bytes = 0
-    root = get_upload_root()
-    try:
-        for p in root.rglob("*"):
-            if p.is_file():
-                uploads_bytes += p.stat().st_size
-    except Exception:  # noqa: BLE001
-        uploads_bytes = -1  # каталог недоступен (например, S3-бэкенд)
-
-    # Прирост за последние 7 дней (по дате создания записи).
-    week_ago = datetime.now(timezone.utc) - timedelta(days=7)
-    users_delta = await db.scalar(
-        select(func.count(User.id)).where(User.created_at >= week_ago)
-    ) or 0
-    families_delta = await db.scalar(
-        select(func.count(Family.id)).where(Family.created_at >= week_ago)
-    ) or 0
-    messages_delta = await db.scalar(
-        select(func.count(Message.id)).where(Message.created_at >= week_ago)
-    ) or 0
+# Снимок старше этого считается устаревшим и пересобирается на запросе
+# (фоновые снимки выключены или планировщик на этом инстансе не запущен).
+_STATS_MAX_AGE = timedelta(minutes=30)
+
 
+@router.get("/stats", response_model=AdminStats)
+async def get_stats(
+    refresh: bool = Query(default=False),
+    db: AsyncSession = Depends(get_db),
+):
+    """Цифры из последнего снимка (services/platform_stats.py) — без COUNT по
+    messages и без обхода хранилища на каждый запрос. ``refresh`` — снять новый."""
+    snap = await latest_snapshot(db)
+    max_age = max(_STATS_MAX_AGE, timedelta(seconds=2 * settings.stats_snapshot_interval_seconds))
+    if refresh or snap is None or snap.taken_at < datetime.now(timezone.utc) - max_age:
+        await flush_storage_usage()
+        snap = await take_snapshot(db)
+        await db.commit()
+
+    base = await baseline_snapshot(db, snap, timedelta(days=7))
     return AdminStats(
-        users=users,
-        families=families,
-        messages=messages,
-        banned_users=banned,
-        uploads_bytes=uploads_bytes,
-        users_delta_7d=users_delta,
-        families_delta_7d=families_delta,
-        messages_delta_7d=messages_delta,
+        users=snap.users,
+        families=snap.families,
+        messages=snap.messages,
+        banned_users=snap.banned_users,
+        uploads_bytes=snap.uploads_bytes,
+        uploads_objects=snap.uploads_objects,
+        users_delta_7d=snap.users - base.users if base else 0,
+        families_delta_7d=snap.families - base.families if base else 0,
+        messages_delta_7d=snap.messages - base.messages if base else 0,
+        taken_at=snap.taken_at,
+        delta_since=base.taken_at if base else None,
+    )
+
+
+@router.get("/runtime/pin-hash", response_model=AdminPinHashStats)
+async def get_pin_hash_stats():
+    """Очередь/время PBKDF2 этого воркера: рост queue — сигнал добавить воркеров."""
+    return AdminPinHashStats(**pin_hash_stats.snapshot())
+
+
+@router.post("/maintenance/balances/reconcile", response_model=AdminBalanceReconcileReport)
+async def reconcile_member_balances(
+    fix: bool = Query(default=False),
+    family_id: uuid.UUID | None = Query(default=None),
+    db: AsyncSession = Depends(get_db),
+    actor: User = Depends(require_developer),
+):
+    """Пересчитать балансы с нуля и сравнить с леджером; ``fix`` — исправить дрейф."""
+    drift = await reconcile_balances(db, family_id=family_id, fix=fix)
+    if fix:
+        await log_platform_action(
+            db,
+            actor_id=actor.id,
+            action="balances.reconciled",
+            target_type="family" if family_id else None,
+            target_id=family_id,
+            metadata={"drifted": len(drift)},
+        )
+        await db.commit()
+    return AdminBalanceReconcileReport(
+        drifted=len(drift),
+        fixed=fix,
+        items=[AdminBalanceDrift(**asdict(d)) for d in drift[:200]],
     )
 
 
+@router.post("/maintenance/storage/recount", response_model=AdminJobRow)
+async def recount_storage_usage(
+    db: AsyncSession = Depends(get_db),
+    actor: User = Depends(require_developer),
+):
+    """Поставить фоновый пересчёт объёма хранилища (обход диска / листинг бакета)."""
+    job = await enqueue_storage_recount(db)
+    await log_platform_action(
+        db,
+        actor_id=actor.id,
+        action="storage.recount_requested",
+        target_type="job",
+        target_id=job.id,
+    )
+    await db.commit()
+    wake_job_worker()
+    return AdminJobRow.model_validate(job)
+
+
+@router.get("/jobs", response_model=list[AdminJobRow])
+async def list_jobs(
+    db: AsyncSession = Depends(get_db),
+    status_: str | None = Query(default=None, alias="status"),
+    kind: str | None = Query(default=None),
+    limit: int = Query(default=100, ge=1, le=500),
+    offset: int = Query(default=0, ge=0),
+):
+    q = select(BackgroundJob)
+    if status_:
+        q = q.where(BackgroundJob.status == status_)
+    if kind:
+        q = q.where(BackgroundJob.kind == kind)
+    rows = await db.scalars(
+        q.order_by(BackgroundJob.created_at.desc()).limit(limit).offset(offset)
+    )
+    return [AdminJobRow.model_validate(j) for j in rows.all()]
+
+
+@router.get("/jobs/{job_id}", response_model=AdminJobRow)
+async def get_job(job_id: uuid.UUID, db: AsyncSession = Depends(get_db)):
+    job = await db.get(BackgroundJob, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return AdminJobRow.model_validate(job)
+
+
+@router.post("/jobs/{job_id}/retry", response_model=AdminJobRow)
+async def retry_job(
+    job_id: uuid.UUID,
+    db: AsyncSession = Depends(get_db),
+    actor: User = Depends(require_developer),
+):
+    """Вернуть окончательно упавшую задачу в очередь с новым бюджетом попыток."""
+    job = await db.get(BackgroundJob, job_id, with_for_update=True)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    if job.status != JOB_FAILED:
+        raise HTTPException(status_code=409, detail="Only failed jobs can be retried")
+    job.status = JOB_QUEUED
+    job.attempts = 0
+    job.run_after = datetime.now(timezone.utc)
+    job.finished_at = None
+    await log_platform_action(
+        db,
+        actor_id=actor.id,
+        action="job.retried",
+        target_type="job",
+        target_id=job.id,
+        metadata={"kind": job.kind},
+    )
+    await db.commit()
+    wake_job_worker()
+    return AdminJobRow.model_validate(job)
+
+
 @router.get("/audit", response_model=list[AdminAuditRow])
 async def list_audit(
     db: AsyncSession = Depends(get_db),
     limit: int = Query(default=100, ge=1, le=500),
     offset: int = Query(default=0, ge=0),
 ):
-    rows = (
-        await db.execute(
-            select(PlatformAuditLogEntry, User.username, User.display_name)
-            .outerjoin(User, User.id == PlatformAuditLogEntry.actor_id)
-            .order_by(PlatformAuditLogEntry.created_at.desc())
-            .limit(limit)
-            .offset(offset)
-        )
-    ).all()
+    q = (
+        select(PlatformAuditLogEntry, User.username, User.display_name)
+        .outerjoin(User, User.id == PlatformAuditLogEntry.actor_id)
+        .order_by(PlatformAuditLogEntry.created_at.desc())
+        .limit(limit)
+        .offset(offset)
+    )
+    # Нижняя граница по сроку хранения — отсекает секции, ждущие удаления.
+    cutoff = retention_cutoff(settings.platform_audit_retention_days, datetime.now(timezone.utc))
+    if cutoff is not None:
+        q = q.where(PlatformAuditLogEntry.created_at >= cutoff)
+    rows = (await db.execute(q)).all()
     return [
         AdminAuditRow(
             id=r.id,
@@ -1,4 +1,13 @@
-"""GET /families/{id}/audit-log — журнал аудита."""
+"""GET /families/{id}/audit-log — журнал аудита.
+
+Keyset-пагинация по (created_at, id) — индекс ``ix_audit_log_family_cursor``:
+записи с одинаковым временем не дублируются и не теряются на стыке страниц.
+Курсор непрозрачный: клиент передаёт ``cursor`` последней полученной записи.
+
+Таблица секционирована по месяцам: нижняя граница по сроку хранения семьи и
+верхняя из курсора ограничивают ``created_at``, и план читает только нужные
+секции (см. app.services.audit_partitions).
+"""
 
 from __future__ import annotations
 
@@ -8,14 +17,16 @@ from uuid import UUID
 
 from fastapi import APIRouter, Depends, HTTPException, Query, status
 from pydantic import BaseModel
-from sqlalchemy import select
+from sqlalchemy import select, tuple_
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.auth.deps import get_current_user
+from app.core.cursors import decode_cursor, encode_cursor
 from app.core.permissions import Perm, has_perm
 from app.db.deps import get_db
 from app.models.audit_log import AuditLogEntry
 from app.models.user import User
+from app.services.audit_partitions import family_audit_cutoff
 from app.services.family import require_membership
 from app.services.roles import effective_permissions
 
@@ -32,18 +43,26 @@ class AuditLogResponse(BaseModel):
     target_id: UUID | None
     metadata: dict[str, Any] | None
     created_at: datetime
+    # Передать как ``cursor``, чтобы получить записи старше этой.
+    cursor: str
 
 
 @router.get("/audit-log", response_model=list[AuditLogResponse])
 async def list_audit_log(
     family_id: UUID,
     limit: int = Query(default=50, ge=1, le=200),
+    cursor: str | None = Query(default=None, max_length=128),
     before: datetime | None = Query(default=None),
     action: str | None = Query(default=None),
+    action_prefix: str | None = Query(default=None, max_length=64),
+    actor_id: UUID | None = Query(default=None),
     db: AsyncSession = Depends(get_db),
     user: User = Depends(get_current_user),
 ):
-    """Возвращает свежие события первыми. ``before`` — для пагинации (cursor).
+    """Возвращает свежие события первыми. Следующая страница — ``cursor``
+    последней записи; ``before`` (время) оставлен для старых клиентов.
+    Фильтры: точное ``action``, ``action_prefix`` (например, ``role.``) и
+    ``actor_id``.
 
     Требует ``VIEW_AUDIT_LOG`` или owner-membership.
     """
@@ -59,13 +78,24 @@ async def list_audit_log(
     q = (
         select(AuditLogEntry)
         .where(AuditLogEntry.family_id == family_id)
-        .order_by(AuditLogEntry.created_at.desc())
+        .order_by(AuditLogEntry.created_at.desc(), AuditLogEntry.id.desc())
         .limit(limit)
     )
-    if before is not None:
+    cutoff = await family_audit_cutoff(db, family_id)
+    if cutoff is not None:
+        q = q.where(AuditLogEntry.created_at >= cutoff)
+    if cursor is not None:
+        q = q.where(
+            tuple_(AuditLogEntry.created_at, AuditLogEntry.id) < tuple_(*decode_cursor(cursor))
+        )
+    elif before is not None:
         q = q.where(AuditLogEntry.created_at < before)
     if action is not None:
         q = q.where(AuditLogEntry.action == action)
+    if action_prefix:
+        q = q.where(AuditLogEntry.action.startswith(action_prefix, autoescape=True))
+    if actor_id is not None:
+        q = q.where(AuditLogEntry.actor_id == actor_id)
 
     rows = (await db.scalars(q)).all()
 
@@ -92,6 +122,7 @@ async def list_audit_log(
                 target_id=r.target_id,
                 metadata=r.metadata_json,
                 created_at=r.created_at,
+                cursor=encode_cursor(r.created_at, r.id),
             )
         )
     return out
@@ -15,7 +15,7 @@ from app.core.rate_limit import (
     pin_failure_limiter,
     register_ip_limiter,
 )
-from app.core.security import dummy_verify, hash_pin, verify_pin
+from app.core.security import dummy_verify_async, hash_pin_async, verify_pin_async
 from app.core.ws_tickets import ws_ticket_store
 from app.db.deps import get_db
 from app.models.membership import Membership, Role
@@ -112,7 +112,7 @@ async def register(
     user = User(
         username=body.username,
         display_name=body.display_name,
-        password_hash=hash_pin(body.pin),
+        password_hash=await hash_pin_async(body.pin),
         birthday=body.birthday,
     )
     db.add(user)
@@ -165,8 +165,8 @@ async def login_by_pin(
     # verify_pin (pbkdf2) дорог; чтобы несуществующий логин не отвечал заметно
     # быстрее существующего, при отсутствии пользователя гоняем фиктивную проверку.
     if user is None:
-        dummy_verify()
-    if not user or not verify_pin(body.pin, user.password_hash):
+        await dummy_verify_async()
+    if not user or not await verify_pin_async(body.pin, user.password_hash):
         await pin_failure_ip_limiter.record(ip_key)
         locked_now, retry_after = await login_throttle.record_failure(db, body.username)
         if locked_now:
@@ -237,7 +237,7 @@ async def join_by_invite(
     user = User(
         username=username,
         display_name=body.display_name.strip(),
-        password_hash=hash_pin(body.pin),
+        password_hash=await hash_pin_async(body.pin),
         birthday=body.birthday,
     )
     db.add(user)
@@ -0,0 +1,73 @@
+"""Long-poll журнала событий бота: `GET /bot/events?after=seq&wait=30`.
+
+Для ботов, которые не держат WebSocket: один запрос на все семьи и чаты вместо
+опроса истории каждого чата по таймеру. Если новых событий нет, запрос ждёт
+до `wait` секунд — его будит запись в журнал на любом инстансе (через
+ws_manager). На время ожидания соединение с БД возвращается в пул.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import time
+
+from fastapi import APIRouter, Depends, Query
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.auth.bot_deps import get_current_bot
+from app.auth.rate_limit_deps import bot_rate_limit
+from app.db.deps import get_db
+from app.models.user import User
+from app.schemas.bots import BotEventsPage
+from app.services.bot_events import event_frame, head_seq, read_events, visible_events
+from app.ws.manager import ws_manager
+
+router = APIRouter(prefix="/bot", tags=["bot"])
+
+
+@router.get(
+    "/events",
+    response_model=BotEventsPage,
+    dependencies=[bot_rate_limit("bot_poll_events")],
+)
+async def poll_bot_events(
+    after: int = Query(default=0, ge=0),
+    wait: int = Query(default=0, ge=0, le=60),
+    limit: int = Query(default=100, ge=1, le=500),
+    db: AsyncSession = Depends(get_db),
+    bot_user: User = Depends(get_current_bot),
+):
+    bot_id = bot_user.id
+    deadline = time.monotonic() + wait
+    wake = asyncio.Event()
+    ws_manager.watch_bot_events(bot_id, wake)
+    try:
+        cursor, truncated = after, False
+        while True:
+            # Сброс ДО чтения: запись между чтением и ожиданием не потеряется.
+            wake.clear()
+            rows = await read_events(db, bot_id, cursor, limit)
+            if rows:
+                truncated = truncated or rows[0].seq > cursor + 1
+                events = await visible_events(db, bot_id, rows)
+                cursor = rows[-1].seq
+                if events:
+                    return BotEventsPage(
+                        events=[event_frame(e) for e in events], next=cursor, truncated=truncated
+                    )
+                # Вся пачка невидима боту — курсор сдвинут, читаем дальше.
+                continue
+            head = await head_seq(db, bot_id)
+            if head > cursor:
+                # Журнал после курсора целиком удалён по сроку хранения.
+                return BotEventsPage(events=[], next=head, truncated=True)
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return BotEventsPage(events=[], next=cursor, truncated=truncated)
+            await db.rollback()
+            try:
+                await asyncio.wait_for(wake.wait(), timeout=remaining)
+            except asyncio.TimeoutError:
+                pass
+    finally:
+        ws_manager.unwatch_bot_events(bot_id, wake)
@@ -3,13 +3,21 @@
 Бот подключается по WebSocket с bot-токеном (заголовок `Authorization: Bearer …`
 или `?token=…`) и получает события семей в реальном времени — тот же поток, что
 и люди (`new_message`, `reaction_added/removed`, `message_edited/deleted`,
-`mention`, `channel_post`, presence). Действия бот делает через REST (как у
-Discord: gateway — события, REST — действия).
+`message_attachments_updated`, `mention`, `channel_post`, presence). Действия
+бот делает через REST (как у Discord: gateway — события, REST — действия).
 
 Реализация: при подключении сокет бота регистрируется во всех его семьях
 (`connect_family`) и во всех видимых ему чатах (`connect`) через существующий
-`ws_manager`, поэтому правок в send-эндпоинтах почти не нужно. Чаты, созданные
-после подключения, подхватываются на каждом клиентском `ping` (re-sync).
+`ws_manager`, поэтому правок в send-эндпоинтах почти не нужно. Дальше подписки
+правятся по событиям `ws_manager.chat_access_changed` (чат создан/удалён,
+overrides, роли): пересчитывается только затронутый чат или семья, а `ping` —
+просто `pong` без обращения к БД.
+
+Resume: события, записанные в журнал бота (bot_events), приходят с полем `seq`.
+Переподключившись с `?last_seq=N`, бот получает в `ready` текущий `seq`
+журнала и затем пропущенное (N, seq] с пометкой `"replayed": true`, после чего
+`{"type": "resumed"}`. Живые события с seq ≤ seq из `ready`, пришедшие во
+время досылки, — дубли досылаемых, бот их отбрасывает.
 
 Аутентификация bot-токеном (не cookie), поэтому CSWSH-проверка Origin не нужна.
 Пока gateway подключён, бот считается «онлайн» (presence) — видно, что он запущен.
@@ -17,7 +25,8 @@ Discord: gateway — события, REST — действия).
 
 from __future__ import annotations
 
-from datetime import datetime, timezone
+import asyncio
+import logging
 from uuid import UUID
 
 from fastapi import APIRouter, WebSocket, WebSocketDisconnect
@@ -29,23 +38,36 @@ from app.core.permissions import Perm, has_perm
 from app.db.session import AsyncSessionLocal
 from app.models.chat import Chat
 from app.models.membership import Membership
-from app.models.user import User
 from app.services.bans import is_banned_now
+from app.services.bot_events import event_frame, head_seq, read_events, visible_events
 from app.services.roles import effective_permissions_for_chats
+from app.ws.codec import accept_ws, send_payload
 from app.ws.manager import ws_manager
+from app.ws.presence import presence_tracker
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter(tags=["bot"])
 
+# family_id → chat_id, которые надо перепроверить (None — всю семью).
+_Dirty = dict[UUID, set[UUID] | None]
+# Пауза перед повтором упавшего пересчёта доступа: удваивается до предела.
+_RESYNC_RETRY_SECONDS = 1.0
+_RESYNC_RETRY_MAX_SECONDS = 30.0
+
 
 async def _load_viewable_chats(
-    db: AsyncSession, memberships: list[Membership]
+    db: AsyncSession, memberships: list[Membership], only: _Dirty | None = None
 ) -> dict[UUID, set[UUID]]:
-    """family_id → множество chat_id, которые бот может видеть (VIEW_CHANNEL)."""
+    """family_id → множество chat_id, которые бот может видеть (VIEW_CHANNEL).
+    `only` сужает проверку до перечисленных чатов семьи."""
     out: dict[UUID, set[UUID]] = {}
     for m in memberships:
-        chats = (
-            await db.scalars(select(Chat).where(Chat.family_id == m.family_id))
-        ).all()
+        query = select(Chat).where(Chat.family_id == m.family_id)
+        chat_ids = only.get(m.family_id) if only is not None else None
+        if chat_ids is not None:
+            query = query.where(Chat.id.in_(chat_ids))
+        chats = (await db.scalars(query)).all()
         perms = await effective_permissions_for_chats(db, m, [c.id for c in chats])
         out[m.family_id] = {
             c.id for c in chats if has_perm(perms.get(c.id, 0), Perm.VIEW_CHANNEL)
@@ -53,21 +75,113 @@ async def _load_viewable_chats(
     return out
 
 
-def _presence_payload(family_id: UUID, user_id: UUID, is_online: bool, last_seen) -> dict:
-    return {
-        "type": "presence_update",
-        "family_id": str(family_id),
-        "user_id": str(user_id),
-        "is_online": is_online,
-        "last_seen_at": last_seen.isoformat() if last_seen else None,
-    }
+def _drain(queue: asyncio.Queue, first: tuple[UUID, UUID | None]) -> _Dirty:
+    """Склеить накопившиеся события в одну пачку: пересчёт всей семьи
+    поглощает пересчёт отдельных её чатов."""
+    dirty: _Dirty = {}
+    item: tuple[UUID, UUID | None] | None = first
+    while item is not None:
+        fid, cid = item
+        if cid is None or dirty.get(fid, ()) is None:
+            dirty[fid] = None
+        else:
+            dirty.setdefault(fid, set()).add(cid)
+        try:
+            item = queue.get_nowait()
+        except asyncio.QueueEmpty:
+            item = None
+    return dirty
+
+
+def _requeue(queue: asyncio.Queue, dirty: _Dirty) -> None:
+    """Вернуть необработанную пачку в очередь — _drain склеит её заново."""
+    for fid, scope in dirty.items():
+        for cid in (None,) if scope is None else scope:
+            queue.put_nowait((fid, cid))
+
+
+async def _follow_chat_access(
+    websocket: WebSocket,
+    bot_id: UUID,
+    queue: asyncio.Queue,
+    registered: dict[UUID, set[UUID]],
+) -> None:
+    """Применять события доступа к чатам к подпискам сокета, пока он жив."""
+    retry = _RESYNC_RETRY_SECONDS
+    while True:
+        dirty = _drain(queue, await queue.get())
+        try:
+            async with AsyncSessionLocal() as db:
+                memberships = (
+                    await db.scalars(
+                        select(Membership).where(
+                            Membership.user_id == bot_id,
+                            Membership.family_id.in_(list(dirty)),
+                        )
+                    )
+                ).all()
+                visible = await _load_viewable_chats(db, memberships, dirty)
+        except Exception:  # noqa: BLE001
+            logger.exception("bot gateway: chat access resync failed")
+            # Пачка не теряется: повтор с паузой, новые события за это
+            # время склеятся с ней.
+            _requeue(queue, dirty)
+            await asyncio.sleep(retry)
+            retry = min(retry * 2, _RESYNC_RETRY_MAX_SECONDS)
+            continue
+        retry = _RESYNC_RETRY_SECONDS
+        for fid, scope in dirty.items():
+            current = registered.setdefault(fid, set())
+            now_visible = visible.get(fid, set())
+            checked = current if scope is None else current & scope
+            for cid in now_visible - current:
+                await ws_manager.connect(cid, websocket, family_id=fid, user_id=bot_id)
+            for cid in checked - now_visible:
+                ws_manager.disconnect(cid, websocket)
+            current.difference_update(checked - now_visible)
+            current.update(now_visible)
+
+
+_REPLAY_BATCH = 500
+
+
+def _parse_last_seq(websocket: WebSocket) -> int | None:
+    raw = websocket.query_params.get("last_seq")
+    if raw is None:
+        return None
+    try:
+        value = int(raw)
+    except ValueError:
+        return None
+    return value if value >= 0 else None
+
+
+async def _replay(websocket: WebSocket, bot_id: UUID, last_seq: int, head: int) -> bool:
+    """Дослать события журнала (last_seq, head]. True — часть уже удалена по
+    сроку хранения (пропущенное придётся дочитать из истории)."""
+    truncated = False
+    cursor = last_seq
+    while cursor < head:
+        async with AsyncSessionLocal() as db:
+            rows = await read_events(db, bot_id, cursor, _REPLAY_BATCH)
+            rows = [r for r in rows if r.seq <= head]
+            if not rows:
+                return True
+            truncated = truncated or rows[0].seq > cursor + 1
+            events = await visible_events(db, bot_id, rows)
+        for event in events:
+            await send_payload(websocket, event_frame(event, replayed=True))
+        cursor = rows[-1].seq
+    return truncated
 
 
 @router.websocket("/bot/gateway")
 async def bot_gateway(websocket: WebSocket):
     token = extract_ws_bot_token(websocket)
+    last_seq = _parse_last_seq(websocket)
 
-    registered_chats: set[UUID] = set()
+    registered: dict[UUID, set[UUID]] = {}
+    access_events: asyncio.Queue = asyncio.Queue()
 
     # Короткоживущая сессия только на аутентификацию и загрузку чатов/семей.
     async with AsyncSessionLocal() as db:
@@ -81,100 +195,85 @@ async def bot_gateway(websocket: WebSocket):
                 select(Membership).where(Membership.user_id == bot_user.id)
             )
         ).all()
-        family_chats = await _load_viewable_chats(db, memberships)
+        family_ids = [m.family_id for m in memberships]
+        # Подписка на события — до загрузки чатов: изменение, случившееся во
+        # время загрузки, придёт в очередь и будет применено повторно.
+        for fid in family_ids:
+            ws_manager.watch_chat_access(fid, access_events)
+        try:
+            family_chats = await _load_viewable_chats(db, memberships)
+        except BaseException:
+            for fid in family_ids:
+                ws_manager.unwatch_chat_access(fid, access_events)
+            raise
 
         bot_id = bot_user.id
         bot_username = bot_user.username
         bot_display = bot_user.display_name
         last_seen = bot_user.last_seen_at
-        family_ids = [m.family_id for m in memberships]
 
-    await websocket.accept()
+    await accept_ws(websocket)
+    # До подписок: живые события сразу приходят с seq бота.
+    ws_manager.register_bot_socket(websocket, bot_id)
 
     # Регистрация на события: семьи (family-level) + видимые чаты.
     for fid in family_ids:
         await ws_manager.connect_family(fid, websocket, user_id=bot_id)
         for cid in family_chats.get(fid, set()):
             await ws_manager.connect(cid, websocket, family_id=fid, user_id=bot_id)
-            registered_chats.add(cid)
+        registered[fid] = set(family_chats.get(fid, set()))
+    follower = asyncio.create_task(
+        _follow_chat_access(websocket, bot_id, access_events, registered),
+        name=f"bot-gateway-access-{bot_id}",
+    )
 
     # B2 — presence. Счётчик присутствия глобален по user_id, поэтому регистрируем
-    # один раз (на первую семью), а статус транслируем во все семьи.
-    became_online = False
+    # один раз (на первую семью), а статус трекер транслирует во все семьи.
     if family_ids:
-        became_online = await ws_manager.register_presence_connection(
-            family_ids[0], bot_id, websocket
+        await presence_tracker.connect(
+            bot_id, websocket, family_id=family_ids[0], last_seen_at=last_seen
         )
-    if became_online:
-        async with AsyncSessionLocal() as db:
-            u = await db.get(User, bot_id)
-            if u and not u.is_online:
-                u.is_online = True
-                await db.commit()
-                last_seen = u.last_seen_at
-        for fid in family_ids:
-            await ws_manager.broadcast_to_family(
-                fid, _presence_payload(fid, bot_id, True, last_seen)
-            )
 
-    await websocket.send_json(
+    # Голова журнала — после подписок: всё позже неё придёт вживую.
+    async with AsyncSessionLocal() as db:
+        head = await head_seq(db, bot_id)
+
+    await send_payload(
+        websocket,
         {
             "type": "ready",
+            "seq": head,
             "bot": {
                 "id": str(bot_id),
                 "username": bot_username,
                 "display_name": bot_display,
             },
             "family_ids": [str(f) for f in family_ids],
-        }
+        },
     )
 
     try:
+        if last_seq is not None:
+            truncated = await _replay(websocket, bot_id, last_seq, head)
+            await send_payload(
+                websocket, {"type": "resumed", "seq": head, "truncated": truncated}
+            )
         while True:
             data = await websocket.receive_text()
             if data == "ping":
-                # B1 — подхватываем чаты, созданные после подключения.
-                async with AsyncSessionLocal() as db:
-                    memberships = (
-                        await db.scalars(
-                            select(Membership).where(Membership.user_id == bot_id)
-                        )
-                    ).all()
-                    fresh = await _load_viewable_chats(db, memberships)
-                for fid, cids in fresh.items():
-                    for cid in cids:
-                        if cid not in registered_chats:
-                            await ws_manager.connect(
-                                cid, websocket, family_id=fid, user_id=bot_id
-                            )
-                            registered_chats.add(cid)
                 await websocket.send_text("pong")
     except WebSocketDisconnect:
         pass
     finally:
-        for cid in registered_chats:
-            ws_manager.disconnect(cid, websocket)
+        follower.cancel()
+        ws_manager.unregister_bot_socket(websocket)
+        for fid in family_ids:
+            ws_manager.unwatch_chat_access(fid, access_events)
+        for cids in registered.values():
+            for cid in cids:
+                ws_manager.disconnect(cid, websocket)
         for fid in family_ids:
             ws_manager.disconnect_family(fid, websocket)
 
-        became_offline = False
         if family_ids:
-            became_offline = await ws_manager.unregister_presence_connection(
-                family_ids[0], bot_id, websocket
-            )
-        if became_offline:
-            offline_seen = datetime.now(timezone.utc)
-            try:
-                async with AsyncSessionLocal() as db:
-                    u = await db.get(User, bot_id)
-                    if u:
-                        u.is_online = False
-                        u.last_seen_at = offline_seen
-                        await db.commit()
-                        offline_seen = u.last_seen_at
-            except Exception:  # noqa: BLE001
-                pass
-            for fid in family_ids:
-                await ws_manager.broadcast_to_family(
-                    fid, _presence_payload(fid, bot_id, False, offline_seen)
-                )
+            await presence_tracker.disconnect(bot_id, websocket, family_id=family_ids[0])
@@ -18,7 +18,7 @@ from app.core.bot_tokens import (
     token_display_prefix,
 )
 from app.core.permissions import Perm
-from app.core.security import hash_pin
+from app.core.security import hash_pin_async
 from app.db.deps import get_db
 from app.models.bot import Bot
 from app.models.membership import Membership, Role
@@ -26,6 +26,7 @@ from app.models.user import User
 from app.schemas.bots import BotCreate, BotResponse, BotWithToken
 from app.services.audit import log_action
 from app.services.roles import assign_default_roles_on_join, require_family_perm
+from app.ws.manager import ws_manager
 
 router = APIRouter(prefix="/families/{family_id}/bots", tags=["bots"])
 
@@ -115,7 +116,7 @@ async def create_bot(
     bot_user = User(
         username=username,
         display_name=body.display_name.strip(),
-        password_hash=hash_pin(secrets.token_hex(16)),
+        password_hash=await hash_pin_async(secrets.token_hex(16)),
         is_bot=True,
     )
     db.add(bot_user)
@@ -146,6 +147,8 @@ async def create_bot(
         metadata={"username": username, "display_name": bot_user.display_name},
     )
     await db.commit()
+    # Семья могла быть без ботов — журнал событий должен начать её писать.
+    await ws_manager.invalidate_bot_auth(bot_user.id)
     await db.refresh(bot)
     await db.refresh(bot_user)
 
@@ -176,6 +179,8 @@ async def regenerate_token(
         metadata={"username": bot_user.username},
     )
     await db.commit()
+    # Старый токен не должен жить в кэше аутентификации до истечения TTL.
+    await ws_manager.invalidate_bot_auth(bot_user.id)
     await db.refresh(bot)
 
     return BotWithToken(**_to_response(bot, bot_user).model_dump(), token=raw_token)
@@ -204,3 +209,4 @@ async def delete_bot(
     # прошлые сообщения бота остаются (Message.author_id = SET NULL).
     await db.delete(bot_user)
     await db.commit()
+    await ws_manager.invalidate_bot_auth(bot_user.id)
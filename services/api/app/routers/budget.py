@@ -1,5 +1,4 @@
 from calendar import monthrange
-from collections import defaultdict
 from datetime import date
 from decimal import Decimal, ROUND_HALF_UP
 from uuid import UUID
@@ -10,6 +9,7 @@ from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import selectinload
 
 from app.auth.deps import get_current_user
+from app.auth.rate_limit_deps import user_rate_limit
 from app.core.permissions import Perm, has_perm
 from app.db.deps import get_db
 from app.services.roles import effective_permissions
@@ -33,6 +33,12 @@ from app.schemas.budget import (
     BudgetTransactionResponse,
     BudgetTransactionUpdate,
 )
+from app.services.balance_ledger import (
+    BUDGET,
+    apply_balance_delta,
+    budget_contribution,
+    ledger_balances,
+)
 from app.services.family import require_membership
 
 family_router = APIRouter(prefix="/families/{family_id}/budget", tags=["budget"])
@@ -117,11 +123,18 @@ def _validate_splits(
         )
 
 
-async def _load_tx(db: AsyncSession, tx_id: UUID) -> BudgetTransaction | None:
+async def _load_tx(
+    db: AsyncSession, tx_id: UUID, *, for_update: bool = False
+) -> BudgetTransaction | None:
+    query = select(BudgetTransaction).where(BudgetTransaction.id == tx_id)
+    if for_update:
+        # Изменение пересчитывает вклад в леджер балансов от текущего состояния —
+        # два параллельных PATCH/DELETE одной транзакции не должны видеть одно и то же «до».
+        query = query.with_for_update(of=BudgetTransaction).execution_options(
+            populate_existing=True
+        )
     return await db.scalar(
-        select(BudgetTransaction)
-        .where(BudgetTransaction.id == tx_id)
-        .options(
+        query.options(
             selectinload(BudgetTransaction.author),
             selectinload(BudgetTransaction.payer),
             selectinload(BudgetTransaction.splits).selectinload(
@@ -131,6 +144,10 @@ async def _load_tx(db: AsyncSession, tx_id: UUID) -> BudgetTransaction | None:
     )
 
 
+def _tx_contribution(tx: BudgetTransaction) -> dict[UUID, Decimal]:
+    return budget_contribution(tx.paid_by, tx.amount, ((s.user_id, s.share) for s in tx.splits))
+
+
 @family_router.get("/categories", response_model=BudgetCategoriesResponse)
 async def list_categories(
     family_id: UUID,
@@ -254,6 +271,15 @@ async def create_transaction(
                     for s in splits
                 ]
             )
+        await apply_balance_delta(
+            db,
+            family_id,
+            BUDGET,
+            {},
+            budget_contribution(
+                tx.paid_by, tx.amount, [(s.user_id, _to_money(s.share)) for s in splits]
+            ),
+        )
 
     await db.commit()
 
@@ -320,7 +346,11 @@ async def month_summary(
     )
 
 
-@family_router.get("/balances", response_model=list[BudgetMemberBalance])
+@family_router.get(
+    "/balances",
+    response_model=list[BudgetMemberBalance],
+    dependencies=[user_rate_limit("list_balances")],
+)
 async def list_balances(
     family_id: UUID,
     db: AsyncSession = Depends(get_db),
@@ -340,37 +370,15 @@ async def list_balances(
         .options(selectinload(Membership.user))
     )
     members = memberships.all()
-    member_ids = {m.user_id for m in members}
-
-    balances: dict[UUID, Decimal] = defaultdict(lambda: Decimal("0.00"))
-    for m in members:
-        balances[m.user_id] = Decimal("0.00")
-
-    txs = await db.scalars(
-        select(BudgetTransaction)
-        .where(BudgetTransaction.family_id == family_id)
-        .options(selectinload(BudgetTransaction.splits))
-    )
-
-    for tx in txs.all():
-        if not tx.splits:
-            continue
-        if tx.paid_by is None:
-            continue
-        amount = _to_money(tx.amount)
-        # Кто заплатил — тому "должны" amount
-        if tx.paid_by in member_ids:
-            balances[tx.paid_by] += amount
-        # Каждому участнику доли — "должен" свою share
-        for split in tx.splits:
-            if split.user_id in member_ids:
-                balances[split.user_id] -= _to_money(split.share)
+    # Суммы ведутся инкрементально (services/balance_ledger.py) — здесь только
+    # чтение по строке на участника, без обхода истории транзакций.
+    balances = await ledger_balances(db, family_id, BUDGET)
 
     return [
         BudgetMemberBalance(
             user_id=m.user_id,
             display_name=m.user.display_name,
-            balance=_to_money(balances[m.user_id]),
+            balance=_to_money(balances.get(m.user_id, Decimal("0"))),
         )
         for m in members
     ]
@@ -396,7 +404,7 @@ async def update_transaction(
     db: AsyncSession = Depends(get_db),
     user: User = Depends(get_current_user),
 ):
-    tx = await _load_tx(db, tx_id)
+    tx = await _load_tx(db, tx_id, for_update=True)
     if not tx:
         raise HTTPException(status_code=404, detail="Transaction not found")
 
@@ -411,6 +419,8 @@ async def update_transaction(
 
     updated = body.model_fields_set
     family_user_ids = await _family_user_ids(tx.family_id, db)
+    balance_before = _tx_contribution(tx)
+    shares_after = [(s.user_id, s.share) for s in tx.splits]
 
     if "type" in updated and body.type is not None:
         tx.type = BudgetTxType(body.type)
@@ -453,6 +463,7 @@ async def update_transaction(
             # Если splits добавили, а paid_by не задан — ставим автора
             if new_splits and tx.paid_by is None:
                 tx.paid_by = user.id
+        shares_after = [(s.user_id, _to_money(s.share)) for s in new_splits]
     elif "amount" in updated and tx.splits:
         # Сумма изменилась, но splits не переданы — это нарушит триггер.
         # Требуем явно передать splits заново.
@@ -461,6 +472,13 @@ async def update_transaction(
             detail="When changing amount of a split transaction, splits must be re-supplied",
         )
 
+    await apply_balance_delta(
+        db,
+        tx.family_id,
+        BUDGET,
+        balance_before,
+        budget_contribution(tx.paid_by, tx.amount, shares_after),
+    )
     await db.commit()
 
     loaded = await _load_tx(db, tx.id)
@@ -475,7 +493,7 @@ async def delete_transaction(
     db: AsyncSession = Depends(get_db),
     user: User = Depends(get_current_user),
 ):
-    tx = await db.get(BudgetTransaction, tx_id)
+    tx = await _load_tx(db, tx_id, for_update=True)
     if not tx:
         raise HTTPException(status_code=404, detail="Transaction not found")
 
@@ -486,5 +504,6 @@ async def delete_transaction(
             detail="Only the author or family owner can delete",
         )
 
+    await apply_balance_delta(db, tx.family_id, BUDGET, _tx_contribution(tx), {})
     await db.delete(tx)
     await db.commit()
@@ -14,6 +14,7 @@ from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
 from fastapi import Depends
 
+from app.auth.rate_limit_deps import anon_rate_limit
 from app.db.deps import get_db
 from app.models.calendar_event import CalendarEvent
 from app.models.family import Family
@@ -40,7 +41,7 @@ def _utc(dt: datetime) -> str:
     return dt.astimezone(timezone.utc).strftime("%Y%m%dT%H%M%SZ")
 
 
-@router.get("/{token}.ics")
+@router.get("/{token}.ics", dependencies=[anon_rate_limit("calendar_feed")])
 async def calendar_feed(token: str, db: AsyncSession = Depends(get_db)):
     family = await db.scalar(select(Family).where(Family.calendar_feed_token == token))
     if family is None:
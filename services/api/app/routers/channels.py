@@ -7,6 +7,7 @@ from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.auth.deps import get_current_user
+from app.auth.bot_cache import bot_auth_cache
 from app.auth.bot_deps import get_current_bot
 from app.core.permissions import Perm, has_perm
 from app.db.deps import get_db
@@ -51,12 +52,15 @@ def _channel_post_payload(channel_id: UUID, post: Post) -> dict:
 
 
 async def _require_member(family_id: UUID, user: User, db: AsyncSession) -> Membership:
-    m = await db.scalar(
-        select(Membership).where(
-            Membership.family_id == family_id,
-            Membership.user_id == user.id,
+    # Боты ходят в цикле — их членства уже лежат в кэше аутентификации.
+    m = await bot_auth_cache.membership(db, user.id, family_id) if user.is_bot else None
+    if m is None:
+        m = await db.scalar(
+            select(Membership).where(
+                Membership.family_id == family_id,
+                Membership.user_id == user.id,
+            )
         )
-    )
     if not m:
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Not a family member")
     return m
@@ -2,18 +2,20 @@ import asyncio
 import mimetypes
 import re
 import uuid
-from datetime import datetime, timedelta, timezone
+from datetime import datetime, timezone
 from pathlib import Path
 from uuid import UUID
 
-from fastapi import APIRouter, Depends, File, Form, HTTPException, Query, Response, UploadFile, WebSocket, WebSocketDisconnect, status
+from fastapi import APIRouter, Depends, File, Form, HTTPException, Query, Request, Response, UploadFile, WebSocket, WebSocketDisconnect, status
 from sqlalchemy import case, delete, func, inspect as sa_inspect, select
 from sqlalchemy.dialects.postgresql import insert as pg_insert
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import selectinload
 
 from app.auth.deps import get_current_user
+from app.auth.bot_cache import bot_auth_cache
 from app.auth.bot_deps import get_current_bot
+from app.auth.rate_limit_deps import bot_rate_limit, user_rate_limit
 from app.core.permissions import Perm, has_perm
 from app.core.uploads import (
     ALLOWED_ATTACHMENT_EXT,
@@ -22,14 +24,10 @@ from app.core.uploads import (
     resolve_upload_path,
 )
 from app.core.file_signatures import enforce_safe_signature
-from app.core.storage import storage
-from app.core.ws_security import is_allowed_ws_origin
-from app.core.jwt import COOKIE_NAME, decode_access_token
-from app.core.ws_tickets import ws_ticket_store
 from app.db.deps import get_db
 from app.db.session import AsyncSessionLocal
 from app.services.audit import log_action
-from app.services.bans import is_banned_now
+from app.services.chat_changes import load_changes, log_change
 from app.services.moderation import enforce_message_content, get_settings
 from app.services.push import notify_new_message
 from app.services.roles import (
@@ -38,7 +36,17 @@ from app.services.roles import (
     require_chat_perm,
     require_family_perm,
 )
+from app.services.jobs import wake_job_worker
+from app.services.previews import TARGET_MESSAGE, delete_previews, enqueue_previews, preview_item
+from app.services.storage_cleanup import chat_storage_prefix, enqueue_storage_cleanup
+from app.services.storage_quota import (
+    delete_upload,
+    precheck_upload_quota,
+    release_prefix_storage,
+    save_upload,
+)
 from app.models.chat import Chat
+from app.models.chat_change import CHANGE_DELETE, CHANGE_EDIT, CHANGE_NEW, CHANGE_REACTION
 from app.models.membership import Membership
 from app.models.message import Message
 from app.models.message_read import MessageRead
@@ -56,6 +64,7 @@ from app.schemas.components import (
 from app.core.interactions import MODAL_REPLY_TTL_SECONDS, interaction_store
 from app.schemas.chats import (
     EMOJI_PATTERN,
+    ChatChangesResponse,
     ChatCreate,
     ChatPinRequest,
     ChatResponse,
@@ -64,13 +73,17 @@ from app.schemas.chats import (
     MessageSearchResult,
     MessageReadRequest,
     MessageReactionCreate,
+    MessageReactionsDelta,
     MessageResponse,
     MessageUpdate,
     PinnedMessagePreview,
     ReaderInfo,
     ReactionSummary,
 )
+from app.ws.auth import authenticate_ws_user
+from app.ws.codec import accept_ws
 from app.ws.manager import ws_manager
+from app.ws.presence import presence_tracker
 
 router = APIRouter(prefix="/families/{family_id}/chats", tags=["chats"])
 
@@ -82,21 +95,6 @@ MAX_ATTACHMENTS_PER_MESSAGE = 8
 MESSAGE_SEARCH_LIMIT = 30
 
 
-def _presence_payload(
-    family_id: UUID,
-    user_id: UUID,
-    is_online: bool,
-    last_seen_at: datetime | None,
-) -> dict:
-    return {
-        "type": "presence_update",
-        "family_id": str(family_id),
-        "user_id": str(user_id),
-        "is_online": is_online,
-        "last_seen_at": last_seen_at.isoformat() if last_seen_at else None,
-    }
-
-
 def _compact_preview_text(text: str) -> str:
     compact = " ".join(text.split())
     if not compact:
@@ -168,6 +166,7 @@ def _chat_to_response(chat: Chat) -> ChatResponse:
         pinned_message_id=chat.pinned_message_id,
         pinned_message=pinned_preview,
         encryption_protocol=chat.encryption_protocol,
+        change_seq=chat.change_seq,
         created_at=chat.created_at,
     )
 
@@ -201,12 +200,15 @@ async def _load_chat_with_pin(
 
 
 async def _require_member(family_id: UUID, user: User, db: AsyncSession) -> Membership:
-    m = await db.scalar(
-        select(Membership).where(
-            Membership.family_id == family_id,
-            Membership.user_id == user.id,
+    # Боты ходят в цикле — их членства уже лежат в кэше аутентификации.
+    m = await bot_auth_cache.membership(db, user.id, family_id) if user.is_bot else None
+    if m is None:
+        m = await db.scalar(
+            select(Membership).where(
+                Membership.family_id == family_id,
+                Membership.user_id == user.id,
+            )
         )
-    )
     if not m:
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Not a family member")
     return m
@@ -505,6 +507,7 @@ async def create_chat(
         },
     )
     await db.commit()
+    await ws_manager.chat_access_changed(family_id, chat.id)
     loaded_chat = await _load_chat_with_pin(db, family_id, chat.id)
     if not loaded_chat:
         raise HTTPException(status_code=404, detail="Chat not found")
@@ -683,8 +686,15 @@ async def delete_chat(
         target_id=chat.id,
         metadata={"name": chat.name},
     )
+    # Вложения списываются с семьи и авторов сразу, файлы удаляет фоновая
+    # очистка — она коммитится вместе с удалением чата (как у семьи).
+    prefix = chat_storage_prefix(chat_id)
+    await release_prefix_storage(db, prefix)
     await db.delete(chat)
+    await enqueue_storage_cleanup(db, [prefix])
     await db.commit()
+    wake_job_worker()
+    await ws_manager.chat_access_changed(family_id, chat_id)
 
 
 @router.get("/{chat_id}/messages", response_model=list[MessageResponse])
@@ -727,7 +737,77 @@ async def get_messages(
     return [_msg_response(m) for m in messages]
 
 
-@router.get("/{chat_id}/messages/search", response_model=list[MessageSearchResult])
+@router.get("/{chat_id}/changes", response_model=ChatChangesResponse)
+async def get_chat_changes(
+    family_id: UUID,
+    chat_id: UUID,
+    since: int = Query(ge=0),
+    limit: int = Query(default=500, ge=1, le=1000),
+    db: AsyncSession = Depends(get_db),
+    user: User = Depends(get_current_user),
+):
+    """Дельта для переподключившегося клиента: что изменилось после `since`
+    (seq из ChatResponse.change_seq или chat_seq последнего WS-события).
+    Журнал после `since` уже очищен по сроку — resync_required: клиент
+    перечитывает историю и продолжает с отданного seq."""
+    m = await _require_member(family_id, user, db)
+
+    chat = await db.get(Chat, chat_id)
+    if not chat or chat.family_id != family_id:
+        raise HTTPException(status_code=404, detail="Chat not found")
+    await require_chat_perm(db, m, chat_id, Perm.VIEW_CHANNEL, Perm.READ_HISTORY)
+    _ensure_age_gate(chat, user)
+    await _ensure_18plus_perm(chat, m, db)
+
+    delta = await load_changes(db, chat_id, since, limit, head=chat.change_seq)
+    if delta.resync_required:
+        return ChatChangesResponse(seq=delta.seq, resync_required=True)
+
+    # Сообщение, удалённое уже после отданного окна, здесь не найдётся — его
+    # delete придёт следующей страницей, пропуск безопасен.
+    full: dict[UUID, Message] = {}
+    if delta.new or delta.edited:
+        full = {
+            msg.id: msg
+            for msg in await db.scalars(
+                select(Message)
+                .where(Message.id.in_(delta.new + delta.edited))
+                .options(
+                    selectinload(Message.author),
+                    selectinload(Message.reactions),
+                    selectinload(Message.reads).selectinload(MessageRead.user),
+                )
+            )
+        }
+    reacted: list[Message] = []
+    if delta.reactions:
+        reacted = list(
+            await db.scalars(
+                select(Message)
+                .where(Message.id.in_(delta.reactions))
+                .options(selectinload(Message.reactions))
+            )
+        )
+
+    new = sorted((full[i] for i in delta.new if i in full), key=lambda msg: msg.created_at)
+    return ChatChangesResponse(
+        seq=delta.seq,
+        new=[_msg_response(msg) for msg in new],
+        edited=[_msg_response(full[i]) for i in delta.edited if i in full],
+        deleted=delta.deleted,
+        reactions=[
+            MessageReactionsDelta(message_id=msg.id, reactions=_reaction_summaries(msg))
+            for msg in reacted
+        ],
+        has_more=delta.has_more,
+    )
+
+
+@router.get(
+    "/{chat_id}/messages/search",
+    response_model=list[MessageSearchResult],
+    dependencies=[user_rate_limit("search_messages")],
+)
 async def search_messages(
     family_id: UUID,
     chat_id: UUID,
@@ -905,10 +985,13 @@ async def send_message(
     db.add(msg)
     await db.flush()
     await db.refresh(msg, ["author"])
+    seq = await log_change(db, chat_id, msg.id, CHANGE_NEW)
     await db.commit()
 
     msg_dict = _msg_to_dict(msg)
-    await ws_manager.broadcast_to_chat(chat_id, {"type": "new_message", "message": msg_dict})
+    await ws_manager.broadcast_to_chat(
+        chat_id, {"type": "new_message", "message": msg_dict, "chat_seq": seq}
+    )
 
     if mentions:
         await ws_manager.broadcast_to_family(
@@ -933,10 +1016,16 @@ async def send_message(
     return _msg_response(msg, user.display_name)
 
 
-@router.post("/{chat_id}/messages/attachments", response_model=MessageResponse, status_code=status.HTTP_201_CREATED)
+@router.post(
+    "/{chat_id}/messages/attachments",
+    response_model=MessageResponse,
+    status_code=status.HTTP_201_CREATED,
+    dependencies=[user_rate_limit("upload_attachments", per_mb=1)],
+)
 async def send_message_with_attachments(
     family_id: UUID,
     chat_id: UUID,
+    request: Request,
     files: list[UploadFile] = File(...),
     text: str | None = Form(default=None),
     db: AsyncSession = Depends(get_db),
@@ -976,6 +1065,7 @@ async def send_message_with_attachments(
         raise HTTPException(status_code=400, detail="Text too long (max 4000)")
 
     enforce_message_content(await get_settings(db, family_id), body_text)
+    await precheck_upload_quota(db, request, clean_files, family_id=family_id, user_id=user.id)
 
     attachments: list[dict] = []
     for upload in clean_files:
@@ -995,8 +1085,13 @@ async def send_message_with_attachments(
 
         stored_name = f"{uuid.uuid4()}{ext}"
         try:
-            await storage.save(
-                f"chat_files/{chat_id}/{stored_name}", payload, upload.content_type
+            await save_upload(
+                db,
+                f"chat_files/{chat_id}/{stored_name}",
+                payload,
+                upload.content_type,
+                family_id=family_id,
+                user_id=user.id,
             )
         except OSError as exc:
             raise HTTPException(
@@ -1025,11 +1120,19 @@ async def send_message_with_attachments(
     )
     db.add(msg)
     await db.flush()
+    await enqueue_previews(
+        db,
+        [preview_item(TARGET_MESSAGE, msg.id, a["url"]) for a in attachments if a["kind"] == "image"],
+    )
     await db.refresh(msg, ["author"])
+    seq = await log_change(db, chat_id, msg.id, CHANGE_NEW)
     await db.commit()
+    wake_job_worker()
 
     msg_dict = _msg_to_dict(msg)
-    await ws_manager.broadcast_to_chat(chat_id, {"type": "new_message", "message": msg_dict})
+    await ws_manager.broadcast_to_chat(
+        chat_id, {"type": "new_message", "message": msg_dict, "chat_seq": seq}
+    )
 
     if mentions:
         await ws_manager.broadcast_to_family(
@@ -1059,6 +1162,7 @@ MAX_VOICE_SIZE = 10 * 1024 * 1024  # 10 MB
 async def send_voice_message(
     family_id: UUID,
     chat_id: UUID,
+    request: Request,
     file: UploadFile = File(...),
     db: AsyncSession = Depends(get_db),
     user: User = Depends(get_current_user),
@@ -1095,16 +1199,20 @@ async def send_voice_message(
             detail="Голосовое сообщение должно быть аудио.",
         )
 
+    await precheck_upload_quota(db, request, [file], family_id=family_id, user_id=user.id)
     payload = await file.read()
     if len(payload) > MAX_VOICE_SIZE:
         raise HTTPException(status_code=413, detail="Голосовое сообщение слишком большое (макс. 10 МБ)")
 
     stored_name = f"voice_{uuid.uuid4()}.webm"
     try:
-        await storage.save(
+        await save_upload(
+            db,
             f"chat_files/{chat_id}/{stored_name}",
             payload,
             file.content_type or "audio/webm",
+            family_id=family_id,
+            user_id=user.id,
         )
     except OSError as exc:
         raise HTTPException(status_code=500, detail="Failed to save voice message") from exc
@@ -1126,10 +1234,13 @@ async def send_voice_message(
     db.add(msg)
     await db.flush()
     await db.refresh(msg, ["author"])
+    seq = await log_change(db, chat_id, msg.id, CHANGE_NEW)
     await db.commit()
 
     msg_dict = _msg_to_dict(msg)
-    await ws_manager.broadcast_to_chat(chat_id, {"type": "new_message", "message": msg_dict})
+    await ws_manager.broadcast_to_chat(
+        chat_id, {"type": "new_message", "message": msg_dict, "chat_seq": seq}
+    )
 
     push_body = f"{user.display_name}: 🎤 Голосовое сообщение"
     _schedule_message_push(chat=chat, family_id=family_id, author_id=user.id, body=push_body)
@@ -1201,11 +1312,16 @@ async def edit_message(
     msg.text = body.text
     msg.edited = True
     msg.mentions = [] if is_encrypted else _parse_mentions(body.text)
+    seq = await log_change(db, chat_id, msg.id, CHANGE_EDIT)
     await db.commit()
 
     await ws_manager.broadcast_to_chat(
         chat_id,
-        {"type": "message_edited", "message": {"id": str(msg.id), "text": msg.text, "edited": True}},
+        {
+            "type": "message_edited",
+            "message": {"id": str(msg.id), "text": msg.text, "edited": True},
+            "chat_seq": seq,
+        },
     )
     return _msg_response(msg)
 
@@ -1259,14 +1375,16 @@ async def delete_message(
     for item in msg.attachments or []:
         if not isinstance(item, dict):
             continue
-        await storage.delete_by_url(item.get("url"))
+        await delete_upload(db, item.get("url"))
+        await delete_previews(item.get("url"), item.get("preview"))
 
     await db.delete(msg)
+    seq = await log_change(db, chat_id, message_id, CHANGE_DELETE)
     await db.commit()
 
     await ws_manager.broadcast_to_chat(
         chat_id,
-        {"type": "message_deleted", "message_id": str(message_id)},
+        {"type": "message_deleted", "message_id": str(message_id), "chat_seq": seq},
     )
     if was_pinned:
         await ws_manager.broadcast_to_chat(chat_id, _chat_pin_update_payload(chat))
@@ -1306,10 +1424,11 @@ async def add_reaction(
             index_elements=["message_id", "user_id", "emoji"],
         )
     )
-    await db.commit()
-
     if (result.rowcount or 0) == 0:
+        await db.commit()
         return
+    seq = await log_change(db, chat_id, message_id, CHANGE_REACTION)
+    await db.commit()
 
     await ws_manager.broadcast_to_chat(
         chat_id,
@@ -1319,6 +1438,7 @@ async def add_reaction(
             "emoji": emoji,
             "user_id": str(user.id),
             "display_name": user.display_name,
+            "chat_seq": seq,
         },
     )
 
@@ -1351,18 +1471,22 @@ async def remove_reaction(
             MessageReaction.emoji == emoji,
         )
     )
+    if (result.rowcount or 0) == 0:
+        await db.commit()
+        return
+    seq = await log_change(db, chat_id, message_id, CHANGE_REACTION)
     await db.commit()
 
-    if (result.rowcount or 0) > 0:
-        await ws_manager.broadcast_to_chat(
-            chat_id,
-            {
-                "type": "reaction_removed",
-                "message_id": str(message_id),
-                "emoji": emoji,
-                "user_id": str(user.id),
-            },
-        )
+    await ws_manager.broadcast_to_chat(
+        chat_id,
+        {
+            "type": "reaction_removed",
+            "message_id": str(message_id),
+            "emoji": emoji,
+            "user_id": str(user.id),
+            "chat_seq": seq,
+        },
+    )
 
 
 @router.post(
@@ -1394,7 +1518,7 @@ async def create_interaction(
     if author is None or not author.is_bot:
         raise HTTPException(status_code=409, detail="Message is not from a bot")
 
-    iid = interaction_store.create(
+    iid = await interaction_store.create(
         message_id=msg.id,
         chat_id=chat_id,
         family_id=family_id,
@@ -1438,7 +1562,7 @@ async def submit_modal(
     m = await _require_member(family_id, user, db)
     await require_chat_perm(db, m, chat_id, Perm.VIEW_CHANNEL)
 
-    pending = interaction_store.consume(interaction_id)
+    pending = await interaction_store.consume(interaction_id)
     if pending is None or pending.kind != "modal":
         raise HTTPException(status_code=404, detail="Modal interaction not found or expired")
     if pending.user_id != user.id:
@@ -1446,7 +1570,7 @@ async def submit_modal(
     if pending.chat_id != chat_id or pending.message_id != message_id:
         raise HTTPException(status_code=404, detail="Interaction does not match this message")
 
-    new_iid = interaction_store.create(
+    new_iid = await interaction_store.create(
         message_id=pending.message_id,
         chat_id=chat_id,
         family_id=family_id,
@@ -1475,38 +1599,12 @@ async def chat_ws(
     family_id: UUID,
     chat_id: UUID,
 ):
-    # Defense-in-depth против CSWSH: чужой Origin не пускаем (L8).
-    if not is_allowed_ws_origin(websocket):
-        await websocket.close(code=4403)
-        return
-
-    token = websocket.cookies.get(COOKIE_NAME)
-    decoded = decode_access_token(token) if token else None
-    user_id = decoded[0] if decoded else None
-    token_iat = decoded[1] if decoded else None
-    if not user_id:
-        ticket = websocket.query_params.get("ticket")
-        if ticket:
-            user_id = await ws_ticket_store.consume(ticket)
-    if not user_id:
-        await websocket.close(code=4001)
-        return
-
     async with AsyncSessionLocal() as db:
-        user = await db.scalar(select(User).where(User.id == user_id))
-        if not user:
-            await websocket.close(code=4001)
-            return
-
-        if token_iat is not None and token_iat + timedelta(seconds=1) < user.password_changed_at:
-            await websocket.close(code=4001)
-            return
-
-        # Глобальный бан: закрываем и ticket-путь (revocation по password_changed_at
-        # не срабатывает при token_iat is None).
-        if is_banned_now(user):
-            await websocket.close(code=4003)
+        user, close_code = await authenticate_ws_user(websocket, db)
+        if user is None:
+            await websocket.close(code=close_code)
             return
+        user_id = user.id
 
         m = await db.scalar(
             select(Membership).where(
@@ -1536,25 +1634,11 @@ async def chat_ws(
 
         last_seen_at = user.last_seen_at
 
-    await websocket.accept()
+    await accept_ws(websocket)
     await ws_manager.connect(chat_id, websocket, family_id=family_id, user_id=user_id)
-    became_online = await ws_manager.register_presence_connection(family_id, user_id, websocket)
-    if became_online:
-        async with AsyncSessionLocal() as db:
-            u = await db.get(User, user_id)
-            if u:
-                u.is_online = True
-                await db.commit()
-                last_seen_at = u.last_seen_at
-        await ws_manager.broadcast_to_family(
-            family_id,
-            _presence_payload(
-                family_id=family_id,
-                user_id=user_id,
-                is_online=True,
-                last_seen_at=last_seen_at,
-            ),
-        )
+    await presence_tracker.connect(
+        user_id, websocket, family_id=family_id, last_seen_at=last_seen_at
+    )
 
     try:
         while True:
@@ -1565,29 +1649,7 @@ async def chat_ws(
         pass
     finally:
         ws_manager.disconnect(chat_id, websocket)
-        became_offline = await ws_manager.unregister_presence_connection(
-            family_id,
-            user_id,
-            websocket,
-        )
-        if became_offline:
-            offline_seen = datetime.now(timezone.utc)
-            async with AsyncSessionLocal() as db:
-                u = await db.get(User, user_id)
-                if u:
-                    u.is_online = False
-                    u.last_seen_at = offline_seen
-                    await db.commit()
-                    offline_seen = u.last_seen_at
-            await ws_manager.broadcast_to_family(
-                family_id,
-                _presence_payload(
-                    family_id=family_id,
-                    user_id=user_id,
-                    is_online=False,
-                    last_seen_at=offline_seen,
-                ),
-            )
+        await presence_tracker.disconnect(user_id, websocket, family_id=family_id)
 
 
 # ── Bot Dev API (аутентификация bot-токеном) ─────────────────────────────────
@@ -1617,6 +1679,7 @@ async def bot_me(
     "/families/{family_id}/chats/{chat_id}/messages",
     response_model=MessageResponse,
     status_code=status.HTTP_201_CREATED,
+    dependencies=[bot_rate_limit("bot_send_message")],
 )
 async def bot_send_message(
     family_id: UUID,
@@ -1655,10 +1718,13 @@ async def bot_send_message(
     db.add(msg)
     await db.flush()
     await db.refresh(msg, ["author"])
+    seq = await log_change(db, chat_id, msg.id, CHANGE_NEW)
     await db.commit()
 
     msg_dict = _msg_to_dict(msg)
-    await ws_manager.broadcast_to_chat(chat_id, {"type": "new_message", "message": msg_dict})
+    await ws_manager.broadcast_to_chat(
+        chat_id, {"type": "new_message", "message": msg_dict, "chat_seq": seq}
+    )
 
     if mentions:
         await ws_manager.broadcast_to_family(
@@ -1682,6 +1748,7 @@ async def bot_send_message(
 @bot_router.get(
     "/families/{family_id}/chats/{chat_id}/messages",
     response_model=list[MessageResponse],
+    dependencies=[bot_rate_limit("bot_poll_messages")],
 )
 async def bot_poll_messages(
     family_id: UUID,
@@ -1727,7 +1794,11 @@ async def bot_poll_messages(
     return [_msg_response(m) for m in messages]
 
 
-@bot_router.get("/families/{family_id}/chats", response_model=list[BotChatInfo])
+@bot_router.get(
+    "/families/{family_id}/chats",
+    response_model=list[BotChatInfo],
+    dependencies=[bot_rate_limit("bot_list_chats")],
+)
 async def bot_list_chats(
     family_id: UUID,
     db: AsyncSession = Depends(get_db),
@@ -1776,10 +1847,11 @@ async def bot_add_reaction(
         .values(message_id=message_id, user_id=bot_user.id, emoji=emoji)
         .on_conflict_do_nothing(index_elements=["message_id", "user_id", "emoji"])
     )
-    await db.commit()
-
     if (result.rowcount or 0) == 0:
+        await db.commit()
         return
+    seq = await log_change(db, chat_id, message_id, CHANGE_REACTION)
+    await db.commit()
 
     await ws_manager.broadcast_to_chat(
         chat_id,
@@ -1789,6 +1861,7 @@ async def bot_add_reaction(
             "emoji": emoji,
             "user_id": str(bot_user.id),
             "display_name": bot_user.display_name,
+            "chat_seq": seq,
         },
     )
 
@@ -1821,18 +1894,22 @@ async def bot_remove_reaction(
             MessageReaction.emoji == emoji,
         )
     )
+    if (result.rowcount or 0) == 0:
+        await db.commit()
+        return
+    seq = await log_change(db, chat_id, message_id, CHANGE_REACTION)
     await db.commit()
 
-    if (result.rowcount or 0) > 0:
-        await ws_manager.broadcast_to_chat(
-            chat_id,
-            {
-                "type": "reaction_removed",
-                "message_id": str(message_id),
-                "emoji": emoji,
-                "user_id": str(bot_user.id),
-            },
-        )
+    await ws_manager.broadcast_to_chat(
+        chat_id,
+        {
+            "type": "reaction_removed",
+            "message_id": str(message_id),
+            "emoji": emoji,
+            "user_id": str(bot_user.id),
+            "chat_seq": seq,
+        },
+    )
 
 
 @bot_router.patch(
@@ -1870,6 +1947,7 @@ async def bot_edit_message(
     msg.mentions = _parse_mentions(body.text)
     if body.components is not None:
         msg.components = dump_components(body.components)
+    seq = await log_change(db, chat_id, msg.id, CHANGE_EDIT)
     await db.commit()
 
     await ws_manager.broadcast_to_chat(
@@ -1882,6 +1960,7 @@ async def bot_edit_message(
                 "edited": True,
                 "components": msg.components or [],
             },
+            "chat_seq": seq,
         },
     )
     return _msg_response(msg)
@@ -1919,14 +1998,16 @@ async def bot_delete_message(
 
     for item in msg.attachments or []:
         if isinstance(item, dict):
-            await storage.delete_by_url(item.get("url"))
+            await delete_upload(db, item.get("url"))
+            await delete_previews(item.get("url"), item.get("preview"))
 
     await db.delete(msg)
+    seq = await log_change(db, chat_id, message_id, CHANGE_DELETE)
     await db.commit()
 
     await ws_manager.broadcast_to_chat(
         chat_id,
-        {"type": "message_deleted", "message_id": str(message_id)},
+        {"type": "message_deleted", "message_id": str(message_id), "chat_seq": seq},
     )
     if was_pinned:
         await ws_manager.broadcast_to_chat(chat_id, _chat_pin_update_payload(chat))
@@ -1940,7 +2021,7 @@ async def bot_respond_interaction(
     bot_user: User = Depends(get_current_bot),
 ):
     """Бот отвечает на интеракцию: update_message / message / ack / modal."""
-    pending = interaction_store.consume(interaction_id)
+    pending = await interaction_store.consume(interaction_id)
     if pending is None:
         raise HTTPException(status_code=404, detail="Interaction not found or expired")
     if pending.bot_id != bot_user.id:
@@ -1956,7 +2037,7 @@ async def bot_respond_interaction(
         # body.modal гарантирован валидатором схемы. Открываем форму ТОЛЬКО
         # кликнувшему — модалка не идёт в общий чат.
         assert body.modal is not None
-        new_iid = interaction_store.create(
+        new_iid = await interaction_store.create(
             message_id=pending.message_id,
             chat_id=chat_id,
             family_id=family_id,
@@ -1995,6 +2076,7 @@ async def bot_respond_interaction(
             msg.mentions = _parse_mentions(body.text)
         if body.components is not None:
             msg.components = dump_components(body.components)
+        seq = await log_change(db, chat_id, msg.id, CHANGE_EDIT)
         await db.commit()
         await ws_manager.broadcast_to_chat(
             chat_id,
@@ -2006,6 +2088,7 @@ async def bot_respond_interaction(
                     "edited": msg.edited,
                     "components": msg.components or [],
                 },
+                "chat_seq": seq,
             },
         )
         return _msg_response(msg)
@@ -2042,8 +2125,9 @@ async def bot_respond_interaction(
     db.add(new_msg)
     await db.flush()
     await db.refresh(new_msg, ["author"])
+    seq = await log_change(db, chat_id, new_msg.id, CHANGE_NEW)
     await db.commit()
     await ws_manager.broadcast_to_chat(
-        chat_id, {"type": "new_message", "message": _msg_to_dict(new_msg)}
+        chat_id, {"type": "new_message", "message": _msg_to_dict(new_msg), "chat_seq": seq}
     )
     return _msg_response(new_msg, bot_user.display_name)
@@ -1,4 +1,3 @@
-from collections import defaultdict
 from decimal import Decimal, ROUND_HALF_UP
 from uuid import UUID
 
@@ -8,6 +7,7 @@ from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import selectinload
 
 from app.auth.deps import get_current_user
+from app.auth.rate_limit_deps import user_rate_limit
 from app.db.deps import get_db
 from app.models.expense import Expense, ExpenseSplit
 from app.models.membership import Membership
@@ -18,6 +18,12 @@ from app.schemas.expenses import (
     ExpenseResponse,
     ExpenseSplitSchema,
 )
+from app.services.balance_ledger import (
+    EXPENSE,
+    apply_balance_delta,
+    expense_contribution,
+    ledger_balances,
+)
 from app.services.family import require_membership
 from app.ws.manager import ws_manager
 
@@ -132,6 +138,17 @@ async def create_expense(
                 for split in body.splits
             ]
         )
+        await apply_balance_delta(
+            db,
+            family_id,
+            EXPENSE,
+            {},
+            expense_contribution(
+                expense.paid_by,
+                expense.amount,
+                [(split.user_id, _to_money(split.share)) for split in body.splits],
+            ),
+        )
 
     await db.commit()
 
@@ -172,7 +189,11 @@ async def list_expenses(
     return [_to_expense_response(expense) for expense in expenses.all()]
 
 
-@router.get("/balance", response_model=list[BalanceResponse])
+@router.get(
+    "/balance",
+    response_model=list[BalanceResponse],
+    dependencies=[user_rate_limit("expense_balances")],
+)
 async def get_balances(
     family_id: UUID,
     db: AsyncSession = Depends(get_db),
@@ -187,26 +208,14 @@ async def get_balances(
     )
     family_memberships = memberships.all()
 
-    balances: dict[UUID, Decimal] = defaultdict(lambda: Decimal("0.00"))
-    for membership in family_memberships:
-        balances[membership.user_id] = Decimal("0.00")
-
-    expenses = await db.scalars(
-        select(Expense)
-        .where(Expense.family_id == family_id)
-        .options(selectinload(Expense.splits))
-    )
-
-    for expense in expenses.all():
-        balances[expense.paid_by] += _to_money(expense.amount)
-        for split in expense.splits:
-            balances[split.user_id] -= _to_money(split.share)
+    # Леджер ведётся при создании расходов (services/balance_ledger.py).
+    balances = await ledger_balances(db, family_id, EXPENSE)
 
     return [
         BalanceResponse(
             user_id=membership.user_id,
             display_name=membership.user.display_name,
-            balance=_to_money(balances[membership.user_id]),
+            balance=_to_money(balances.get(membership.user_id, Decimal("0"))),
         )
         for membership in family_memberships
     ]
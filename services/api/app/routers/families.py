@@ -1,7 +1,4 @@
 import secrets
-import shutil
-from datetime import datetime, timedelta, timezone
-from pathlib import Path
 from uuid import UUID
 
 from fastapi import APIRouter, Depends, HTTPException, WebSocket, WebSocketDisconnect, status
@@ -10,32 +7,36 @@ from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import selectinload
 
 from app.auth.deps import get_current_user
-from app.core.jwt import COOKIE_NAME, decode_access_token
-from app.core.uploads import get_upload_root
-from app.core.ws_security import is_allowed_ws_origin
-from app.core.ws_tickets import ws_ticket_store
 from app.db.deps import get_db
 from app.db.session import AsyncSessionLocal
 from app.models.chat import Chat
 from app.models.family import Family
 from app.models.membership import Membership, Role
+from app.models.storage_object import OWNER_FAMILY
 from app.models.user import User
 from app.schemas.families import (
     ChangeMemberRoleRequest,
     CreateFamilyRequest,
     FamilyDetailResponse,
+    FamilyMemberPresence,
     FamilyMemberResponse,
     FamilyResponse,
+    StorageUsageResponse,
     TransferOwnershipRequest,
 )
 from app.core.permissions import Perm
 from app.schemas.moderation import ModerationSettingsResponse, ModerationSettingsUpdate
 from app.services.audit import log_action
-from app.services.bans import is_banned_now
 from app.services.family import create_family, require_membership, require_owner
+from app.services.jobs import wake_job_worker
 from app.services.moderation import get_or_create_settings
 from app.services.roles import require_family_perm
+from app.services.storage_cleanup import enqueue_storage_cleanup, family_storage_prefixes
+from app.services.storage_quota import owner_storage_usage, release_family_storage
+from app.ws.auth import authenticate_ws_user
+from app.ws.codec import accept_ws, send_payload
 from app.ws.manager import ws_manager
+from app.ws.presence import presence_payload, presence_tracker
 
 router = APIRouter(prefix="/families", tags=["families"])
 
@@ -83,21 +84,6 @@ async def disable_calendar_feed(
         await db.commit()
 
 
-def _presence_payload(
-    family_id: UUID,
-    user_id: UUID,
-    is_online: bool,
-    last_seen_at: datetime | None,
-) -> dict:
-    return {
-        "type": "presence_update",
-        "family_id": str(family_id),
-        "user_id": str(user_id),
-        "is_online": is_online,
-        "last_seen_at": last_seen_at.isoformat() if last_seen_at else None,
-    }
-
-
 def _family_to_detail_response(family: Family) -> FamilyDetailResponse:
     members = [
         FamilyMemberResponse(
@@ -265,6 +251,41 @@ async def get_family(
     return _family_to_detail_response(family)
 
 
+@router.get("/{family_id}/presence", response_model=list[FamilyMemberPresence])
+async def get_family_presence(
+    family_id: UUID,
+    db: AsyncSession = Depends(get_db),
+    user: User = Depends(get_current_user),
+):
+    """Статус всех участников одним запросом — вместо опроса профилей по одному."""
+    await require_membership(family_id, user, db)
+
+    rows = await db.execute(
+        select(User.id, User.is_online, User.last_seen_at)
+        .join(Membership, Membership.user_id == User.id)
+        .where(Membership.family_id == family_id)
+    )
+    snapshot = await presence_tracker.snapshot(
+        {user_id: (is_online, last_seen) for user_id, is_online, last_seen in rows.all()}
+    )
+    return [
+        FamilyMemberPresence(user_id=user_id, is_online=is_online, last_seen_at=last_seen)
+        for user_id, (is_online, last_seen) in snapshot.items()
+    ]
+
+
+@router.get("/{family_id}/storage", response_model=StorageUsageResponse)
+async def get_family_storage(
+    family_id: UUID,
+    db: AsyncSession = Depends(get_db),
+    user: User = Depends(get_current_user),
+):
+    """Занятое семьёй место и квота — из счётчика, без обхода файлов."""
+    await require_membership(family_id, user, db)
+    used, objects, quota = await owner_storage_usage(db, OWNER_FAMILY, family_id)
+    return StorageUsageResponse(used_bytes=used, objects=objects, quota_bytes=quota)
+
+
 @router.patch("/{family_id}", response_model=FamilyResponse)
 async def rename_family(
     family_id: UUID,
@@ -327,6 +348,7 @@ async def update_moderation(
         "slowmode_default_seconds",
         "banned_words",
         "max_message_length",
+        "audit_retention_days",
     ):
         old = getattr(settings, field)
         new = getattr(body, field)
@@ -365,7 +387,7 @@ async def delete_family(
         raise HTTPException(status_code=404, detail="Family not found")
 
     # Собираем id чатов заранее: после удаления строк их уже не достать,
-    # а нам нужно вычистить директории с вложениями с диска.
+    # а нам нужно вычистить из хранилища их вложения.
     chat_ids = list(
         (await db.scalars(select(Chat.id).where(Chat.family_id == family_id))).all()
     )
@@ -375,30 +397,15 @@ async def delete_family(
     # budget/calendar/notes/reminders/family_tree, family_roles→member_roles,
     # channel/chat overrides, audit_log) уходят по FK ON DELETE CASCADE на
     # уровне БД — все нужные внешние ключи объявлены с ondelete="CASCADE".
+    # Доли участников в файлах семьи списываются сразу, не дожидаясь очистки.
+    await release_family_storage(db, family_id)
     await db.execute(sa_delete(Family).where(Family.id == family_id))
+    # Файлы (local и s3) удаляет фоновая задача: она коммитится вместе с
+    # удалением строк, так что при откате файлы не теряются, а при падении
+    # процесса очистка не пропадает. Запрос не ждёт rmtree/листинга бакета.
+    await enqueue_storage_cleanup(db, family_storage_prefixes(family_id, chat_ids))
     await db.commit()
-
-    # Файлы чистим только ПОСЛЕ успешного коммита, чтобы не потерять их,
-    # если транзакция откатится. Все вложения семьи лежат под upload-root:
-    #   <root>/<family_id>/                — галерея и прочие файлы семьи,
-    #   <root>/chat_files/<chat_id>/       — вложения и голосовые сообщений.
-    upload_root = get_upload_root().resolve()
-    chat_files_root = (upload_root / "chat_files").resolve()
-    for chat_id in chat_ids:
-        chat_path = (chat_files_root / str(chat_id)).resolve()
-        try:
-            chat_path.relative_to(chat_files_root)
-        except ValueError:
-            continue
-        shutil.rmtree(chat_path, ignore_errors=True)
-
-    family_path = (upload_root / str(family_id)).resolve()
-    try:
-        family_path.relative_to(upload_root)
-    except ValueError:
-        family_path = None
-    if family_path is not None:
-        shutil.rmtree(family_path, ignore_errors=True)
+    wake_job_worker()
 
     # Журнал аудита здесь не ведём — запись всё равно ушла бы под каскад.
     # Вместо этого уведомляем клиентов, чтобы они сбросили активную семью,
@@ -567,38 +574,12 @@ async def family_ws(
     websocket: WebSocket,
     family_id: UUID,
 ):
-    # Defense-in-depth против CSWSH: чужой Origin не пускаем (L8).
-    if not is_allowed_ws_origin(websocket):
-        await websocket.close(code=4403)
-        return
-
-    token = websocket.cookies.get(COOKIE_NAME)
-    decoded = decode_access_token(token) if token else None
-    user_id = decoded[0] if decoded else None
-    token_iat = decoded[1] if decoded else None
-    if not user_id:
-        ticket = websocket.query_params.get("ticket")
-        if ticket:
-            user_id = await ws_ticket_store.consume(ticket)
-    if not user_id:
-        await websocket.close(code=4001)
-        return
-
     async with AsyncSessionLocal() as db:
-        user = await db.scalar(select(User).where(User.id == user_id))
-        if not user:
-            await websocket.close(code=4001)
-            return
-
-        if token_iat is not None and token_iat + timedelta(seconds=1) < user.password_changed_at:
-            await websocket.close(code=4001)
-            return
-
-        # Глобальный бан: закрываем даже валидный ticket-путь (где revocation по
-        # password_changed_at не срабатывает, т.к. token_iat is None).
-        if is_banned_now(user):
-            await websocket.close(code=4003)
+        user, close_code = await authenticate_ws_user(websocket, db)
+        if user is None:
+            await websocket.close(code=close_code)
             return
+        user_id = user.id
 
         m = await db.scalar(
             select(Membership).where(
@@ -613,35 +594,22 @@ async def family_ws(
         was_online = user.is_online
         last_seen_at = user.last_seen_at
 
-    await websocket.accept()
+    await accept_ws(websocket)
     await ws_manager.connect_family(family_id, websocket, user_id=user_id)
-    became_online = await ws_manager.register_presence_connection(family_id, user_id, websocket)
-    if became_online or not was_online:
-        async with AsyncSessionLocal() as db:
-            u = await db.get(User, user_id)
-            if u:
-                u.is_online = True
-                await db.commit()
-                last_seen_at = u.last_seen_at
-        await ws_manager.broadcast_to_family(
-            family_id,
-            _presence_payload(
-                family_id=family_id,
-                user_id=user_id,
-                is_online=True,
-                last_seen_at=last_seen_at,
-            ),
-        )
+    await presence_tracker.connect(
+        user_id,
+        websocket,
+        family_id=family_id,
+        last_seen_at=last_seen_at,
+        was_online=was_online,
+    )
 
     # Always send the caller's current presence state to avoid stale UI on connect races.
-    await websocket.send_json(
-        _presence_payload(
-            family_id=family_id,
-            user_id=user_id,
-            is_online=True,
-            last_seen_at=last_seen_at,
-        )
-    )
+    await send_payload(websocket, presence_payload(family_id, user_id, True, last_seen_at))
+    # Статус всей семьи одним сообщением — клиенту не нужно восстанавливать его
+    # по последующим presence_update.
+    for snapshot in await presence_tracker.family_snapshots([family_id]):
+        await send_payload(websocket, snapshot)
 
     try:
         while True:
@@ -652,26 +620,4 @@ async def family_ws(
         pass
     finally:
         ws_manager.disconnect_family(family_id, websocket)
-        became_offline = await ws_manager.unregister_presence_connection(
-            family_id,
-            user_id,
-            websocket,
-        )
-        if became_offline:
-            offline_seen = datetime.now(timezone.utc)
-            async with AsyncSessionLocal() as db:
-                u = await db.get(User, user_id)
-                if u:
-                    u.is_online = False
-                    u.last_seen_at = offline_seen
-                    await db.commit()
-                    offline_seen = u.last_seen_at
-            await ws_manager.broadcast_to_family(
-                family_id,
-                _presence_payload(
-                    family_id=family_id,
-                    user_id=user_id,
-                    is_online=False,
-                    last_seen_at=offline_seen,
-                ),
-            )
+        await presence_tracker.disconnect(user_id, websocket, family_id=family_id)
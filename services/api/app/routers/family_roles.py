@@ -2,10 +2,13 @@
 
 from __future__ import annotations
 
+import hashlib
+import json
 from uuid import UUID
 
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy import delete, func, select
+from fastapi import APIRouter, Depends, HTTPException, Request, Response, status
+from fastapi.responses import JSONResponse
+from sqlalchemy import delete, func, literal, select
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.auth.deps import get_current_user
@@ -33,7 +36,8 @@ from app.schemas.role import (
 )
 from app.services.audit import log_action
 from app.services.family import require_membership
-from app.services.roles import effective_permissions
+from app.services.roles import effective_permissions, effective_permissions_matrix
+from app.ws.manager import ws_manager
 
 router = APIRouter(prefix="/families/{family_id}", tags=["roles"])
 
@@ -139,6 +143,13 @@ async def _list_roles_with_counts(
     return [_role_to_response(r, counts.get(r.id, 0)) for r in roles]
 
 
+def _etags(header: str | None) -> set[str]:
+    """``If-None-Match: "a", W/"b"`` → {"a", "b"}."""
+    if not header:
+        return set()
+    return {tag.strip().removeprefix("W/").strip('"') for tag in header.split(",")}
+
+
 # ─────────────────────────────────────────────────────────────────────────────
 # Эндпоинты
 # ─────────────────────────────────────────────────────────────────────────────
@@ -147,6 +158,7 @@ async def _list_roles_with_counts(
 @router.get("/me/permissions")
 async def get_my_effective_permissions(
     family_id: UUID,
+    request: Request,
     db: AsyncSession = Depends(get_db),
     user: User = Depends(get_current_user),
 ):
@@ -154,56 +166,53 @@ async def get_my_effective_permissions(
       * base — права на уровне семьи (OR ролей);
       * chats: { chat_id → bits } и channels: { channel_id → bits } с учётом overrides;
       * is_administrator: шорткат — есть ли ADMINISTRATOR-бит или owner-membership.
+
+    Вся матрица — за несколько запросов независимо от числа чатов
+    (``effective_permissions_matrix``). ETag — хэш ответа: клиент кэширует
+    матрицу и присылает ``If-None-Match``, пока роли, override-ы и состав
+    чатов не изменились, — в ответ 304 без тела. Экономится только трафик:
+    матрица считается и на 304 (версии прав у семьи нет, хэш — от ответа).
     """
     from app.models.chat import Chat
     from app.models.channel import Channel
-    from app.services.roles import (
-        effective_chat_permissions,
-        effective_channel_permissions,
-    )
 
     membership = await require_membership(family_id, user, db)
     is_developer = bool(user.is_developer)
     is_owner = membership.role.value == "owner"
-    base = await effective_permissions(db, membership.id)
-
-    # Шорткат — owner и разработчик (god-mode) получают все биты.
-    god_mode = is_owner or is_developer
-    if god_mode:
-        base = base | int(Perm.ADMINISTRATOR)
 
-    chat_ids = (
-        await db.scalars(
-            select(Chat.id).where(Chat.family_id == family_id)
+    targets = (
+        await db.execute(
+            select(Chat.id, literal("chat"))
+            .where(Chat.family_id == family_id)
+            .union_all(select(Channel.id, literal("channel")).where(Channel.family_id == family_id))
         )
     ).all()
-    channel_ids = (
-        await db.scalars(
-            select(Channel.id).where(Channel.family_id == family_id)
+    chat_ids = [tid for tid, kind in targets if kind == "chat"]
+    channel_ids = [tid for tid, kind in targets if kind == "channel"]
+
+    # Шорткат — owner и разработчик (god-mode) получают все биты.
+    if is_owner or is_developer:
+        base = await effective_permissions(db, membership.id) | int(Perm.ADMINISTRATOR)
+        chat_bits = dict.fromkeys(chat_ids, base)
+        channel_bits = dict.fromkeys(channel_ids, base)
+    else:
+        base, chat_bits, channel_bits = await effective_permissions_matrix(
+            db, membership, chat_ids, channel_ids
         )
-    ).all()
 
-    chat_perms: dict[str, int] = {}
-    channel_perms: dict[str, int] = {}
-    for cid in chat_ids:
-        if god_mode:
-            chat_perms[str(cid)] = base
-        else:
-            chat_perms[str(cid)] = await effective_chat_permissions(db, membership.id, cid)
-    for cid in channel_ids:
-        if god_mode:
-            channel_perms[str(cid)] = base
-        else:
-            channel_perms[str(cid)] = await effective_channel_permissions(db, membership.id, cid)
-
-    return {
+    body = {
         "base": base,
         "is_owner": is_owner,
         "is_developer": is_developer,
         "is_administrator": bool(base & int(Perm.ADMINISTRATOR)),
-        "chats": chat_perms,
-        "channels": channel_perms,
+        "chats": {str(cid): bits for cid, bits in chat_bits.items()},
+        "channels": {str(cid): bits for cid, bits in channel_bits.items()},
     }
+    digest = hashlib.sha256(json.dumps(body, sort_keys=True).encode()).hexdigest()[:32]
+    headers = {"ETag": f'"{digest}"', "Cache-Control": "private, no-cache"}
+    if digest in _etags(request.headers.get("if-none-match")):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    return JSONResponse(body, headers=headers)
 
 
 @router.get("/permissions/catalog", response_model=PermissionsCatalogResponse)
@@ -375,6 +384,7 @@ async def reorder_roles(
         metadata={"order": [role.name for role in final_order]},
     )
     await db.commit()
+    await ws_manager.chat_access_changed(family_id)
     return await _list_roles_with_counts(db, family_id)
 
 
@@ -447,6 +457,9 @@ async def update_role(
         )
 
     await db.commit()
+    if perm_diff or "priority" in changes:
+        # Права и порядок ролей решают видимость чатов — пересчёт подписок ботов.
+        await ws_manager.chat_access_changed(family_id)
     await db.refresh(role)
 
     member_count = await db.scalar(
@@ -481,6 +494,7 @@ async def delete_role(
     )
     await db.delete(role)
     await db.commit()
+    await ws_manager.chat_access_changed(family_id)
 
 
 @router.put(
@@ -621,6 +635,7 @@ async def set_member_roles(
     )
 
     await db.commit()
+    await ws_manager.chat_access_changed(family_id)
 
     # Возвращаем актуальный набор ролей участника.
     out_roles = (
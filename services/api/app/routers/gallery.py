@@ -1,22 +1,40 @@
 import uuid
+from datetime import datetime
 from pathlib import Path
 from uuid import UUID
 
-from fastapi import APIRouter, Depends, File, Form, HTTPException, Query, UploadFile, status
-from sqlalchemy import select
+from fastapi import APIRouter, Depends, File, Form, HTTPException, Query, Request, UploadFile, status
+from sqlalchemy import delete, desc, func, select, tuple_
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import selectinload
 
 from app.auth.deps import get_current_user
+from app.auth.rate_limit_deps import user_rate_limit
+from app.core.cursors import decode_cursor, encode_cursor
 from app.core.file_signatures import enforce_safe_signature
 from app.core.permissions import Perm, has_perm
-from app.core.storage import storage
 from app.db.deps import get_db
 from app.models.gallery_item import GalleryItem, MediaType
 from app.models.membership import Membership
 from app.models.user import User
-from app.schemas.gallery import BulkDeleteRequest, GalleryItemResponse
+from app.schemas.gallery import BulkDeleteRequest, GalleryItemResponse, GalleryTimelineBucket
+from app.services.jobs import wake_job_worker
+from app.services.previews import (
+    TARGET_GALLERY,
+    delete_previews,
+    enqueue_previews,
+    preview_item,
+    preview_urls,
+)
 from app.services.roles import effective_permissions
+from app.services.storage_cleanup import enqueue_storage_deletes
+from app.services.storage_quota import (
+    delete_upload,
+    delete_uploads,
+    precheck_upload_quota,
+    save_upload,
+    save_uploads,
+)
 
 router = APIRouter(prefix="/families/{family_id}/gallery", tags=["gallery"])
 
@@ -37,6 +55,7 @@ ALLOWED_FILES = {
     ".epub", ".fb2", ".mobi",
 }
 MAX_FILE_SIZE = 50 * 1024 * 1024
+MAX_BULK_FILES = 100
 
 
 async def _require_member(family_id: UUID, user: User, db: AsyncSession) -> Membership:
@@ -51,6 +70,16 @@ async def _require_member(family_id: UUID, user: User, db: AsyncSession) -> Memb
     return m
 
 
+def _media_type(ext: str) -> MediaType:
+    if ext in ALLOWED_IMAGES:
+        return MediaType.IMAGE
+    if ext in ALLOWED_VIDEOS:
+        return MediaType.VIDEO
+    if ext in ALLOWED_FILES:
+        return MediaType.FILE
+    raise HTTPException(status_code=415, detail="Неподдерживаемый формат файла")
+
+
 def _item_to_response(item: GalleryItem) -> GalleryItemResponse:
     return GalleryItemResponse(
         id=item.id,
@@ -62,7 +91,9 @@ def _item_to_response(item: GalleryItem) -> GalleryItemResponse:
         file_name=item.file_name,
         file_size=item.file_size,
         caption=item.caption,
+        preview=item.preview,
         created_at=item.created_at,
+        cursor=encode_cursor(item.created_at, item.id),
     )
 
 
@@ -71,24 +102,72 @@ async def list_gallery(
     family_id: UUID,
     limit: int = Query(default=50, ge=1, le=100),
     offset: int = Query(default=0, ge=0),
+    cursor: str | None = Query(default=None, max_length=128),
+    before: datetime | None = Query(default=None),
+    media_type: MediaType | None = Query(default=None),
     db: AsyncSession = Depends(get_db),
     user: User = Depends(get_current_user),
 ):
+    """Новые первыми. Следующая страница — ``cursor`` последнего элемента
+    (keyset по (created_at, id): глубина прокрутки не влияет на скорость,
+    новые загрузки и удаления не сдвигают страницы). ``before`` — переход к
+    дате (например, к месяцу из ``/timeline``). ``offset`` оставлен для
+    старых клиентов."""
     await _require_member(family_id, user, db)
-    items = await db.scalars(
+    query = (
         select(GalleryItem)
         .where(GalleryItem.family_id == family_id)
         .options(selectinload(GalleryItem.uploader))
-        .order_by(GalleryItem.created_at.desc())
+        .order_by(GalleryItem.created_at.desc(), GalleryItem.id.desc())
         .limit(limit)
         .offset(offset)
     )
+    if media_type is not None:
+        query = query.where(GalleryItem.media_type == media_type)
+    if before is not None:
+        query = query.where(GalleryItem.created_at < before)
+    if cursor is not None:
+        query = query.where(
+            tuple_(GalleryItem.created_at, GalleryItem.id) < tuple_(*decode_cursor(cursor))
+        )
+    items = await db.scalars(query)
     return [_item_to_response(i) for i in items.all()]
 
 
-@router.post("", response_model=GalleryItemResponse, status_code=status.HTTP_201_CREATED)
+@router.get("/timeline", response_model=list[GalleryTimelineBucket])
+async def gallery_timeline(
+    family_id: UUID,
+    media_type: MediaType | None = Query(default=None),
+    db: AsyncSession = Depends(get_db),
+    user: User = Depends(get_current_user),
+):
+    """Число файлов по месяцам (UTC), новые первыми — для перехода к году или
+    месяцу без прокрутки ленты. Один агрегирующий запрос по индексу семьи."""
+    await _require_member(family_id, user, db)
+    month = func.date_trunc("month", func.timezone("UTC", GalleryItem.created_at))
+    query = (
+        select(month.label("month"), func.count().label("count"))
+        .where(GalleryItem.family_id == family_id)
+        # По метке, а не выражению: иначе параметры date_trunc в SELECT и
+        # GROUP BY станут разными $n и Postgres не сочтёт их одним выражением.
+        .group_by("month")
+        .order_by(desc("month"))
+    )
+    if media_type is not None:
+        query = query.where(GalleryItem.media_type == media_type)
+    rows = await db.execute(query)
+    return [GalleryTimelineBucket(month=m.date(), count=n) for m, n in rows.all()]
+
+
+@router.post(
+    "",
+    response_model=GalleryItemResponse,
+    status_code=status.HTTP_201_CREATED,
+    dependencies=[user_rate_limit("gallery_upload", per_mb=1)],
+)
 async def upload_to_gallery(
     family_id: UUID,
+    request: Request,
     file: UploadFile = File(...),
     caption: str | None = Form(default=None),
     db: AsyncSession = Depends(get_db),
@@ -98,16 +177,9 @@ async def upload_to_gallery(
 
     original_name = file.filename or "file"
     ext = Path(original_name).suffix.lower()
+    media_type = _media_type(ext)
 
-    if ext in ALLOWED_IMAGES:
-        media_type = MediaType.IMAGE
-    elif ext in ALLOWED_VIDEOS:
-        media_type = MediaType.VIDEO
-    elif ext in ALLOWED_FILES:
-        media_type = MediaType.FILE
-    else:
-        raise HTTPException(status_code=415, detail="Неподдерживаемый формат файла")
-
+    await precheck_upload_quota(db, request, [file], family_id=family_id, user_id=user.id)
     content = await file.read()
     if len(content) > MAX_FILE_SIZE:
         raise HTTPException(status_code=413, detail="Файл слишком большой (макс. 50 МБ)")
@@ -115,7 +187,14 @@ async def upload_to_gallery(
 
     filename = f"{uuid.uuid4()}{ext}"
     try:
-        await storage.save(f"{family_id}/{filename}", content, file.content_type)
+        await save_upload(
+            db,
+            f"{family_id}/{filename}",
+            content,
+            file.content_type,
+            family_id=family_id,
+            user_id=user.id,
+        )
     except OSError as exc:
         raise HTTPException(
             status_code=500,
@@ -134,7 +213,11 @@ async def upload_to_gallery(
         caption=caption,
     )
     db.add(item)
+    await db.flush()
+    if media_type == MediaType.IMAGE:
+        await enqueue_previews(db, [preview_item(TARGET_GALLERY, item.id, url)])
     await db.commit()
+    wake_job_worker()
 
     item = await db.scalar(
         select(GalleryItem)
@@ -144,6 +227,94 @@ async def upload_to_gallery(
     return _item_to_response(item)
 
 
+@router.post(
+    "/bulk",
+    response_model=list[GalleryItemResponse],
+    status_code=status.HTTP_201_CREATED,
+    dependencies=[user_rate_limit("gallery_upload", per_mb=1)],
+)
+async def bulk_upload_to_gallery(
+    family_id: UUID,
+    request: Request,
+    files: list[UploadFile] = File(...),
+    db: AsyncSession = Depends(get_db),
+    user: User = Depends(get_current_user),
+):
+    """Несколько файлов одним запросом: читаются и пишутся в хранилище
+    параллельно, строки и учёт — одной транзакцией. Ошибка в любом файле
+    отменяет всю пачку."""
+    await _require_member(family_id, user, db)
+    if len(files) > MAX_BULK_FILES:
+        raise HTTPException(status_code=400, detail=f"Не больше {MAX_BULK_FILES} файлов за раз")
+
+    names = [f.filename or "file" for f in files]
+    exts = [Path(name).suffix.lower() for name in names]
+    media_types = [_media_type(ext) for ext in exts]
+    await precheck_upload_quota(db, request, files, family_id=family_id, user_id=user.id)
+
+    def _reader(file: UploadFile, name: str, ext: str):
+        async def read() -> bytes:
+            content = await file.read()
+            if len(content) > MAX_FILE_SIZE:
+                raise HTTPException(
+                    status_code=413, detail=f"Файл слишком большой (макс. 50 МБ): {name}"
+                )
+            enforce_safe_signature(ext, content)
+            return content
+
+        return read
+
+    keys = [f"{family_id}/{uuid.uuid4()}{ext}" for ext in exts]
+    try:
+        sizes = await save_uploads(
+            db,
+            [
+                (key, _reader(f, name, ext), f.content_type)
+                for key, f, name, ext in zip(keys, files, names, exts)
+            ],
+            family_id=family_id,
+            user_id=user.id,
+        )
+    except OSError as exc:
+        raise HTTPException(
+            status_code=500,
+            detail="Не удалось сохранить файл. Проверьте права на папку загрузок.",
+        ) from exc
+
+    items = [
+        GalleryItem(
+            family_id=family_id,
+            uploaded_by=user.id,
+            media_type=media_type,
+            url=f"/static/uploads/{key}",
+            file_name=name,
+            file_size=size,
+        )
+        for key, name, media_type, size in zip(keys, names, media_types, sizes)
+    ]
+    db.add_all(items)
+    await db.flush()
+    await enqueue_previews(
+        db,
+        [
+            preview_item(TARGET_GALLERY, item.id, item.url)
+            for item in items
+            if item.media_type == MediaType.IMAGE
+        ],
+    )
+    await db.commit()
+    wake_job_worker()
+
+    ids = [item.id for item in items]
+    loaded = await db.scalars(
+        select(GalleryItem)
+        .where(GalleryItem.id.in_(ids))
+        .options(selectinload(GalleryItem.uploader))
+    )
+    by_id = {item.id: item for item in loaded.all()}
+    return [_item_to_response(by_id[item_id]) for item_id in ids]
+
+
 @router.delete("/{item_id}", status_code=status.HTTP_204_NO_CONTENT)
 async def delete_gallery_item(
     family_id: UUID,
@@ -162,7 +333,8 @@ async def delete_gallery_item(
         if not has_perm(bits, Perm.MANAGE_GALLERY):
             raise HTTPException(status_code=403, detail="Недостаточно прав для удаления чужих файлов")
 
-    await storage.delete_by_url(item.url)
+    await delete_upload(db, item.url)
+    await delete_previews(item.url, item.preview)
 
     await db.delete(item)
     await db.commit()
@@ -179,15 +351,25 @@ async def bulk_delete_gallery(
     can_manage_others = m.role.value == "owner" or has_perm(
         await effective_permissions(db, m.id), Perm.MANAGE_GALLERY
     )
-    items = await db.scalars(
-        select(GalleryItem).where(
-            GalleryItem.family_id == family_id,
-            GalleryItem.id.in_(body.ids),
-        )
+    # Одно DELETE … RETURNING вместо загрузки строк и удаления по одной;
+    # файлы (оригиналы и превью) удаляет фоновая задача пачками.
+    stmt = delete(GalleryItem).where(
+        GalleryItem.family_id == family_id,
+        GalleryItem.id.in_(body.ids),
     )
-    for item in items.all():
-        if item.uploaded_by != user.id and not can_manage_others:
-            continue
-        await storage.delete_by_url(item.url)
-        await db.delete(item)
+    if not can_manage_others:
+        stmt = stmt.where(GalleryItem.uploaded_by == user.id)
+    rows = (
+        await db.execute(
+            stmt.returning(GalleryItem.url, GalleryItem.preview),
+            execution_options={"synchronize_session": False},
+        )
+    ).all()
+    to_delete = await delete_uploads(db, [url for url, _ in rows])
+    to_delete += [
+        (url, None) for stored_url, preview in rows for url in preview_urls(stored_url, preview)
+    ]
+    enqueued = await enqueue_storage_deletes(db, to_delete)
     await db.commit()
+    if enqueued:
+        wake_job_worker()
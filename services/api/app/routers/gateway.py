@@ -0,0 +1,206 @@
+"""Мультиплекс-gateway для людей: один WebSocket на устройство.
+
+Раньше клиент держал `families/{id}/ws` на каждую семью и `chats/{id}/ws` на
+каждый открытый чат — каждый сокет заново проходил handshake (JWT, User,
+Membership, чат, права). Здесь сокет аутентифицируется один раз, а семьи и
+чаты подписываются in-band:
+
+    → {"op": "subscribe",   "family_ids": [...], "chat_ids": [...]}
+    ← {"type": "subscribed", "family_ids": [...], "chat_ids": [...], "denied": [...]}
+    → {"op": "unsubscribe", "family_ids": [...], "chat_ids": [...]}
+    ← {"type": "unsubscribed", "family_ids": [...], "chat_ids": [...]}
+    → "ping"  ← "pong"
+
+Права на пачку чатов проверяются одним `effective_permissions_for_chats` на
+семью. Presence считается один раз на соединение, а не на каждую подписку; на
+подписку семьи приходит `presence_snapshot` со статусом всех участников.
+Kick/удаление семьи не рвёт сокет: приходит `family_removed`, подписки этой
+семьи снимаются, остальные продолжают работать.
+
+Старые `families/{id}/ws` и `chats/{id}/ws` остаются для совместимости.
+"""
+
+from __future__ import annotations
+
+import json
+from uuid import UUID
+
+from fastapi import APIRouter, WebSocket, WebSocketDisconnect
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.permissions import Perm, has_perm
+from app.db.session import AsyncSessionLocal
+from app.models.chat import Chat
+from app.models.membership import Membership
+from app.services.roles import effective_permissions_for_chats
+from app.ws.auth import authenticate_ws_user
+from app.ws.codec import accept_ws, send_payload
+from app.ws.manager import ws_manager
+from app.ws.presence import presence_tracker
+
+router = APIRouter(tags=["gateway"])
+
+# Защита от «подпишись на всё сразу»: лимиты на одну операцию и на сокет.
+_MAX_IDS_PER_OP = 100
+_MAX_FAMILIES = 50
+_MAX_CHATS = 500
+
+
+def _parse_ids(raw, denied: list[str]) -> list[UUID]:
+    if not isinstance(raw, list):
+        return []
+    out: list[UUID] = []
+    for value in raw[:_MAX_IDS_PER_OP]:
+        try:
+            out.append(UUID(str(value)))
+        except ValueError:
+            denied.append(str(value))
+    return out
+
+
+async def _subscribe(
+    websocket: WebSocket, user_id: UUID, family_ids: list[UUID], chat_ids: list[UUID]
+) -> tuple[list[UUID], list[UUID], list[UUID]]:
+    """Проверить членство/права пачкой и подписать сокет. → (семьи, чаты, отказы)."""
+    denied: list[UUID] = []
+    async with AsyncSessionLocal() as db:
+        chat_family: dict[UUID, UUID] = {}
+        if chat_ids:
+            rows = await db.execute(
+                select(Chat.id, Chat.family_id).where(Chat.id.in_(chat_ids))
+            )
+            chat_family = dict(rows.all())
+        needed = set(family_ids) | set(chat_family.values())
+        memberships: dict[UUID, Membership] = {}
+        if needed:
+            rows = await db.scalars(
+                select(Membership).where(
+                    Membership.user_id == user_id,
+                    Membership.family_id.in_(needed),
+                )
+            )
+            memberships = {m.family_id: m for m in rows.all()}
+
+        by_family: dict[UUID, list[UUID]] = {}
+        for cid in chat_ids:
+            fid = chat_family.get(cid)
+            if fid is None or fid not in memberships:
+                denied.append(cid)
+            else:
+                by_family.setdefault(fid, []).append(cid)
+        viewable: list[tuple[UUID, UUID]] = []
+        for fid, cids in by_family.items():
+            perms = await effective_permissions_for_chats(db, memberships[fid], cids)
+            for cid in cids:
+                if has_perm(perms.get(cid, 0), Perm.VIEW_CHANNEL):
+                    viewable.append((fid, cid))
+                else:
+                    denied.append(cid)
+
+    subs = ws_manager.mux_subscriptions(websocket)
+    chat_count = sum(len(c) for c in subs.values())
+    families_ok: list[UUID] = []
+    for fid in family_ids:
+        if fid not in memberships or (fid not in subs and len(subs) >= _MAX_FAMILIES):
+            denied.append(fid)
+            continue
+        ws_manager.mux_subscribe_family(websocket, fid, user_id)
+        families_ok.append(fid)
+    chats_ok: list[UUID] = []
+    for fid, cid in viewable:
+        if cid not in subs.get(fid, set()):
+            if chat_count >= _MAX_CHATS or (fid not in subs and len(subs) >= _MAX_FAMILIES):
+                denied.append(cid)
+                continue
+            chat_count += 1
+        ws_manager.mux_subscribe_chat(websocket, fid, cid, user_id)
+        chats_ok.append(cid)
+    return families_ok, chats_ok, denied
+
+
+def _unsubscribe(websocket: WebSocket, family_ids: list[UUID], chat_ids: list[UUID]) -> None:
+    for cid in chat_ids:
+        ws_manager.mux_unsubscribe_chat(websocket, cid)
+    for fid in family_ids:
+        ws_manager.mux_unsubscribe_family(websocket, fid)
+
+
+async def _member_family_ids(db: AsyncSession, user_id: UUID) -> list[UUID]:
+    rows = await db.scalars(select(Membership.family_id).where(Membership.user_id == user_id))
+    return list(rows.all())
+
+
+@router.websocket("/gateway")
+async def gateway_ws(websocket: WebSocket):
+    async with AsyncSessionLocal() as db:
+        user, close_code = await authenticate_ws_user(websocket, db)
+        if user is None:
+            await websocket.close(code=close_code)
+            return
+        user_id = user.id
+        last_seen_at = user.last_seen_at
+        family_ids = await _member_family_ids(db, user_id)
+
+    await accept_ws(websocket)
+    ws_manager.register_mux(websocket)
+    await presence_tracker.connect(user_id, websocket, last_seen_at=last_seen_at)
+
+    await send_payload(
+        websocket,
+        {
+            "type": "ready",
+            "user_id": str(user_id),
+            "family_ids": [str(f) for f in family_ids],
+        },
+    )
+
+    try:
+        while True:
+            data = await websocket.receive_text()
+            if data == "ping":
+                await websocket.send_text("pong")
+                continue
+            try:
+                msg = json.loads(data)
+            except ValueError:
+                msg = None
+            op = msg.get("op") if isinstance(msg, dict) else None
+            if op not in ("subscribe", "unsubscribe"):
+                await send_payload(websocket, {"type": "error", "detail": "unknown op"})
+                continue
+
+            invalid: list[str] = []
+            fids = _parse_ids(msg.get("family_ids"), invalid)
+            cids = _parse_ids(msg.get("chat_ids"), invalid)
+            if op == "unsubscribe":
+                _unsubscribe(websocket, fids, cids)
+                await send_payload(
+                    websocket,
+                    {
+                        "type": "unsubscribed",
+                        "family_ids": [str(f) for f in fids],
+                        "chat_ids": [str(c) for c in cids],
+                    },
+                )
+                continue
+
+            fams_ok, chats_ok, denied = await _subscribe(websocket, user_id, fids, cids)
+            await send_payload(
+                websocket,
+                {
+                    "type": "subscribed",
+                    "family_ids": [str(f) for f in fams_ok],
+                    "chat_ids": [str(c) for c in chats_ok],
+                    "denied": [str(d) for d in denied] + invalid,
+                },
+            )
+            # Снапшот presence подписанных семей (включая себя) — чтобы UI не
+            # собирал статусы по последующим presence_update.
+            for snapshot in await presence_tracker.family_snapshots(fams_ok):
+                await send_payload(websocket, snapshot)
+    except WebSocketDisconnect:
+        pass
+    finally:
+        ws_manager.unregister_mux(websocket)
+        await presence_tracker.disconnect(user_id, websocket)
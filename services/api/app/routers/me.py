@@ -2,7 +2,7 @@ import uuid
 from datetime import datetime, timezone
 from pathlib import Path
 
-from fastapi import APIRouter, Depends, File, HTTPException, Response, UploadFile, status
+from fastapi import APIRouter, Depends, File, HTTPException, Request, Response, UploadFile, status
 from sqlalchemy import delete, select
 from sqlalchemy.ext.asyncio import AsyncSession
 
@@ -11,20 +11,27 @@ from app.core.config import settings
 from app.core.cookies import set_auth_cookie
 from app.core.jwt import create_access_token
 from app.core.file_signatures import enforce_safe_signature
-from app.core.security import hash_pin, verify_pin
-from app.core.storage import storage
+from app.core.security import hash_pin_async, verify_pin_async
 from app.services.push import is_push_enabled
+from app.services.storage_quota import (
+    delete_upload,
+    owner_storage_usage,
+    precheck_upload_quota,
+    save_upload,
+)
 from app.ws.manager import ws_manager
 from app.db.deps import get_db
 from app.models.family import Family
 from app.models.membership import Membership
 from app.models.push_subscription import PushSubscription
+from app.models.storage_object import OWNER_USER
 from app.models.user import User
 from app.schemas.me import (
     ChangePinRequest, MeResponse, MyFamilyResponse,
     PushPublicKeyResponse, PushSubscribeRequest, PushUnsubscribeRequest,
     UpdateProfileRequest,
 )
+from app.schemas.families import StorageUsageResponse
 
 ALLOWED_EXT = {".jpg", ".jpeg", ".png", ".webp"}
 MAX_SIZE = 5 * 1024 * 1024
@@ -78,9 +85,9 @@ async def change_pin(
     db: AsyncSession = Depends(get_db),
     user: User = Depends(get_current_user),
 ):
-    if not verify_pin(body.current_pin, user.password_hash):
+    if not await verify_pin_async(body.current_pin, user.password_hash):
         raise HTTPException(status_code=400, detail="Неверный текущий PIN")
-    user.password_hash = hash_pin(body.new_pin)
+    user.password_hash = await hash_pin_async(body.new_pin)
     # Отозвать все ранее выпущенные JWT этого пользователя (включая
     # потенциально украденные). Текущая сессия получит свежую cookie ниже.
     user.password_changed_at = datetime.now(timezone.utc)
@@ -94,6 +101,7 @@ async def change_pin(
 
 @router.post("/avatar", response_model=MeResponse)
 async def upload_avatar(
+    request: Request,
     file: UploadFile = File(...),
     db: AsyncSession = Depends(get_db),
     user: User = Depends(get_current_user),
@@ -102,6 +110,7 @@ async def upload_avatar(
     if ext not in ALLOWED_EXT:
         raise HTTPException(status_code=415, detail="Unsupported file type")
 
+    await precheck_upload_quota(db, request, [file], family_id=None, user_id=user.id)
     content = await file.read()
     if len(content) > MAX_SIZE:
         raise HTTPException(status_code=413, detail="Файл слишком большой (макс. 5 МБ)")
@@ -109,7 +118,9 @@ async def upload_avatar(
 
     filename = f"{uuid.uuid4()}{ext}"
     try:
-        await storage.save(f"avatars/{filename}", content, file.content_type)
+        await save_upload(
+            db, f"avatars/{filename}", content, file.content_type, family_id=None, user_id=user.id
+        )
     except OSError as exc:
         raise HTTPException(
             status_code=500,
@@ -117,7 +128,7 @@ async def upload_avatar(
         ) from exc
 
     if user.avatar_url:
-        await storage.delete_by_url(user.avatar_url)
+        await delete_upload(db, user.avatar_url)
 
     user.avatar_url = f"/static/uploads/avatars/{filename}"
     await db.commit()
@@ -125,6 +136,16 @@ async def upload_avatar(
     return user
 
 
+@router.get("/storage", response_model=StorageUsageResponse)
+async def my_storage(
+    db: AsyncSession = Depends(get_db),
+    user: User = Depends(get_current_user),
+):
+    """Сколько места занимают мои загрузки во всех семьях (включая аватар)."""
+    used, objects, quota = await owner_storage_usage(db, OWNER_USER, user.id)
+    return StorageUsageResponse(used_bytes=used, objects=objects, quota_bytes=quota)
+
+
 @router.get("/families", response_model=list[MyFamilyResponse])
 async def my_families(
     db: AsyncSession = Depends(get_db),
@@ -35,6 +35,7 @@ from app.services.roles import (
     effective_chat_permissions,
     effective_permissions,
 )
+from app.ws.manager import ws_manager
 
 router = APIRouter(prefix="/families/{family_id}", tags=["permissions"])
 
@@ -263,6 +264,13 @@ async def _list_overrides(
     return [_item(row) for row in rows]
 
 
+async def _notify_scope(family_id: UUID, scope_type: ScopeType, scope_id: UUID) -> None:
+    # Подписки bot gateway зависят от видимости чатов; каналы рассылаются
+    # на уровне семьи и пересчёта не требуют.
+    if scope_type == "chat":
+        await ws_manager.chat_access_changed(family_id, scope_id)
+
+
 async def _upsert_override(
     *,
     family_id: UUID,
@@ -312,6 +320,7 @@ async def _upsert_override(
                 ),
             )
             await db.commit()
+            await _notify_scope(family_id, scope_type, scope_id)
         return OverrideItem(
             subject_type=subject_type,
             role_id=subject_id if subject_type == "role" else None,
@@ -356,6 +365,7 @@ async def _upsert_override(
         ),
     )
     await db.commit()
+    await _notify_scope(family_id, scope_type, scope_id)
     return _item(existing)
 
 
@@ -401,6 +411,7 @@ async def _delete_override(
         ),
     )
     await db.commit()
+    await _notify_scope(family_id, scope_type, scope_id)
 
 
 # ─────────────────────────────────────────────────────────────────────────────
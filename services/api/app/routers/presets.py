@@ -15,7 +15,7 @@ from sqlalchemy.orm import selectinload
 
 from app.auth.deps import get_current_user
 from app.core.permissions import Perm
-from app.core.security import hash_pin
+from app.core.security import hash_pin_async
 from app.db.deps import get_db
 from app.models.chat import Chat
 from app.models.membership import Membership, Role
@@ -23,7 +23,7 @@ from app.models.preset_bot import PresetBot
 from app.models.user import User
 from app.schemas.presets import PresetResponse, PresetUpdateRequest
 from app.services.audit import log_action
-from app.services.preset_bots import PRESETS, PresetMeta
+from app.services.preset_bots import PRESETS, PresetMeta, next_run_at
 from app.services.roles import assign_default_roles_on_join, require_family_perm
 
 router = APIRouter(prefix="/families/{family_id}/presets", tags=["presets"])
@@ -104,7 +104,7 @@ async def _create_bot_identity(
     bot_user = User(
         username=username,
         display_name=meta.default_display_name,
-        password_hash=hash_pin(secrets.token_hex(16)),
+        password_hash=await hash_pin_async(secrets.token_hex(16)),
         is_bot=True,
     )
     db.add(bot_user)
@@ -171,6 +171,8 @@ async def upsert_preset(
         pb.target_chat_id = body.target_chat_id
     if body.enabled is not None:
         pb.enabled = body.enabled
+    # Час/часовой пояс могли измениться — шедулер смотрит только на next_run_at.
+    pb.next_run_at = next_run_at(config, pb.last_run_at)
 
     await log_action(
         db,
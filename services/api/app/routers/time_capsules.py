@@ -8,7 +8,7 @@ import uuid
 from datetime import datetime, timezone
 from pathlib import Path
 
-from fastapi import APIRouter, Depends, File, Form, HTTPException, UploadFile, status
+from fastapi import APIRouter, Depends, File, Form, HTTPException, Request, UploadFile, status
 from sqlalchemy import func, select
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import selectinload
@@ -16,7 +16,6 @@ from sqlalchemy.orm import selectinload
 from app.auth.deps import get_current_user
 from app.core.file_signatures import enforce_safe_signature
 from app.core.permissions import Perm, has_perm
-from app.core.storage import storage
 from app.core.uploads import ALLOWED_ATTACHMENT_EXT, DANGEROUS_CONTENT_TYPES
 from app.db.deps import get_db
 from app.models.membership import Membership
@@ -30,6 +29,7 @@ from app.schemas.time_capsule import (
     CapsuleRow,
 )
 from app.services.roles import effective_permissions
+from app.services.storage_quota import delete_upload, precheck_upload_quota, save_upload
 
 router = APIRouter(prefix="/families/{family_id}/capsules", tags=["time-capsules"])
 
@@ -231,6 +231,7 @@ async def get_capsule(
 async def add_entry(
     family_id: uuid.UUID,
     capsule_id: uuid.UUID,
+    request: Request,
     text: str | None = Form(default=None),
     files: list[UploadFile] = File(default=[]),
     db: AsyncSession = Depends(get_db),
@@ -251,6 +252,7 @@ async def add_entry(
         raise HTTPException(status_code=400, detail="Текст слишком длинный (макс 4000)")
     if len(clean_files) > _MAX_FILES:
         raise HTTPException(status_code=400, detail=f"Слишком много файлов (макс {_MAX_FILES})")
+    await precheck_upload_quota(db, request, clean_files, family_id=family_id, user_id=user.id)
 
     attachments: list[dict] = []
     for upload in clean_files:
@@ -264,7 +266,14 @@ async def add_entry(
         stored_name = f"{uuid.uuid4()}{ext}"
         # Кладём под {family_id}/ — отдаётся существующим membership-гейтед роутом.
         try:
-            await storage.save(f"{family_id}/{stored_name}", payload, upload.content_type)
+            await save_upload(
+                db,
+                f"{family_id}/{stored_name}",
+                payload,
+                upload.content_type,
+                family_id=family_id,
+                user_id=user.id,
+            )
         except OSError as exc:
             raise HTTPException(status_code=500, detail="Не удалось сохранить вложение") from exc
         attachments.append(
@@ -310,7 +319,7 @@ async def delete_entry(
     for item in entry.attachments or []:
         url = item.get("url")
         if url:
-            await storage.delete_by_url(url)
+            await delete_upload(db, url)
     await db.delete(entry)
     await db.commit()
 
@@ -341,7 +350,7 @@ async def delete_capsule(
         for item in e.attachments or []:
             url = item.get("url")
             if url:
-                await storage.delete_by_url(url)
+                await delete_upload(db, url)
 
     await db.delete(capsule)
     await db.commit()
@@ -1,16 +1,20 @@
+from collections.abc import AsyncIterator
+from pathlib import Path
 from uuid import UUID
 
-from fastapi import APIRouter, Depends, HTTPException, status
-from fastapi.responses import FileResponse, StreamingResponse
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from fastapi.responses import FileResponse, Response, StreamingResponse
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.auth.deps import get_current_user
 from app.core.storage import storage
-from app.core.uploads import safe_serve_params, safe_serve_params_for_name
+from app.core.uploads import safe_serve_params_for_name
 from app.db.deps import get_db
 from app.models.chat import Chat
 from app.models.user import User
+from app.services.blobs import physical_url
 from app.services.family import require_membership
+from app.services.previews import PREVIEW_SIZES, variant_url
 
 router = APIRouter(prefix="/static/uploads", tags=["uploads"])
 
@@ -37,44 +41,80 @@ def _validate_path_segment(value: str, field_name: str) -> str:
     return value
 
 
-async def _serve(stored_url: str):
+def _file_response(path: Path, served_url: str) -> FileResponse:
+    media_type, disposition = safe_serve_params_for_name(served_url)
+    return FileResponse(
+        path,
+        media_type=media_type,
+        headers={**_SAFE_HEADERS, "Content-Disposition": disposition},
+    )
+
+
+def _stream_response(
+    result: tuple[AsyncIterator[bytes], int], served_url: str
+) -> StreamingResponse:
+    media_type, disposition = safe_serve_params_for_name(served_url)
+    iterator, size = result
+    headers = {**_SAFE_HEADERS, "Content-Disposition": disposition}
+    if size:
+        headers["Content-Length"] = str(size)
+    return StreamingResponse(iterator, media_type=media_type, headers=headers)
+
+
+async def _serve_variant(stored_url: str, size: str) -> Response | None:
+    """``?size=`` → построенный вариант или None (тогда отдаётся оригинал).
+    Варианты не дедуплицируются — physical_url не нужен; на S3 сразу GET,
+    без HEAD-проверки существования."""
+    if size not in PREVIEW_SIZES:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid size")
+    preview = variant_url(stored_url, size)
+    if preview is None:
+        return None
+    path = storage.local_path_for_url(preview)
+    if path is not None:
+        return _file_response(path, preview) if path.is_file() else None
+    result = await storage.open_stream_for_url(preview)
+    return _stream_response(result, preview) if result is not None else None
+
+
+async def _serve(stored_url: str, db: AsyncSession, size: str | None = None):
+    if size is not None:
+        variant = await _serve_variant(stored_url, size)
+        if variant is not None:
+            return variant
+    # Доступ уже проверен по публичному URL; дедуплицированный файл читается
+    # из общего тела, а тип/имя для заголовков берутся из публичного URL.
+    source_url = await physical_url(db, stored_url)
+
     # Локальный бэкенд — быстрый путь через FileResponse (как раньше).
-    path = storage.local_path_for_url(stored_url)
+    path = storage.local_path_for_url(source_url)
     if path is not None:
         if not path.is_file():
             raise HTTPException(status_code=status.HTTP_404_NOT_FOUND)
-        media_type, disposition = safe_serve_params(path)
-        return FileResponse(
-            path,
-            media_type=media_type,
-            headers={**_SAFE_HEADERS, "Content-Disposition": disposition},
-        )
+        return _file_response(path, stored_url)
 
     # Удалённый бэкенд (S3) — стримим с теми же защитными заголовками.
-    result = await storage.open_stream_for_url(stored_url)
+    result = await storage.open_stream_for_url(source_url)
     if result is None:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND)
-    iterator, size = result
-    media_type, disposition = safe_serve_params_for_name(stored_url)
-    headers = {**_SAFE_HEADERS, "Content-Disposition": disposition}
-    if size:
-        headers["Content-Length"] = str(size)
-    return StreamingResponse(iterator, media_type=media_type, headers=headers)
+    return _stream_response(result, stored_url)
 
 
 @router.get("/avatars/{filename}")
 async def download_avatar(
     filename: str,
+    db: AsyncSession = Depends(get_db),
     _user: User = Depends(get_current_user),
 ):
     safe_filename = _validate_path_segment(filename, "filename")
-    return await _serve(f"/static/uploads/avatars/{safe_filename}")
+    return await _serve(f"/static/uploads/avatars/{safe_filename}", db)
 
 
 @router.get("/chat_files/{chat_id}/{filename}")
 async def download_chat_file(
     chat_id: UUID,
     filename: str,
+    size: str | None = Query(default=None, max_length=8),
     db: AsyncSession = Depends(get_db),
     user: User = Depends(get_current_user),
 ):
@@ -83,16 +123,19 @@ async def download_chat_file(
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND)
     await require_membership(chat.family_id, user, db)
     safe_filename = _validate_path_segment(filename, "filename")
-    return await _serve(f"/static/uploads/chat_files/{chat_id}/{safe_filename}")
+    url = f"/static/uploads/chat_files/{chat_id}/{safe_filename}"
+    return await _serve(url, db, size)
 
 
 @router.get("/{family_id}/{filename}")
 async def download_family_file(
     family_id: UUID,
     filename: str,
+    size: str | None = Query(default=None, max_length=8),
     db: AsyncSession = Depends(get_db),
     user: User = Depends(get_current_user),
 ):
     await require_membership(family_id, user, db)
     safe_filename = _validate_path_segment(filename, "filename")
-    return await _serve(f"/static/uploads/{family_id}/{safe_filename}")
+    url = f"/static/uploads/{family_id}/{safe_filename}"
+    return await _serve(url, db, size)
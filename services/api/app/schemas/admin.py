@@ -4,6 +4,7 @@ from __future__ import annotations
 
 import uuid
 from datetime import datetime
+from decimal import Decimal
 
 from pydantic import BaseModel, Field
 
@@ -34,10 +35,66 @@ class AdminStats(BaseModel):
     messages: int
     banned_users: int
     uploads_bytes: int
-    # Прирост (новые записи) за последние 7 дней — превращает витрину в дашборд.
+    uploads_objects: int = 0
+    # Прирост за последние 7 дней — превращает витрину в дашборд. Считается
+    # разницей снимков; ``delta_since`` — момент базового снимка (если история
+    # короче 7 дней — самый ранний).
     users_delta_7d: int = 0
     families_delta_7d: int = 0
     messages_delta_7d: int = 0
+    # Момент снимка, из которого отданы цифры.
+    taken_at: datetime | None = None
+    delta_since: datetime | None = None
+
+
+class AdminPinHashStats(BaseModel):
+    """Пул хэширования PIN (core/security.py) — с момента старта процесса."""
+
+    workers: int
+    max_pending: int
+    calls: int
+    rejected: int
+    pending: int
+    queue_seconds_avg: float
+    queue_seconds_max: float
+    run_seconds_avg: float
+
+
+class AdminBalanceDrift(BaseModel):
+    family_id: uuid.UUID
+    user_id: uuid.UUID
+    budget_expected: Decimal
+    budget_actual: Decimal
+    expense_expected: Decimal
+    expense_actual: Decimal
+
+
+class AdminBalanceReconcileReport(BaseModel):
+    """Сверка леджера member_balances с пересчётом балансов с нуля."""
+
+    drifted: int
+    fixed: bool
+    # Не больше первых 200 расхождений — полный список в логах не нужен.
+    items: list[AdminBalanceDrift] = []
+
+
+class AdminJobRow(BaseModel):
+    """Фоновая задача (background_jobs) с прогрессом."""
+
+    model_config = {"from_attributes": True}
+
+    id: uuid.UUID
+    kind: str
+    status: str
+    attempts: int
+    max_attempts: int
+    progress_done: int
+    progress_total: int | None = None
+    last_error: str | None = None
+    payload: dict
+    run_after: datetime
+    created_at: datetime
+    finished_at: datetime | None = None
 
 
 class AdminAuditRow(BaseModel):
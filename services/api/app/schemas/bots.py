@@ -60,3 +60,14 @@ class BotChannelInfo(BaseModel):
 
 class BotPostRequest(BaseModel):
     text: str = Field(min_length=1, max_length=10000)
+
+
+class BotEventsPage(BaseModel):
+    """Ответ long-poll `/bot/events`: события с seq и курсор продолжения."""
+
+    events: list[dict]
+    # Передать как `after` в следующий запрос.
+    next: int
+    # Часть событий после `after` уже удалена по сроку хранения — пропущенное
+    # придётся дочитать из истории чатов.
+    truncated: bool = False
@@ -4,6 +4,8 @@ from uuid import UUID
 
 from pydantic import BaseModel, Field
 
+from app.schemas.gallery import MediaPreview
+
 # Reaction-emoji validation.
 #
 # Goal: accept (essentially) *any* real emoji \u2014 including ZWJ sequences
@@ -78,6 +80,8 @@ class ChatResponse(BaseModel):
     pinned_message_id: UUID | None = None
     pinned_message: PinnedMessagePreview | None = None
     encryption_protocol: str | None = None
+    # Последний seq журнала изменений — точка отсчёта для /changes?since=.
+    change_seq: int = 0
     created_at: datetime
 
 
@@ -114,6 +118,7 @@ class MessageAttachment(BaseModel):
     file_name: str
     file_size: int | None = None
     content_type: str | None = None
+    preview: MediaPreview | None = None
 
 
 class MessageReadRequest(BaseModel):
@@ -146,3 +151,23 @@ class MessageResponse(BaseModel):
     reactions: list[ReactionSummary] = []
     readers: list[ReaderInfo] = []
     created_at: datetime
+
+
+class MessageReactionsDelta(BaseModel):
+    message_id: UUID
+    reactions: list[ReactionSummary] = []
+
+
+class ChatChangesResponse(BaseModel):
+    """Дельта чата после since: клиент применяет её и запоминает seq.
+    has_more — журнал отдан не целиком, нужно повторить запрос с новым seq.
+    resync_required — журнал после since уже очищен по сроку хранения:
+    изменений в ответе нет, клиент перечитывает историю и запоминает seq."""
+
+    seq: int
+    new: list[MessageResponse] = []
+    edited: list[MessageResponse] = []
+    deleted: list[UUID] = []
+    reactions: list[MessageReactionsDelta] = []
+    has_more: bool = False
+    resync_required: bool = False
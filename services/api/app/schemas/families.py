@@ -42,6 +42,20 @@ class FamilyMemberResponse(BaseModel):
     joined_at: datetime
 
 
+class FamilyMemberPresence(BaseModel):
+    user_id: UUID
+    is_online: bool
+    last_seen_at: datetime | None = None
+
+
+class StorageUsageResponse(BaseModel):
+    """Занятое место семьи или пользователя. ``quota_bytes`` = None — без лимита."""
+
+    used_bytes: int
+    objects: int
+    quota_bytes: int | None = None
+
+
 class FamilyDetailResponse(BaseModel):
     model_config = {"from_attributes": True}
 
@@ -1,4 +1,4 @@
-from datetime import datetime
+from datetime import date, datetime
 from uuid import UUID
 
 from pydantic import BaseModel
@@ -6,6 +6,16 @@ from pydantic import BaseModel
 from app.models.gallery_item import MediaType
 
 
+class MediaPreview(BaseModel):
+    """Превью картинки: вариант отдаётся по ``<url>?size=<имя из sizes>``."""
+
+    width: int
+    height: int
+    blurhash: str
+    color: str
+    sizes: list[str] = []
+
+
 class GalleryItemResponse(BaseModel):
     model_config = {"from_attributes": True}
 
@@ -18,8 +28,17 @@ class GalleryItemResponse(BaseModel):
     file_name: str | None
     file_size: int | None
     caption: str | None
+    preview: MediaPreview | None = None
     created_at: datetime
+    # Передать как ``cursor``, чтобы получить файлы старше этого.
+    cursor: str
 
 
 class BulkDeleteRequest(BaseModel):
-    ids: list[UUID]
\ No newline at end of file
+    ids: list[UUID]
+
+class GalleryTimelineBucket(BaseModel):
+    """Сколько файлов загружено за месяц (UTC); ``month`` — его первое число."""
+
+    month: date
+    count: int
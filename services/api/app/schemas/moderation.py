@@ -13,6 +13,7 @@ class ModerationSettingsResponse(BaseModel):
     slowmode_default_seconds: int
     banned_words: list[str]
     max_message_length: int
+    audit_retention_days: int
 
 
 class ModerationSettingsUpdate(BaseModel):
@@ -20,6 +21,8 @@ class ModerationSettingsUpdate(BaseModel):
     slowmode_default_seconds: int = Field(ge=0, le=21600)
     banned_words: list[str] = Field(default_factory=list)
     max_message_length: int = Field(ge=0, le=HARD_MESSAGE_LIMIT)
+    # 0 — платформенный срок; больше платформенного не действует.
+    audit_retention_days: int = Field(default=0, ge=0, le=3650)
 
     @field_validator("banned_words")
     @classmethod
@@ -3,6 +3,12 @@
 Записываем коротко и одним вызовом: ``await log_action(db, ...)``.
 Запись делается в текущей транзакции — если вызвать перед ``db.commit``,
 она зафиксируется атомарно вместе с основным действием.
+
+С ``AUDIT_BUFFERED_WRITES`` (по умолчанию) записи не сбрасываются в БД на
+каждом вызове, а копятся в ``session.info`` и уходят при commit одним
+многострочным INSERT — без отдельного round trip на каждое действие. Откат
+транзакции выбрасывает буфер вместе с ней. Прочитать свою же запись до commit
+в этом режиме нельзя — в коде приложения это и не нужно.
 """
 
 from __future__ import annotations
@@ -10,11 +16,39 @@ from __future__ import annotations
 import uuid
 from typing import Any
 
+from sqlalchemy import event
 from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session, SessionTransaction
 
+from app.core.config import settings
 from app.models.audit_log import AuditLogEntry
 from app.models.platform_audit_log import PlatformAuditLogEntry
 
+_BUFFER_KEY = "audit_buffer"
+
+
+async def _write(db: AsyncSession, entry: AuditLogEntry | PlatformAuditLogEntry) -> None:
+    if settings.audit_buffered_writes:
+        db.info.setdefault(_BUFFER_KEY, []).append(entry)
+        return
+    db.add(entry)
+    await db.flush()
+
+
+@event.listens_for(Session, "before_commit")
+def _add_buffered_entries(session: Session) -> None:
+    # Добавленное здесь попадает в финальный flush commit'а; однотипные
+    # строки ORM вставляет одним INSERT … VALUES (…), (…).
+    buffered = session.info.pop(_BUFFER_KEY, None)
+    if buffered:
+        session.add_all(buffered)
+
+
+@event.listens_for(Session, "after_soft_rollback")
+def _drop_buffered_entries(session: Session, previous: SessionTransaction) -> None:
+    if previous.parent is None:
+        session.info.pop(_BUFFER_KEY, None)
+
 
 async def log_platform_action(
     db: AsyncSession,
@@ -34,8 +68,7 @@ async def log_platform_action(
         target_id=target_id,
         metadata_json=metadata,
     )
-    db.add(entry)
-    await db.flush()
+    await _write(db, entry)
 
 
 async def log_action(
@@ -57,8 +90,7 @@ async def log_action(
         target_id=target_id,
         metadata_json=metadata,
     )
-    db.add(entry)
-    await db.flush()
+    await _write(db, entry)
 
 
 # Известные коды действий — для документации и UI. Сервер не валидирует
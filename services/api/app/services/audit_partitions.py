@@ -0,0 +1,290 @@
+"""Помесячные секции журналов аудита: создание наперёд и очистка по сроку хранения.
+
+``audit_log`` и ``platform_audit_log`` секционированы RANGE по ``created_at``
+(миграция 051): секция ``<таблица>_pYYYY_MM`` покрывает UTC-месяц, строки вне
+созданных секций попадают в ``<таблица>_default``. Планировщик:
+
+* создаёт секции на AUDIT_PARTITION_PREMAKE_MONTHS вперёд; если в default
+  уже лежат строки нового месяца, они переносятся в секцию в той же транзакции;
+* секции, целиком старше платформенного срока (AUDIT_RETENTION_DAYS /
+  PLATFORM_AUDIT_RETENTION_DAYS, по умолчанию 0 — не удалять), удаляет одним
+  DROP — без DELETE, мёртвых строк и VACUUM; при AUDIT_PARTITION_DETACH отцепляет их в схему ``archive``,
+  которую backup.sh не дампит;
+* семьи со сроком короче платформенного (``audit_retention_days`` в
+  настройках модерации) чистит пачками DELETE: секция общая для всех семей.
+
+Лента журнала (``list_audit_log``) ограничена снизу сроком хранения семьи —
+это и скрывает записи, ждущие очистки, и отсекает старые секции планом.
+
+Проход идёт под ``pg_try_advisory_lock``: при нескольких инстансах с
+SCHEDULER_ENABLED одновременно работает один, остальные пропускают проход.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import re
+from datetime import datetime, timedelta, timezone
+from uuid import UUID
+
+from sqlalchemy import delete, func, select, text, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.db.session import engine
+from app.models.audit_log import AuditLogEntry
+from app.models.family_moderation_settings import FamilyModerationSettings
+
+logger = logging.getLogger(__name__)
+
+AUDIT_LOG = "audit_log"
+PLATFORM_AUDIT_LOG = "platform_audit_log"
+ARCHIVE_SCHEMA = "archive"
+
+_PRUNE_BATCH = 5000
+_MAINTENANCE_INTERVAL_SECONDS = 6 * 3600
+# Ключ pg_try_advisory_lock: два инстанса не должны создавать одну и ту же
+# секцию и убирать одни и те же старые секции одновременно.
+_MAINTENANCE_LOCK_KEY = 0x41554454  # "AUDT"
+
+
+def month_start(moment: datetime) -> datetime:
+    moment = moment.astimezone(timezone.utc)
+    return moment.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+
+def add_months(month: datetime, n: int) -> datetime:
+    index = month.year * 12 + month.month - 1 + n
+    return month.replace(year=index // 12, month=index % 12 + 1)
+
+
+def partition_name(table: str, month: datetime) -> str:
+    return f"{table}_p{month:%Y_%m}"
+
+
+def partition_month(table: str, name: str) -> datetime | None:
+    """Месяц секции по её имени; None — не помесячная секция (default и пр.)."""
+    match = re.fullmatch(rf"{re.escape(table)}_p(\d{{4}})_(\d{{2}})", name)
+    if match is None:
+        return None
+    return datetime(int(match[1]), int(match[2]), 1, tzinfo=timezone.utc)
+
+
+def retention_cutoff(days: int, now: datetime) -> datetime | None:
+    """Граница хранения: записи старше неё удаляются; None — хранить всё."""
+    return now - timedelta(days=days) if days > 0 else None
+
+
+def family_retention_days(family_days: int) -> int:
+    """Срок хранения журнала семьи: свой, если он короче платформенного."""
+    platform = settings.audit_retention_days
+    if family_days > 0 and (platform == 0 or family_days < platform):
+        return family_days
+    return platform
+
+
+async def family_audit_cutoff(
+    db: AsyncSession, family_id: UUID, now: datetime | None = None
+) -> datetime | None:
+    family_days = await db.scalar(
+        select(FamilyModerationSettings.audit_retention_days).where(
+            FamilyModerationSettings.family_id == family_id
+        )
+    )
+    return retention_cutoff(
+        family_retention_days(family_days or 0), now or datetime.now(timezone.utc)
+    )
+
+
+async def list_partitions(db: AsyncSession, table: str) -> list[str]:
+    rows = await db.scalars(
+        text(
+            "SELECT c.relname FROM pg_inherits i "
+            "JOIN pg_class c ON c.oid = i.inhrelid "
+            "WHERE i.inhparent = CAST(:table AS regclass) ORDER BY c.relname"
+        ),
+        {"table": table},
+    )
+    return list(rows)
+
+
+async def create_partition(db: AsyncSession, table: str, month: datetime) -> str:
+    """Секция за месяц; строки этого месяца из default переезжают в неё."""
+    name = partition_name(table, month)
+    lo, hi = month.isoformat(), add_months(month, 1).isoformat()
+    await db.execute(text(f'CREATE TABLE "{name}" (LIKE "{table}" INCLUDING DEFAULTS)'))
+    await db.execute(
+        text(
+            f'WITH moved AS (DELETE FROM "{table}_default" '
+            "WHERE created_at >= :lo AND created_at < :hi RETURNING *) "
+            f'INSERT INTO "{name}" SELECT * FROM moved'
+        ),
+        {"lo": month, "hi": add_months(month, 1)},
+    )
+    # Индексы и внешние ключи родителя ATTACH навешивает сам.
+    await db.execute(
+        text(f"ALTER TABLE \"{table}\" ATTACH PARTITION \"{name}\" FOR VALUES FROM ('{lo}') TO ('{hi}')")
+    )
+    await db.commit()
+    return name
+
+
+async def ensure_partitions(
+    db: AsyncSession, table: str, now: datetime, ahead: int
+) -> list[str]:
+    """Создать недостающие секции с текущего месяца на `ahead` вперёд."""
+    existing = set(await list_partitions(db, table))
+    current = month_start(now)
+    created = []
+    for n in range(ahead + 1):
+        month = add_months(current, n)
+        if partition_name(table, month) not in existing:
+            created.append(await create_partition(db, table, month))
+    return created
+
+
+async def drop_expired_partitions(
+    db: AsyncSession, table: str, cutoff: datetime, *, detach: bool = False
+) -> list[str]:
+    """Убрать секции, целиком лежащие раньше `cutoff`, и такие же строки default."""
+    removed = []
+    for name in await list_partitions(db, table):
+        month = partition_month(table, name)
+        if month is None or add_months(month, 1) > cutoff:
+            continue
+        if detach:
+            await db.execute(text(f'ALTER TABLE "{table}" DETACH PARTITION "{name}"'))
+            await db.execute(text(f'CREATE SCHEMA IF NOT EXISTS "{ARCHIVE_SCHEMA}"'))
+            await db.execute(text(f'ALTER TABLE "{name}" SET SCHEMA "{ARCHIVE_SCHEMA}"'))
+        else:
+            await db.execute(text(f'DROP TABLE "{name}"'))
+        await db.commit()
+        removed.append(name)
+    await db.execute(
+        text(f'DELETE FROM "{table}_default" WHERE created_at < :cutoff'), {"cutoff": cutoff}
+    )
+    await db.commit()
+    return removed
+
+
+async def prune_family_audit(db: AsyncSession, now: datetime) -> int:
+    """Удалить пачками записи семей со сроком короче платформенного."""
+    overrides = (
+        await db.execute(
+            select(
+                FamilyModerationSettings.family_id,
+                FamilyModerationSettings.audit_retention_days,
+            ).where(FamilyModerationSettings.audit_retention_days > 0)
+        )
+    ).all()
+    total = 0
+    for family_id, family_days in overrides:
+        days = family_retention_days(family_days)
+        if days != family_days:
+            continue  # не короче платформенного — хватит удаления секций
+        cutoff = retention_cutoff(days, now)
+        while True:
+            batch = (
+                select(AuditLogEntry.id, AuditLogEntry.created_at)
+                .where(AuditLogEntry.family_id == family_id, AuditLogEntry.created_at < cutoff)
+                .limit(_PRUNE_BATCH)
+            )
+            result = await db.execute(
+                delete(AuditLogEntry).where(
+                    tuple_(AuditLogEntry.id, AuditLogEntry.created_at).in_(batch)
+                )
+            )
+            await db.commit()
+            total += result.rowcount or 0
+            if (result.rowcount or 0) < _PRUNE_BATCH:
+                break
+    return total
+
+
+async def run_maintenance(db: AsyncSession, now: datetime | None = None) -> None:
+    now = now or datetime.now(timezone.utc)
+    retention = {
+        AUDIT_LOG: settings.audit_retention_days,
+        PLATFORM_AUDIT_LOG: settings.platform_audit_retention_days,
+    }
+    for table, days in retention.items():
+        created = await ensure_partitions(db, table, now, settings.audit_partition_premake_months)
+        if created:
+            logger.info("%s: созданы секции %s", table, ", ".join(created))
+        cutoff = retention_cutoff(days, now)
+        if cutoff is not None:
+            removed = await drop_expired_partitions(
+                db, table, cutoff, detach=settings.audit_partition_detach
+            )
+            if removed:
+                logger.info("%s: убраны секции %s", table, ", ".join(removed))
+    pruned = await prune_family_audit(db, now)
+    if pruned:
+        logger.info("audit_log: удалено %d записей по срокам хранения семей", pruned)
+
+
+async def run_maintenance_locked(now: datetime | None = None) -> bool:
+    """Проход обслуживания, если его не выполняет другой инстанс.
+    → False, если блокировка занята и проход пропущен.
+
+    Блокировка сессионная: проход коммитит после каждой секции, поэтому
+    держится на отдельном соединении, к которому привязана сессия."""
+    async with engine.connect() as conn:
+        locked = await conn.scalar(select(func.pg_try_advisory_lock(_MAINTENANCE_LOCK_KEY)))
+        await conn.commit()
+        if not locked:
+            return False
+        try:
+            async with AsyncSession(bind=conn, expire_on_commit=False) as db:
+                await run_maintenance(db, now)
+        finally:
+            await conn.rollback()
+            await conn.execute(select(func.pg_advisory_unlock(_MAINTENANCE_LOCK_KEY)))
+            await conn.commit()
+    return True
+
+
+_maintenance_task: asyncio.Task[None] | None = None
+_maintenance_stop: asyncio.Event | None = None
+
+
+async def _maintenance_loop(stop_event: asyncio.Event) -> None:
+    while not stop_event.is_set():
+        try:
+            if not await run_maintenance_locked():
+                logger.debug("audit partition maintenance: проход выполняет другой инстанс")
+        except Exception:
+            logger.exception("audit partition maintenance failed")
+        try:
+            await asyncio.wait_for(stop_event.wait(), timeout=_MAINTENANCE_INTERVAL_SECONDS)
+        except asyncio.TimeoutError:
+            continue
+
+
+async def start_audit_partition_maintenance() -> None:
+    global _maintenance_task, _maintenance_stop
+    if not settings.audit_partition_maintenance_enabled:
+        return
+    if _maintenance_task and not _maintenance_task.done():
+        return
+    _maintenance_stop = asyncio.Event()
+    _maintenance_task = asyncio.create_task(
+        _maintenance_loop(_maintenance_stop), name="audit-partition-maintenance"
+    )
+    logger.info("audit partition maintenance started")
+
+
+async def stop_audit_partition_maintenance() -> None:
+    global _maintenance_task, _maintenance_stop
+    if not _maintenance_task:
+        return
+    if _maintenance_stop:
+        _maintenance_stop.set()
+    try:
+        await _maintenance_task
+    except Exception:
+        logger.exception("audit partition maintenance stopped with error")
+    _maintenance_task = None
+    _maintenance_stop = None
+    logger.info("audit partition maintenance stopped")
@@ -0,0 +1,292 @@
+"""Инкрементальный леджер балансов (member_balances) и его сверка.
+
+Роутеры бюджета и расходов при каждом изменении считают «вклад» записи в
+балансы участников до и после изменения и применяют разницу одним
+``INSERT ... ON CONFLICT DO UPDATE SET col = col + delta`` в той же транзакции.
+Прибавление дельты коммутативно, поэтому параллельные записи в одну семью не
+теряют обновлений (строка леджера блокируется на время транзакции; строки
+берутся в порядке user_id — без взаимоблокировок).
+
+Сверка (``reconcile_balances``) пересчитывает балансы с нуля одним запросом и
+сравнивает с леджером. Дрейф появляется только в обход приложения: каскады
+при удалении пользователя (paid_by → NULL, splits → CASCADE), ручные правки
+в БД. Исправление — тоже дельтой, посчитанной в одном снапшоте, так что
+конкурентные записи, закоммиченные во время сверки, не затираются.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+from collections import defaultdict
+from collections.abc import Iterable, Mapping
+from dataclasses import dataclass
+from decimal import Decimal
+from uuid import UUID
+
+from sqlalchemy import Numeric, and_, cast, exists, func, literal, or_, select, union_all
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.db.session import AsyncSessionLocal
+from app.models.budget_transaction import BudgetTransaction, BudgetTransactionSplit
+from app.models.expense import Expense, ExpenseSplit
+from app.models.member_balance import MemberBalance
+
+logger = logging.getLogger(__name__)
+
+BUDGET = "budget_balance"
+EXPENSE = "expense_balance"
+
+_ZERO = Decimal("0.00")
+# Ключ pg_advisory_xact_lock: исправления дельтой нельзя применять из двух
+# сверок одновременно — обе увидели бы один и тот же дрейф и прибавили бы его дважды.
+_RECONCILE_LOCK_KEY = 0x4C454447  # "LEDG"
+
+Contribution = dict[UUID, Decimal]
+
+
+# ── Вклад одной записи ──────────────────────────────────────────────────────
+
+
+def _contribution(
+    paid_by: UUID | None, amount: Decimal, shares: Iterable[tuple[UUID, Decimal]]
+) -> Contribution:
+    out: Contribution = defaultdict(lambda: _ZERO)
+    if paid_by is not None:
+        out[paid_by] += amount
+    for user_id, share in shares:
+        out[user_id] -= share
+    return dict(out)
+
+
+def budget_contribution(
+    paid_by: UUID | None, amount: Decimal, shares: Iterable[tuple[UUID, Decimal]]
+) -> Contribution:
+    """Транзакции без splits или без плательщика в балансах не участвуют."""
+    shares = list(shares)
+    if paid_by is None or not shares:
+        return {}
+    return _contribution(paid_by, amount, shares)
+
+
+def expense_contribution(
+    paid_by: UUID, amount: Decimal, shares: Iterable[tuple[UUID, Decimal]]
+) -> Contribution:
+    return _contribution(paid_by, amount, shares)
+
+
+async def apply_balance_delta(
+    db: AsyncSession,
+    family_id: UUID,
+    column: str,
+    before: Mapping[UUID, Decimal],
+    after: Mapping[UUID, Decimal],
+) -> None:
+    """Прибавить к леджеру семьи ``after − before``. Не коммитит."""
+    delta = {
+        user_id: after.get(user_id, _ZERO) - before.get(user_id, _ZERO)
+        for user_id in set(before) | set(after)
+    }
+    rows = [
+        {"family_id": family_id, "user_id": user_id, column: value}
+        for user_id, value in sorted(delta.items(), key=lambda kv: kv[0].bytes)
+        if value != 0
+    ]
+    if not rows:
+        return
+    stmt = pg_insert(MemberBalance).values(rows)
+    await db.execute(
+        stmt.on_conflict_do_update(
+            index_elements=[MemberBalance.family_id, MemberBalance.user_id],
+            set_={
+                column: getattr(MemberBalance, column) + stmt.excluded[column],
+                "updated_at": func.now(),
+            },
+        )
+    )
+
+
+async def ledger_balances(db: AsyncSession, family_id: UUID, column: str) -> dict[UUID, Decimal]:
+    rows = await db.execute(
+        select(MemberBalance.user_id, getattr(MemberBalance, column)).where(
+            MemberBalance.family_id == family_id
+        )
+    )
+    return {user_id: value for user_id, value in rows.all()}
+
+
+# ── Сверка ──────────────────────────────────────────────────────────────────
+
+
+@dataclass
+class BalanceDrift:
+    family_id: UUID
+    user_id: UUID
+    budget_expected: Decimal
+    budget_actual: Decimal
+    expense_expected: Decimal
+    expense_actual: Decimal
+
+
+def _expected_balances(family_id: UUID | None):
+    """Балансы с нуля — по тем же правилам, что и вклад одной записи."""
+    t, ts = BudgetTransaction, BudgetTransactionSplit
+    e, es = Expense, ExpenseSplit
+    zero = cast(literal(0), Numeric(14, 2))
+
+    def scoped(query, family_col):
+        return query.where(family_col == family_id) if family_id is not None else query
+
+    parts = union_all(
+        scoped(
+            select(
+                t.family_id.label("family_id"),
+                t.paid_by.label("user_id"),
+                t.amount.label("budget"),
+                zero.label("expense"),
+            ).where(t.paid_by.is_not(None), exists().where(ts.transaction_id == t.id)),
+            t.family_id,
+        ),
+        scoped(
+            select(t.family_id, ts.user_id, -ts.share, zero)
+            .join(t, t.id == ts.transaction_id)
+            .where(t.paid_by.is_not(None)),
+            t.family_id,
+        ),
+        scoped(select(e.family_id, e.paid_by, zero, e.amount), e.family_id),
+        scoped(
+            select(e.family_id, es.user_id, zero, -es.share).join(e, e.id == es.expense_id),
+            e.family_id,
+        ),
+    ).subquery()
+    return (
+        select(
+            parts.c.family_id,
+            parts.c.user_id,
+            func.sum(parts.c.budget).label("budget"),
+            func.sum(parts.c.expense).label("expense"),
+        )
+        .group_by(parts.c.family_id, parts.c.user_id)
+        .subquery()
+    )
+
+
+async def reconcile_balances(
+    db: AsyncSession, *, family_id: UUID | None = None, fix: bool = False
+) -> list[BalanceDrift]:
+    """Сравнить леджер с пересчётом с нуля; при ``fix`` — исправить. Не коммитит."""
+    if fix:
+        await db.execute(select(func.pg_advisory_xact_lock(_RECONCILE_LOCK_KEY)))
+
+    expected = _expected_balances(family_id)
+    ledger_q = select(MemberBalance)
+    if family_id is not None:
+        ledger_q = ledger_q.where(MemberBalance.family_id == family_id)
+    ledger = ledger_q.subquery()
+
+    exp_budget = func.coalesce(expected.c.budget, 0)
+    exp_expense = func.coalesce(expected.c.expense, 0)
+    act_budget = func.coalesce(ledger.c.budget_balance, 0)
+    act_expense = func.coalesce(ledger.c.expense_balance, 0)
+    # Один запрос = один снапшот: ожидаемое и фактическое согласованы между собой.
+    rows = await db.execute(
+        select(
+            func.coalesce(expected.c.family_id, ledger.c.family_id),
+            func.coalesce(expected.c.user_id, ledger.c.user_id),
+            exp_budget,
+            act_budget,
+            exp_expense,
+            act_expense,
+        )
+        .select_from(
+            expected.join(
+                ledger,
+                and_(
+                    expected.c.family_id == ledger.c.family_id,
+                    expected.c.user_id == ledger.c.user_id,
+                ),
+                full=True,
+            )
+        )
+        .where(or_(exp_budget != act_budget, exp_expense != act_expense))
+    )
+    drift = [BalanceDrift(*row) for row in rows.all()]
+
+    if drift:
+        logger.warning(
+            "balance ledger drift: %d row(s)%s%s",
+            len(drift),
+            f" in family {family_id}" if family_id else "",
+            ", fixing" if fix else "",
+        )
+    if fix:
+        by_family: dict[UUID, list[BalanceDrift]] = defaultdict(list)
+        for d in drift:
+            by_family[d.family_id].append(d)
+        for fid, items in by_family.items():
+            for column, attr in ((BUDGET, "budget"), (EXPENSE, "expense")):
+                await apply_balance_delta(
+                    db,
+                    fid,
+                    column,
+                    {d.user_id: getattr(d, f"{attr}_actual") for d in items},
+                    {d.user_id: getattr(d, f"{attr}_expected") for d in items},
+                )
+    return drift
+
+
+# ── Периодическая сверка ────────────────────────────────────────────────────
+
+_scheduler_task: asyncio.Task[None] | None = None
+_scheduler_stop: asyncio.Event | None = None
+
+
+async def run_balance_reconciliation() -> int:
+    async with AsyncSessionLocal() as db:
+        drift = await reconcile_balances(db, fix=True)
+        await db.commit()
+        return len(drift)
+
+
+async def _scheduler_loop(stop_event: asyncio.Event) -> None:
+    interval = settings.balance_reconcile_interval_seconds
+    while not stop_event.is_set():
+        try:
+            await asyncio.wait_for(stop_event.wait(), timeout=interval)
+            return
+        except asyncio.TimeoutError:
+            pass
+        try:
+            await run_balance_reconciliation()
+        except Exception:
+            logger.exception("balance reconciliation tick failed")
+
+
+async def start_balance_reconciler() -> None:
+    global _scheduler_task, _scheduler_stop
+    if settings.balance_reconcile_interval_seconds <= 0:
+        return
+    if _scheduler_task and not _scheduler_task.done():
+        return
+    _scheduler_stop = asyncio.Event()
+    _scheduler_task = asyncio.create_task(
+        _scheduler_loop(_scheduler_stop), name="balance-reconciler"
+    )
+    logger.info("balance reconciler started")
+
+
+async def stop_balance_reconciler() -> None:
+    global _scheduler_task, _scheduler_stop
+    if not _scheduler_task:
+        return
+    if _scheduler_stop:
+        _scheduler_stop.set()
+    try:
+        await _scheduler_task
+    except Exception:
+        logger.exception("balance reconciler stopped with error")
+    _scheduler_task = None
+    _scheduler_stop = None
+    logger.info("balance reconciler stopped")
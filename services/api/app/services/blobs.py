@@ -0,0 +1,139 @@
+"""Контентно-адресуемое хранение загрузок с подсчётом ссылок (таблица blobs).
+
+При ``STORAGE_DEDUP_ENABLED`` тело файла пишется один раз под
+``blobs/<aa>/<bb>/<sha256>``, а каждая загрузка (вложение, фото галереи, ...)
+получает свой обычный ключ в storage_objects со ссылкой ``blob_hash``. Одна и
+та же фотография, пересланная в несколько чатов и в галерею, занимает место
+один раз, а повторная загрузка не пишет в хранилище вовсе.
+
+Публичные URL не меняются: routers/uploads.py проверяет доступ по ним, а
+``physical_url`` подменяет только источник байтов.
+
+Удаление уменьшает ``refcount``; тела без ссылок удаляет задача
+``storage.gc_blobs`` (services/jobs.py). Сборщик берёт строку ``FOR UPDATE``
+и перепроверяет ``refcount``, а загрузка увеличивает счётчик через
+``INSERT … ON CONFLICT``, который ждёт ту же блокировку, — поэтому тело,
+на которое успела сослаться новая загрузка, не удаляется.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import logging
+
+from sqlalchemy import bindparam, exists, select, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.storage import storage, url_to_key
+from app.core.uploads import UPLOADS_URL_PREFIX
+from app.models.background_job import JOB_QUEUED, BackgroundJob
+from app.models.storage_object import Blob, StoredObject
+from app.services.jobs import JobContext, enqueue_job, job_handler
+
+logger = logging.getLogger(__name__)
+
+BLOB_GC = "storage.gc_blobs"
+_GC_BATCH = 200
+# Меньше — хэшируем прямо в event loop: поток дороже самого sha256.
+_HASH_IN_THREAD_FROM = 256 * 1024
+
+
+def blob_key(digest: str) -> str:
+    return f"blobs/{digest[:2]}/{digest[2:4]}/{digest}"
+
+
+async def content_hash(data: bytes) -> str:
+    if len(data) < _HASH_IN_THREAD_FROM:
+        return hashlib.sha256(data).hexdigest()
+    # hashlib отпускает GIL на больших буферах — 50 МБ не блокируют loop.
+    return await asyncio.to_thread(lambda: hashlib.sha256(data).hexdigest())
+
+
+async def acquire_blob(
+    db: AsyncSession,
+    data: bytes,
+    content_type: str | None,
+    written: list[str] | None = None,
+) -> str:
+    """Сослаться на тело с таким содержимым, записав его, если это первая
+    ссылка. → sha256. Не коммитит.
+
+    Ключ записанного тела добавляется в `written`: при откате транзакции
+    строки blobs не останется, и тело удаляет вызывающий, а не сборщик."""
+    digest = await content_hash(data)
+    refs = await db.scalar(
+        pg_insert(Blob)
+        .values(hash=digest, size=len(data), refcount=1)
+        .on_conflict_do_update(
+            index_elements=[Blob.hash], set_={"refcount": Blob.refcount + 1}
+        )
+        .returning(Blob.refcount)
+    )
+    if refs == 1:
+        # Первая ссылка (или тело ждало сборщика) — пишем. Повторная запись
+        # того же содержимого безвредна.
+        await storage.save(blob_key(digest), data, content_type)
+        if written is not None:
+            written.append(blob_key(digest))
+    return digest
+
+
+async def release_blobs(db: AsyncSession, refs: dict[str, int]) -> None:
+    """Снять ``refs[hash]`` ссылок; тела без ссылок уйдут сборщику. Не коммитит."""
+    if not refs:
+        return
+    await db.execute(
+        update(Blob.__table__)
+        .where(Blob.__table__.c.hash == bindparam("b_hash"))
+        .values(refcount=Blob.__table__.c.refcount - bindparam("b_refs")),
+        [{"b_hash": h, "b_refs": n} for h, n in refs.items()],
+    )
+    if await db.scalar(select(exists().where(Blob.hash.in_(refs), Blob.refcount <= 0))):
+        await enqueue_blob_gc(db)
+
+
+async def enqueue_blob_gc(db: AsyncSession) -> None:
+    """Поставить сборку мусора, если она ещё не в очереди."""
+    pending = await db.scalar(
+        select(
+            exists().where(BackgroundJob.kind == BLOB_GC, BackgroundJob.status == JOB_QUEUED)
+        )
+    )
+    if not pending:
+        await enqueue_job(db, BLOB_GC, {})
+
+
+async def physical_url(db: AsyncSession, stored_url: str) -> str:
+    """Публичный URL → URL, по которому реально лежат байты."""
+    key = url_to_key(stored_url)
+    if not key:
+        return stored_url
+    digest = await db.scalar(select(StoredObject.blob_hash).where(StoredObject.key == key))
+    return f"{UPLOADS_URL_PREFIX}{blob_key(digest)}" if digest else stored_url
+
+
+@job_handler(BLOB_GC)
+async def collect_garbage(ctx: JobContext) -> None:
+    deleted = 0
+    while True:
+        batch = (
+            await ctx.db.scalars(
+                select(Blob)
+                .where(Blob.refcount <= 0)
+                .order_by(Blob.hash)
+                .limit(_GC_BATCH)
+                .with_for_update(skip_locked=True)
+            )
+        ).all()
+        if not batch:
+            break
+        for blob in batch:
+            await storage.delete_by_url(
+                f"{UPLOADS_URL_PREFIX}{blob_key(blob.hash)}", size=blob.size
+            )
+            await ctx.db.delete(blob)
+        deleted += len(batch)
+        await ctx.progress(deleted)
+    logger.info("blob gc %s: %d blob(s) removed", ctx.job.id, deleted)
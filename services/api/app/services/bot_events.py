@@ -0,0 +1,319 @@
+"""Журнал событий ботов (bot_events): запись, чтение с фильтром видимости, очистка.
+
+Запись идёт на инстансе-источнике рассылки через `broadcast_recorder` — хук
+ws_manager. Рассылка в семью без ботов журнал не трогает вовсе: семьи с
+ботами (и сами боты) держатся в кэше процесса, чат → семья — тоже. Остальные
+события менеджер ставит в очередь: люди получают их сразу, а фоновый писатель
+кладёт пачку в журналы ботов одной транзакцией (блокировка строк ботов → +1
+к ``bots.event_seq`` → INSERT на событие) и досылает событие gateway-сокетам
+ботов с его seq, будя long-poll'ы на всех инстансах.
+
+Права на чат (VIEW_CHANNEL) проверяются при ЧТЕНИИ — только для чатов,
+встретившихся в отданной пачке. Запись не зависит от прав.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from collections import OrderedDict, defaultdict
+from datetime import datetime, timedelta, timezone
+from uuid import UUID
+
+from sqlalchemy import delete, insert, literal, select, tuple_, update
+from sqlalchemy.dialects.postgresql import JSONB, UUID as PG_UUID
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.core.permissions import Perm, has_perm
+from app.db.session import AsyncSessionLocal
+from app.models.bot import Bot
+from app.models.bot_event import BotEvent
+from app.models.chat import Chat
+from app.models.membership import Membership
+from app.services.roles import effective_permissions_for_chats
+
+logger = logging.getLogger(__name__)
+
+SCOPE_CHAT = "chat"
+SCOPE_FAMILY = "family"
+SCOPE_USER = "user"
+
+# Частые или сессионные события — в журнал не пишутся (по сокету приходят как раньше).
+_UNLOGGED_TYPES = frozenset({"presence_update", "presence_snapshot", "force_logout"})
+_PRUNE_BATCH = 5000
+_PRUNE_INTERVAL_SECONDS = 3600
+# Кэш «где есть боты» перечитывается не реже этого и сразу — после
+# ws_manager.invalidate_bot_auth (создание и удаление бота, на всех инстансах).
+_SCOPES_TTL_SECONDS = 60.0
+_CHAT_FAMILY_CACHE_SIZE = 10_000
+
+
+def _record_statement(scope: str, target_id: UUID, payload: dict):
+    if scope == SCOPE_USER:
+        targets = select(
+            Bot.user_id, literal(None, PG_UUID(as_uuid=True)).label("family_id")
+        ).where(Bot.user_id == target_id)
+    else:
+        targets = select(Bot.user_id, Membership.family_id).join(
+            Membership, Membership.user_id == Bot.user_id
+        )
+        if scope == SCOPE_CHAT:
+            targets = targets.join(Chat, Chat.family_id == Membership.family_id).where(
+                Chat.id == target_id
+            )
+        else:
+            targets = targets.where(Membership.family_id == target_id)
+    # Строки ботов блокируются в одном порядке: параллельные записи в семью
+    # с несколькими ботами не взаимоблокируются.
+    targets = targets.order_by(Bot.user_id).with_for_update(of=Bot).cte("targets")
+    bumped = (
+        update(Bot)
+        .where(Bot.user_id == targets.c.user_id)
+        .values(event_seq=Bot.event_seq + 1)
+        .returning(Bot.user_id, Bot.event_seq, targets.c.family_id)
+        .cte("bumped")
+    )
+    chat_id = target_id if scope == SCOPE_CHAT else None
+    return (
+        insert(BotEvent)
+        .from_select(
+            ["bot_user_id", "seq", "family_id", "chat_id", "payload"],
+            select(
+                bumped.c.user_id,
+                bumped.c.event_seq,
+                bumped.c.family_id,
+                literal(chat_id, PG_UUID(as_uuid=True)),
+                literal(payload, JSONB),
+            ),
+        )
+        .add_cte(targets)
+        .add_cte(bumped)
+        .returning(BotEvent.bot_user_id, BotEvent.seq)
+    )
+
+
+async def record(
+    db: AsyncSession, scope: str, target_id: UUID, payload: dict
+) -> dict[UUID, int]:
+    """Записать событие в журналы затронутых ботов; bot user_id → seq."""
+    if payload.get("type") in _UNLOGGED_TYPES:
+        return {}
+    rows = await db.execute(_record_statement(scope, target_id, payload))
+    return {bot_id: seq for bot_id, seq in rows.all()}
+
+
+class BroadcastRecorder:
+    """Хук ws_manager (app.ws.manager.EventRecorder): фильтр по кэшу семей с
+    ботами и пакетная запись из очереди менеджера."""
+
+    def __init__(self) -> None:
+        self._families: set[UUID] = set()
+        self._bots: set[UUID] = set()
+        self._loaded_at: float | None = None
+        self._generation = 0
+        self._chat_family: OrderedDict[UUID, UUID] = OrderedDict()
+        self._lock = asyncio.Lock()
+
+    def invalidate(self) -> None:
+        self._generation += 1
+        self._loaded_at = None
+
+    def _fresh(self) -> bool:
+        return (
+            self._loaded_at is not None
+            and time.monotonic() - self._loaded_at < _SCOPES_TTL_SECONDS
+        )
+
+    async def _refresh(self) -> None:
+        async with self._lock:
+            if self._fresh():
+                return
+            generation, started = self._generation, time.monotonic()
+            async with AsyncSessionLocal() as db:
+                rows = (
+                    await db.execute(
+                        select(Bot.user_id, Membership.family_id).outerjoin(
+                            Membership, Membership.user_id == Bot.user_id
+                        )
+                    )
+                ).all()
+            self._bots = {bot_id for bot_id, _ in rows}
+            self._families = {fid for _, fid in rows if fid is not None}
+            # Сброс во время запроса — прочитанное могло устареть.
+            if generation == self._generation:
+                self._loaded_at = started
+
+    async def _family_of_chat(self, chat_id: UUID) -> UUID | None:
+        family_id = self._chat_family.get(chat_id)
+        if family_id is not None:
+            self._chat_family.move_to_end(chat_id)
+            return family_id
+        async with AsyncSessionLocal() as db:
+            family_id = await db.scalar(select(Chat.family_id).where(Chat.id == chat_id))
+        if family_id is not None:
+            # Чат не переезжает между семьями — запись не устаревает.
+            self._chat_family[chat_id] = family_id
+            if len(self._chat_family) > _CHAT_FAMILY_CACHE_SIZE:
+                self._chat_family.popitem(last=False)
+        return family_id
+
+    async def wants(self, scope: str, target_id: UUID, payload: dict) -> bool:
+        if payload.get("type") in _UNLOGGED_TYPES:
+            return False
+        if not self._fresh():
+            await self._refresh()
+        if scope == SCOPE_USER:
+            return target_id in self._bots
+        if not self._families:
+            return False
+        if scope == SCOPE_FAMILY:
+            return target_id in self._families
+        return await self._family_of_chat(target_id) in self._families
+
+    async def record(self, events: list[tuple[str, UUID, dict]]) -> list[dict[str, int]]:
+        """Записать пачку событий одной транзакцией, в порядке рассылки.
+        Ключи — строки: номера уходят в Redis-конверт."""
+        out: list[dict[str, int]] = []
+        async with AsyncSessionLocal() as db:
+            for scope, target_id, payload in events:
+                seqs = await record(db, scope, target_id, payload)
+                out.append({str(bot_id): seq for bot_id, seq in seqs.items()})
+            await db.commit()
+        return out
+
+
+broadcast_recorder = BroadcastRecorder()
+
+
+# ── Чтение ──────────────────────────────────────────────────────────────────
+
+
+async def head_seq(db: AsyncSession, bot_user_id: UUID) -> int:
+    return await db.scalar(select(Bot.event_seq).where(Bot.user_id == bot_user_id)) or 0
+
+
+async def read_events(
+    db: AsyncSession, bot_user_id: UUID, after: int, limit: int
+) -> list[BotEvent]:
+    return list(
+        (
+            await db.scalars(
+                select(BotEvent)
+                .where(BotEvent.bot_user_id == bot_user_id, BotEvent.seq > after)
+                .order_by(BotEvent.seq)
+                .limit(limit)
+            )
+        ).all()
+    )
+
+
+async def visible_events(
+    db: AsyncSession, bot_user_id: UUID, events: list[BotEvent]
+) -> list[BotEvent]:
+    """Оставить то, что gateway доставил бы боту сейчас: события семей, где он
+    состоит, и чатов, которые он видит (VIEW_CHANNEL)."""
+    family_ids = {e.family_id for e in events if e.family_id is not None}
+    memberships = {}
+    if family_ids:
+        memberships = {
+            m.family_id: m
+            for m in await db.scalars(
+                select(Membership).where(
+                    Membership.user_id == bot_user_id,
+                    Membership.family_id.in_(family_ids),
+                )
+            )
+        }
+    chats: dict[UUID, set[UUID]] = defaultdict(set)
+    for e in events:
+        if e.chat_id is not None and e.family_id in memberships:
+            chats[e.family_id].add(e.chat_id)
+    perms: dict[UUID, int] = {}
+    for family_id, chat_ids in chats.items():
+        perms.update(
+            await effective_permissions_for_chats(db, memberships[family_id], list(chat_ids))
+        )
+
+    return [
+        e
+        for e in events
+        if e.family_id is None
+        or (
+            e.family_id in memberships
+            and (e.chat_id is None or has_perm(perms.get(e.chat_id, 0), Perm.VIEW_CHANNEL))
+        )
+    ]
+
+
+def event_frame(event: BotEvent, **extra) -> dict:
+    """Событие в том виде, в каком его получает бот: исходный payload + seq."""
+    return {**event.payload, "seq": event.seq, **extra}
+
+
+# ── Очистка по сроку хранения ───────────────────────────────────────────────
+
+
+async def prune_bot_events(db: AsyncSession, older_than: datetime) -> int:
+    """Удалить события старше `older_than` пачками; сколько удалено."""
+    total = 0
+    while True:
+        batch = (
+            select(BotEvent.bot_user_id, BotEvent.seq)
+            .where(BotEvent.created_at < older_than)
+            .limit(_PRUNE_BATCH)
+        )
+        result = await db.execute(
+            delete(BotEvent).where(
+                tuple_(BotEvent.bot_user_id, BotEvent.seq).in_(batch)
+            )
+        )
+        await db.commit()
+        total += result.rowcount or 0
+        if (result.rowcount or 0) < _PRUNE_BATCH:
+            return total
+
+
+_pruner_task: asyncio.Task[None] | None = None
+_pruner_stop: asyncio.Event | None = None
+
+
+async def _pruner_loop(stop_event: asyncio.Event) -> None:
+    retention = timedelta(hours=settings.bot_event_retention_hours)
+    while not stop_event.is_set():
+        try:
+            async with AsyncSessionLocal() as db:
+                await prune_bot_events(db, datetime.now(timezone.utc) - retention)
+        except Exception:
+            logger.exception("bot events prune failed")
+        try:
+            await asyncio.wait_for(stop_event.wait(), timeout=_PRUNE_INTERVAL_SECONDS)
+        except asyncio.TimeoutError:
+            continue
+
+
+async def start_bot_event_pruner() -> None:
+    global _pruner_task, _pruner_stop
+    if not settings.bot_event_log_enabled:
+        return
+    if _pruner_task and not _pruner_task.done():
+        return
+    _pruner_stop = asyncio.Event()
+    _pruner_task = asyncio.create_task(_pruner_loop(_pruner_stop), name="bot-events-pruner")
+    logger.info("bot events pruner started")
+
+
+async def stop_bot_event_pruner() -> None:
+    global _pruner_task, _pruner_stop
+    if not _pruner_task:
+        return
+    if _pruner_stop:
+        _pruner_stop.set()
+    try:
+        await _pruner_task
+    except Exception:
+        logger.exception("bot events pruner stopped with error")
+    _pruner_task = None
+    _pruner_stop = None
+    logger.info("bot events pruner stopped")
@@ -0,0 +1,188 @@
+"""Seq изменений сообщений чата и дельта «что изменилось после since».
+
+`log_change` вызывается в транзакции изменения прямо перед commit: счётчик
+чата увеличивается под блокировкой его строки, так что seq выдаются в
+порядке коммита и клиент, запомнивший seq, ничего не пропустит. Блокировка
+держится только до commit — поэтому вызов ставится последним.
+
+`load_changes` сворачивает журнал после `since` по сообщениям: созданное и
+удалённое внутри окна не попадает никуда, правки и реакции у нового
+сообщения уже учтены в нём самом.
+
+Журнал хранится CHAT_CHANGE_RETENTION_DAYS (пачками удаляет планировщик).
+seq идут без дыр, поэтому очищенное видно по первой записи после `since`:
+если это не since+1 (или записей нет, а счётчик чата ушёл дальше), дельта
+неполна — клиенту отвечается ``resync_required`` и он перечитывает историю.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta, timezone
+from uuid import UUID
+
+from sqlalchemy import delete, insert, literal, select, tuple_, update
+from sqlalchemy.dialects.postgresql import UUID as PG_UUID
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.db.session import AsyncSessionLocal
+from app.models.chat import Chat
+from app.models.chat_change import (
+    CHANGE_DELETE,
+    CHANGE_EDIT,
+    CHANGE_NEW,
+    ChatChange,
+)
+
+logger = logging.getLogger(__name__)
+
+_PRUNE_BATCH = 5000
+_PRUNE_INTERVAL_SECONDS = 3600
+
+
+async def log_change(db: AsyncSession, chat_id: UUID, message_id: UUID, kind: str) -> int:
+    """Выдать следующий seq чата и записать изменение одним запросом."""
+    bumped = (
+        update(Chat)
+        .where(Chat.id == chat_id)
+        .values(change_seq=Chat.change_seq + 1)
+        .returning(Chat.id, Chat.change_seq)
+        .cte("bumped")
+    )
+    return await db.scalar(
+        insert(ChatChange)
+        .from_select(
+            ["chat_id", "seq", "message_id", "kind"],
+            select(
+                bumped.c.id,
+                bumped.c.change_seq,
+                literal(message_id, PG_UUID(as_uuid=True)),
+                literal(kind),
+            ),
+        )
+        .add_cte(bumped)
+        .returning(ChatChange.seq)
+    )
+
+
+@dataclass(slots=True)
+class ChatDelta:
+    seq: int
+    has_more: bool
+    # Часть журнала после since уже очищена — дельта неполна.
+    resync_required: bool = False
+    new: list[UUID] = field(default_factory=list)
+    edited: list[UUID] = field(default_factory=list)
+    deleted: list[UUID] = field(default_factory=list)
+    reactions: list[UUID] = field(default_factory=list)
+
+
+async def load_changes(
+    db: AsyncSession, chat_id: UUID, since: int, limit: int, head: int
+) -> ChatDelta:
+    """Изменения чата с seq > since (не больше `limit` записей журнала).
+    `head` — счётчик чата (chats.change_seq): без записей после since, но с
+    since < head журнал очищен целиком. Неполная дельта → resync_required
+    с seq = head и без изменений."""
+    rows = (
+        await db.execute(
+            select(ChatChange.seq, ChatChange.message_id, ChatChange.kind)
+            .where(ChatChange.chat_id == chat_id, ChatChange.seq > since)
+            .order_by(ChatChange.seq)
+            .limit(limit + 1)
+        )
+    ).all()
+    truncated = rows[0].seq > since + 1 if rows else since < head
+    if truncated:
+        return ChatDelta(
+            seq=max(head, rows[-1].seq if rows else 0), has_more=False, resync_required=True
+        )
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+
+    kinds: dict[UUID, set[str]] = {}
+    for _, message_id, kind in rows:
+        kinds.setdefault(message_id, set()).add(kind)
+
+    delta = ChatDelta(seq=rows[-1].seq if rows else since, has_more=has_more)
+    for message_id, seen in kinds.items():
+        if CHANGE_DELETE in seen:
+            if CHANGE_NEW not in seen:
+                delta.deleted.append(message_id)
+        elif CHANGE_NEW in seen:
+            delta.new.append(message_id)
+        elif CHANGE_EDIT in seen:
+            delta.edited.append(message_id)
+        else:
+            delta.reactions.append(message_id)
+    return delta
+
+
+# ── Очистка по сроку хранения ───────────────────────────────────────────────
+
+
+async def prune_chat_changes(db: AsyncSession, older_than: datetime) -> int:
+    """Удалить записи журнала старше `older_than` пачками; сколько удалено."""
+    total = 0
+    while True:
+        batch = (
+            select(ChatChange.chat_id, ChatChange.seq)
+            .where(ChatChange.created_at < older_than)
+            .limit(_PRUNE_BATCH)
+        )
+        result = await db.execute(
+            delete(ChatChange).where(tuple_(ChatChange.chat_id, ChatChange.seq).in_(batch))
+        )
+        await db.commit()
+        total += result.rowcount or 0
+        if (result.rowcount or 0) < _PRUNE_BATCH:
+            return total
+
+
+_pruner_task: asyncio.Task[None] | None = None
+_pruner_stop: asyncio.Event | None = None
+
+
+async def _pruner_loop(stop_event: asyncio.Event) -> None:
+    retention = timedelta(days=settings.chat_change_retention_days)
+    while not stop_event.is_set():
+        try:
+            async with AsyncSessionLocal() as db:
+                pruned = await prune_chat_changes(db, datetime.now(timezone.utc) - retention)
+            if pruned:
+                logger.info("chat_changes: удалено %d записей по сроку хранения", pruned)
+        except Exception:
+            logger.exception("chat changes prune failed")
+        try:
+            await asyncio.wait_for(stop_event.wait(), timeout=_PRUNE_INTERVAL_SECONDS)
+        except asyncio.TimeoutError:
+            continue
+
+
+async def start_chat_change_pruner() -> None:
+    global _pruner_task, _pruner_stop
+    if settings.chat_change_retention_days <= 0:
+        return
+    if _pruner_task and not _pruner_task.done():
+        return
+    _pruner_stop = asyncio.Event()
+    _pruner_task = asyncio.create_task(_pruner_loop(_pruner_stop), name="chat-changes-pruner")
+    logger.info("chat changes pruner started")
+
+
+async def stop_chat_change_pruner() -> None:
+    global _pruner_task, _pruner_stop
+    if not _pruner_task:
+        return
+    if _pruner_stop:
+        _pruner_stop.set()
+    try:
+        await _pruner_task
+    except Exception:
+        logger.exception("chat changes pruner stopped with error")
+    _pruner_task = None
+    _pruner_stop = None
+    logger.info("chat changes pruner stopped")
@@ -0,0 +1,231 @@
+"""Персистентная очередь фоновых задач (таблица background_jobs) и её воркер.
+
+Задача ставится ``enqueue_job`` в транзакции вызывающего кода: закоммитилось
+изменение — закоммитилась и задача. Воркер забирает готовые задачи
+``FOR UPDATE SKIP LOCKED`` (несколько воркеров безопасны), помечает
+``running`` с арендой ``locked_until`` и выполняет обработчик вне блокировки.
+Упал обработчик — повтор с экспоненциальной задержкой, пока не исчерпаны
+``max_attempts``; упал весь процесс — задачу заберут после истечения аренды.
+
+Обработчики регистрируются декоратором ``@job_handler("kind")`` и должны быть
+идемпотентны: задача может выполниться повторно.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+from collections.abc import Awaitable, Callable
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import and_, or_, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.db.session import AsyncSessionLocal
+from app.models.background_job import (
+    JOB_DONE,
+    JOB_FAILED,
+    JOB_QUEUED,
+    JOB_RUNNING,
+    BackgroundJob,
+)
+
+logger = logging.getLogger(__name__)
+
+_MAX_RETRY_DELAY_SECONDS = 3600
+_BATCH = 20
+_ERROR_MAX_LEN = 2000
+
+
+class JobContext:
+    """То, что получает обработчик: сессия, сама задача и отчёт о прогрессе."""
+
+    def __init__(self, db: AsyncSession, job: BackgroundJob) -> None:
+        self.db = db
+        self.job = job
+
+    @property
+    def payload(self) -> dict:
+        return self.job.payload or {}
+
+    async def progress(self, done: int, total: int | None = None) -> None:
+        """Записать прогресс и продлить аренду. Коммитит сессию."""
+        self.job.progress_done = done
+        if total is not None:
+            self.job.progress_total = total
+        self.job.locked_until = _now() + timedelta(seconds=settings.job_lease_seconds)
+        await self.db.commit()
+
+
+JobHandler = Callable[[JobContext], Awaitable[None]]
+_handlers: dict[str, JobHandler] = {}
+
+
+def job_handler(kind: str) -> Callable[[JobHandler], JobHandler]:
+    def register(fn: JobHandler) -> JobHandler:
+        _handlers[kind] = fn
+        return fn
+
+    return register
+
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+async def enqueue_job(
+    db: AsyncSession, kind: str, payload: dict, *, max_attempts: int = 5
+) -> BackgroundJob:
+    """Поставить задачу в очередь в текущей транзакции. Не коммитит."""
+    job = BackgroundJob(kind=kind, payload=payload, max_attempts=max_attempts)
+    db.add(job)
+    await db.flush()
+    return job
+
+
+def retry_delay_seconds(attempts: int) -> int:
+    return min(settings.job_retry_base_seconds * 2 ** max(attempts - 1, 0), _MAX_RETRY_DELAY_SECONDS)
+
+
+def _fail_or_retry(job: BackgroundJob, error: str) -> None:
+    job.last_error = error[:_ERROR_MAX_LEN]
+    job.locked_until = None
+    if job.attempts >= job.max_attempts:
+        job.status = JOB_FAILED
+        job.finished_at = _now()
+        logger.error("job %s (%s) failed permanently: %s", job.id, job.kind, error)
+    else:
+        job.status = JOB_QUEUED
+        job.run_after = _now() + timedelta(seconds=retry_delay_seconds(job.attempts))
+        logger.warning("job %s (%s) attempt %d failed: %s", job.id, job.kind, job.attempts, error)
+
+
+async def claim_job(db: AsyncSession) -> BackgroundJob | None:
+    """Взять одну готовую задачу (или задачу с истёкшей арендой) и пометить running."""
+    while True:
+        now = _now()
+        job = await db.scalar(
+            select(BackgroundJob)
+            .where(
+                or_(
+                    and_(BackgroundJob.status == JOB_QUEUED, BackgroundJob.run_after <= now),
+                    and_(BackgroundJob.status == JOB_RUNNING, BackgroundJob.locked_until < now),
+                )
+            )
+            .order_by(BackgroundJob.run_after)
+            .limit(1)
+            .with_for_update(skip_locked=True)
+        )
+        if job is None:
+            return None
+        if job.status == JOB_RUNNING and job.attempts >= job.max_attempts:
+            # Процесс умирал на этой задаче каждый раз — больше не пробуем.
+            _fail_or_retry(job, job.last_error or "lease expired")
+            await db.commit()
+            continue
+        job.status = JOB_RUNNING
+        job.attempts += 1
+        job.locked_until = now + timedelta(seconds=settings.job_lease_seconds)
+        await db.commit()
+        return job
+
+
+async def run_job(db: AsyncSession, job: BackgroundJob) -> bool:
+    """Выполнить взятую задачу. → True, если успешно."""
+    job_id = job.id
+    handler = _handlers.get(job.kind)
+    if handler is None:
+        job.attempts = job.max_attempts
+        _fail_or_retry(job, f"unknown job kind: {job.kind}")
+        await db.commit()
+        return False
+    try:
+        await handler(JobContext(db, job))
+    except Exception as exc:  # noqa: BLE001
+        await db.rollback()
+        job = await db.get(BackgroundJob, job_id, populate_existing=True)
+        if job is not None:
+            _fail_or_retry(job, f"{type(exc).__name__}: {exc}")
+            await db.commit()
+        return False
+    job.status = JOB_DONE
+    job.finished_at = _now()
+    job.locked_until = None
+    job.last_error = None
+    await db.commit()
+    return True
+
+
+async def run_due_jobs(limit: int = _BATCH) -> int:
+    """Выполнить до ``limit`` готовых задач, каждую в своей сессии. → сколько взято."""
+    taken = 0
+    while taken < limit:
+        async with AsyncSessionLocal() as db:
+            job = await claim_job(db)
+            if job is None:
+                break
+            taken += 1
+            await run_job(db, job)
+    return taken
+
+
+# ── Воркер ──────────────────────────────────────────────────────────────────
+
+_scheduler_task: asyncio.Task[None] | None = None
+_scheduler_stop: asyncio.Event | None = None
+_wakeup: asyncio.Event | None = None
+
+
+def wake_job_worker() -> None:
+    """Разбудить воркер этого процесса сразу после коммита новой задачи."""
+    if _wakeup is not None:
+        _wakeup.set()
+
+
+async def _scheduler_loop(stop_event: asyncio.Event, wakeup: asyncio.Event) -> None:
+    while not stop_event.is_set():
+        wakeup.clear()
+        try:
+            if await run_due_jobs() >= _BATCH:
+                continue  # очередь не пуста — без паузы
+        except Exception:
+            logger.exception("job worker tick failed")
+        waiters = [asyncio.ensure_future(stop_event.wait()), asyncio.ensure_future(wakeup.wait())]
+        try:
+            await asyncio.wait(
+                waiters,
+                timeout=settings.job_poll_interval_seconds,
+                return_when=asyncio.FIRST_COMPLETED,
+            )
+        finally:
+            for w in waiters:
+                w.cancel()
+
+
+async def start_job_worker() -> None:
+    global _scheduler_task, _scheduler_stop, _wakeup
+    if _scheduler_task and not _scheduler_task.done():
+        return
+    _scheduler_stop = asyncio.Event()
+    _wakeup = asyncio.Event()
+    _scheduler_task = asyncio.create_task(
+        _scheduler_loop(_scheduler_stop, _wakeup), name="job-worker"
+    )
+    logger.info("job worker started")
+
+
+async def stop_job_worker() -> None:
+    global _scheduler_task, _scheduler_stop, _wakeup
+    if not _scheduler_task:
+        return
+    if _scheduler_stop:
+        _scheduler_stop.set()
+    try:
+        await _scheduler_task
+    except Exception:
+        logger.exception("job worker stopped with error")
+    _scheduler_task = None
+    _scheduler_stop = None
+    _wakeup = None
+    logger.info("job worker stopped")
@@ -0,0 +1,134 @@
+"""Снимки статистики платформы (platform_stats_snapshots) для /admin/stats.
+
+Раньше каждый запрос админки делал семь ``COUNT(*)`` (в том числе по
+messages) и обходил весь upload-root. Теперь счётчики считаются фоном раз в
+``STATS_SNAPSHOT_INTERVAL_SECONDS`` и сохраняются с отметкой времени; объём
+загрузок берётся из storage_usage. Прирост за период — разница с ближайшим
+снимком не позже начала периода.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import delete, func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.db.session import AsyncSessionLocal
+from app.models.family import Family
+from app.models.message import Message
+from app.models.platform_stats import PlatformStatsSnapshot
+from app.models.user import User
+from app.services.storage_usage import flush_storage_usage, storage_totals
+
+logger = logging.getLogger(__name__)
+
+_RETENTION = timedelta(days=90)
+
+
+async def take_snapshot(db: AsyncSession) -> PlatformStatsSnapshot:
+    """Посчитать счётчики и сохранить снимок. Не коммитит."""
+    users = await db.scalar(select(func.count(User.id))) or 0
+    banned = await db.scalar(select(func.count(User.id)).where(User.is_banned == True)) or 0  # noqa: E712
+    families = await db.scalar(select(func.count(Family.id))) or 0
+    messages = await db.scalar(select(func.count(Message.id))) or 0
+    uploads_bytes, uploads_objects = await storage_totals(db)
+    snap = PlatformStatsSnapshot(
+        taken_at=datetime.now(timezone.utc),
+        users=users,
+        families=families,
+        messages=messages,
+        banned_users=banned,
+        uploads_bytes=uploads_bytes,
+        uploads_objects=uploads_objects,
+    )
+    db.add(snap)
+    await db.execute(
+        delete(PlatformStatsSnapshot).where(
+            PlatformStatsSnapshot.taken_at < snap.taken_at - _RETENTION
+        )
+    )
+    await db.flush()
+    return snap
+
+
+async def latest_snapshot(db: AsyncSession) -> PlatformStatsSnapshot | None:
+    return await db.scalar(
+        select(PlatformStatsSnapshot).order_by(PlatformStatsSnapshot.taken_at.desc()).limit(1)
+    )
+
+
+async def baseline_snapshot(
+    db: AsyncSession, latest: PlatformStatsSnapshot, period: timedelta
+) -> PlatformStatsSnapshot | None:
+    """Снимок для прироста за ``period``: последний не позже ``latest − period``,
+    а если история короче — самый ранний (прирост «с момента первого снимка»)."""
+    cutoff = latest.taken_at - period
+    base = await db.scalar(
+        select(PlatformStatsSnapshot)
+        .where(PlatformStatsSnapshot.taken_at <= cutoff)
+        .order_by(PlatformStatsSnapshot.taken_at.desc())
+        .limit(1)
+    )
+    if base is None:
+        base = await db.scalar(
+            select(PlatformStatsSnapshot).order_by(PlatformStatsSnapshot.taken_at.asc()).limit(1)
+        )
+    return base
+
+
+async def run_stats_snapshot() -> None:
+    await flush_storage_usage()
+    async with AsyncSessionLocal() as db:
+        await take_snapshot(db)
+        await db.commit()
+
+
+# ── Периодические снимки ────────────────────────────────────────────────────
+
+_scheduler_task: asyncio.Task[None] | None = None
+_scheduler_stop: asyncio.Event | None = None
+
+
+async def _scheduler_loop(stop_event: asyncio.Event) -> None:
+    interval = settings.stats_snapshot_interval_seconds
+    while not stop_event.is_set():
+        try:
+            await run_stats_snapshot()
+        except Exception:
+            logger.exception("stats snapshot tick failed")
+        try:
+            await asyncio.wait_for(stop_event.wait(), timeout=interval)
+        except asyncio.TimeoutError:
+            continue
+
+
+async def start_stats_scheduler() -> None:
+    global _scheduler_task, _scheduler_stop
+    if settings.stats_snapshot_interval_seconds <= 0:
+        return
+    if _scheduler_task and not _scheduler_task.done():
+        return
+    _scheduler_stop = asyncio.Event()
+    _scheduler_task = asyncio.create_task(
+        _scheduler_loop(_scheduler_stop), name="stats-scheduler"
+    )
+    logger.info("stats scheduler started")
+
+
+async def stop_stats_scheduler() -> None:
+    global _scheduler_task, _scheduler_stop
+    if not _scheduler_task:
+        return
+    if _scheduler_stop:
+        _scheduler_stop.set()
+    try:
+        await _scheduler_task
+    except Exception:
+        logger.exception("stats scheduler stopped with error")
+    _scheduler_task = None
+    _scheduler_stop = None
+    logger.info("stats scheduler stopped")
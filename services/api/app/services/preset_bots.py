@@ -4,14 +4,21 @@
 его для UI и дефолтную настройку; хендлер (`(db, family_id, config) -> str|None`)
 собирает текст поста на сегодня. `None` означает «сегодня постить нечего» — тик
 всё равно фиксируется (`last_run_at`), чтобы не гонять хендлер весь день.
+
+Хендлер может иметь пакетную подготовку (`PRESET_PREFETCH`): именинники всех
+забранных за тик семей ищутся одним запросом, а не по запросу на семью.
+
+Расписание хранится в `PresetBot.next_run_at` (см. `next_run_at`): шедулер
+берёт только строки, у которых момент наступил, а не сканирует все пресеты.
 """
 
+import calendar
 from dataclasses import dataclass, field
-from datetime import date, datetime, timedelta, timezone
+from datetime import date, datetime, time, timedelta, timezone
 from typing import Any, Awaitable, Callable
 from uuid import UUID
 
-from sqlalchemy import extract, select
+from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.models.calendar_event import CalendarEvent
@@ -49,34 +56,95 @@ def to_local(dt: datetime, config: dict[str, Any]) -> datetime:
     return (dt.astimezone(timezone.utc) + _tz_offset(config)).replace(tzinfo=None)
 
 
+def next_run_at(
+    config: dict[str, Any],
+    last_run_at: datetime | None,
+    now: datetime | None = None,
+) -> datetime:
+    """Ближайший момент (aware UTC), когда пресет должен отработать: локальный
+    `config['hour']` сегодня, если сегодня (по локальному tz) он ещё не
+    отрабатывал, иначе — завтра. Момент может быть в прошлом: час уже пробил,
+    а прогона сегодня не было — значит, пора."""
+    now = now or datetime.now(timezone.utc)
+    offset = _tz_offset(config)
+    today = (now.astimezone(timezone.utc) + offset).date()
+    day = today
+    if last_run_at is not None and to_local(last_run_at, config).date() >= today:
+        day = today + timedelta(days=1)
+    local = datetime.combine(day, time(hour=int(config.get("hour", 9))))
+    return (local - offset).replace(tzinfo=timezone.utc)
+
+
 # ── Хендлеры ─────────────────────────────────────────────────────────────
 
-async def _handle_birthday(
-    db: AsyncSession, family_id: UUID, config: dict[str, Any]
-) -> str | None:
-    today = local_today(config)
-    rows = await db.scalars(
-        select(User)
-        .join(Membership, Membership.user_id == User.id)
+def birthday_key(day: date) -> int:
+    """Дата → MMDD, как ``User.birthday_md``."""
+    return day.month * 100 + day.day
+
+
+def _birthday_keys(day: date) -> set[int]:
+    # Родившиеся 29 февраля в невисокосный год празднуют 28-го.
+    if (day.month, day.day) == (2, 28) and not calendar.isleap(day.year):
+        return {228, 229}
+    return {birthday_key(day)}
+
+
+async def birthdays_on(
+    db: AsyncSession, days: dict[UUID, date]
+) -> dict[UUID, list[tuple[str, date]]]:
+    """Именинники по семьям: {family_id → локальная дата «сегодня» семьи} →
+    {family_id → [(display_name, birthday), ...]}.
+
+    Один запрос на все семьи по индексу ``ix_users_birthday_md``: у каждой
+    семьи свой часовой пояс, поэтому берутся все нужные MMDD, а лишнее
+    отсекается в памяти."""
+    if not days:
+        return {}
+    keys = set().union(*(_birthday_keys(d) for d in days.values()))
+    rows = await db.execute(
+        select(Membership.family_id, User.display_name, User.birthday)
+        .join(User, User.id == Membership.user_id)
         .where(
-            Membership.family_id == family_id,
+            Membership.family_id.in_(days),
             User.is_bot == False,  # noqa: E712
             User.birthday.is_not(None),
-            extract("month", User.birthday) == today.month,
-            extract("day", User.birthday) == today.day,
+            User.birthday_md.in_(keys),
         )
+        .order_by(User.display_name)
     )
-    people = rows.all()
+    out: dict[UUID, list[tuple[str, date]]] = {}
+    for family_id, name, birthday in rows.all():
+        if birthday_key(birthday) in _birthday_keys(days[family_id]):
+            out.setdefault(family_id, []).append((name, birthday))
+    return out
+
+
+async def _prefetch_birthdays(
+    db: AsyncSession, presets: list[tuple[UUID, dict[str, Any]]]
+) -> dict[UUID, list[tuple[str, date]]]:
+    return await birthdays_on(db, {family_id: local_today(config) for family_id, config in presets})
+
+
+async def _handle_birthday(
+    db: AsyncSession,
+    family_id: UUID,
+    config: dict[str, Any],
+    prefetched: list[tuple[str, date]] | None = None,
+) -> str | None:
+    today = local_today(config)
+    people = prefetched
+    if people is None:
+        people = (await birthdays_on(db, {family_id: today})).get(family_id, [])
     if not people:
         return None
 
     parts: list[str] = []
-    for u in people:
-        age = today.year - u.birthday.year if u.birthday else None
-        if age and age > 0:
-            parts.append(f"{u.display_name} ({age})")
+    for name, birthday in people:
+        age = today.year - birthday.year
+        if age > 0:
+            parts.append(f"{name} ({age})")
         else:
-            parts.append(u.display_name)
+            parts.append(name)
 
     if len(parts) == 1:
         return f"🎂 Сегодня день рождения у {parts[0]}! Поздравляем! 🎉"
@@ -136,8 +204,18 @@ PRESETS: dict[str, PresetMeta] = {
 }
 
 PRESET_HANDLERS: dict[
-    str, Callable[[AsyncSession, UUID, dict[str, Any]], Awaitable[str | None]]
+    str, Callable[..., Awaitable[str | None]]
 ] = {
     "birthday": _handle_birthday,
     "digest": _handle_digest,
 }
+
+# Пакетная подготовка данных для всех пресетов вида, забранных шедулером за
+# тик: `(db, [(family_id, config), ...]) -> {family_id → данные}`. Данные
+# передаются хендлеру как `prefetched=`; без них хендлер читает сам.
+PRESET_PREFETCH: dict[
+    str,
+    Callable[[AsyncSession, list[tuple[UUID, dict[str, Any]]]], Awaitable[dict[UUID, Any]]],
+] = {
+    "birthday": _prefetch_birthdays,
+}
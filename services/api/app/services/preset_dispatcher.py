@@ -1,46 +1,51 @@
 """Шедулер пресет-ботов (трек D).
 
-Каждые N секунд опрашивает `preset_bots`, находит включённые пресеты, у которых
-«час пробил» и которые ещё не отработали сегодня (по локальному tz), зовёт их
-хендлер и постит результат в целевой чат от имени бот-личности. Дедуп — через
-`last_run_at`; при нескольких инстансах строки берутся под `SKIP LOCKED`, поэтому
-каждый пресет отрабатывает ровно один раз в день без leader-election.
+Каждые N секунд забирает из `preset_bots` только пресеты, у которых наступил
+`next_run_at` (частичный индекс `ix_preset_bots_due`), зовёт их хендлер и
+постит результат в целевой чат от имени бот-личности.
+
+Забор — короткая транзакция под `SKIP LOCKED`: `next_run_at` сдвигается на
+аренду `_LEASE`, поэтому другие инстансы эти строки не возьмут, а пресет,
+чей прогон оборвался вместе с процессом, повторится после аренды. Хендлеры
+выполняются параллельно (не больше `_CONCURRENCY`), каждый в своей сессии —
+медленная семья не задерживает остальные. Перед прогоном данные для всех
+забранных пресетов одного вида готовятся одним запросом (`PRESET_PREFETCH`).
+После прогона `last_run_at` фиксируется, а `next_run_at` переносится на
+следующий день.
 """
 
 import asyncio
 import logging
-from datetime import datetime, timezone
+from datetime import datetime, timedelta, timezone
+from typing import Any
+from uuid import UUID
 
 from sqlalchemy import select
 from sqlalchemy.orm import selectinload
 
 from app.db.session import AsyncSessionLocal
+from app.models.chat_change import CHANGE_NEW
 from app.models.message import Message
 from app.models.preset_bot import PresetBot
-from app.services.preset_bots import PRESET_HANDLERS, local_now, to_local
+from app.services.chat_changes import log_change
+from app.services.preset_bots import PRESET_HANDLERS, PRESET_PREFETCH, next_run_at
 from app.ws.manager import ws_manager
 
 logger = logging.getLogger(__name__)
 
 _POLL_INTERVAL_SECONDS = 60
+# Сколько пресетов забирается одной транзакцией.
+_CLAIM_BATCH = 100
+# Сколько хендлеров выполняется одновременно.
+_CONCURRENCY = 8
+# На сколько сдвигается next_run_at забранного пресета на время прогона.
+_LEASE = timedelta(minutes=10)
 _scheduler_task: asyncio.Task[None] | None = None
 _scheduler_stop: asyncio.Event | None = None
 _dispatch_lock = asyncio.Lock()
 
 
-def _is_due(pb: PresetBot) -> bool:
-    config = pb.config or {}
-    now_local = local_now(config)
-    hour = int(config.get("hour", 9))
-    if now_local.hour < hour:
-        return False
-    if pb.last_run_at is not None:
-        if to_local(pb.last_run_at, config).date() >= now_local.date():
-            return False
-    return True
-
-
-def _new_message_payload(msg: Message, bot_user) -> dict:
+def _new_message_payload(msg: Message, bot_user, chat_seq: int) -> dict:
     return {
         "type": "new_message",
         "message": {
@@ -59,60 +64,147 @@ def _new_message_payload(msg: Message, bot_user) -> dict:
             "readers": [],
             "created_at": msg.created_at.isoformat(),
         },
+        "chat_seq": chat_seq,
     }
 
 
-async def dispatch_due_presets() -> int:
-    async with _dispatch_lock:
-        async with AsyncSessionLocal() as db:
-            result = await db.scalars(
-                select(PresetBot)
-                .where(
-                    PresetBot.enabled == True,  # noqa: E712
-                    PresetBot.target_chat_id.is_not(None),
+# Забранный пресет: (id, вид, семья, настройки).
+_Claimed = tuple[UUID, str, UUID, dict[str, Any]]
+
+
+async def _claim_due(now: datetime) -> tuple[list[_Claimed], bool]:
+    """Забрать наступившие пресеты: сдвинуть их next_run_at на аренду.
+    → (забранные, была ли пачка полной — тогда могут быть ещё)."""
+    async with AsyncSessionLocal() as db:
+        result = await db.scalars(
+            select(PresetBot)
+            .where(
+                PresetBot.enabled == True,  # noqa: E712
+                PresetBot.target_chat_id.is_not(None),
+                PresetBot.next_run_at <= now,
+            )
+            .order_by(PresetBot.next_run_at)
+            .limit(_CLAIM_BATCH)
+            .with_for_update(skip_locked=True)
+        )
+        rows = result.all()
+        claimed: list[_Claimed] = []
+        for pb in rows:
+            due = next_run_at(pb.config or {}, pb.last_run_at, now)
+            if due > now:
+                # Сегодня уже отработал (например, после смены часа) — просто
+                # перенести на правильный момент.
+                pb.next_run_at = due
+                continue
+            pb.next_run_at = now + _LEASE
+            claimed.append((pb.id, pb.preset_key, pb.family_id, dict(pb.config or {})))
+        await db.commit()
+        return claimed, len(rows) == _CLAIM_BATCH
+
+
+async def _prefetch(claimed: list[_Claimed]) -> dict[UUID, Any]:
+    """Пакетная подготовка по видам пресетов. → {preset_id → prefetched}.
+    Упала — хендлеры прочитают данные сами."""
+    by_key: dict[str, list[_Claimed]] = {}
+    for item in claimed:
+        if item[1] in PRESET_PREFETCH:
+            by_key.setdefault(item[1], []).append(item)
+    if not by_key:
+        return {}
+    out: dict[UUID, Any] = {}
+    async with AsyncSessionLocal() as db:
+        for key, items in by_key.items():
+            try:
+                data = await PRESET_PREFETCH[key](db, [(fid, cfg) for _, _, fid, cfg in items])
+            except Exception:
+                logger.exception("preset %s prefetch failed", key)
+                continue
+            for preset_id, _, family_id, _ in items:
+                out[preset_id] = data.get(family_id, [])
+    return out
+
+
+async def _run_preset(
+    preset_id: UUID, slots: asyncio.Semaphore, prefetched: dict[UUID, Any]
+) -> bool:
+    """Прогнать один забранный пресет в своей сессии. → опубликован ли пост."""
+    async with slots, AsyncSessionLocal() as db:
+        pb = await db.scalar(
+            select(PresetBot)
+            .where(PresetBot.id == preset_id)
+            .options(selectinload(PresetBot.bot_user))
+        )
+        if pb is None or not pb.enabled or pb.target_chat_id is None:
+            return False
+        now = datetime.now(timezone.utc)
+        handler = PRESET_HANDLERS.get(pb.preset_key)
+        if handler is None:
+            pb.next_run_at = next_run_at(pb.config or {}, now, now)
+            await db.commit()
+            return False
+        try:
+            if preset_id in prefetched:
+                text = await handler(
+                    db, pb.family_id, pb.config or {}, prefetched=prefetched[preset_id]
                 )
-                .options(selectinload(PresetBot.bot_user))
-                .with_for_update(skip_locked=True)
+            else:
+                text = await handler(db, pb.family_id, pb.config or {})
+        except Exception:
+            logger.exception("preset %s handler failed", pb.preset_key)
+            # не трогаем last_run_at → повтор на следующем тике
+            await db.rollback()
+            pb = await db.get(PresetBot, preset_id, populate_existing=True)
+            if pb is not None:
+                pb.next_run_at = now + timedelta(seconds=_POLL_INTERVAL_SECONDS)
+                await db.commit()
+            return False
+
+        # Отметить прогон даже если постить нечего (text is None),
+        # чтобы не гонять хендлер весь день.
+        pb.last_run_at = now
+        pb.next_run_at = next_run_at(pb.config or {}, now, now)
+        msg = None
+        seq = 0
+        if text:
+            msg = Message(
+                chat_id=pb.target_chat_id,
+                author_id=pb.bot_user_id,
+                text=text,
             )
-            presets = [pb for pb in result.all() if _is_due(pb)]
-            if not presets:
-                return 0
-
-            posted: list[tuple[Message, object]] = []
-            for pb in presets:
-                handler = PRESET_HANDLERS.get(pb.preset_key)
-                if handler is None:
-                    continue
-                try:
-                    text = await handler(db, pb.family_id, pb.config or {})
-                except Exception:
-                    logger.exception("preset %s handler failed", pb.preset_key)
-                    # не трогаем last_run_at → повтор на следующем тике
-                    continue
-
-                # Отметить прогон даже если постить нечего (text is None),
-                # чтобы не гонять хендлер весь день.
-                pb.last_run_at = datetime.now(timezone.utc)
-
-                if text:
-                    msg = Message(
-                        chat_id=pb.target_chat_id,
-                        author_id=pb.bot_user_id,
-                        text=text,
-                    )
-                    db.add(msg)
-                    posted.append((msg, pb.bot_user))
+            db.add(msg)
+            await db.flush()
+            seq = await log_change(db, msg.chat_id, msg.id, CHANGE_NEW)
+        bot_user = pb.bot_user
+        await db.commit()
 
-            await db.commit()
+        if msg is None:
+            return False
+        await db.refresh(msg, ["created_at"])
+        await ws_manager.broadcast_to_chat(
+            msg.chat_id, _new_message_payload(msg, bot_user, seq)
+        )
+        return True
 
-            sent = 0
-            for msg, bot_user in posted:
-                await db.refresh(msg, ["created_at"])
-                await ws_manager.broadcast_to_chat(
-                    msg.chat_id, _new_message_payload(msg, bot_user)
-                )
-                sent += 1
-            return sent
+
+async def dispatch_due_presets() -> int:
+    async with _dispatch_lock:
+        slots = asyncio.Semaphore(_CONCURRENCY)
+        sent = 0
+        while True:
+            claimed, more = await _claim_due(datetime.now(timezone.utc))
+            prefetched = await _prefetch(claimed)
+            results = await asyncio.gather(
+                *(_run_preset(item[0], slots, prefetched) for item in claimed),
+                return_exceptions=True,
+            )
+            for (pid, *_), res in zip(claimed, results):
+                if isinstance(res, BaseException):
+                    # Аренда истечёт — пресет повторится.
+                    logger.error("preset %s run failed: %r", pid, res)
+                elif res:
+                    sent += 1
+            if not more:
+                return sent
 
 
 async def _scheduler_loop(stop_event: asyncio.Event) -> None:
@@ -0,0 +1,216 @@
+"""Превью загруженных картинок: миниатюры WebP, blurhash и цвет-заглушка.
+
+Сетка галереи раньше грузила оригиналы по 5–20 МБ. Теперь после загрузки
+картинки (галерея, вложение в чат) в той же транзакции ставится задача
+``media.previews`` (services/jobs.py). Воркер читает оригинал из хранилища,
+строит варианты в пуле процессов (декодирование JPEG и ресайз — чистый CPU,
+в потоках упирались бы в GIL и тормозили бы event loop) и кладёт их рядом с
+оригиналом:
+
+    <family_id>/<uuid>.jpg  →  <family_id>/<uuid>.s.webp, <uuid>.m.webp
+
+Под тем же префиксом — значит, те же проверки доступа в routers/uploads.py
+(вариант отдаётся по ``?size=s``) и та же очистка при удалении семьи.
+Метаданные (размеры, blurhash, цвет, список вариантов) пишутся в
+``GalleryItem.preview`` и в ``preview`` словаря вложения; сообщение попадает
+в журнал /changes один раз на задачу, клиентам уходит
+``message_attachments_updated`` — только новые вложения, текст и пометка
+«изменено» не трогаются.
+
+Pillow — опциональная зависимость: без него задачи не ставятся.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import importlib.util
+import logging
+import multiprocessing
+from concurrent.futures import BrokenExecutor, ProcessPoolExecutor
+from pathlib import PurePosixPath
+from uuid import UUID
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.core.images import render_previews
+from app.core.storage import storage, url_to_key
+from app.core.uploads import UPLOADS_URL_PREFIX
+from app.models.chat_change import CHANGE_EDIT
+from app.models.gallery_item import GalleryItem
+from app.models.message import Message
+from app.services.blobs import physical_url
+from app.services.chat_changes import log_change
+from app.services.jobs import JobContext, enqueue_job, job_handler
+from app.ws.manager import ws_manager
+
+logger = logging.getLogger(__name__)
+
+MEDIA_PREVIEWS = "media.previews"
+TARGET_GALLERY = "gallery"
+TARGET_MESSAGE = "message"
+
+# Имя варианта → длинная сторона, px.
+PREVIEW_SIZES: dict[str, int] = {"s": 320, "m": 1280}
+_VARIANT_EXT = ".webp"
+_VARIANT_CONTENT_TYPE = "image/webp"
+
+
+def previews_available() -> bool:
+    return settings.previews_enabled and importlib.util.find_spec("PIL") is not None
+
+
+def variant_url(stored_url: str, size: str) -> str | None:
+    """``…/<uuid>.jpg`` → ``…/<uuid>.<size>.webp``; None для чужих URL."""
+    key = url_to_key(stored_url)
+    if not key or size not in PREVIEW_SIZES:
+        return None
+    path = PurePosixPath(key)
+    return f"{UPLOADS_URL_PREFIX}{path.parent / f'{path.stem}.{size}{_VARIANT_EXT}'}"
+
+
+def preview_urls(stored_url: str, preview: dict | None) -> list[str]:
+    """URL всех построенных вариантов — чтобы удалить их вместе с оригиналом."""
+    urls = [variant_url(stored_url, size) for size in (preview or {}).get("sizes", [])]
+    return [u for u in urls if u]
+
+
+async def delete_previews(stored_url: str, preview: dict | None) -> None:
+    # Пачкой: один клиент S3, размеры неизвестны — delete_urls узнаёт их HEAD'ом
+    # и списывает из storage_usage.
+    urls = preview_urls(stored_url, preview)
+    if urls:
+        await storage.delete_urls([(url, None) for url in urls])
+
+
+def preview_item(target: str, row_id: UUID, stored_url: str) -> dict:
+    return {"target": target, "id": str(row_id), "url": stored_url}
+
+
+async def enqueue_previews(db: AsyncSession, items: list[dict]) -> None:
+    """Поставить построение превью в текущей транзакции. Не коммитит."""
+    if items and previews_available():
+        await enqueue_job(db, MEDIA_PREVIEWS, {"items": items}, max_attempts=3)
+
+
+# ── Пул процессов ───────────────────────────────────────────────────────────
+
+_executor: ProcessPoolExecutor | None = None
+_slots: asyncio.Semaphore | None = None
+
+
+def _pool() -> tuple[ProcessPoolExecutor, asyncio.Semaphore]:
+    global _executor, _slots
+    if _executor is None:
+        # spawn, а не fork: форк процесса с живым event loop и потоками
+        # (asyncpg, пул PIN-хэширования) небезопасен.
+        _executor = ProcessPoolExecutor(
+            max_workers=settings.preview_workers,
+            mp_context=multiprocessing.get_context("spawn"),
+        )
+    if _slots is None:
+        _slots = asyncio.Semaphore(settings.preview_workers)
+    return _executor, _slots
+
+
+async def render_image(data: bytes) -> dict:
+    """``render_previews`` в пуле процессов; не больше ``preview_workers`` сразу."""
+    executor, slots = _pool()
+    async with slots:
+        return await asyncio.get_running_loop().run_in_executor(
+            executor, render_previews, data, PREVIEW_SIZES, settings.preview_max_pixels
+        )
+
+
+def shutdown_preview_pool() -> None:
+    global _executor, _slots
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+    _executor = None
+    _slots = None
+
+
+# ── Задача ──────────────────────────────────────────────────────────────────
+
+
+async def _build(stored_url: str, source_url: str, limit: asyncio.Semaphore) -> dict | None:
+    # Оригиналы читаются не раньше, чем освободится место в пуле, — в памяти
+    # не больше ``preview_workers`` фотографий сразу.
+    async with limit:
+        data = await storage.read_by_url(source_url)
+        if data is None:
+            return None
+        try:
+            result = await render_image(data)
+        except BrokenExecutor:
+            raise  # упал пул, а не картинка — задачу стоит повторить
+        except Exception as exc:  # noqa: BLE001
+            # Битый файл, HEIC без плагина, «бомба» — повтор не поможет.
+            logger.warning("preview skipped for %s: %s: %s", stored_url, type(exc).__name__, exc)
+            return None
+    variants: dict[str, bytes] = result.pop("variants")
+    for size, body in variants.items():
+        key = url_to_key(variant_url(stored_url, size) or "")
+        if key:
+            await storage.save(key, body, _VARIANT_CONTENT_TYPE)
+    result["sizes"] = sorted(variants, key=PREVIEW_SIZES.__getitem__)
+    return result
+
+
+async def _attach(
+    db: AsyncSession, item: dict, preview: dict, touched: dict[UUID, Message]
+) -> bool:
+    """Записать метаданные в строку. → False, если строки/вложения уже нет.
+    Изменённые сообщения собираются в `touched` — журнал и рассылка по ним
+    одним событием на сообщение."""
+    row_id, stored_url = UUID(item["id"]), item["url"]
+    if item["target"] == TARGET_GALLERY:
+        gallery_item = await db.get(GalleryItem, row_id)
+        if gallery_item is None or gallery_item.url != stored_url:
+            return False
+        gallery_item.preview = preview
+        return True
+    msg = await db.get(Message, row_id)
+    if msg is None or not any(
+        isinstance(a, dict) and a.get("url") == stored_url for a in msg.attachments or []
+    ):
+        return False
+    msg.attachments = [
+        {**a, "preview": preview} if isinstance(a, dict) and a.get("url") == stored_url else a
+        for a in msg.attachments
+    ]
+    touched[msg.id] = msg
+    return True
+
+
+@job_handler(MEDIA_PREVIEWS)
+async def build_previews(ctx: JobContext) -> None:
+    items: list[dict] = list(ctx.payload.get("items") or [])
+    await ctx.progress(0, len(items))
+    # Сессия не конкурентна: источники и запись метаданных — последовательно,
+    # параллельны только чтение оригиналов и рендер в пуле.
+    sources = [await physical_url(ctx.db, item["url"]) for item in items]
+    limit = asyncio.Semaphore(settings.preview_workers)
+    previews = await asyncio.gather(
+        *(_build(item["url"], source, limit) for item, source in zip(items, sources))
+    )
+    touched: dict[UUID, Message] = {}
+    for item, preview in zip(items, previews):
+        if preview is not None and not await _attach(ctx.db, item, preview, touched):
+            # Строку удалили, пока строились превью, — варианты не нужны.
+            await delete_previews(item["url"], preview)
+    seqs = {
+        msg_id: await log_change(ctx.db, msg.chat_id, msg_id, CHANGE_EDIT)
+        for msg_id, msg in touched.items()
+    }
+    await ctx.progress(len(items), len(items))
+    for msg_id, msg in touched.items():
+        await ws_manager.broadcast_to_chat(
+            msg.chat_id,
+            {
+                "type": "message_attachments_updated",
+                "message_id": str(msg_id),
+                "attachments": msg.attachments,
+                "chat_seq": seqs[msg_id],
+            },
+        )
@@ -5,7 +5,7 @@ from __future__ import annotations
 import uuid
 from typing import Iterable
 
-from sqlalchemy import select
+from sqlalchemy import or_, select
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.core.permissions import PRESET_DEFS, Perm
@@ -92,6 +92,68 @@ async def effective_permissions(
     return out
 
 
+async def _member_roles(
+    db: AsyncSession,
+    membership_id: uuid.UUID,
+) -> tuple[int, list[uuid.UUID]]:
+    """OR прав ролей участника и id этих ролей — одним запросом."""
+    rows = (
+        await db.execute(
+            select(MemberRole.role_id, FamilyRole.permissions)
+            .join(FamilyRole, FamilyRole.id == MemberRole.role_id)
+            .where(MemberRole.membership_id == membership_id)
+        )
+    ).all()
+    return merge_perms(bits for _, bits in rows), [role_id for role_id, _ in rows]
+
+
+async def _overrides_by_target(
+    db: AsyncSession,
+    user_id: uuid.UUID,
+    role_ids: list[uuid.UUID],
+    target_ids: list[uuid.UUID],
+    *,
+    override_model,
+    id_attr: str,
+) -> dict[uuid.UUID, list[tuple[int, int]]]:
+    """Override-ы ролей участника и его персональные для набора чатов/каналов —
+    одним запросом. → {target → [(allow, deny), ...]} в порядке применения:
+    роли по приоритету (desc), персональный — последним."""
+    id_col = getattr(override_model, id_attr)
+    rows = (
+        await db.execute(
+            select(
+                id_col,
+                override_model.role_id,
+                FamilyRole.priority,
+                override_model.allow,
+                override_model.deny,
+            )
+            .outerjoin(FamilyRole, FamilyRole.id == override_model.role_id)
+            .where(
+                id_col.in_(target_ids),
+                or_(
+                    override_model.role_id.in_(role_ids),
+                    override_model.user_id == user_id,
+                ),
+            )
+        )
+    ).all()
+    rows = sorted(rows, key=lambda r: (r[1] is None, -(r[2] or 0)))
+    out: dict[uuid.UUID, list[tuple[int, int]]] = {}
+    for tid, _role_id, _prio, allow, deny in rows:
+        out.setdefault(tid, []).append((allow, deny))
+    return out
+
+
+def _apply_override_chain(base: int, chain: Iterable[tuple[int, int]]) -> int:
+    """deny применяется первым, потом allow — для каждого override по порядку."""
+    for allow, deny in chain:
+        base &= ~(deny or 0)
+        base |= allow or 0
+    return base
+
+
 async def _apply_overrides(
     db: AsyncSession,
     membership_id: uuid.UUID,
@@ -113,71 +175,19 @@ async def _apply_overrides(
         ChatPermissionOverride,
     )
 
-    # Соберём все роли участника
     membership = await db.get(Membership, membership_id)
     if not membership:
         return base
 
-    role_ids = (
-        await db.scalars(
-            select(MemberRole.role_id).where(MemberRole.membership_id == membership_id)
-        )
-    ).all()
-
+    _, role_ids = await _member_roles(db, membership_id)
     if channel_id:
-        overrides = (
-            await db.execute(
-                select(
-                    FamilyRole.priority,
-                    ChannelPermissionOverride.allow,
-                    ChannelPermissionOverride.deny,
-                )
-                .join(FamilyRole, FamilyRole.id == ChannelPermissionOverride.role_id)
-                .where(
-                    ChannelPermissionOverride.channel_id == channel_id,
-                    ChannelPermissionOverride.role_id.in_(role_ids),
-                    ChannelPermissionOverride.role_id.is_not(None),
-                )
-                .order_by(FamilyRole.priority.desc())
-            )
-        ).all()
-        member_override = await db.scalar(
-            select(ChannelPermissionOverride).where(
-                ChannelPermissionOverride.channel_id == channel_id,
-                ChannelPermissionOverride.user_id == membership.user_id,
-            )
-        )
+        target, model, id_attr = channel_id, ChannelPermissionOverride, "channel_id"
     else:
-        overrides = (
-            await db.execute(
-                select(
-                    FamilyRole.priority,
-                    ChatPermissionOverride.allow,
-                    ChatPermissionOverride.deny,
-                )
-                .join(FamilyRole, FamilyRole.id == ChatPermissionOverride.role_id)
-                .where(
-                    ChatPermissionOverride.chat_id == chat_id,
-                    ChatPermissionOverride.role_id.in_(role_ids),
-                    ChatPermissionOverride.role_id.is_not(None),
-                )
-                .order_by(FamilyRole.priority.desc())
-            )
-        ).all()
-        member_override = await db.scalar(
-            select(ChatPermissionOverride).where(
-                ChatPermissionOverride.chat_id == chat_id,
-                ChatPermissionOverride.user_id == membership.user_id,
-            )
-        )
-
-    for _prio, allow, deny in overrides:
-        base &= ~(deny or 0)
-        base |= allow or 0
-    if member_override:
-        base &= ~(member_override.deny or 0)
-        base |= member_override.allow or 0
-    return base
+        target, model, id_attr = chat_id, ChatPermissionOverride, "chat_id"
+    chains = await _overrides_by_target(
+        db, membership.user_id, role_ids, [target], override_model=model, id_attr=id_attr
+    )
+    return _apply_override_chain(base, chains.get(target, []))
 
 
 async def effective_channel_permissions(
@@ -290,71 +300,33 @@ async def _effective_permissions_bulk(
     *,
     override_model,
     id_attr: str,
+    roles: tuple[int, list[uuid.UUID]] | None = None,
 ) -> dict[uuid.UUID, int]:
     """Считает effective-права участника сразу для набора чатов/каналов.
 
-    Один проход без N+1: базовые права берём один раз, все override-ы для ролей
-    участника и его персональные — двумя batch-запросами, затем применяем в
-    памяти (deny, потом allow; роли по приоритету, персональный override — последним).
+    Один проход без N+1: роли участника (биты и id) — одним запросом (или
+    готовые ``roles``), все override-ы ролей и персональные — вторым, затем
+    применяем в памяти (deny, потом allow; роли по приоритету, персональный
+    override — последним).
     """
     if not target_ids:
         return {}
     if membership.role.value == "owner":
         return {tid: int(Perm.ADMINISTRATOR) for tid in target_ids}
 
-    base = await effective_permissions(db, membership.id)
+    base, role_ids = roles if roles is not None else await _member_roles(db, membership.id)
     if base & int(Perm.ADMINISTRATOR):
         return {tid: base for tid in target_ids}
 
-    role_ids = (
-        await db.scalars(
-            select(MemberRole.role_id).where(MemberRole.membership_id == membership.id)
-        )
-    ).all()
-
-    id_col = getattr(override_model, id_attr)
-
-    # Override-ы ролей, уже отсортированные по приоритету (desc) — порядок применения.
-    role_overrides: dict[uuid.UUID, list[tuple[int, int]]] = {}
-    if role_ids:
-        rows = (
-            await db.execute(
-                select(id_col, override_model.allow, override_model.deny)
-                .join(FamilyRole, FamilyRole.id == override_model.role_id)
-                .where(
-                    id_col.in_(target_ids),
-                    override_model.role_id.in_(role_ids),
-                    override_model.role_id.is_not(None),
-                )
-                .order_by(FamilyRole.priority.desc())
-            )
-        ).all()
-        for tid, allow, deny in rows:
-            role_overrides.setdefault(tid, []).append((allow, deny))
-
-    # Персональные override-ы участника.
-    member_rows = (
-        await db.execute(
-            select(id_col, override_model.allow, override_model.deny).where(
-                id_col.in_(target_ids),
-                override_model.user_id == membership.user_id,
-            )
-        )
-    ).all()
-    member_overrides = {tid: (allow, deny) for tid, allow, deny in member_rows}
-
-    out: dict[uuid.UUID, int] = {}
-    for tid in target_ids:
-        bits = base
-        for allow, deny in role_overrides.get(tid, []):
-            bits &= ~(deny or 0)
-            bits |= allow or 0
-        if tid in member_overrides:
-            allow, deny = member_overrides[tid]
-            bits &= ~(deny or 0)
-            bits |= allow or 0
-        out[tid] = bits
-    return out
+    chains = await _overrides_by_target(
+        db,
+        membership.user_id,
+        role_ids,
+        target_ids,
+        override_model=override_model,
+        id_attr=id_attr,
+    )
+    return {tid: _apply_override_chain(base, chains.get(tid, [])) for tid in target_ids}
 
 
 async def effective_permissions_for_chats(
@@ -383,6 +355,35 @@ async def effective_permissions_for_channels(
     )
 
 
+async def effective_permissions_matrix(
+    db: AsyncSession,
+    membership: Membership,
+    chat_ids: list[uuid.UUID],
+    channel_ids: list[uuid.UUID],
+) -> tuple[int, dict[uuid.UUID, int], dict[uuid.UUID, int]]:
+    """Права участника в семье и во всех переданных чатах и каналах.
+
+    → (базовые биты, {chat_id → биты}, {channel_id → биты}). Три запроса
+    независимо от числа чатов: роли участника и по одному на override-ы
+    чатов и каналов.
+    """
+    from app.models.permission_override import (
+        ChannelPermissionOverride,
+        ChatPermissionOverride,
+    )
+
+    roles = await _member_roles(db, membership.id)
+    chats = await _effective_permissions_bulk(
+        db, membership, list(chat_ids),
+        override_model=ChatPermissionOverride, id_attr="chat_id", roles=roles,
+    )
+    channels = await _effective_permissions_bulk(
+        db, membership, list(channel_ids),
+        override_model=ChannelPermissionOverride, id_attr="channel_id", roles=roles,
+    )
+    return roles[0], chats, channels
+
+
 def merge_perms(bits: Iterable[int]) -> int:
     out = 0
     for b in bits:
@@ -0,0 +1,135 @@
+"""Фоновая очистка хранилища (задача ``storage.delete_prefixes``).
+
+Удаление семьи раньше чистило файлы прямо в обработчике запроса
+(``shutil.rmtree`` по каждому чату) и не трогало S3 вовсе. Теперь обработчик
+ставит задачу со списком префиксов в той же транзакции, что и удаление строк,
+а воркер (services/jobs.py) удаляет их через ``storage.delete_prefix`` —
+одинаково для local и s3. Удаление префикса идемпотентно, поэтому повтор
+после сбоя просто доудаляет остаток.
+
+``storage.delete_objects`` — удаление отдельных файлов пачкой (массовое
+удаление из галереи): обработчик удаляет строки одним ``DELETE … RETURNING``
+и ставит задачи по ``_DELETE_JOB_BATCH`` файлов — по одному DeleteObjects на
+задачу в S3.
+
+``storage.recount_usage`` — полный пересчёт storage_usage обходом хранилища
+(первичное заполнение после миграции и исправление дрейфа учёта); заодно
+пересобирает счётчики семей и пользователей из реестра storage_objects.
+Пустую таблицу (первый запуск после миграции 041) пересчёт заполняет сам:
+``ensure_storage_usage_seeded`` ставит его при старте приложения — иначе
+удаления увели бы счётчики с нуля в минус.
+"""
+
+from __future__ import annotations
+
+import logging
+from uuid import UUID
+
+from sqlalchemy import exists, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.storage import DeleteItem, storage
+from app.db.session import AsyncSessionLocal
+from app.models.background_job import JOB_QUEUED, JOB_RUNNING, BackgroundJob
+from app.models.platform_stats import StorageUsage
+from app.services.jobs import JobContext, enqueue_job, job_handler
+from app.services.storage_quota import recount_owner_usage
+from app.services.storage_usage import replace_storage_usage, usage_area
+
+logger = logging.getLogger(__name__)
+
+STORAGE_CLEANUP = "storage.delete_prefixes"
+STORAGE_RECOUNT = "storage.recount_usage"
+STORAGE_DELETE_OBJECTS = "storage.delete_objects"
+
+# Файлов в одной задаче storage.delete_objects (= предел DeleteObjects в S3).
+_DELETE_JOB_BATCH = 1000
+
+
+def chat_storage_prefix(chat_id: UUID) -> str:
+    """Вложения и голосовые сообщения чата."""
+    return f"chat_files/{chat_id}/"
+
+
+def family_storage_prefixes(family_id: UUID, chat_ids: list[UUID]) -> list[str]:
+    """Всё, что хранится за семьёй:
+      <family_id>/            — галерея и прочие файлы семьи;
+      chat_files/<chat_id>/   — вложения и голосовые сообщения чатов.
+    """
+    return [chat_storage_prefix(chat_id) for chat_id in chat_ids] + [f"{family_id}/"]
+
+
+async def enqueue_storage_cleanup(db: AsyncSession, prefixes: list[str]) -> BackgroundJob:
+    return await enqueue_job(db, STORAGE_CLEANUP, {"prefixes": prefixes})
+
+
+@job_handler(STORAGE_CLEANUP)
+async def delete_prefixes(ctx: JobContext) -> None:
+    prefixes: list[str] = list(ctx.payload.get("prefixes") or [])
+    await ctx.progress(0, len(prefixes))
+    deleted = 0
+    for i, prefix in enumerate(prefixes):
+        async def _heartbeat(_: int, i: int = i) -> None:
+            # Большой префикс в S3 удаляется пачками — продлеваем аренду.
+            await ctx.progress(i, len(prefixes))
+
+        deleted += await storage.delete_prefix(prefix, on_progress=_heartbeat)
+        await ctx.progress(i + 1, len(prefixes))
+    logger.info("storage cleanup %s: %d object(s) under %d prefix(es)", ctx.job.id, deleted, len(prefixes))
+
+
+async def enqueue_storage_deletes(db: AsyncSession, items: list[DeleteItem]) -> int:
+    """Поставить удаление файлов задачами по ``_DELETE_JOB_BATCH``. Не коммитит.
+    → сколько задач поставлено."""
+    batches = [items[i : i + _DELETE_JOB_BATCH] for i in range(0, len(items), _DELETE_JOB_BATCH)]
+    for batch in batches:
+        await enqueue_job(db, STORAGE_DELETE_OBJECTS, {"items": [list(item) for item in batch]})
+    return len(batches)
+
+
+@job_handler(STORAGE_DELETE_OBJECTS)
+async def delete_objects(ctx: JobContext) -> None:
+    items: list[DeleteItem] = [(url, size) for url, size in ctx.payload.get("items") or []]
+    await ctx.progress(0, len(items))
+    if ctx.job.attempts > 1:
+        # Часть файлов могла удалиться в прошлой попытке — размеры из реестра
+        # списали бы их повторно; пусть хранилище само проверит, что осталось.
+        items = [(url, None) for url, _ in items]
+    deleted = await storage.delete_urls(items)
+    await ctx.progress(len(items), len(items))
+    logger.info("storage delete %s: %d of %d object(s)", ctx.job.id, deleted, len(items))
+
+
+async def enqueue_storage_recount(db: AsyncSession) -> BackgroundJob:
+    return await enqueue_job(db, STORAGE_RECOUNT, {}, max_attempts=3)
+
+
+async def ensure_storage_usage_seeded() -> bool:
+    """Поставить пересчёт, если storage_usage пуста и он ещё не в очереди.
+    Вызывается при старте до запуска записи дельт. → поставлен ли."""
+    async with AsyncSessionLocal() as db:
+        if await db.scalar(select(StorageUsage.area).limit(1)) is not None:
+            return False
+        pending = await db.scalar(
+            select(
+                exists().where(
+                    BackgroundJob.kind == STORAGE_RECOUNT,
+                    BackgroundJob.status.in_((JOB_QUEUED, JOB_RUNNING)),
+                )
+            )
+        )
+        if pending:
+            return False
+        await enqueue_storage_recount(db)
+        await db.commit()
+    logger.info("storage_usage is empty — recount queued")
+    return True
+
+
+@job_handler(STORAGE_RECOUNT)
+async def recount_usage(ctx: JobContext) -> None:
+    usage = await storage.scan_usage(usage_area)
+    await replace_storage_usage(ctx.db, usage)
+    await recount_owner_usage(ctx.db)
+    objects = sum(n for _, n in usage.values())
+    await ctx.progress(objects, objects)
@@ -0,0 +1,420 @@
+"""Учёт хранилища по семьям и пользователям и квоты на запись.
+
+Обработчики загрузок сохраняют и удаляют файлы через ``save_upload`` /
+``delete_upload``, а не напрямую через ``storage``: файл регистрируется в
+storage_objects, счётчики storage_owner_usage меняются в транзакции запроса —
+вместе со строкой (GalleryItem, Message, ...), которая на файл ссылается.
+
+Квоты (``FAMILY_STORAGE_QUOTA_BYTES`` / ``USER_STORAGE_QUOTA_BYTES``, 0 — без
+ограничения) проверяются дважды:
+  * ``precheck_upload_quota`` — в начале обработчика, по подсказке размера
+    (размер принятой части UploadFile, иначе Content-Length запроса), до
+    ``read()`` файла в память и до проверки сигнатуры;
+  * ``save_upload`` — перед записью, по точному размеру.
+Параллельные загрузки могут превысить квоту на одну загрузку — квота мягкая.
+
+Массовые операции галереи идут через ``save_uploads`` (файлы читаются и
+пишутся параллельно, реестр и счётчики — одним запросом) и ``delete_uploads``
+(одно ``DELETE … RETURNING`` по реестру; сами файлы удаляет фоновая задача).
+
+При ``STORAGE_DEDUP_ENABLED`` тело файла хранится контентно-адресуемо
+(services/blobs.py); квоты и счётчики по-прежнему считают логический размер.
+"""
+
+from __future__ import annotations
+
+import asyncio
+from collections.abc import Awaitable, Callable, Sequence
+from uuid import UUID
+
+from fastapi import HTTPException, Request, UploadFile, status
+from sqlalchemy import Row, delete, func, select, tuple_
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.core.storage import DeleteItem, storage, url_to_key
+from app.core.uploads import UPLOADS_URL_PREFIX
+from app.models.storage_object import (
+    OWNER_FAMILY,
+    OWNER_USER,
+    StorageOwnerUsage,
+    StoredObject,
+)
+from app.services.blobs import acquire_blob, release_blobs
+
+_MB = 1024 * 1024
+
+# (тип владельца, id, Δбайт, Δобъектов)
+_Delta = tuple[str, UUID, int, int]
+# Файл массовой загрузки: ключ, чтение с проверками (HTTPException), content-type.
+UploadSource = tuple[str, Callable[[], Awaitable[bytes]], str | None]
+# Сколько файлов массовой загрузки читается и пишется одновременно.
+_BULK_WRITE_CONCURRENCY = 4
+
+
+def _quota_for(owner_type: str) -> int:
+    if owner_type == OWNER_FAMILY:
+        return settings.family_storage_quota_bytes
+    return settings.user_storage_quota_bytes
+
+
+def upload_size_hint(request: Request | None, uploads: Sequence[UploadFile]) -> int:
+    """Размер загрузки до чтения файлов: сумма ``UploadFile.size``, а если он
+    известен не для всех частей — Content-Length запроса (с запасом на
+    multipart-обвязку)."""
+    sizes = [u.size for u in uploads]
+    if sizes and all(s is not None for s in sizes):
+        return sum(sizes)
+    if request is None:
+        return 0
+    try:
+        return max(int(request.headers.get("content-length") or 0), 0)
+    except ValueError:
+        return 0
+
+
+async def _usage(db: AsyncSession, owners: list[tuple[str, UUID]]) -> dict[tuple[str, UUID], int]:
+    if not owners:
+        return {}
+    rows = await db.execute(
+        select(StorageOwnerUsage.owner_type, StorageOwnerUsage.owner_id, StorageOwnerUsage.bytes)
+        .where(tuple_(StorageOwnerUsage.owner_type, StorageOwnerUsage.owner_id).in_(owners))
+    )
+    return {(t, oid): b for t, oid, b in rows.all()}
+
+
+async def check_storage_quota(
+    db: AsyncSession,
+    *,
+    family_id: UUID | None,
+    user_id: UUID | None,
+    incoming: int,
+) -> None:
+    """413, если ``incoming`` байт не помещаются в квоту семьи или пользователя."""
+    if incoming <= 0:
+        return
+    limited = [
+        (owner_type, owner_id)
+        for owner_type, owner_id in ((OWNER_FAMILY, family_id), (OWNER_USER, user_id))
+        if owner_id is not None and _quota_for(owner_type) > 0
+    ]
+    used = await _usage(db, limited)
+    for owner in limited:
+        quota = _quota_for(owner[0])
+        free = max(quota - used.get(owner, 0), 0)
+        if incoming > free:
+            whose = "семьи" if owner[0] == OWNER_FAMILY else "пользователя"
+            raise HTTPException(
+                status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                detail=f"Недостаточно места в хранилище {whose}: свободно {free // _MB} МБ "
+                f"из {quota // _MB} МБ",
+            )
+
+
+async def precheck_upload_quota(
+    db: AsyncSession,
+    request: Request | None,
+    uploads: Sequence[UploadFile],
+    *,
+    family_id: UUID | None,
+    user_id: UUID | None,
+) -> None:
+    """Отказ по квоте до чтения файлов — по подсказке размера."""
+    await check_storage_quota(
+        db,
+        family_id=family_id,
+        user_id=user_id,
+        incoming=upload_size_hint(request, uploads),
+    )
+
+
+async def _apply(db: AsyncSession, deltas: list[_Delta]) -> None:
+    deltas = [d for d in deltas if d[2] or d[3]]
+    if not deltas:
+        return
+    stmt = pg_insert(StorageOwnerUsage).values(
+        [{"owner_type": t, "owner_id": oid, "bytes": b, "objects": n} for t, oid, b, n in deltas]
+    )
+    await db.execute(
+        stmt.on_conflict_do_update(
+            index_elements=[StorageOwnerUsage.owner_type, StorageOwnerUsage.owner_id],
+            set_={
+                "bytes": StorageOwnerUsage.bytes + stmt.excluded.bytes,
+                "objects": StorageOwnerUsage.objects + stmt.excluded.objects,
+                "updated_at": func.now(),
+            },
+        )
+    )
+
+
+def _owner_deltas(
+    family_id: UUID | None, user_id: UUID | None, size: int, objects: int
+) -> list[_Delta]:
+    out: list[_Delta] = []
+    if family_id is not None:
+        out.append((OWNER_FAMILY, family_id, size, objects))
+    if user_id is not None:
+        out.append((OWNER_USER, user_id, size, objects))
+    return out
+
+
+async def save_upload(
+    db: AsyncSession,
+    key: str,
+    data: bytes,
+    content_type: str | None,
+    *,
+    family_id: UUID | None,
+    user_id: UUID | None,
+    written: list[str] | None = None,
+) -> None:
+    """Проверить квоту, записать файл и учесть его. Не коммитит.
+
+    Ключ записанного файла (или тела) добавляется в `written`.
+    OSError хранилища пробрасывается — обработчик превращает её в 500."""
+    await check_storage_quota(db, family_id=family_id, user_id=user_id, incoming=len(data))
+    blob_hash = None
+    if settings.storage_dedup_enabled:
+        blob_hash = await acquire_blob(db, data, content_type, written)
+    else:
+        await storage.save(key, data, content_type)
+        if written is not None:
+            written.append(key)
+    inserted = await db.scalar(
+        pg_insert(StoredObject)
+        .values(
+            key=key, family_id=family_id, user_id=user_id, size=len(data), blob_hash=blob_hash
+        )
+        .on_conflict_do_nothing(index_elements=[StoredObject.key])
+        .returning(StoredObject.key)
+    )
+    if inserted is not None:
+        await _apply(db, _owner_deltas(family_id, user_id, len(data), 1))
+    elif blob_hash is not None:
+        await release_blobs(db, {blob_hash: 1})
+
+
+async def save_uploads(
+    db: AsyncSession,
+    sources: Sequence[UploadSource],
+    *,
+    family_id: UUID | None,
+    user_id: UUID | None,
+) -> list[int]:
+    """Записать пачку файлов и учесть их одним запросом. → размеры. Не коммитит.
+
+    Файлы читаются и пишутся параллельно (не больше
+    ``_BULK_WRITE_CONCURRENCY`` в памяти сразу). Упала любая — уже
+    записанные удаляются, ошибка пробрасывается: пачка целиком или ничего.
+    Квота проверяется по точному итогу после записи."""
+    if settings.storage_dedup_enabled:
+        # Ссылки на тела берутся в сессии запроса — она не конкурентна.
+        sizes = []
+        bodies: list[str] = []
+        try:
+            for key, read, content_type in sources:
+                data = await read()
+                await save_upload(
+                    db,
+                    key,
+                    data,
+                    content_type,
+                    family_id=family_id,
+                    user_id=user_id,
+                    written=bodies,
+                )
+                sizes.append(len(data))
+        except Exception:
+            # Откат заберёт и строки blobs — тела, записанные этим вызовом,
+            # сборщик уже не найдёт. Удаляем до отката: строки ещё под
+            # блокировкой, параллельная загрузка того же тела ждёт её.
+            await storage.delete_urls([(f"{UPLOADS_URL_PREFIX}{key}", None) for key in bodies])
+            raise
+        return sizes
+
+    slots = asyncio.Semaphore(_BULK_WRITE_CONCURRENCY)
+    written: list[str] = []
+
+    async def _write(key: str, read: Callable[[], Awaitable[bytes]], content_type: str | None) -> int:
+        async with slots:
+            data = await read()
+            await storage.save(key, data, content_type)
+            written.append(key)
+            return len(data)
+
+    results = await asyncio.gather(*(_write(*source) for source in sources), return_exceptions=True)
+    try:
+        for result in results:
+            if isinstance(result, BaseException):
+                raise result
+        sizes = [int(size) for size in results]
+        await check_storage_quota(db, family_id=family_id, user_id=user_id, incoming=sum(sizes))
+    except Exception:
+        await storage.delete_urls([(f"{UPLOADS_URL_PREFIX}{key}", None) for key in written])
+        raise
+    await db.execute(
+        pg_insert(StoredObject),
+        [
+            {"key": key, "family_id": family_id, "user_id": user_id, "size": size}
+            for (key, _, _), size in zip(sources, sizes)
+        ],
+    )
+    await _apply(db, _owner_deltas(family_id, user_id, sum(sizes), len(sizes)))
+    return sizes
+
+
+async def delete_upload(db: AsyncSession, stored_url: str | None) -> None:
+    """Удалить файл и списать его с владельцев. Не коммитит.
+
+    Дедуплицированный файл лишь теряет ссылку на тело. Файлы, загруженные до
+    появления учёта, в реестре отсутствуют — они просто удаляются."""
+    if not stored_url:
+        return
+    key = url_to_key(stored_url)
+    row = None
+    if key:
+        row = (
+            await db.execute(
+                delete(StoredObject)
+                .where(StoredObject.key == key)
+                .returning(
+                    StoredObject.family_id,
+                    StoredObject.user_id,
+                    StoredObject.size,
+                    StoredObject.blob_hash,
+                )
+            )
+        ).first()
+    if row is not None and row.blob_hash:
+        await release_blobs(db, {row.blob_hash: 1})
+    else:
+        await storage.delete_by_url(stored_url, size=row.size if row is not None else None)
+    if row is not None:
+        await _apply(db, _owner_deltas(row.family_id, row.user_id, -row.size, -1))
+
+
+async def delete_uploads(db: AsyncSession, stored_urls: Sequence[str]) -> list[DeleteItem]:
+    """Снять с учёта пачку файлов одним ``DELETE … RETURNING``. Не коммитит.
+
+    Сами файлы не удаляются: → (URL, размер или None) того, что осталось
+    удалить из хранилища, — для ``enqueue_storage_deletes``
+    (services/storage_cleanup.py). Дедуплицированные файлы только теряют
+    ссылки на тела."""
+    keys = {key: url for url in stored_urls if (key := url_to_key(url))}
+    rows = []
+    if keys:
+        rows = (
+            await db.execute(
+                delete(StoredObject)
+                .where(StoredObject.key.in_(keys))
+                .returning(
+                    StoredObject.key,
+                    StoredObject.family_id,
+                    StoredObject.user_id,
+                    StoredObject.size,
+                    StoredObject.blob_hash,
+                )
+            )
+        ).all()
+    sizes = await _release_rows(db, rows)
+    # Файлы до появления учёта в реестре отсутствуют — их размер неизвестен.
+    registered = {row.key for row in rows}
+    return [
+        (url, sizes.get(key)) for key, url in keys.items() if key in sizes or key not in registered
+    ]
+
+
+async def _release_rows(db: AsyncSession, rows: Sequence[Row]) -> dict[str, int]:
+    """Списать удалённые из реестра строки с владельцев и снять ссылки на
+    тела. → ключ → размер для файлов без тела (их удаляет вызывающий)."""
+    deltas: dict[tuple[str, UUID], list[int]] = {}
+    blob_refs: dict[str, int] = {}
+    sizes: dict[str, int] = {}
+    for row in rows:
+        for owner_type, owner_id, _, _ in _owner_deltas(row.family_id, row.user_id, 0, 0):
+            acc = deltas.setdefault((owner_type, owner_id), [0, 0])
+            acc[0] -= row.size
+            acc[1] -= 1
+        if row.blob_hash:
+            blob_refs[row.blob_hash] = blob_refs.get(row.blob_hash, 0) + 1
+        else:
+            sizes[row.key] = row.size
+    await _apply(db, [(t, oid, b, n) for (t, oid), (b, n) in deltas.items()])
+    await release_blobs(db, blob_refs)
+    return sizes
+
+
+async def release_prefix_storage(db: AsyncSession, prefix: str) -> None:
+    """Перед удалением чата: снять с учёта всё под префиксом
+    (``chat_files/<chat_id>/``) — доли семьи и авторов, ссылки на тела.
+
+    Файлы удаляет фоновая очистка префикса (services/storage_cleanup.py). Не коммитит."""
+    rows = (
+        await db.execute(
+            delete(StoredObject)
+            .where(StoredObject.key.startswith(prefix, autoescape=True))
+            .returning(
+                StoredObject.key,
+                StoredObject.family_id,
+                StoredObject.user_id,
+                StoredObject.size,
+                StoredObject.blob_hash,
+            )
+        )
+    ).all()
+    await _release_rows(db, rows)
+
+
+async def release_family_storage(db: AsyncSession, family_id: UUID) -> None:
+    """Перед удалением семьи: снять доли участников, ссылки на общие тела и
+    сам счётчик семьи.
+
+    Файлы удаляет фоновая очистка (services/storage_cleanup.py). Не коммитит."""
+    rows = await db.execute(
+        select(StoredObject.user_id, func.sum(StoredObject.size), func.count())
+        .where(StoredObject.family_id == family_id, StoredObject.user_id.is_not(None))
+        .group_by(StoredObject.user_id)
+    )
+    await _apply(db, [(OWNER_USER, uid, -int(b), -int(n)) for uid, b, n in rows.all()])
+    blob_refs = await db.execute(
+        select(StoredObject.blob_hash, func.count())
+        .where(StoredObject.family_id == family_id, StoredObject.blob_hash.is_not(None))
+        .group_by(StoredObject.blob_hash)
+    )
+    await db.execute(delete(StoredObject).where(StoredObject.family_id == family_id))
+    await release_blobs(db, {h: int(n) for h, n in blob_refs.all()})
+    await db.execute(
+        delete(StorageOwnerUsage).where(
+            StorageOwnerUsage.owner_type == OWNER_FAMILY,
+            StorageOwnerUsage.owner_id == family_id,
+        )
+    )
+
+
+async def recount_owner_usage(db: AsyncSession) -> None:
+    """Пересобрать счётчики владельцев из реестра (исправление дрейфа). Не коммитит."""
+    await db.execute(delete(StorageOwnerUsage))
+    for owner_type, column in ((OWNER_FAMILY, StoredObject.family_id), (OWNER_USER, StoredObject.user_id)):
+        rows = await db.execute(
+            select(column, func.sum(StoredObject.size), func.count())
+            .where(column.is_not(None))
+            .group_by(column)
+        )
+        values = [
+            {"owner_type": owner_type, "owner_id": oid, "bytes": int(b), "objects": int(n)}
+            for oid, b, n in rows.all()
+        ]
+        if values:
+            await db.execute(pg_insert(StorageOwnerUsage), values)
+
+
+async def owner_storage_usage(
+    db: AsyncSession, owner_type: str, owner_id: UUID
+) -> tuple[int, int, int | None]:
+    """→ (байт, объектов, квота или None, если без ограничения)."""
+    row = await db.get(StorageOwnerUsage, (owner_type, owner_id))
+    quota = _quota_for(owner_type)
+    if row is None:
+        return 0, 0, quota or None
+    return max(row.bytes, 0), max(row.objects, 0), quota or None
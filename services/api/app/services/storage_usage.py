@@ -0,0 +1,157 @@
+"""Учёт объёма хранилища (таблица storage_usage) без обхода файлов.
+
+Хранилище (core/storage.py) сообщает сюда каждое сохранение и удаление —
+``record_storage_delta`` подключается к нему при импорте модуля; объём копится по «областям» — первому сегменту ключа. Дельты суммируются в
+памяти процесса и раз в ``STORAGE_USAGE_FLUSH_SECONDS`` пишутся одним
+атомарным ``bytes = bytes + delta`` на область — без UPDATE горячей строки на
+каждую загрузку и без зависимости от транзакции запроса (файл уже записан,
+откат его не вернёт).
+
+Потерянные при падении процесса дельты и прочий дрейф исправляет полный
+пересчёт (задача ``storage.recount_usage``). Он же заполняет пустую таблицу:
+при старте ставится автоматически (services/storage_cleanup.py,
+``ensure_storage_usage_seeded``).
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+
+from sqlalchemy import func, select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.core.storage import set_usage_recorder
+from app.db.session import AsyncSessionLocal
+from app.models.platform_stats import StorageUsage
+
+logger = logging.getLogger(__name__)
+
+AREA_FAMILIES = "families"
+AREA_CHAT_FILES = "chat_files"
+AREA_AVATARS = "avatars"
+AREA_BLOBS = "blobs"
+_NAMED_AREAS = {AREA_CHAT_FILES, AREA_AVATARS, AREA_BLOBS}
+
+
+def usage_area(key: str) -> str:
+    """``chat_files/<chat>/x`` → chat_files, ``avatars/x`` → avatars,
+    ``blobs/…`` → blobs (дедуплицированные тела), ``<family>/x`` → families."""
+    head = key.split("/", 1)[0]
+    return head if head in _NAMED_AREAS else AREA_FAMILIES
+
+
+# область → (Δбайт, Δобъектов), ещё не записанные в БД.
+_pending: dict[str, tuple[int, int]] = {}
+
+
+def record_storage_delta(key: str, bytes_delta: int, objects_delta: int) -> None:
+    if not bytes_delta and not objects_delta:
+        return
+    area = usage_area(key)
+    b, n = _pending.get(area, (0, 0))
+    _pending[area] = (b + bytes_delta, n + objects_delta)
+
+
+set_usage_recorder(record_storage_delta)
+
+
+async def flush_storage_usage() -> int:
+    """Записать накопленные дельты. → сколько областей обновлено."""
+    global _pending
+    if not _pending:
+        return 0
+    batch, _pending = _pending, {}
+    stmt = pg_insert(StorageUsage).values(
+        [{"area": area, "bytes": b, "objects": n} for area, (b, n) in sorted(batch.items())]
+    )
+    try:
+        async with AsyncSessionLocal() as db:
+            await db.execute(
+                stmt.on_conflict_do_update(
+                    index_elements=[StorageUsage.area],
+                    set_={
+                        "bytes": StorageUsage.bytes + stmt.excluded.bytes,
+                        "objects": StorageUsage.objects + stmt.excluded.objects,
+                        "updated_at": func.now(),
+                    },
+                )
+            )
+            await db.commit()
+    except Exception:
+        for area, (b, n) in batch.items():
+            pb, pn = _pending.get(area, (0, 0))
+            _pending[area] = (pb + b, pn + n)
+        raise
+    return len(batch)
+
+
+async def storage_totals(db: AsyncSession) -> tuple[int, int]:
+    """→ (байт, объектов) по всем областям."""
+    row = (
+        await db.execute(
+            select(
+                func.coalesce(func.sum(StorageUsage.bytes), 0),
+                func.coalesce(func.sum(StorageUsage.objects), 0),
+            )
+        )
+    ).one()
+    return int(row[0]), int(row[1])
+
+
+async def replace_storage_usage(db: AsyncSession, usage: dict[str, tuple[int, int]]) -> None:
+    """Заменить учёт результатами полного пересчёта. Не коммитит."""
+    _pending.clear()
+    await db.execute(StorageUsage.__table__.delete())
+    if usage:
+        await db.execute(
+            pg_insert(StorageUsage),
+            [{"area": area, "bytes": b, "objects": n} for area, (b, n) in usage.items()],
+        )
+
+
+# ── Периодическая запись ────────────────────────────────────────────────────
+
+_scheduler_task: asyncio.Task[None] | None = None
+_scheduler_stop: asyncio.Event | None = None
+
+
+async def _scheduler_loop(stop_event: asyncio.Event) -> None:
+    while not stop_event.is_set():
+        try:
+            await asyncio.wait_for(
+                stop_event.wait(), timeout=settings.storage_usage_flush_seconds
+            )
+        except asyncio.TimeoutError:
+            pass
+        try:
+            await flush_storage_usage()
+        except Exception:
+            logger.exception("storage usage flush failed")
+
+
+async def start_storage_usage_flusher() -> None:
+    global _scheduler_task, _scheduler_stop
+    if _scheduler_task and not _scheduler_task.done():
+        return
+    _scheduler_stop = asyncio.Event()
+    _scheduler_task = asyncio.create_task(
+        _scheduler_loop(_scheduler_stop), name="storage-usage-flusher"
+    )
+
+
+async def stop_storage_usage_flusher() -> None:
+    """Остановить и записать остаток (цикл делает финальный flush сам)."""
+    global _scheduler_task, _scheduler_stop
+    if not _scheduler_task:
+        return
+    if _scheduler_stop:
+        _scheduler_stop.set()
+    try:
+        await _scheduler_task
+    except Exception:
+        logger.exception("storage usage flusher stopped with error")
+    _scheduler_task = None
+    _scheduler_stop = None
@@ -0,0 +1,52 @@
+"""Аутентификация человека на WS-handshake (общая для всех WS-эндпоинтов).
+
+Источник личности — httpOnly-cookie с JWT либо одноразовый `?ticket=` (см.
+core/ws_tickets.py). Проверки те же, что у REST: отзыв токена по
+`password_changed_at` и глобальный бан. Членство в семье/права на чат
+проверяет сам эндпоинт — у мультиплекс-gateway это делается пакетно.
+"""
+
+from __future__ import annotations
+
+from datetime import timedelta
+
+from fastapi import WebSocket
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.jwt import COOKIE_NAME, decode_access_token
+from app.core.ws_security import is_allowed_ws_origin
+from app.core.ws_tickets import ws_ticket_store
+from app.models.user import User
+from app.services.bans import is_banned_now
+
+
+async def authenticate_ws_user(
+    websocket: WebSocket, db: AsyncSession
+) -> tuple[User | None, int]:
+    """Вернуть (user, 0) или (None, close_code) — сокет закрывает вызывающий."""
+    # Defense-in-depth против CSWSH: чужой Origin не пускаем (L8).
+    if not is_allowed_ws_origin(websocket):
+        return None, 4403
+
+    token = websocket.cookies.get(COOKIE_NAME)
+    decoded = decode_access_token(token) if token else None
+    user_id = decoded[0] if decoded else None
+    token_iat = decoded[1] if decoded else None
+    if not user_id:
+        ticket = websocket.query_params.get("ticket")
+        if ticket:
+            user_id = await ws_ticket_store.consume(ticket)
+    if not user_id:
+        return None, 4001
+
+    user = await db.scalar(select(User).where(User.id == user_id))
+    if not user:
+        return None, 4001
+    if token_iat is not None and token_iat + timedelta(seconds=1) < user.password_changed_at:
+        return None, 4001
+    # Глобальный бан: закрываем и ticket-путь (revocation по password_changed_at
+    # не срабатывает при token_iat is None).
+    if is_banned_now(user):
+        return None, 4003
+    return user, 0
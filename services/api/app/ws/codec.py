@@ -0,0 +1,105 @@
+"""Формат WS-кадров сервер → клиент: JSON (текст) или MessagePack (бинарные).
+
+Формат выбирается один раз, при accept: клиент предлагает подпротокол
+`lentik.msgpack` (или передаёт `?format=msgpack`, если его WS-клиент не
+умеет подпротоколы). Без пакета `msgpack` или при WS_MSGPACK_ENABLED=false
+сокет молча остаётся на JSON — подпротокол тогда не подтверждается, и клиент
+видит это по ответу рукопожатия. Клиент → сервер всегда текст (ping, op).
+
+Рассылка кодирует событие не больше одного раза на формат (`Frames`), а не
+на каждый сокет. Сжатие (permessage-deflate) — ниже, в протоколе uvicorn,
+см. app.ws.deflate.
+"""
+
+from __future__ import annotations
+
+import json
+import logging
+from collections.abc import Callable
+from functools import cache
+from weakref import WeakKeyDictionary
+
+from fastapi import WebSocket
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+JSON = "json"
+MSGPACK = "msgpack"
+MSGPACK_SUBPROTOCOL = "lentik.msgpack"
+
+# Сокет → формат; JSON не записывается. Слабые ссылки: запись уходит вместе
+# с сокетом, отдельная очистка при disconnect не нужна.
+_formats: WeakKeyDictionary[WebSocket, str] = WeakKeyDictionary()
+
+
+@cache
+def _msgpack_packb() -> Callable[[object], bytes] | None:
+    try:
+        import msgpack
+    except ImportError:
+        logger.warning(
+            "Клиент запросил MessagePack, но пакет msgpack не установлен — "
+            "отдаём JSON. Установите: pip install msgpack"
+        )
+        return None
+    return msgpack.Packer(use_bin_type=True).pack
+
+
+def negotiate(websocket: WebSocket) -> tuple[str, str | None]:
+    """Формат сокета и подпротокол, который нужно подтвердить в accept."""
+    offered = websocket.scope.get("subprotocols") or []
+    wants = (
+        MSGPACK_SUBPROTOCOL in offered or websocket.query_params.get("format") == MSGPACK
+    )
+    if wants and settings.ws_msgpack_enabled and _msgpack_packb() is not None:
+        return MSGPACK, MSGPACK_SUBPROTOCOL if MSGPACK_SUBPROTOCOL in offered else None
+    return JSON, None
+
+
+async def accept_ws(websocket: WebSocket) -> str:
+    """`websocket.accept()` с выбором формата кадров; возвращает формат."""
+    fmt, subprotocol = negotiate(websocket)
+    await websocket.accept(subprotocol=subprotocol)
+    if fmt != JSON:
+        _formats[websocket] = fmt
+    return fmt
+
+
+def wire_format(ws: WebSocket) -> str:
+    return _formats.get(ws, JSON)
+
+
+def encode(payload: dict, fmt: str) -> str | bytes:
+    if fmt == MSGPACK:
+        return _msgpack_packb()(payload)
+    return json.dumps(payload, ensure_ascii=False)
+
+
+class Frames:
+    """Событие рассылки, закодированное лениво и не больше раза на формат."""
+
+    __slots__ = ("payload", "_encoded")
+
+    def __init__(self, payload: dict) -> None:
+        self.payload = payload
+        self._encoded: dict[str, str | bytes] = {}
+
+    def get(self, fmt: str) -> str | bytes:
+        data = self._encoded.get(fmt)
+        if data is None:
+            data = self._encoded[fmt] = encode(self.payload, fmt)
+        return data
+
+
+async def send_frame(ws: WebSocket, data: str | bytes) -> None:
+    if isinstance(data, bytes):
+        await ws.send_bytes(data)
+    else:
+        await ws.send_text(data)
+
+
+async def send_payload(ws: WebSocket, payload: dict) -> None:
+    """Разовое событие одному сокету (ready, снапшоты, ответы на op)."""
+    await send_frame(ws, encode(payload, wire_format(ws)))
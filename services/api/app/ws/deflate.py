@@ -0,0 +1,41 @@
+"""uvicorn-протокол WebSocket с настроенным permessage-deflate.
+
+Штатный `websockets`-протокол uvicorn согласует сжатие с параметрами zlib по
+умолчанию: окно 2^15 и memLevel 8 — около 256 КБ на КАЖДОЕ соединение только
+под компрессор. События чата — сотни байт с повторяющимися ключами, им
+хватает окна 2^12 (ws_deflate_window_bits) и memLevel 5: ~32 КБ на сокет и
+вдвое-втрое меньше CPU на кадр ценой чуть худшего сжатия — всё равно в 5+ раз
+меньше несжатого JSON (см. benchmarks/bench_ws_wire.py).
+
+Подключается при запуске сервера:
+
+    uvicorn app.main:app --ws app.ws.deflate:DeflateWebSocketProtocol
+
+`--ws-per-message-deflate false` по-прежнему выключает сжатие целиком.
+Клиенты без permessage-deflate работают как раньше — расширение согласуется
+в рукопожатии.
+"""
+
+from __future__ import annotations
+
+from typing import Any
+
+from uvicorn.protocols.websockets.websockets_impl import WebSocketProtocol
+from websockets.extensions.permessage_deflate import ServerPerMessageDeflateFactory
+
+from app.core.config import settings
+
+
+def deflate_factory() -> ServerPerMessageDeflateFactory:
+    return ServerPerMessageDeflateFactory(
+        server_max_window_bits=settings.ws_deflate_window_bits,
+        client_max_window_bits=settings.ws_deflate_window_bits,
+        compress_settings={"memLevel": settings.ws_deflate_mem_level},
+    )
+
+
+class DeflateWebSocketProtocol(WebSocketProtocol):
+    def __init__(self, *args: Any, **kwargs: Any) -> None:
+        super().__init__(*args, **kwargs)
+        if self.config.ws_per_message_deflate:
+            self.available_extensions = [deflate_factory()]
@@ -6,7 +6,10 @@
 пользователей, подключённых к другим инстансам/воркерам.
 
 Контроль присутствия (online/offline) при нескольких инстансах ведётся счётчиком
-в Redis (`ws:presence:{user_id}`).
+в Redis (`ws:presence:{user_id}`). Каждый инстанс дополнительно хранит свою долю
+счётчиков (`ws:presence:inst:{instance_id}`: user_id → число сокетов) и пишет
+heartbeat в `ws:instances`. Инстанс, переставший слать heartbeat, «подметается»
+живыми: его доля вычитается из общих счётчиков за секунды, а не за сутки TTL.
 """
 
 from __future__ import annotations
@@ -14,12 +17,16 @@ from __future__ import annotations
 import asyncio
 import json
 import logging
+import time
 from collections import defaultdict
-from uuid import UUID
+from typing import Protocol
+from uuid import UUID, uuid4
 
 from fastapi import WebSocket
 
+from app.auth.bot_cache import bot_auth_cache
 from app.core import redis_client
+from app.ws.codec import Frames, encode, send_frame, send_payload, wire_format
 
 logger = logging.getLogger(__name__)
 
@@ -28,6 +35,38 @@ _CHANNEL = "lentik:ws"
 # Защитный TTL на счётчик присутствия, чтобы аварийно «утёкший» инкремент
 # (процесс умер без decr) сам истёк, а не держал пользователя online вечно.
 _PRESENCE_TTL = 60 * 60 * 24
+_PRESENCE_PREFIX = "ws:presence:"
+_INSTANCE_PREFIX = "ws:presence:inst:"
+# ZSET instance_id → время последнего heartbeat (unix).
+_INSTANCES_KEY = "ws:instances"
+
+
+def presence_key(user_id: UUID) -> str:
+    return f"{_PRESENCE_PREFIX}{user_id}"
+
+
+# Событие журнала ботов: (scope, id, payload).
+LoggedEvent = tuple[str, UUID, dict]
+# Кому доставлять копию рассылки, если журнал ботов пишется в фоне.
+_AUDIENCE_PEOPLE = "people"
+_AUDIENCE_BOTS = "bots"
+# Очередь записи в журнал: предел и размер пачки на одну транзакцию.
+_EVENT_QUEUE_SIZE = 10_000
+_EVENT_BATCH = 100
+_EVENT_DRAIN_TIMEOUT_SECONDS = 5.0
+
+
+class EventRecorder(Protocol):
+    """Журнал событий ботов; реализация — app.services.bot_events."""
+
+    async def wants(self, scope: str, target_id: UUID, payload: dict) -> bool:
+        """Есть ли у адресата рассылки боты (дёшево, из кэша)."""
+
+    async def record(self, events: list[LoggedEvent]) -> list[dict[str, int]]:
+        """Записать пачку; на каждое событие {str(bot user_id): seq}."""
+
+    def invalidate(self) -> None:
+        """Состав ботов изменился — перечитать кэш."""
 
 
 class ConnectionManager:
@@ -41,8 +80,26 @@ class ConnectionManager:
         self._family_user_sockets: dict[UUID, dict[UUID, set[WebSocket]]] = defaultdict(
             lambda: defaultdict(set)
         )
+        # Мультиплекс-сокеты (/gateway): одна семья/чат подписывается и
+        # отписывается in-band, а kick из одной семьи не должен рвать сокет,
+        # обслуживающий остальные. socket → family_id → подписанные chat_id.
+        self._mux: dict[WebSocket, dict[UUID, set[UUID]]] = {}
+        # Подписчики на изменения доступа к чатам семьи (bot gateway):
+        # family_id → очереди, куда кладётся (family_id, chat_id | None).
+        self._chat_access_watchers: dict[UUID, set[asyncio.Queue]] = defaultdict(set)
+        # Журнал событий ботов: рассылка в семью с ботами ставится в очередь
+        # записи (на инстансе-источнике). Люди получают событие сразу, а
+        # gateway-сокеты ботов — после записи, с его seq; тогда же будятся
+        # long-poll'ы бота.
+        self._event_recorder: EventRecorder | None = None
+        self._event_queue: asyncio.Queue[LoggedEvent] | None = None
+        self._event_writer: asyncio.Task | None = None
+        self._bot_sockets: dict[WebSocket, UUID] = {}
+        self._bot_event_waiters: dict[UUID, set[asyncio.Event]] = defaultdict(set)
         self._sub_task: asyncio.Task | None = None
         self._pubsub = None
+        self.instance_id = uuid4().hex
+        self._heartbeat_sent = False
 
     # ── Жизненный цикл Redis-подписчика ─────────────────────────────────────
 
@@ -61,6 +118,7 @@ class ConnectionManager:
             self._sub_task = None
 
     async def stop(self) -> None:
+        await self._stop_event_writer()
         if self._sub_task is not None:
             self._sub_task.cancel()
             try:
@@ -98,9 +156,13 @@ class ConnectionManager:
     async def _handle_envelope(self, env: dict) -> None:
         kind = env.get("kind")
         if kind == "chat":
-            await self._deliver_to_chat(UUID(env["id"]), env["payload"])
+            await self._deliver_to_chat(
+                UUID(env["id"]), env["payload"], env.get("seqs"), env.get("audience")
+            )
         elif kind == "family":
-            await self._deliver_to_family(UUID(env["id"]), env["payload"])
+            await self._deliver_to_family(
+                UUID(env["id"]), env["payload"], env.get("seqs"), env.get("audience")
+            )
         elif kind == "kick":
             await self._close_family_user(UUID(env["family_id"]), UUID(env["user_id"]))
         elif kind == "family_close":
@@ -108,7 +170,16 @@ class ConnectionManager:
         elif kind == "force_logout":
             await self._force_logout_user(UUID(env["user_id"]))
         elif kind == "user":
-            await self._deliver_to_user(UUID(env["user_id"]), env["payload"])
+            await self._deliver_to_user(
+                UUID(env["user_id"]), env["payload"], env.get("seqs"), env.get("audience")
+            )
+        elif kind == "chat_access":
+            chat_id = env.get("chat_id")
+            self._notify_chat_access(UUID(env["id"]), UUID(chat_id) if chat_id else None)
+        elif kind == "bot_auth":
+            bot_auth_cache.invalidate_user(UUID(env["user_id"]))
+            if self._event_recorder is not None:
+                self._event_recorder.invalidate()
 
     async def _publish(self, env: dict) -> bool:
         """Опубликовать событие в Redis. True — опубликовано (доставку сделает
@@ -170,18 +241,85 @@ class ConnectionManager:
             if not by_user:
                 del self._family_user_sockets[family_id]
 
+    # ── Мультиплекс-сокеты (один сокет — много семей и чатов) ───────────────
+
+    def register_mux(self, ws: WebSocket) -> None:
+        self._mux.setdefault(ws, {})
+
+    def mux_subscriptions(self, ws: WebSocket) -> dict[UUID, set[UUID]]:
+        return self._mux.get(ws, {})
+
+    def mux_subscribe_family(self, ws: WebSocket, family_id: UUID, user_id: UUID) -> None:
+        self._mux[ws].setdefault(family_id, set())
+        self._family_connections[family_id].add(ws)
+        self._family_user_sockets[family_id][user_id].add(ws)
+
+    def mux_subscribe_chat(
+        self, ws: WebSocket, family_id: UUID, chat_id: UUID, user_id: UUID
+    ) -> None:
+        self._mux[ws].setdefault(family_id, set()).add(chat_id)
+        self._chat_connections[chat_id].add(ws)
+        self._family_user_sockets[family_id][user_id].add(ws)
+
+    def mux_unsubscribe_chat(self, ws: WebSocket, chat_id: UUID) -> None:
+        for chats in self._mux.get(ws, {}).values():
+            chats.discard(chat_id)
+        self._discard(self._chat_connections, chat_id, ws)
+
+    def mux_unsubscribe_family(self, ws: WebSocket, family_id: UUID) -> None:
+        """Снять подписку на семью вместе со всеми её чатами."""
+        chats = self._mux.get(ws, {}).pop(family_id, set())
+        for chat_id in chats:
+            self._discard(self._chat_connections, chat_id, ws)
+        self._discard(self._family_connections, family_id, ws)
+        by_user = self._family_user_sockets.get(family_id)
+        if by_user:
+            for user_id, sockets in list(by_user.items()):
+                sockets.discard(ws)
+                if not sockets:
+                    del by_user[user_id]
+            if not by_user:
+                del self._family_user_sockets[family_id]
+
+    def unregister_mux(self, ws: WebSocket) -> None:
+        for family_id in list(self._mux.get(ws, {})):
+            self.mux_unsubscribe_family(ws, family_id)
+        self._mux.pop(ws, None)
+
+    async def _mux_revoke_family(self, ws: WebSocket, family_id: UUID) -> None:
+        """Kick/удаление семьи для мультиплекс-сокета: отписать только эту
+        семью и сообщить клиенту — остальные подписки сокета живут дальше."""
+        self.mux_unsubscribe_family(ws, family_id)
+        try:
+            await send_payload(ws, {"type": "family_removed", "family_id": str(family_id)})
+        except Exception:  # noqa: BLE001
+            pass
+
+    @staticmethod
+    def _discard(index: dict[UUID, set[WebSocket]], key: UUID, ws: WebSocket) -> None:
+        conns = index.get(key)
+        if conns is None:
+            return
+        conns.discard(ws)
+        if not conns:
+            del index[key]
+
     # ── Присутствие (online/offline) ────────────────────────────────────────
 
     async def register_presence_connection(
         self,
-        family_id: UUID,
+        family_id: UUID | None,
         user_id: UUID,
         ws: WebSocket,
     ) -> bool:
         """Регистрирует соединение. Возвращает True, если это ПЕРВОЕ активное
         соединение пользователя (во всём кластере при Redis, иначе локально) —
-        т.е. пользователь только что стал online."""
-        self._presence_connections[family_id][user_id].add(ws)
+        т.е. пользователь только что стал online.
+
+        ``family_id=None`` — соединение не привязано к одной семье (/gateway):
+        учитывается только в глобальном счётчике пользователя."""
+        if family_id is not None:
+            self._presence_connections[family_id][user_id].add(ws)
         local = self._user_connections[user_id]
         was_locally_offline = len(local) == 0
         local.add(ws)
@@ -189,8 +327,11 @@ class ConnectionManager:
         r = await redis_client.get_redis()
         if r is not None:
             try:
-                count = await r.incr(f"ws:presence:{user_id}")
-                await r.expire(f"ws:presence:{user_id}", _PRESENCE_TTL)
+                pipe = r.pipeline(transaction=True)
+                pipe.incr(presence_key(user_id))
+                pipe.expire(presence_key(user_id), _PRESENCE_TTL)
+                pipe.hincrby(self._instance_key, str(user_id), 1)
+                count, *_ = await pipe.execute()
                 return count == 1
             except Exception:  # noqa: BLE001
                 logger.exception("presence incr failed; using local state")
@@ -198,13 +339,15 @@ class ConnectionManager:
 
     async def unregister_presence_connection(
         self,
-        family_id: UUID,
+        family_id: UUID | None,
         user_id: UUID,
         ws: WebSocket,
     ) -> bool:
         """Снимает соединение. Возвращает True, если это было ПОСЛЕДНЕЕ активное
         соединение пользователя — т.е. пользователь стал offline."""
-        family_connections = self._presence_connections.get(family_id)
+        family_connections = (
+            self._presence_connections.get(family_id) if family_id is not None else None
+        )
         if family_connections:
             user_connections = family_connections.get(user_id)
             if user_connections:
@@ -225,43 +368,177 @@ class ConnectionManager:
         r = await redis_client.get_redis()
         if r is not None:
             try:
-                count = await r.decr(f"ws:presence:{user_id}")
+                pipe = r.pipeline(transaction=True)
+                pipe.decr(presence_key(user_id))
+                pipe.hincrby(self._instance_key, str(user_id), -1)
+                count, mine = await pipe.execute()
+                if mine <= 0:
+                    await r.hdel(self._instance_key, str(user_id))
                 if count <= 0:
                     # Не даём счётчику уйти в минус из-за дрейфа.
-                    await r.delete(f"ws:presence:{user_id}")
+                    await r.delete(presence_key(user_id))
                     return True
                 return False
             except Exception:  # noqa: BLE001
                 logger.exception("presence decr failed; using local state")
         return local_became_empty
 
+    async def online_users(self, user_ids: list[UUID]) -> set[UUID]:
+        """Кто из ``user_ids`` сейчас онлайн: с Redis — по счётчикам всего
+        кластера (один MGET), иначе — по локальным соединениям."""
+        if not user_ids:
+            return set()
+        r = await redis_client.get_redis()
+        if r is not None:
+            try:
+                counts = await r.mget([presence_key(u) for u in user_ids])
+                return {u for u, c in zip(user_ids, counts) if c and int(c) > 0}
+            except Exception:  # noqa: BLE001
+                logger.exception("presence mget failed; using local state")
+        return {u for u in user_ids if self._user_connections.get(u)}
+
+    # ── Heartbeat инстанса и подметание мёртвых ────────────────────────────
+
+    @property
+    def _instance_key(self) -> str:
+        return f"{_INSTANCE_PREFIX}{self.instance_id}"
+
+    async def heartbeat(self) -> None:
+        """Отметить инстанс живым. Если его успели подмести (долгий stall event
+        loop, сетевой раздел), вернуть свою долю счётчиков обратно."""
+        r = await redis_client.get_redis()
+        if r is None:
+            return
+        try:
+            added = await r.zadd(_INSTANCES_KEY, {self.instance_id: time.time()})
+            if added and self._heartbeat_sent:
+                logger.warning("ws instance %s was reaped while alive; resyncing", self.instance_id)
+                await self._resync_presence(r)
+            self._heartbeat_sent = True
+        except Exception:  # noqa: BLE001
+            logger.exception("ws heartbeat failed")
+
+    async def _resync_presence(self, r) -> None:
+        pipe = r.pipeline(transaction=True)
+        pipe.delete(self._instance_key)
+        for user_id, sockets in self._user_connections.items():
+            if not sockets:
+                continue
+            pipe.hincrby(self._instance_key, str(user_id), len(sockets))
+            pipe.incrby(presence_key(user_id), len(sockets))
+            pipe.expire(presence_key(user_id), _PRESENCE_TTL)
+        await pipe.execute()
+
+    async def reap_dead_instances(self, timeout_seconds: float) -> list[UUID]:
+        """Вычесть из общих счётчиков долю инстансов без heartbeat дольше
+        ``timeout_seconds``. → пользователи, у которых счётчик дошёл до нуля
+        (им нужно объявить offline). Каждый мёртвый инстанс подметает ровно один
+        живой — тот, чей ZREM вернул 1."""
+        r = await redis_client.get_redis()
+        if r is None:
+            return []
+        went_offline: list[UUID] = []
+        try:
+            dead = await r.zrangebyscore(_INSTANCES_KEY, "-inf", time.time() - timeout_seconds)
+            for instance_id in dead:
+                if instance_id == self.instance_id or not await r.zrem(_INSTANCES_KEY, instance_id):
+                    continue
+                key = f"{_INSTANCE_PREFIX}{instance_id}"
+                share = {
+                    UUID(u): int(n) for u, n in (await r.hgetall(key)).items() if int(n) > 0
+                }
+                gone: list[UUID] = []
+                if share:
+                    pipe = r.pipeline(transaction=True)
+                    for user_id, n in share.items():
+                        pipe.decrby(presence_key(user_id), n)
+                    counts = await pipe.execute()
+                    gone = [u for u, c in zip(share, counts) if c <= 0]
+                    if gone:
+                        await r.delete(*(presence_key(u) for u in gone))
+                    went_offline.extend(gone)
+                await r.delete(key)
+                logger.warning(
+                    "reaped dead ws instance %s: %d user(s), %d offline",
+                    instance_id,
+                    len(share),
+                    len(gone),
+                )
+        except Exception:  # noqa: BLE001
+            logger.exception("ws instance sweep failed")
+        return went_offline
+
     # ── Рассылка ────────────────────────────────────────────────────────────
 
     async def broadcast_to_chat(self, chat_id: UUID, payload: dict) -> None:
-        if await self._publish({"kind": "chat", "id": str(chat_id), "payload": payload}):
-            return
-        await self._deliver_to_chat(chat_id, payload)
+        audience = await self._defer("chat", chat_id, payload)
+        await self._send("chat", chat_id, payload, None, audience)
 
     async def broadcast_to_family(self, family_id: UUID, payload: dict) -> None:
-        if await self._publish({"kind": "family", "id": str(family_id), "payload": payload}):
+        audience = await self._defer("family", family_id, payload)
+        await self._send("family", family_id, payload, None, audience)
+
+    async def _send(
+        self,
+        scope: str,
+        target_id: UUID,
+        payload: dict,
+        seqs: dict[str, int] | None,
+        audience: str | None,
+    ) -> None:
+        """Разослать событие (через Redis или локально) части адресатов:
+        None — всем, _AUDIENCE_PEOPLE / _AUDIENCE_BOTS — без сокетов ботов / только им."""
+        env = {"kind": scope, "payload": payload, "seqs": seqs, "audience": audience}
+        env["user_id" if scope == "user" else "id"] = str(target_id)
+        if await self._publish(env):
             return
-        await self._deliver_to_family(family_id, payload)
+        deliver = {
+            "chat": self._deliver_to_chat,
+            "family": self._deliver_to_family,
+            "user": self._deliver_to_user,
+        }[scope]
+        await deliver(target_id, payload, seqs, audience)
+
+    def _in_audience(self, ws: WebSocket, audience: str | None) -> bool:
+        if audience is None:
+            return True
+        return (ws in self._bot_sockets) == (audience == _AUDIENCE_BOTS)
 
-    async def _deliver_to_chat(self, chat_id: UUID, payload: dict) -> None:
+    async def _deliver_to_chat(
+        self,
+        chat_id: UUID,
+        payload: dict,
+        seqs: dict[str, int] | None = None,
+        audience: str | None = None,
+    ) -> None:
+        self._wake_bot_events(seqs)
+        frames = Frames(payload)
         dead: list[WebSocket] = []
         for ws in list(self._chat_connections.get(chat_id, [])):
+            if not self._in_audience(ws, audience):
+                continue
             try:
-                await ws.send_text(json.dumps(payload, ensure_ascii=False))
+                await send_frame(ws, self._frame(ws, frames, seqs))
             except Exception:  # noqa: BLE001
                 dead.append(ws)
         for ws in dead:
             self.disconnect(chat_id, ws)
 
-    async def _deliver_to_family(self, family_id: UUID, payload: dict) -> None:
+    async def _deliver_to_family(
+        self,
+        family_id: UUID,
+        payload: dict,
+        seqs: dict[str, int] | None = None,
+        audience: str | None = None,
+    ) -> None:
+        self._wake_bot_events(seqs)
+        frames = Frames(payload)
         dead: list[WebSocket] = []
         for ws in list(self._family_connections.get(family_id, [])):
+            if not self._in_audience(ws, audience):
+                continue
             try:
-                await ws.send_text(json.dumps(payload, ensure_ascii=False))
+                await send_frame(ws, self._frame(ws, frames, seqs))
             except Exception:  # noqa: BLE001
                 dead.append(ws)
         for ws in dead:
@@ -270,17 +547,24 @@ class ConnectionManager:
     async def broadcast_to_user(self, user_id: UUID, payload: dict) -> None:
         """Доставить событие всем активным сокетам одного пользователя на всех
         инстансах (например, личное напоминание без семьи)."""
-        if await self._publish(
-            {"kind": "user", "user_id": str(user_id), "payload": payload}
-        ):
-            return
-        await self._deliver_to_user(user_id, payload)
+        audience = await self._defer("user", user_id, payload)
+        await self._send("user", user_id, payload, None, audience)
 
-    async def _deliver_to_user(self, user_id: UUID, payload: dict) -> None:
+    async def _deliver_to_user(
+        self,
+        user_id: UUID,
+        payload: dict,
+        seqs: dict[str, int] | None = None,
+        audience: str | None = None,
+    ) -> None:
+        self._wake_bot_events(seqs)
+        frames = Frames(payload)
         dead: list[WebSocket] = []
         for ws in list(self._user_connections.get(user_id, set())):
+            if not self._in_audience(ws, audience):
+                continue
             try:
-                await ws.send_text(json.dumps(payload, ensure_ascii=False))
+                await send_frame(ws, self._frame(ws, frames, seqs))
             except Exception:  # noqa: BLE001
                 dead.append(ws)
         for ws in dead:
@@ -288,6 +572,143 @@ class ConnectionManager:
             if conns is not None:
                 conns.discard(ws)
 
+    # ── Журнал событий ботов ────────────────────────────────────────────────
+
+    def set_event_recorder(self, recorder: EventRecorder | None) -> None:
+        self._event_recorder = recorder
+
+    async def _defer(self, scope: str, target_id: UUID, payload: dict) -> str | None:
+        """Поставить рассылку в очередь журнала ботов. → _AUDIENCE_PEOPLE,
+        если поставлена (ботам её доставит писатель, с seq), иначе None —
+        ботов у адресата нет, и событие сразу уходит всем."""
+        if self._event_recorder is None:
+            return None
+        try:
+            if not await self._event_recorder.wants(scope, target_id, payload):
+                return None
+        except Exception:  # noqa: BLE001
+            logger.exception("bot event log lookup failed")
+            return None
+        if self._event_queue is None:
+            self._event_queue = asyncio.Queue(_EVENT_QUEUE_SIZE)
+        if self._event_writer is None or self._event_writer.done():
+            self._event_writer = asyncio.create_task(
+                self._event_writer_loop(self._event_queue), name="bot-event-writer"
+            )
+        try:
+            self._event_queue.put_nowait((scope, target_id, payload))
+        except asyncio.QueueFull:
+            # Журнал — best-effort: живая доставка важнее.
+            logger.warning("bot event log queue full, event not logged")
+            return None
+        return _AUDIENCE_PEOPLE
+
+    async def _event_writer_loop(self, queue: asyncio.Queue[LoggedEvent]) -> None:
+        """Писать очередь в журнал пачками (одна транзакция на пачку) и
+        досылать каждое событие ботам с его seq — в порядке рассылки."""
+        assert self._event_recorder is not None
+        while True:
+            batch = [await queue.get()]
+            while len(batch) < _EVENT_BATCH and not queue.empty():
+                batch.append(queue.get_nowait())
+            try:
+                results = await self._event_recorder.record(batch)
+            except Exception:  # noqa: BLE001
+                # Живая доставка ботам — и без seq.
+                logger.exception("bot event log write failed")
+                results = [{} for _ in batch]
+            for (scope, target_id, payload), seqs in zip(batch, results):
+                try:
+                    await self._send(scope, target_id, payload, seqs, _AUDIENCE_BOTS)
+                except Exception:  # noqa: BLE001
+                    logger.exception("bot event delivery failed")
+            for _ in batch:
+                queue.task_done()
+
+    async def flush_bot_events(self, timeout: float = _EVENT_DRAIN_TIMEOUT_SECONDS) -> None:
+        """Дождаться записи и доставки всего, что стоит в очереди журнала."""
+        if self._event_queue is None or self._event_writer is None:
+            return
+        try:
+            await asyncio.wait_for(self._event_queue.join(), timeout)
+        except asyncio.TimeoutError:
+            logger.warning("bot event log: %d event(s) left unwritten", self._event_queue.qsize())
+
+    async def _stop_event_writer(self) -> None:
+        await self.flush_bot_events()
+        if self._event_writer is not None:
+            self._event_writer.cancel()
+            try:
+                await self._event_writer
+            except (asyncio.CancelledError, Exception):  # noqa: BLE001
+                pass
+            self._event_writer = None
+        self._event_queue = None
+
+    def register_bot_socket(self, ws: WebSocket, bot_id: UUID) -> None:
+        self._bot_sockets[ws] = bot_id
+
+    def unregister_bot_socket(self, ws: WebSocket) -> None:
+        self._bot_sockets.pop(ws, None)
+
+    def _frame(
+        self, ws: WebSocket, frames: Frames, seqs: dict[str, int] | None
+    ) -> str | bytes:
+        """Кадр события в формате сокета: gateway-сокету бота — с его seq."""
+        fmt = wire_format(ws)
+        if seqs:
+            bot_id = self._bot_sockets.get(ws)
+            seq = seqs.get(str(bot_id)) if bot_id is not None else None
+            if seq is not None:
+                return encode({**frames.payload, "seq": seq}, fmt)
+        return frames.get(fmt)
+
+    def watch_bot_events(self, bot_id: UUID, event: asyncio.Event) -> None:
+        self._bot_event_waiters[bot_id].add(event)
+
+    def unwatch_bot_events(self, bot_id: UUID, event: asyncio.Event) -> None:
+        waiters = self._bot_event_waiters.get(bot_id)
+        if waiters is None:
+            return
+        waiters.discard(event)
+        if not waiters:
+            del self._bot_event_waiters[bot_id]
+
+    def _wake_bot_events(self, seqs: dict[str, int] | None) -> None:
+        for bot_id in seqs or ():
+            for event in self._bot_event_waiters.get(UUID(bot_id), ()):
+                event.set()
+
+    # ── Изменения доступа к чатам ───────────────────────────────────────────
+
+    def watch_chat_access(self, family_id: UUID, queue: asyncio.Queue) -> None:
+        self._chat_access_watchers[family_id].add(queue)
+
+    def unwatch_chat_access(self, family_id: UUID, queue: asyncio.Queue) -> None:
+        watchers = self._chat_access_watchers.get(family_id)
+        if watchers is None:
+            return
+        watchers.discard(queue)
+        if not watchers:
+            del self._chat_access_watchers[family_id]
+
+    async def chat_access_changed(self, family_id: UUID, chat_id: UUID | None = None) -> None:
+        """Сообщить подписчикам на ВСЕХ инстансах, что видимость чатов семьи
+        могла измениться: чат создан/удалён или поменялись его overrides
+        (`chat_id`), либо роли — тогда пересчитывается вся семья (None)."""
+        env = {
+            "kind": "chat_access",
+            "id": str(family_id),
+            "chat_id": str(chat_id) if chat_id else None,
+        }
+        if await self._publish(env):
+            return
+        self._notify_chat_access(family_id, chat_id)
+
+    def _notify_chat_access(self, family_id: UUID, chat_id: UUID | None) -> None:
+        for queue in self._chat_access_watchers.get(family_id, ()):
+            queue.put_nowait((family_id, chat_id))
+
     # ── Принудительное закрытие соединений ──────────────────────────────────
 
     async def kick_user_from_family(self, family_id: UUID, user_id: UUID) -> None:
@@ -301,6 +722,8 @@ class ConnectionManager:
         await self._close_family_user(family_id, user_id)
 
     async def _close_family_user(self, family_id: UUID, user_id: UUID) -> None:
+        # Вместе с сокетами — закэшированное членство, если это бот.
+        bot_auth_cache.invalidate_user(user_id)
         by_user = self._family_user_sockets.get(family_id)
         if not by_user:
             return
@@ -308,6 +731,9 @@ class ConnectionManager:
         if not sockets:
             return
         for ws in list(sockets):
+            if ws in self._mux:
+                await self._mux_revoke_family(ws, family_id)
+                continue
             try:
                 await ws.close(code=4003)
             except Exception:  # noqa: BLE001
@@ -330,6 +756,7 @@ class ConnectionManager:
         await self._force_logout_user(user_id)
 
     async def _force_logout_user(self, user_id: UUID) -> None:
+        bot_auth_cache.invalidate_user(user_id)
         # Собираем все известные сокеты пользователя из всех локальных реестров.
         sockets: set[WebSocket] = set()
         for by_user in self._family_user_sockets.values():
@@ -338,10 +765,10 @@ class ConnectionManager:
             sockets.update(by_user.get(user_id, set()))
         sockets.update(self._user_connections.get(user_id, set()))
 
-        payload = json.dumps({"type": "force_logout"}, ensure_ascii=False)
+        frames = Frames({"type": "force_logout"})
         for ws in sockets:
             try:
-                await ws.send_text(payload)
+                await send_frame(ws, frames.get(wire_format(ws)))
             except Exception:  # noqa: BLE001
                 pass
             try:
@@ -355,6 +782,16 @@ class ConnectionManager:
                 conns.discard(ws)
             self._remove_from_family_user_index(ws)
 
+    async def invalidate_bot_auth(self, user_id: UUID) -> None:
+        """Сбросить кэш аутентификации бота на ВСЕХ инстансах (смена токена,
+        удаление) — иначе старый токен жил бы до истечения TTL. Заодно
+        перечитывается кэш семей с ботами у журнала событий (новый бот)."""
+        if await self._publish({"kind": "bot_auth", "user_id": str(user_id)}):
+            return
+        bot_auth_cache.invalidate_user(user_id)
+        if self._event_recorder is not None:
+            self._event_recorder.invalidate()
+
     async def disconnect_family_all(self, family_id: UUID) -> None:
         """Закрыть ВСЕ соединения семьи на всех инстансах (удаление семьи)."""
         if await self._publish({"kind": "family_close", "id": str(family_id)}):
@@ -362,6 +799,7 @@ class ConnectionManager:
         await self._close_family_all(family_id)
 
     async def _close_family_all(self, family_id: UUID) -> None:
+        bot_auth_cache.invalidate_family(family_id)
         by_user = self._family_user_sockets.get(family_id)
         sockets: list[WebSocket] = []
         if by_user:
@@ -370,6 +808,9 @@ class ConnectionManager:
         sockets.extend(self._family_connections.get(family_id, set()))
 
         for ws in set(sockets):
+            if ws in self._mux:
+                await self._mux_revoke_family(ws, family_id)
+                continue
             try:
                 await ws.close(code=4003)
             except Exception:  # noqa: BLE001
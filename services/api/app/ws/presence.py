@@ -0,0 +1,330 @@
+"""Presence (online/offline) с debounce и отложенной записью в БД.
+
+Раньше каждое первое подключение и каждое последнее отключение сразу писали
+`UPDATE users SET is_online` и рассылали семье `presence_update`. Мобильный
+клиент, который теряет сеть на пару секунд, превращал это в поток записей и
+широковещательных событий.
+
+Теперь:
+  * «в сети» — по-прежнему счётчик соединений ws_manager (Redis/локально);
+  * последнее отключение не объявляет offline сразу, а ставит пользователя в
+    grace-период (`PRESENCE_GRACE_SECONDS`). Переподключился раньше — событий
+    нет вовсе. С Redis grace — общий ZSET `ws:presence:grace` (user → дедлайн):
+    переподключение к другому инстансу тоже гасит пару offline/online, а
+    истёкший grace объявит любой живой инстанс, даже если «свой» упал;
+  * инстансы шлют heartbeat; доля упавшего инстанса вычитается из счётчиков
+    за `PRESENCE_INSTANCE_TIMEOUT_SECONDS` (см. ws_manager.reap_dead_instances);
+  * `is_online`/`last_seen_at` копятся в памяти и пишутся в `users` пачкой раз
+    в `PRESENCE_FLUSH_INTERVAL_SECONDS` (bulk UPDATE по PK);
+  * `snapshot()` отдаёт живое состояние для пачки пользователей одним
+    pipeline — им пользуются `GET /families/{id}/presence` и снапшот семьи,
+    который сокет получает при подписке (`presence_snapshot`).
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from datetime import datetime, timezone
+from uuid import UUID
+
+from sqlalchemy import select, update
+
+from app.core import redis_client
+from app.core.config import settings
+from app.db.session import AsyncSessionLocal
+from app.models.membership import Membership
+from app.models.user import User
+from app.ws.manager import presence_key, ws_manager
+
+logger = logging.getLogger(__name__)
+
+# ZSET user_id → unix-дедлайн объявления offline. Объявляет тот, чей ZREM вернул 1.
+_GRACE_KEY = "ws:presence:grace"
+_TICK_SECONDS = 1.0
+
+
+def presence_payload(
+    family_id: UUID, user_id: UUID, is_online: bool, last_seen_at: datetime | None
+) -> dict:
+    return {
+        "type": "presence_update",
+        "family_id": str(family_id),
+        "user_id": str(user_id),
+        "is_online": is_online,
+        "last_seen_at": last_seen_at.isoformat() if last_seen_at else None,
+    }
+
+
+def presence_snapshot_payload(
+    family_id: UUID, members: dict[UUID, tuple[bool, datetime | None]]
+) -> dict:
+    """Компактный снапшот семьи: список online и last_seen только для offline."""
+    return {
+        "type": "presence_snapshot",
+        "family_id": str(family_id),
+        "online": [str(u) for u, (on, _) in members.items() if on],
+        "last_seen_at": {
+            str(u): seen.isoformat() for u, (on, seen) in members.items() if not on and seen
+        },
+    }
+
+
+class PresenceTracker:
+    def __init__(self) -> None:
+        # user_id → (is_online, last_seen_at | None) — ещё не записано в БД.
+        self._dirty: dict[UUID, tuple[bool, datetime | None]] = {}
+        # user_id → monotonic-дедлайн объявления offline (без Redis).
+        self._pending_offline: dict[UUID, float] = {}
+        self._task: asyncio.Task[None] | None = None
+        self._stop: asyncio.Event | None = None
+        self._last_flush = 0.0
+        self._last_heartbeat = 0.0
+
+    # ── Подключение / отключение ────────────────────────────────────────────
+
+    async def connect(
+        self,
+        user_id: UUID,
+        ws,
+        *,
+        family_id: UUID | None = None,
+        last_seen_at: datetime | None = None,
+        was_online: bool = True,
+    ) -> None:
+        """Зарегистрировать соединение; при переходе в online — объявить семьям.
+
+        ``was_online`` — значение `users.is_online` из БД: если счётчик уже
+        считает пользователя онлайн, а в БД offline (рестарт инстанса сбросил
+        флаг), статус всё равно восстанавливается и объявляется.
+        """
+        became_online = await ws_manager.register_presence_connection(family_id, user_id, ws)
+        if became_online:
+            if await self._cancel_offline(user_id):
+                return  # переподключение в grace-период: offline не объявлялся
+        elif was_online:
+            return
+        self._dirty[user_id] = (True, None)
+        await self._announce(user_id, True, last_seen_at)
+        await self._write_through()
+
+    async def disconnect(self, user_id: UUID, ws, *, family_id: UUID | None = None) -> None:
+        became_offline = await ws_manager.unregister_presence_connection(family_id, user_id, ws)
+        if not became_offline:
+            return
+        grace = settings.presence_grace_seconds
+        self._pending_offline[user_id] = time.monotonic() + grace
+        r = await redis_client.get_redis()
+        if r is not None:
+            try:
+                await r.zadd(_GRACE_KEY, {str(user_id): time.time() + grace})
+            except Exception:  # noqa: BLE001
+                logger.exception("presence grace set failed")
+        if self._task is None:
+            await self.process_due(force=True)
+            await self._write_through()
+
+    async def _write_through(self) -> None:
+        # Фоновый цикл не запущен (тесты, скрипты) — без debounce, пишем сразу.
+        if self._task is None:
+            await self.flush()
+
+    async def _cancel_offline(self, user_id: UUID) -> bool:
+        pending = self._pending_offline.pop(user_id, None) is not None
+        r = await redis_client.get_redis()
+        if r is not None:
+            try:
+                pending = bool(await r.zrem(_GRACE_KEY, str(user_id))) or pending
+            except Exception:  # noqa: BLE001
+                logger.exception("presence grace delete failed")
+        return pending
+
+    async def _announce(self, user_id: UUID, online: bool, last_seen_at: datetime | None) -> None:
+        # Presence глобален по пользователю — объявляем во всех его семьях.
+        async with AsyncSessionLocal() as db:
+            family_ids = (
+                await db.scalars(
+                    select(Membership.family_id).where(Membership.user_id == user_id)
+                )
+            ).all()
+        for fid in family_ids:
+            await ws_manager.broadcast_to_family(
+                fid, presence_payload(fid, user_id, online, last_seen_at)
+            )
+
+    async def process_due(self, *, force: bool = False) -> int:
+        """Объявить offline тем, у кого истёк grace и кто так и не вернулся.
+
+        С Redis берутся и чужие просроченные записи ZSET — если инстанс, который
+        поставил пользователя в grace, упал, offline объявит кто-то другой.
+        """
+        now = time.monotonic()
+        local = [u for u, deadline in self._pending_offline.items() if force or deadline <= now]
+        for user_id in local:
+            self._pending_offline.pop(user_id, None)
+        due = local
+        r = await redis_client.get_redis()
+        if r is not None:
+            due = []
+            try:
+                for user_id in local:
+                    # Объявляет ровно один инстанс — тот, кто забрал запись.
+                    if await r.zrem(_GRACE_KEY, str(user_id)):
+                        due.append(user_id)
+                for raw in await r.zrangebyscore(_GRACE_KEY, "-inf", time.time()):
+                    if await r.zrem(_GRACE_KEY, raw):
+                        due.append(UUID(raw))
+            except Exception:  # noqa: BLE001
+                logger.exception("presence grace scan failed")
+        if not due:
+            return 0
+        online = await ws_manager.online_users(due)
+        for user_id in due:
+            if user_id not in online:
+                await self.mark_offline(user_id)
+        return len(due) - len(online & set(due))
+
+    async def mark_offline(self, user_id: UUID) -> None:
+        seen = datetime.now(timezone.utc)
+        self._dirty[user_id] = (False, seen)
+        try:
+            await self._announce(user_id, False, seen)
+        except Exception:  # noqa: BLE001
+            logger.exception("presence offline announce failed")
+
+    # ── Запись в БД ─────────────────────────────────────────────────────────
+
+    async def flush(self) -> int:
+        if not self._dirty:
+            return 0
+        batch, self._dirty = self._dirty, {}
+        online = [{"id": u, "is_online": True} for u, (on, _) in batch.items() if on]
+        offline = [
+            {"id": u, "is_online": False, "last_seen_at": seen}
+            for u, (on, seen) in batch.items()
+            if not on
+        ]
+        try:
+            async with AsyncSessionLocal() as db:
+                # Bulk UPDATE по первичному ключу — один executemany на группу.
+                if online:
+                    await db.execute(update(User), online)
+                if offline:
+                    await db.execute(update(User), offline)
+                await db.commit()
+        except Exception:
+            # Вернуть несохранённое, не затирая более свежие изменения.
+            for user_id, state in batch.items():
+                self._dirty.setdefault(user_id, state)
+            raise
+        return len(batch)
+
+    # ── Чтение ──────────────────────────────────────────────────────────────
+
+    async def snapshot(
+        self, users: dict[UUID, tuple[bool, datetime | None]]
+    ) -> dict[UUID, tuple[bool, datetime | None]]:
+        """Наложить живое состояние на значения из БД ``{user_id: (is_online, last_seen)}``.
+
+        Пользователь в grace-периоде остаётся online — так же, как его видели
+        семьи (offline им ещё не объявлялся).
+        """
+        ids = list(users)
+        online: set[UUID] = {u for u in ids if u in self._pending_offline}
+        r = await redis_client.get_redis()
+        if r is not None and ids:
+            try:
+                # Один round-trip на всю пачку: счётчики соединений + grace.
+                pipe = r.pipeline(transaction=False)
+                pipe.mget([presence_key(u) for u in ids])
+                pipe.zmscore(_GRACE_KEY, [str(u) for u in ids])
+                counts, graces = await pipe.execute()
+                online |= {
+                    u for u, c, g in zip(ids, counts, graces) if (c and int(c) > 0) or g
+                }
+            except Exception:  # noqa: BLE001
+                logger.exception("presence snapshot pipeline failed")
+                online |= await ws_manager.online_users(ids)
+        else:
+            online |= await ws_manager.online_users(ids)
+        out: dict[UUID, tuple[bool, datetime | None]] = {}
+        for user_id, (_, db_seen) in users.items():
+            dirty = self._dirty.get(user_id)
+            seen = dirty[1] if dirty and dirty[1] is not None else db_seen
+            out[user_id] = (user_id in online, seen)
+        return out
+
+    async def family_snapshots(self, family_ids: list[UUID]) -> list[dict]:
+        """`presence_snapshot` для каждой семьи: один запрос участников всех
+        семей и один pipeline в Redis — вместо запроса на каждого участника."""
+        if not family_ids:
+            return []
+        async with AsyncSessionLocal() as db:
+            rows = (
+                await db.execute(
+                    select(Membership.family_id, User.id, User.is_online, User.last_seen_at)
+                    .join(User, User.id == Membership.user_id)
+                    .where(Membership.family_id.in_(family_ids))
+                )
+            ).all()
+        live = await self.snapshot({uid: (on, seen) for _, uid, on, seen in rows})
+        by_family: dict[UUID, dict[UUID, tuple[bool, datetime | None]]] = {
+            fid: {} for fid in family_ids
+        }
+        for fid, uid, _, _ in rows:
+            by_family[fid][uid] = live[uid]
+        return [presence_snapshot_payload(fid, members) for fid, members in by_family.items()]
+
+    # ── Фоновый цикл ────────────────────────────────────────────────────────
+
+    async def _sweep(self) -> None:
+        """Heartbeat своего инстанса и offline для пользователей упавших."""
+        await ws_manager.heartbeat()
+        reaped = await ws_manager.reap_dead_instances(settings.presence_instance_timeout_seconds)
+        for user_id in reaped:
+            await self.mark_offline(user_id)
+
+    async def _loop(self, stop_event: asyncio.Event) -> None:
+        while not stop_event.is_set():
+            try:
+                if time.monotonic() - self._last_heartbeat >= settings.presence_heartbeat_seconds:
+                    self._last_heartbeat = time.monotonic()
+                    await self._sweep()
+                await self.process_due()
+                if time.monotonic() - self._last_flush >= settings.presence_flush_interval_seconds:
+                    self._last_flush = time.monotonic()
+                    await self.flush()
+            except Exception:
+                logger.exception("presence tick failed")
+            try:
+                await asyncio.wait_for(stop_event.wait(), timeout=_TICK_SECONDS)
+            except asyncio.TimeoutError:
+                continue
+
+    async def start(self) -> None:
+        if self._task and not self._task.done():
+            return
+        self._stop = asyncio.Event()
+        self._task = asyncio.create_task(self._loop(self._stop), name="presence-flusher")
+
+    async def stop(self) -> None:
+        if self._task is None:
+            return
+        if self._stop:
+            self._stop.set()
+        try:
+            await self._task
+        except Exception:  # noqa: BLE001
+            logger.exception("presence flusher stopped with error")
+        self._task = None
+        self._stop = None
+        # Остаток — на диск перед выходом; grace-пользователей считаем ушедшими.
+        try:
+            await self.process_due(force=True)
+            await self.flush()
+        except Exception:  # noqa: BLE001
+            logger.exception("final presence flush failed")
+
+
+presence_tracker = PresenceTracker()
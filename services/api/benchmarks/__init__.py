@@ -0,0 +1,4 @@
+"""Ручные бенчмарки backend'а (не входят в pytest-набор).
+
+Запуск из services/api: ``python -m benchmarks.<module> --help``.
+"""
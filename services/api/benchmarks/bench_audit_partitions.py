@@ -0,0 +1,216 @@
+"""Журнал аудита: одна heap-таблица vs помесячные секции (миграция 051).
+
+Создаёт две копии ``audit_log`` в служебных схемах ``bench_audit_heap`` и
+``bench_audit_part`` (без внешних ключей) и наполняет их одинаковыми
+`--rows` записями `--families` семей за `--months` месяцев. Секции создаются
+тем же кодом, что и у планировщика (app.services.audit_partitions). Меряет:
+
+  * размеры таблицы и индексов (для секций — сумма по всем секциям);
+  * задержку ленты семьи — запрос ``list_audit_log`` первой страницей и
+    страницей по курсору полугодовой давности (медиана `--repeat` прогонов);
+  * очистку по сроку `--retention-days`: DELETE в heap против DROP секций,
+    и размеры после неё (DELETE место не возвращает до VACUUM; секции уходят
+    целыми месяцами, хвост месяца на границе остаётся до следующего прогона).
+
+Нужен живой Postgres (DATABASE_URL). Схемы удаляются в конце.
+
+    python -m benchmarks.bench_audit_partitions --rows 1000000 --families 500
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import statistics
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+
+from benchmarks import _env  # noqa: F401  (до импорта app.*)
+
+from sqlalchemy import select, text, tuple_
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+from app.db.session import engine as app_engine
+from app.models.audit_log import AuditLogEntry
+from app.services.audit_partitions import (
+    AUDIT_LOG,
+    add_months,
+    create_partition,
+    drop_expired_partitions,
+    month_start,
+    retention_cutoff,
+)
+
+HEAP = "bench_audit_heap"
+PART = "bench_audit_part"
+
+_COLUMNS = """
+    id uuid NOT NULL,
+    family_id uuid NOT NULL,
+    actor_id uuid,
+    action varchar(64) NOT NULL,
+    target_type varchar(32),
+    target_id uuid,
+    metadata jsonb,
+    created_at timestamptz NOT NULL DEFAULT now()
+"""
+_INDEXES = (
+    "CREATE INDEX ON audit_log (action)",
+    "CREATE INDEX ON audit_log (created_at)",
+    "CREATE INDEX ON audit_log (family_id, created_at DESC, id DESC)",
+)
+
+
+def _engine(schema: str):
+    # Код сервиса обращается к таблице без схемы — направляем его search_path.
+    return create_async_engine(
+        app_engine.url,
+        connect_args={"server_settings": {"search_path": f"{schema},public"}},
+    )
+
+
+async def _setup(heap, part, rows: int, families: list[uuid.UUID], months: int, now: datetime):
+    async with heap() as db:
+        await db.execute(text(f"CREATE TABLE audit_log ({_COLUMNS}, PRIMARY KEY (id))"))
+        for ddl in _INDEXES:
+            await db.execute(text(ddl))
+        await db.execute(text("SELECT setseed(0.42)"))
+        await db.execute(
+            text(
+                "INSERT INTO audit_log (id, family_id, action, target_type, metadata, created_at) "
+                "SELECT gen_random_uuid(), (CAST(:families AS uuid[]))[1 + g % :n], "
+                "(ARRAY['chat.created','role.updated','member.kicked','moderation.updated'])[1 + g % 4], "
+                "'chat', jsonb_build_object('n', g), "
+                "CAST(:now AS timestamptz) - random() * (CAST(:months AS int) * interval '1 month') "
+                "FROM generate_series(1, CAST(:rows AS int)) g"
+            ),
+            {"families": families, "n": len(families), "now": now, "months": months, "rows": rows},
+        )
+        await db.execute(text("ANALYZE audit_log"))
+        await db.commit()
+
+    async with part() as db:
+        await db.execute(
+            text(
+                f"CREATE TABLE audit_log ({_COLUMNS}, PRIMARY KEY (id, created_at)) "
+                "PARTITION BY RANGE (created_at)"
+            )
+        )
+        await db.execute(text("CREATE TABLE audit_log_default PARTITION OF audit_log DEFAULT"))
+        for ddl in _INDEXES:
+            await db.execute(text(ddl))
+        await db.commit()
+        first = month_start(now - timedelta(days=31 * months))
+        for n in range(months + 2):
+            await create_partition(db, AUDIT_LOG, add_months(first, n))
+        await db.execute(text(f"INSERT INTO audit_log SELECT * FROM {HEAP}.audit_log"))
+        await db.execute(text("ANALYZE audit_log"))
+        await db.commit()
+
+
+async def _sizes(factory, schema: str) -> tuple[float, float]:
+    async with factory() as db:
+        row = (
+            await db.execute(
+                text(
+                    "SELECT sum(pg_table_size(relid)), sum(pg_indexes_size(relid)) "
+                    "FROM pg_partition_tree(CAST(:t AS regclass))"
+                ),
+                {"t": f"{schema}.audit_log"},
+            )
+        ).one()
+    return row[0] / 2**20, row[1] / 2**20
+
+
+async def _latency(factory, families, cutoff, cursor_at, repeat: int) -> tuple[float, float]:
+    """Медиана мс: первая страница ленты и страница по курсору."""
+    head, deep = [], []
+    async with factory() as db:
+        for i in range(repeat):
+            family_id = families[i % len(families)]
+            base = (
+                select(AuditLogEntry)
+                .where(AuditLogEntry.family_id == family_id, AuditLogEntry.created_at >= cutoff)
+                .order_by(AuditLogEntry.created_at.desc(), AuditLogEntry.id.desc())
+                .limit(50)
+            )
+            for samples, q in (
+                (head, base),
+                (
+                    deep,
+                    base.where(
+                        tuple_(AuditLogEntry.created_at, AuditLogEntry.id)
+                        < tuple_(cursor_at, uuid.UUID(int=0))
+                    ),
+                ),
+            ):
+                started = time.perf_counter()
+                (await db.scalars(q)).all()
+                samples.append((time.perf_counter() - started) * 1000)
+            db.expunge_all()
+    return statistics.median(head), statistics.median(deep)
+
+
+async def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--rows", type=int, default=1_000_000)
+    ap.add_argument("--families", type=int, default=500)
+    ap.add_argument("--months", type=int, default=24)
+    ap.add_argument("--retention-days", type=int, default=365)
+    ap.add_argument("--repeat", type=int, default=50)
+    args = ap.parse_args()
+
+    now = datetime.now(timezone.utc)
+    families = [uuid.uuid4() for _ in range(args.families)]
+    cutoff = retention_cutoff(args.retention_days, now)
+    cursor_at = now - timedelta(days=182)
+    engines = {schema: _engine(schema) for schema in (HEAP, PART)}
+    factories = {s: async_sessionmaker(e, expire_on_commit=False) for s, e in engines.items()}
+    heap, part = factories[HEAP], factories[PART]
+
+    async with heap() as db:
+        for schema in engines:
+            await db.execute(text(f"DROP SCHEMA IF EXISTS {schema} CASCADE"))
+            await db.execute(text(f"CREATE SCHEMA {schema}"))
+        await db.commit()
+    try:
+        started = time.perf_counter()
+        await _setup(heap, part, args.rows, families, args.months, now)
+        print(
+            f"seeded {args.rows} записей × 2, {args.families} семей, {args.months} мес. "
+            f"за {time.perf_counter() - started:.1f}s"
+        )
+
+        print(
+            f"{'':<12} {'table MiB':>10} {'index MiB':>10} {'head ms':>9} {'cursor ms':>10} "
+            f"{'retention ms':>13} {'table MiB':>10} {'index MiB':>10}"
+        )
+        for label, schema, factory in (("heap", HEAP, heap), ("partitioned", PART, part)):
+            table_mb, index_mb = await _sizes(factory, schema)
+            head_ms, deep_ms = await _latency(factory, families, cutoff, cursor_at, args.repeat)
+            async with factory() as db:
+                started = time.perf_counter()
+                if schema == HEAP:
+                    await db.execute(text("DELETE FROM audit_log WHERE created_at < :c"), {"c": cutoff})
+                    await db.commit()
+                else:
+                    await drop_expired_partitions(db, AUDIT_LOG, cutoff)
+                retention_ms = (time.perf_counter() - started) * 1000
+            after_table, after_index = await _sizes(factory, schema)
+            print(
+                f"{label:<12} {table_mb:>10.1f} {index_mb:>10.1f} {head_ms:>9.2f} {deep_ms:>10.2f} "
+                f"{retention_ms:>13.0f} {after_table:>10.1f} {after_index:>10.1f}"
+            )
+        print("(последние две колонки — размеры после очистки по сроку хранения)")
+    finally:
+        async with heap() as db:
+            for schema in engines:
+                await db.execute(text(f"DROP SCHEMA IF EXISTS {schema} CASCADE"))
+            await db.commit()
+        for engine in engines.values():
+            await engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
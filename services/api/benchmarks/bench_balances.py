@@ -0,0 +1,147 @@
+"""Балансы семьи: полный пересчёт истории vs чтение леджера member_balances.
+
+Наполняет одну семью `--tx` транзакциями бюджета со splits (по умолчанию 100k)
+и меряет:
+  * legacy — прежний /budget/balances: SELECT всех транзакций + selectinload
+    splits и суммирование в Python;
+  * ledger — текущий путь: строка на участника из member_balances;
+  * reconcile — фоновая сверка одной семьи (пересчёт с нуля в SQL).
+
+Нужен живой Postgres со схемой (DATABASE_URL). Всё выполняется в одной
+транзакции и откатывается в конце — данные в БД не остаются.
+
+    python -m benchmarks.bench_balances --tx 100000 --members 6
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import random
+import statistics
+import time
+import uuid
+from collections import defaultdict
+from datetime import date, timedelta
+from decimal import Decimal
+
+from benchmarks import _env  # noqa: F401  (до импорта app.*)
+
+from sqlalchemy import insert, select
+from sqlalchemy.orm import selectinload
+
+from app.core.security import hash_pin
+from app.db.session import AsyncSessionLocal
+from app.models.budget_transaction import BudgetTransaction, BudgetTransactionSplit, BudgetTxType
+from app.models.family import Family
+from app.models.membership import Membership, Role
+from app.models.user import User
+from app.services.balance_ledger import BUDGET, ledger_balances, reconcile_balances
+
+_BATCH = 5_000
+
+
+async def _seed(db, n_tx: int, n_members: int) -> uuid.UUID:
+    pin = hash_pin("0000")
+    users = [
+        User(username=f"bench_{uuid.uuid4().hex[:12]}", display_name=f"u{i}", password_hash=pin)
+        for i in range(n_members)
+    ]
+    db.add_all(users)
+    family = Family(name="bench balances")
+    db.add(family)
+    await db.flush()
+    db.add_all(
+        Membership(family_id=family.id, user_id=u.id, role=Role.OWNER if i == 0 else Role.MEMBER)
+        for i, u in enumerate(users)
+    )
+    await db.flush()
+
+    rng = random.Random(42)
+    ids = [u.id for u in users]
+    start = date(2015, 1, 1)
+    for offset in range(0, n_tx, _BATCH):
+        txs, splits = [], []
+        for _ in range(min(_BATCH, n_tx - offset)):
+            tx_id = uuid.uuid4()
+            parts = rng.sample(ids, rng.randint(2, len(ids)))
+            cents = rng.randint(100 * len(parts), 500_000)
+            shares = [cents // len(parts)] * len(parts)
+            shares[0] += cents - sum(shares)
+            txs.append(
+                {
+                    "id": tx_id,
+                    "family_id": family.id,
+                    "author_id": parts[0],
+                    "paid_by": rng.choice(ids),
+                    "type": BudgetTxType.EXPENSE,
+                    "category": "bench",
+                    "amount": Decimal(cents) / 100,
+                    "occurred_on": start + timedelta(days=rng.randint(0, 3650)),
+                }
+            )
+            splits.extend(
+                {"id": uuid.uuid4(), "transaction_id": tx_id, "user_id": uid, "share": Decimal(c) / 100}
+                for uid, c in zip(parts, shares)
+            )
+        await db.execute(insert(BudgetTransaction), txs)
+        await db.execute(insert(BudgetTransactionSplit), splits)
+    # Леджер для засеянных напрямую строк — тем же путём, что чинит дрейф.
+    await reconcile_balances(db, family_id=family.id, fix=True)
+    return family.id
+
+
+async def _legacy(db, family_id) -> dict:
+    balances: dict = defaultdict(lambda: Decimal("0.00"))
+    txs = await db.scalars(
+        select(BudgetTransaction)
+        .where(BudgetTransaction.family_id == family_id)
+        .options(selectinload(BudgetTransaction.splits))
+    )
+    for tx in txs.all():
+        if not tx.splits or tx.paid_by is None:
+            continue
+        balances[tx.paid_by] += tx.amount
+        for split in tx.splits:
+            balances[split.user_id] -= split.share
+    db.expunge_all()
+    return dict(balances)
+
+
+async def _time(fn, repeat: int) -> tuple[float, object]:
+    samples, result = [], None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = await fn()
+        samples.append((time.perf_counter() - started) * 1000)
+    return statistics.median(samples), result
+
+
+async def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--tx", type=int, default=100_000)
+    ap.add_argument("--members", type=int, default=6)
+    ap.add_argument("--repeat", type=int, default=3)
+    args = ap.parse_args()
+
+    async with AsyncSessionLocal() as db:
+        try:
+            started = time.perf_counter()
+            family_id = await _seed(db, args.tx, args.members)
+            print(f"seeded {args.tx} transactions in {time.perf_counter() - started:.1f}s")
+
+            legacy_ms, legacy = await _time(lambda: _legacy(db, family_id), args.repeat)
+            ledger_ms, ledger = await _time(lambda: ledger_balances(db, family_id, BUDGET), args.repeat)
+            recon_ms, drift = await _time(lambda: reconcile_balances(db, family_id=family_id), args.repeat)
+
+            assert {k: v for k, v in legacy.items() if v} == {k: v for k, v in ledger.items() if v}
+            assert drift == []
+            print(f"{'legacy (full scan)':<20} {legacy_ms:>10.1f} ms")
+            print(f"{'ledger read':<20} {ledger_ms:>10.2f} ms   x{legacy_ms / max(ledger_ms, 1e-6):.0f}")
+            print(f"{'reconcile (SQL)':<20} {recon_ms:>10.1f} ms")
+        finally:
+            await db.rollback()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,180 @@
+"""Задержка WS ping/pong во время шторма логинов (50 параллельных POST /auth/pin).
+
+Поднимает настоящий uvicorn с приложением (в отдельном потоке, без lifespan —
+планировщики не нужны), открывает живое соединение ``/gateway`` и шлёт в него
+``ping`` каждые `--interval` мс, замеряя время до ``pong``. Параллельно
+`--logins` HTTP-клиентов логинятся через ``/auth/pin`` — каждый своим
+пользователем. Режимы:
+
+  * sync  — прежний путь: verify_pin() прямо в корутине эндпоинта;
+  * pool  — verify_pin_async(): PBKDF2 в ограниченном пуле потоков.
+
+Пользователи засеиваются в БД и удаляются в конце — нужен живой Postgres
+(DATABASE_URL). Клиенты — httpx и websockets, сервер слушает 127.0.0.1.
+
+    python -m benchmarks.bench_login_storm --logins 50 --workers 2
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import socket
+import statistics
+import threading
+import time
+import uuid
+
+import httpx
+from websockets.asyncio.client import connect
+
+from benchmarks import _env  # noqa: F401  (до импорта app.*)
+
+import uvicorn
+from sqlalchemy import delete
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+from app.core import security
+from app.core.config import settings
+from app.db.session import engine as app_engine
+from app.main import app
+from app.models.user import User
+from app.routers import auth as auth_router
+
+_PIN = "1234"
+
+
+async def _verify_inline(pin: str, secret_hash: str) -> bool:
+    return security.verify_pin(pin, secret_hash)
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _start_server(port: int) -> tuple[uvicorn.Server, threading.Thread]:
+    server = uvicorn.Server(
+        uvicorn.Config(app, host="127.0.0.1", port=port, lifespan="off", log_level="warning")
+    )
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.05)
+    return server, thread
+
+
+async def _seed(sessions, count: int) -> list[str]:
+    secret_hash = security.hash_pin(_PIN)
+    names = [f"bench_{uuid.uuid4().hex[:12]}" for _ in range(count)]
+    async with sessions() as db:
+        db.add_all(User(username=n, display_name=n, password_hash=secret_hash) for n in names)
+        await db.commit()
+    return names
+
+
+async def _login(http: httpx.AsyncClient, username: str) -> str:
+    resp = await http.post(
+        "/auth/pin",
+        json={"username": username, "pin": _PIN},
+        headers={"X-Auth-Return-Token": "1"},
+    )
+    resp.raise_for_status()
+    return resp.json()["access_token"]
+
+
+async def _pinger(ws, interval: float, stop: asyncio.Event, rtts: list[float]) -> None:
+    while not stop.is_set():
+        sent = time.perf_counter()
+        await ws.send("ping")
+        while await ws.recv() != "pong":
+            pass  # presence и прочие события gateway
+        rtts.append((time.perf_counter() - sent) * 1000)
+        await asyncio.sleep(interval)
+
+
+def _percentile(values: list[float], q: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * q))] if ordered else 0.0
+
+
+async def _run(base: str, pinger_user: str, users: list[str], interval: float) -> dict:
+    async with httpx.AsyncClient(base_url=base, timeout=120) as http:
+        token = await _login(http, pinger_user)
+        ticket = (
+            await http.post("/auth/ws-ticket", headers={"Authorization": f"Bearer {token}"})
+        ).json()["ticket"]
+        async with connect(f"{base.replace('http', 'ws', 1)}/gateway?ticket={ticket}") as ws:
+            await ws.recv()  # ready
+            stop = asyncio.Event()
+            rtts: list[float] = []
+            pinger = asyncio.create_task(_pinger(ws, interval, stop, rtts))
+            await asyncio.sleep(interval * 20)
+            idle = statistics.median(rtts) if rtts else 0.0
+            rtts.clear()
+            started = time.perf_counter()
+            await asyncio.gather(*(_login(http, u) for u in users))
+            storm = time.perf_counter() - started
+            stop.set()
+            await pinger
+    return {
+        "idle": idle,
+        "storm_s": storm,
+        "p50": statistics.median(rtts) if rtts else 0.0,
+        "p99": _percentile(rtts, 0.99),
+        "max": max(rtts, default=0.0),
+        "pings": len(rtts),
+    }
+
+
+async def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--logins", type=int, default=50)
+    ap.add_argument("--workers", type=int, default=settings.pin_hash_workers)
+    ap.add_argument("--interval", type=float, default=5.0, help="период ping, мс")
+    args = ap.parse_args()
+    settings.pin_hash_workers = args.workers
+    settings.pin_hash_max_pending = max(settings.pin_hash_max_pending, args.logins)
+    # Все логины идут с 127.0.0.1 — квоты не должны мешать замеру.
+    settings.route_limits_enabled = False
+
+    # Пул приложения живёт на loop'е сервера; засев и очистка — своим движком.
+    own_engine = create_async_engine(app_engine.url)
+    sessions = async_sessionmaker(own_engine)
+    names = await _seed(sessions, args.logins + 1)
+    port = _free_port()
+    server, thread = _start_server(port)
+    base = f"http://127.0.0.1:{port}"
+    real_verify = auth_router.verify_pin_async
+    try:
+        print(f"{args.logins} concurrent /auth/pin, ping every {args.interval:.0f} ms, workers={args.workers}")
+        print(
+            f"{'mode':<6} {'idle rtt':>9} {'storm, s':>9} {'rtt p50':>9} {'p99':>9} "
+            f"{'max':>9} {'pings':>6}"
+        )
+        for mode in ("sync", "pool"):
+            auth_router.verify_pin_async = _verify_inline if mode == "sync" else real_verify
+            res = await _run(base, names[0], names[1:], args.interval / 1000)
+            print(
+                f"{mode:<6} {res['idle']:>6.1f} ms {res['storm_s']:>9.2f} {res['p50']:>6.1f} ms "
+                f"{res['p99']:>6.1f} ms {res['max']:>6.1f} ms {res['pings']:>6}"
+            )
+        snap = security.pin_hash_stats.snapshot()
+        print(
+            f"pool queue: avg {snap['queue_seconds_avg'] * 1000:.1f} ms, "
+            f"max {snap['queue_seconds_max'] * 1000:.1f} ms, rejected {snap['rejected']}"
+        )
+    finally:
+        auth_router.verify_pin_async = real_verify
+        server.should_exit = True
+        thread.join(timeout=10)
+        async with sessions() as db:
+            await db.execute(delete(User).where(User.username.in_(names)))
+            await db.commit()
+        await own_engine.dispose()
+        security.shutdown_pin_hasher()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
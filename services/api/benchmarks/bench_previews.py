@@ -0,0 +1,106 @@
+"""Пропускная способность построения превью и задержка event loop.
+
+Генерирует ``--images`` синтетических JPEG (``--width``×``--height``, шум +
+градиент — декодируются не быстрее настоящих фото) и строит для них превью
+(services/previews.py):
+
+  * inline — render_previews() прямо в корутине (как было бы без пула);
+  * pool×N — render_image(): пул из N процессов, N из ``--workers``.
+
+Параллельно «пингер» меряет, насколько loop опаздывает с ответом — это и есть
+задержка WS-доставки на инстансе, пока он строит превью. Нужен Pillow.
+
+    python -m benchmarks.bench_previews --images 40 --workers 1,2,4
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import io
+import os
+import random
+import statistics
+import time
+
+from benchmarks import _env  # noqa: F401  (до импорта app.*)
+
+from app.core.config import settings
+from app.core.images import render_previews
+from app.services import previews
+
+
+def _make_jpeg(width: int, height: int, seed: int) -> bytes:
+    from PIL import Image
+
+    rng = random.Random(seed)
+    noise = Image.frombytes("RGB", (width, height), rng.randbytes(width * height * 3))
+    gradient = Image.linear_gradient("L").resize((width, height)).convert("RGB")
+    buf = io.BytesIO()
+    Image.blend(noise, gradient, 0.7).save(buf, "JPEG", quality=90)
+    return buf.getvalue()
+
+
+async def _pinger(interval: float, stop: asyncio.Event, lags: list[float]) -> None:
+    while not stop.is_set():
+        sent = time.perf_counter()
+        await asyncio.sleep(interval)
+        lags.append((time.perf_counter() - sent - interval) * 1000)
+
+
+async def _run(mode: str, images: list[bytes], interval: float) -> dict:
+    stop = asyncio.Event()
+    lags: list[float] = []
+    pinger = asyncio.create_task(_pinger(interval, stop, lags))
+    await asyncio.sleep(interval * 5)
+    lags.clear()
+    started = time.perf_counter()
+    if mode == "inline":
+        for data in images:
+            render_previews(data, previews.PREVIEW_SIZES, settings.preview_max_pixels)
+            await asyncio.sleep(0)
+    else:
+        await asyncio.gather(*(previews.render_image(data) for data in images))
+    elapsed = time.perf_counter() - started
+    stop.set()
+    await pinger
+    lags.sort()
+    return {
+        "elapsed": elapsed,
+        "rate": len(images) / elapsed,
+        "p50": statistics.median(lags) if lags else 0.0,
+        "max": lags[-1] if lags else 0.0,
+    }
+
+
+async def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--images", type=int, default=40)
+    ap.add_argument("--width", type=int, default=4000)
+    ap.add_argument("--height", type=int, default=3000)
+    ap.add_argument("--workers", default=f"1,2,{os.cpu_count() or 4}")
+    ap.add_argument("--interval", type=float, default=5.0, help="период ping, мс")
+    args = ap.parse_args()
+
+    distinct = [_make_jpeg(args.width, args.height, seed) for seed in range(4)]
+    images = [distinct[i % len(distinct)] for i in range(args.images)]
+    avg_mb = sum(map(len, distinct)) / len(distinct) / 1024 / 1024
+    print(f"{args.images} JPEG {args.width}x{args.height} (~{avg_mb:.1f} MB), sizes={previews.PREVIEW_SIZES}")
+    print(f"{'mode':<8} {'total, s':>9} {'img/s':>7} {'loop lag p50':>13} {'max':>10}")
+
+    modes = ["inline"] + [f"pool×{n}" for n in (int(w) for w in args.workers.split(","))]
+    for mode in modes:
+        if mode != "inline":
+            previews.shutdown_preview_pool()
+            settings.preview_workers = int(mode.split("×")[1])
+            await previews.render_image(distinct[0])  # прогрев: старт процессов
+        res = await _run(mode, images, args.interval / 1000)
+        print(
+            f"{mode:<8} {res['elapsed']:>9.2f} {res['rate']:>7.1f} "
+            f"{res['p50']:>10.1f} ms {res['max']:>7.1f} ms"
+        )
+    previews.shutdown_preview_pool()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,103 @@
+"""Пропускная способность `SlidingWindowLimiter.allow()` на живом Redis.
+
+Сравнивает три варианта на одном и том же Redis:
+  * legacy — прежняя схема (ZREMRANGEBYSCORE+ZCARD, затем pipeline из 4 команд:
+    три round trip'а и гонка между проверкой и записью);
+  * lua    — точное скользящее окно одним EVALSHA;
+  * approx — интерполяция двух фиксированных окон (O(1) памяти на ключ).
+
+Кроме ops/s меряется корректность под конкуренцией: `--burst` параллельных
+allow() на один ключ при лимите `--limit` — сколько запросов реально пропущено.
+
+    python -m benchmarks.bench_rate_limit --redis-url redis://127.0.0.1:6379/15
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import time
+
+from benchmarks import _env  # noqa: F401  (до импорта app.*)
+
+from app.core import redis_client
+from app.core.config import settings
+from app.core.rate_limit import SlidingWindowLimiter, preload_scripts
+
+
+class _LegacyLimiter(SlidingWindowLimiter):
+    """Прежняя реализация Redis-пути — только для сравнения."""
+
+    async def allow(self, key: str) -> bool:
+        r = await redis_client.get_redis()
+        rk = self._rkey(key)
+        now = time.time()
+        await r.zremrangebyscore(rk, 0, now - self.window)
+        if int(await r.zcard(rk)) >= self.limit:
+            return False
+        pipe = r.pipeline()
+        pipe.zremrangebyscore(rk, 0, now - self.window)
+        pipe.zadd(rk, {f"{now}:{id(object())}": now})
+        pipe.zcard(rk)
+        pipe.expire(rk, int(self.window) + 1)
+        await pipe.execute()
+        return True
+
+
+async def _throughput(lim: SlidingWindowLimiter, ops: int, concurrency: int, keys: int) -> float:
+    per_worker = ops // concurrency
+
+    async def worker(w: int) -> None:
+        for i in range(per_worker):
+            await lim.allow(f"bench:{(w * per_worker + i) % keys}")
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker(w) for w in range(concurrency)))
+    return per_worker * concurrency / (time.perf_counter() - started)
+
+
+async def _burst(lim: SlidingWindowLimiter, burst: int) -> int:
+    results = await asyncio.gather(*(lim.allow("burst") for _ in range(burst)))
+    return sum(results)
+
+
+async def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--redis-url", default="redis://127.0.0.1:6379/15")
+    ap.add_argument("--ops", type=int, default=20_000)
+    ap.add_argument("--concurrency", type=int, default=50)
+    ap.add_argument("--keys", type=int, default=1_000, help="число различных ключей (IP)")
+    ap.add_argument("--limit", type=int, default=20)
+    ap.add_argument("--burst", type=int, default=200)
+    args = ap.parse_args()
+
+    settings.redis_url = args.redis_url
+    r = await redis_client.get_redis()
+    if r is None:
+        raise SystemExit(f"Redis недоступен: {args.redis_url}")
+    await preload_scripts()
+
+    variants = {
+        "legacy": _LegacyLimiter(args.limit, 60, name="bench_legacy"),
+        "lua": SlidingWindowLimiter(args.limit, 60, name="bench_lua"),
+        "approx": SlidingWindowLimiter(args.limit, 60, name="bench_approx", approximate=True),
+    }
+    print(f"{'variant':<8} {'ops/s':>10} {'burst allowed':>14} {'bytes/key':>10}")
+    for label, lim in variants.items():
+        # Большой лимит на throughput-прогоне, чтобы мерить путь «записать».
+        lim.limit = args.ops
+        ops = await _throughput(lim, args.ops, args.concurrency, args.keys)
+        mem = await r.memory_usage(lim._rkey("bench:0")) or 0
+        lim.limit = args.limit
+        await lim.reset("burst")
+        allowed = await _burst(lim, args.burst)
+        print(f"{label:<8} {ops:>10.0f} {allowed:>8}/{args.limit:<5} {mem:>10}")
+        for k in range(args.keys):
+            await lim.reset(f"bench:{k}")
+        await lim.reset("burst")
+
+    await redis_client.close_redis()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
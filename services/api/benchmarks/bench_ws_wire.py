@@ -0,0 +1,178 @@
+"""Байты на проводе и CPU на рассылку WS-события: JSON vs MessagePack × сжатие.
+
+Рассылка идёт через настоящий `ConnectionManager._deliver_to_chat` (событие
+кодируется раз на формат) в `--sockets` фейковых сокетов; каждый сокет
+прогоняет кадры через собственный `PerMessageDeflate` из websockets — со своим
+контекстом, как у живого соединения. Поток событий — типичная смесь чата:
+new_message, presence_update, reaction_added, message_edited.
+
+Варианты сжатия: off, zlib по умолчанию (окно 2^15, memLevel 8 — штатный
+uvicorn) и настроенное (WS_DEFLATE_WINDOW_BITS / WS_DEFLATE_MEM_LEVEL).
+Байты — на сокет за событие, с заголовком кадра; CPU — process_time на одну
+рассылку во все сокеты (кодирование + сжатие).
+
+    python -m benchmarks.bench_ws_wire --sockets 200 --events 2000
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import random
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+
+from websockets.extensions.permessage_deflate import PerMessageDeflate
+from websockets.frames import Frame, Opcode
+
+from benchmarks import _env  # noqa: F401  (до импорта app.*)
+
+from app.core.config import settings
+from app.ws import codec
+from app.ws.manager import ConnectionManager
+from app.ws.presence import presence_payload
+
+_WORDS = (
+    "привет как дела сегодня вечером ужин мама папа бабушка школа кружок "
+    "купить хлеб молоко фото дача выходные поедем забрать позвони"
+).split()
+
+
+class _Socket:
+    def __init__(self, deflate: tuple[int, int] | None) -> None:
+        self.deflate = (
+            PerMessageDeflate(False, False, 15, deflate[0], {"memLevel": deflate[1]})
+            if deflate
+            else None
+        )
+        self.wire = 0
+
+    async def send_text(self, text: str) -> None:
+        self._send(Frame(Opcode.TEXT, text.encode()))
+
+    async def send_bytes(self, data: bytes) -> None:
+        self._send(Frame(Opcode.BINARY, data))
+
+    def _send(self, frame: Frame) -> None:
+        if self.deflate is not None:
+            frame = self.deflate.encode(frame)
+        n = len(frame.data)
+        # Кадры сервера не маскируются: 2/4/10 байт заголовка.
+        self.wire += n + (2 if n < 126 else 4 if n < 65536 else 10)
+
+
+def _events(count: int, family_id: uuid.UUID, chat_id: uuid.UUID) -> list[dict]:
+    rnd = random.Random(42)
+    users = [(uuid.uuid4(), f"user{i}", f"Участник {i}") for i in range(8)]
+    messages: list[str] = []
+    now = datetime(2026, 1, 1, tzinfo=timezone.utc)
+    out: list[dict] = []
+    for i in range(count):
+        author_id, username, display = rnd.choice(users)
+        kind = rnd.random()
+        if kind < 0.5 or not messages:
+            msg_id = str(uuid.uuid4())
+            messages.append(msg_id)
+            out.append(
+                {
+                    "type": "new_message",
+                    "message": {
+                        "id": msg_id,
+                        "chat_id": str(chat_id),
+                        "author_id": str(author_id),
+                        "author_username": username,
+                        "author_display_name": display,
+                        "text": " ".join(rnd.choices(_WORDS, k=rnd.randint(2, 14))),
+                        "edited": False,
+                        "reply_to_id": None,
+                        "mentions": [],
+                        "attachments": [],
+                        "components": [],
+                        "reactions": [],
+                        "readers": [],
+                        "created_at": (now + timedelta(seconds=i)).isoformat(),
+                    },
+                    "chat_seq": i + 1,
+                }
+            )
+        elif kind < 0.75:
+            out.append(
+                presence_payload(family_id, author_id, rnd.random() < 0.5, now + timedelta(seconds=i))
+            )
+        elif kind < 0.9:
+            out.append(
+                {
+                    "type": "reaction_added",
+                    "message_id": rnd.choice(messages),
+                    "emoji": rnd.choice("👍❤😂🎉"),
+                    "user_id": str(author_id),
+                    "display_name": display,
+                    "chat_seq": i + 1,
+                }
+            )
+        else:
+            out.append(
+                {
+                    "type": "message_edited",
+                    "message": {
+                        "id": rnd.choice(messages),
+                        "text": " ".join(rnd.choices(_WORDS, k=6)),
+                        "edited": True,
+                    },
+                    "chat_seq": i + 1,
+                }
+            )
+    return out
+
+
+async def _run(fmt: str, deflate: tuple[int, int] | None, sockets: int, events: list[dict]):
+    manager = ConnectionManager()
+    chat_id = uuid.uuid4()
+    conns = [_Socket(deflate) for _ in range(sockets)]
+    for ws in conns:
+        manager._chat_connections[chat_id].add(ws)
+        if fmt != codec.JSON:
+            codec._formats[ws] = fmt
+    started = time.process_time()
+    for payload in events:
+        await manager._deliver_to_chat(chat_id, payload)
+    cpu = time.process_time() - started
+    wire = sum(ws.wire for ws in conns) / sockets / len(events)
+    return wire, cpu / len(events) * 1e6
+
+
+def _zlib_memory(deflate: tuple[int, int] | None) -> int:
+    """Память компрессора zlib на соединение (формула из zconf.h)."""
+    if deflate is None:
+        return 0
+    bits, mem_level = deflate
+    return (1 << (bits + 2)) + (1 << (mem_level + 9))
+
+
+async def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--sockets", type=int, default=200)
+    ap.add_argument("--events", type=int, default=2000)
+    args = ap.parse_args()
+
+    events = _events(args.events, uuid.uuid4(), uuid.uuid4())
+    formats = [codec.JSON]
+    if codec._msgpack_packb() is not None:
+        formats.append(codec.MSGPACK)
+    else:
+        print("msgpack не установлен — только JSON (pip install msgpack)")
+    tuned = (settings.ws_deflate_window_bits, settings.ws_deflate_mem_level)
+    variants = {"off": None, "zlib 15/8": (15, 8), f"tuned {tuned[0]}/{tuned[1]}": tuned}
+
+    print(f"{args.sockets} сокетов, {args.events} событий")
+    print(f"{'format':<8} {'deflate':<11} {'B/event':>8} {'µs CPU/broadcast':>17} {'KiB zlib/conn':>14}")
+    for fmt in formats:
+        for label, deflate in variants.items():
+            wire, cpu = await _run(fmt, deflate, args.sockets, events)
+            mem = _zlib_memory(deflate) / 1024
+            print(f"{fmt:<8} {label:<11} {wire:>8.1f} {cpu:>17.0f} {mem:>14.0f}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
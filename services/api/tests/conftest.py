@@ -121,8 +121,13 @@ def _reset_inmemory_limiters():
         rl.pin_failure_ip_limiter,
         rl.check_username_limiter,
         rl.register_ip_limiter,
+        rl.route_user_limiter,
+        rl.route_bot_limiter,
+        rl.route_family_limiter,
+        rl.route_anon_limiter,
     ):
         lim._events.clear()
+        lim._windows.clear()
     yield
 
 
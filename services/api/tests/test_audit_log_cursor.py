@@ -0,0 +1,80 @@
+"""Журнал аудита: keyset-курсор, фильтры и буферизованная запись до commit."""
+
+from __future__ import annotations
+
+import uuid
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+
+import pytest
+from fastapi import HTTPException
+from sqlalchemy.orm import Session
+
+from app.models.audit_log import AuditLogEntry
+from app.core.cursors import decode_cursor, encode_cursor
+from app.services import audit
+
+from .conftest import auth, make_family, make_user, token_for
+
+pytestmark = pytest.mark.asyncio(loop_scope="session")
+
+
+def test_cursor_round_trip_and_garbage():
+    stamp = datetime(2026, 3, 1, 12, 0, 0, 123456, tzinfo=timezone.utc)
+    entry_id = uuid.uuid4()
+    assert decode_cursor(encode_cursor(stamp, entry_id)) == (stamp, entry_id)
+    for garbage in ("не-курсор", "Zm9v", encode_cursor(stamp, entry_id)[:-3]):
+        with pytest.raises(HTTPException) as exc:
+            decode_cursor(garbage)
+        assert exc.value.status_code == 400
+
+
+async def test_buffered_entries_join_session_only_at_commit(monkeypatch):
+    monkeypatch.setattr(audit.settings, "audit_buffered_writes", True)
+    session = Session()
+    db = SimpleNamespace(info=session.info)
+    family_id = uuid.uuid4()
+    for action in ("role.assigned", "role.reordered"):
+        await audit.log_action(db, family_id=family_id, actor_id=None, action=action)
+    assert not session.new
+
+    audit._add_buffered_entries(session)
+    assert sorted(e.action for e in session.new) == ["role.assigned", "role.reordered"]
+    assert audit._BUFFER_KEY not in session.info
+
+
+async def test_equal_timestamps_page_without_gaps_and_filters(db, client):
+    owner = await make_user(db, "auditcur_owner")
+    other = await make_user(db, "auditcur_other")
+    family = await make_family(db, owner)
+    # Внутри срока хранения журнала — старые записи лента не показывает.
+    stamp = datetime.now(timezone.utc).replace(microsecond=0) - timedelta(days=1)
+    db.add_all(
+        [
+            AuditLogEntry(family_id=family.id, actor_id=owner.id, action="role.created", created_at=stamp),
+            AuditLogEntry(family_id=family.id, actor_id=owner.id, action="role.updated", created_at=stamp),
+            AuditLogEntry(family_id=family.id, actor_id=other.id, action="role.deleted", created_at=stamp),
+            AuditLogEntry(family_id=family.id, actor_id=other.id, action="chat.created", created_at=stamp),
+        ]
+    )
+    await db.flush()
+    url = f"/families/{family.id}/audit-log"
+    headers = auth(token_for(owner))
+
+    seen: list[str] = []
+    params: dict = {"limit": 3, "action_prefix": "role."}
+    while True:
+        page = (await client.get(url, params=params, headers=headers)).json()
+        seen += [e["id"] for e in page]
+        if len(page) < params["limit"]:
+            break
+        params["cursor"] = page[-1]["cursor"]
+    assert len(seen) == len(set(seen)) == 3
+
+    by_actor = (
+        await client.get(url, params={"actor_id": str(other.id)}, headers=headers)
+    ).json()
+    assert sorted(e["action"] for e in by_actor) == ["chat.created", "role.deleted"]
+
+    bad = await client.get(url, params={"cursor": "!!"}, headers=headers)
+    assert bad.status_code == 400
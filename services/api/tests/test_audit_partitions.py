@@ -0,0 +1,124 @@
+"""Секции журнала аудита: создание наперёд, удаление по сроку, сроки семей."""
+
+from __future__ import annotations
+
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from sqlalchemy import func, select, text
+
+from app.core.config import settings
+from app.models.audit_log import AuditLogEntry
+from app.services import audit_partitions as parts
+from app.services.moderation import get_or_create_settings
+
+from .conftest import auth, make_family, make_user, token_for
+
+pytestmark = pytest.mark.asyncio(loop_scope="session")
+
+
+def test_month_math_and_partition_names():
+    dec = datetime(2025, 12, 1, tzinfo=timezone.utc)
+    assert parts.add_months(dec, 1) == datetime(2026, 1, 1, tzinfo=timezone.utc)
+    assert parts.add_months(dec, -12) == datetime(2024, 12, 1, tzinfo=timezone.utc)
+    assert parts.month_start(datetime(2026, 3, 31, 23, 59, tzinfo=timezone.utc)).day == 1
+
+    name = parts.partition_name("audit_log", dec)
+    assert name == "audit_log_p2025_12"
+    assert parts.partition_month("audit_log", name) == dec
+    assert parts.partition_month("audit_log", "audit_log_default") is None
+    assert parts.partition_month("audit_log", "platform_audit_log_p2025_12") is None
+
+
+def test_family_retention_never_exceeds_platform(monkeypatch):
+    monkeypatch.setattr(settings, "audit_retention_days", 365)
+    assert [parts.family_retention_days(d) for d in (0, 30, 400)] == [365, 30, 365]
+    monkeypatch.setattr(settings, "audit_retention_days", 0)
+    assert [parts.family_retention_days(d) for d in (0, 30)] == [0, 30]
+    assert parts.retention_cutoff(0, datetime.now(timezone.utc)) is None
+
+
+async def _partition_of(db, entry: AuditLogEntry) -> str:
+    return await db.scalar(
+        text("SELECT tableoid::regclass::text FROM audit_log WHERE id = :id"), {"id": entry.id}
+    )
+
+
+async def test_new_partition_takes_its_rows_from_default(db):
+    owner = await make_user(db, "auditpart_owner")
+    family = await make_family(db, owner)
+    month = datetime(2031, 5, 1, tzinfo=timezone.utc)
+    entry = AuditLogEntry(family_id=family.id, action="chat.created", created_at=month + timedelta(days=3))
+    db.add(entry)
+    await db.flush()
+    assert await _partition_of(db, entry) == "audit_log_default"
+
+    created = await parts.ensure_partitions(db, parts.AUDIT_LOG, month, ahead=1)
+    assert created == ["audit_log_p2031_05", "audit_log_p2031_06"]
+    assert await _partition_of(db, entry) == "audit_log_p2031_05"
+    assert await parts.ensure_partitions(db, parts.AUDIT_LOG, month, ahead=1) == []
+
+
+async def test_expired_partitions_dropped_and_short_family_retention_pruned(db, client, monkeypatch):
+    monkeypatch.setattr(settings, "audit_retention_days", 365)
+    owner = await make_user(db, "auditpart_keeper")
+    family = await make_family(db, owner)
+    now = datetime.now(timezone.utc)
+    old_month = parts.month_start(now - timedelta(days=800))
+    await parts.create_partition(db, parts.AUDIT_LOG, old_month)
+    ancient = AuditLogEntry(family_id=family.id, action="role.created", created_at=old_month)
+    stale = AuditLogEntry(family_id=family.id, action="role.updated", created_at=now - timedelta(days=60))
+    fresh = AuditLogEntry(family_id=family.id, action="role.deleted", created_at=now)
+    db.add_all([ancient, stale, fresh])
+    await db.flush()
+
+    removed = await parts.drop_expired_partitions(
+        db, parts.AUDIT_LOG, parts.retention_cutoff(365, now)
+    )
+    assert removed == [parts.partition_name(parts.AUDIT_LOG, old_month)]
+
+    moderation = await get_or_create_settings(db, family.id)
+    moderation.audit_retention_days = 30
+    await db.flush()
+    url = f"/families/{family.id}/audit-log"
+    # Запись старше срока семьи скрыта сразу, ещё до очистки.
+    page = (await client.get(url, headers=auth(token_for(owner)))).json()
+    assert [e["action"] for e in page if e["action"].startswith("role.")] == ["role.deleted"]
+
+    assert await parts.prune_family_audit(db, now) == 1
+    left = await db.scalars(
+        select(AuditLogEntry.action).where(AuditLogEntry.family_id == family.id)
+    )
+    assert "role.updated" not in set(left)
+
+
+async def test_default_retention_keeps_old_partitions(db, monkeypatch):
+    monkeypatch.setattr(settings, "audit_retention_days", 0)
+    monkeypatch.setattr(settings, "platform_audit_retention_days", 0)
+    now = datetime.now(timezone.utc)
+    old_month = parts.month_start(now - timedelta(days=800))
+    name = await parts.create_partition(db, parts.AUDIT_LOG, old_month)
+
+    await parts.run_maintenance(db, now)
+    assert name in await parts.list_partitions(db, parts.AUDIT_LOG)
+
+
+async def test_maintenance_skips_pass_while_another_instance_holds_lock(engine, monkeypatch):
+    passes: list[datetime] = []
+
+    async def _run(db, now=None):
+        passes.append(now)
+
+    monkeypatch.setattr(parts, "engine", engine)
+    monkeypatch.setattr(parts, "run_maintenance", _run)
+    async with engine.connect() as other:
+        assert await other.scalar(select(func.pg_try_advisory_lock(parts._MAINTENANCE_LOCK_KEY)))
+        await other.commit()
+        assert await parts.run_maintenance_locked() is False
+        await other.execute(select(func.pg_advisory_unlock(parts._MAINTENANCE_LOCK_KEY)))
+        await other.commit()
+    assert passes == []
+
+    assert await parts.run_maintenance_locked() is True
+    assert await parts.run_maintenance_locked() is True  # блокировка отпущена
+    assert len(passes) == 2
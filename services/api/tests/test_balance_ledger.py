@@ -0,0 +1,124 @@
+"""Леджер балансов (member_balances): инкрементальные обновления и сверка."""
+
+from __future__ import annotations
+
+import uuid
+from decimal import Decimal
+
+import pytest
+from sqlalchemy import update
+
+from app.models.member_balance import MemberBalance
+from app.services.balance_ledger import budget_contribution, reconcile_balances
+
+from .conftest import add_member, auth, make_family, make_user, token_for
+
+pytestmark = pytest.mark.asyncio(loop_scope="session")
+
+
+def test_budget_contribution_rules():
+    a, b = uuid.uuid4(), uuid.uuid4()
+    shares = [(a, Decimal("30.00")), (b, Decimal("70.00"))]
+    assert budget_contribution(a, Decimal("100.00"), shares) == {
+        a: Decimal("70.00"),
+        b: Decimal("-70.00"),
+    }
+    # Без splits или без плательщика транзакция — личный учёт, в балансы не идёт.
+    assert budget_contribution(a, Decimal("100.00"), []) == {}
+    assert budget_contribution(None, Decimal("100.00"), shares) == {}
+
+
+async def _balances(client, path: str, user) -> dict[str, Decimal]:
+    resp = await client.get(path, headers=auth(token_for(user)))
+    assert resp.status_code == 200, resp.text
+    return {row["user_id"]: Decimal(str(row["balance"])) for row in resp.json()}
+
+
+async def test_budget_ledger_follows_create_update_delete(db, client):
+    owner = await make_user(db, "ledger_owner")
+    member = await make_user(db, "ledger_member")
+    family = await make_family(db, owner)
+    await add_member(db, family.id, member)
+    path = f"/families/{family.id}/budget/balances"
+
+    resp = await client.post(
+        f"/families/{family.id}/budget/transactions",
+        json={
+            "type": "expense",
+            "category": "Продукты",
+            "amount": "100.00",
+            "occurred_on": "2026-01-10",
+            "paid_by": str(owner.id),
+            "splits": [
+                {"user_id": str(owner.id), "share": "50.00"},
+                {"user_id": str(member.id), "share": "50.00"},
+            ],
+        },
+        headers=auth(token_for(owner)),
+    )
+    assert resp.status_code == 201, resp.text
+    tx_id = resp.json()["id"]
+    assert await _balances(client, path, owner) == {
+        str(owner.id): Decimal("50.00"),
+        str(member.id): Decimal("-50.00"),
+    }
+
+    resp = await client.patch(
+        f"/budget/transactions/{tx_id}",
+        json={
+            "amount": "90.00",
+            "splits": [{"user_id": str(member.id), "share": "90.00"}],
+        },
+        headers=auth(token_for(owner)),
+    )
+    assert resp.status_code == 200, resp.text
+    assert await _balances(client, path, owner) == {
+        str(owner.id): Decimal("90.00"),
+        str(member.id): Decimal("-90.00"),
+    }
+    assert await reconcile_balances(db, family_id=family.id) == []
+
+    resp = await client.delete(f"/budget/transactions/{tx_id}", headers=auth(token_for(owner)))
+    assert resp.status_code == 204, resp.text
+    assert set((await _balances(client, path, owner)).values()) == {Decimal("0.00")}
+    assert await reconcile_balances(db, family_id=family.id) == []
+
+
+async def test_reconcile_reports_and_fixes_drift(db, client):
+    owner = await make_user(db, "ledger_owner2")
+    member = await make_user(db, "ledger_member2")
+    family = await make_family(db, owner)
+    await add_member(db, family.id, member)
+    path = f"/families/{family.id}/expenses/balance"
+
+    resp = await client.post(
+        f"/families/{family.id}/expenses",
+        json={
+            "title": "Такси",
+            "amount": "40.00",
+            "paid_by": str(member.id),
+            "splits": [
+                {"user_id": str(owner.id), "share": "20.00"},
+                {"user_id": str(member.id), "share": "20.00"},
+            ],
+        },
+        headers=auth(token_for(owner)),
+    )
+    assert resp.status_code == 201, resp.text
+    assert (await _balances(client, path, owner))[str(member.id)] == Decimal("20.00")
+
+    # Правка в обход приложения → дрейф.
+    await db.execute(
+        update(MemberBalance)
+        .where(MemberBalance.family_id == family.id, MemberBalance.user_id == member.id)
+        .values(expense_balance=Decimal("999.00"))
+    )
+    drift = await reconcile_balances(db, family_id=family.id)
+    assert [(d.user_id, d.expense_expected, d.expense_actual) for d in drift] == [
+        (member.id, Decimal("20.00"), Decimal("999.00"))
+    ]
+
+    await reconcile_balances(db, family_id=family.id, fix=True)
+    await db.flush()
+    assert await reconcile_balances(db, family_id=family.id) == []
+    assert (await _balances(client, path, owner))[str(member.id)] == Decimal("20.00")
@@ -0,0 +1,110 @@
+"""Дедуплицированное хранение загрузок: общие тела, счётчик ссылок, сборка мусора."""
+
+from __future__ import annotations
+
+import hashlib
+
+import pytest
+from sqlalchemy import select
+
+from app.core import storage as storage_mod
+from app.models.chat import Chat
+from app.models.storage_object import Blob
+from app.services import blobs, jobs, storage_quota, storage_usage
+from app.services.blobs import BLOB_GC, blob_key, content_hash
+
+from .conftest import auth, make_family, make_user, token_for
+
+pytestmark = pytest.mark.asyncio(loop_scope="session")
+
+PNG_BYTES = bytes.fromhex(
+    "89504e470d0a1a0a0000000d49484452000000010000000108060000001f15c4"
+    "890000000a49444154789c6360000002000100ffff03000006000557bfabd400"
+    "00000049454e44ae426082"
+)
+DIGEST = hashlib.sha256(PNG_BYTES).hexdigest()
+
+
+@pytest.fixture(autouse=True)
+def _dedup_storage(tmp_path, monkeypatch):
+    monkeypatch.setattr(storage_usage, "_pending", {})
+    monkeypatch.setattr(storage_mod, "get_upload_root", lambda: tmp_path)
+    monkeypatch.setattr("app.core.uploads.get_upload_root", lambda: tmp_path)
+    monkeypatch.setattr(storage_quota.settings, "storage_dedup_enabled", True)
+    # Очередь проверяется по первой задаче — превью (если есть Pillow) не мешают.
+    monkeypatch.setattr(storage_quota.settings, "previews_enabled", False)
+
+
+def test_blob_key_is_sharded():
+    assert blob_key("abcdef" + "0" * 58) == f"blobs/ab/cd/abcdef{'0' * 58}"
+
+
+async def test_content_hash_same_inline_and_in_thread(monkeypatch):
+    data = b"q" * 1024
+    inline = await content_hash(data)
+    monkeypatch.setattr(blobs, "_HASH_IN_THREAD_FROM", 0)
+    assert await content_hash(data) == inline == hashlib.sha256(data).hexdigest()
+
+
+async def test_same_file_stored_once_and_collected_at_zero(db, client, tmp_path, monkeypatch):
+    owner = await make_user(db, "blob_owner")
+    family = await make_family(db, owner)
+    chat = Chat(family_id=family.id, name="general", created_by=owner.id)
+    db.add(chat)
+    await db.flush()
+    headers = auth(token_for(owner))
+
+    gallery = await client.post(
+        f"/families/{family.id}/gallery",
+        files={"file": ("pic.png", PNG_BYTES, "image/png")},
+        headers=headers,
+    )
+    assert gallery.status_code == 201, gallery.text
+
+    writes: list[str] = []
+    real_save = storage_mod.storage.save
+
+    async def _counting_save(key, data, content_type=None):
+        writes.append(key)
+        await real_save(key, data, content_type)
+
+    monkeypatch.setattr(storage_mod.storage, "save", _counting_save)
+    msg = await client.post(
+        f"/families/{family.id}/chats/{chat.id}/messages/attachments",
+        files={"files": ("copy.png", PNG_BYTES, "image/png")},
+        headers=headers,
+    )
+    assert msg.status_code == 201, msg.text
+    assert writes == []  # попадание в дедупликацию — без записи
+
+    blob = await db.get(Blob, DIGEST, populate_existing=True)
+    assert blob.refcount == 2
+    assert (tmp_path / blob_key(DIGEST)).read_bytes() == PNG_BYTES
+    assert not (tmp_path / str(family.id)).exists()
+
+    # Публичные URL и проверки доступа прежние, байты — из общего тела.
+    url = msg.json()["attachments"][0]["url"]
+    served = await client.get(url, headers=headers)
+    assert served.status_code == 200 and served.content == PNG_BYTES
+    assert served.headers["content-type"].startswith("image/png")
+    stranger = await make_user(db, "blob_stranger")
+    assert (await client.get(url, headers=auth(token_for(stranger)))).status_code == 403
+
+    resp = await client.delete(
+        f"/families/{family.id}/gallery/{gallery.json()['id']}", headers=headers
+    )
+    assert resp.status_code == 204, resp.text
+    assert (await db.get(Blob, DIGEST, populate_existing=True)).refcount == 1
+    assert (tmp_path / blob_key(DIGEST)).exists()
+
+    resp = await client.delete(
+        f"/families/{family.id}/chats/{chat.id}/messages/{msg.json()['id']}", headers=headers
+    )
+    assert resp.status_code == 204, resp.text
+    assert (await db.get(Blob, DIGEST, populate_existing=True)).refcount == 0
+
+    job = await jobs.claim_job(db)
+    assert job is not None and job.kind == BLOB_GC
+    assert await jobs.run_job(db, job) is True
+    assert await db.scalar(select(Blob).where(Blob.hash == DIGEST)) is None
+    assert not (tmp_path / blob_key(DIGEST)).exists()
@@ -0,0 +1,125 @@
+"""Кэш аутентификации ботов: LRU/TTL, инвалидация и попадание без запросов в БД."""
+
+from __future__ import annotations
+
+import uuid
+
+import pytest
+from sqlalchemy import event
+
+from app.auth import bot_cache
+from app.auth.bot_cache import BotAuthCache, _Entry, bot_auth_cache
+from app.ws.manager import ConnectionManager
+
+from .conftest import auth, make_family, make_user, token_for
+
+pytestmark = pytest.mark.asyncio(loop_scope="session")
+
+
+def _entry(user_id, *family_ids, expires=10.0) -> _Entry:
+    return _Entry(
+        user={"id": user_id},
+        memberships={fid: {"family_id": fid} for fid in family_ids},
+        expires=expires,
+    )
+
+
+def test_lru_evicts_least_recently_used(monkeypatch):
+    monkeypatch.setattr(bot_cache.time, "monotonic", lambda: 0.0)
+    cache = BotAuthCache(max_size=2, ttl_seconds=30)
+    a, b, c = uuid.uuid4(), uuid.uuid4(), uuid.uuid4()
+    cache._put("a", _entry(a))
+    cache._put("b", _entry(b))
+    assert cache._get("a") is not None  # «a» стал свежее «b»
+    cache._put("c", _entry(c))
+    assert list(cache._entries) == ["a", "c"]
+    assert b not in cache._by_user
+
+
+def test_expired_entry_is_dropped(monkeypatch):
+    now = [0.0]
+    monkeypatch.setattr(bot_cache.time, "monotonic", lambda: now[0])
+    cache = BotAuthCache(max_size=10, ttl_seconds=30)
+    user_id = uuid.uuid4()
+    cache._put("t", _entry(user_id, expires=30.0))
+    now[0] = 29.9
+    assert cache._get("t") is not None
+    now[0] = 30.0
+    assert cache._get("t") is None
+    assert cache._by_user == {}
+
+
+async def test_membership_skips_expired_entries(monkeypatch):
+    now = [0.0]
+    monkeypatch.setattr(bot_cache.time, "monotonic", lambda: now[0])
+    cache = BotAuthCache(max_size=10, ttl_seconds=30)
+    user_id, fam = uuid.uuid4(), uuid.uuid4()
+    cache._put("old", _entry(user_id, fam, expires=10.0))
+    cache._put("new", _entry(user_id, fam, expires=20.0))
+    now[0] = 25.0
+    assert await cache.membership(None, user_id, fam) is None
+    assert cache._entries == {} and cache._by_user == {}
+
+
+def test_invalidate_by_user_and_family(monkeypatch):
+    monkeypatch.setattr(bot_cache.time, "monotonic", lambda: 0.0)
+    cache = BotAuthCache(max_size=10, ttl_seconds=30)
+    bot_a, bot_b, fam = uuid.uuid4(), uuid.uuid4(), uuid.uuid4()
+    cache._put("a1", _entry(bot_a, fam))
+    cache._put("a2", _entry(bot_a))
+    cache._put("b", _entry(bot_b, fam))
+
+    cache.invalidate_user(bot_a)
+    assert list(cache._entries) == ["b"]
+    cache.invalidate_family(fam)
+    assert cache._entries == {} and cache._by_user == {}
+
+
+async def test_bot_auth_envelope_invalidates_locally(monkeypatch):
+    monkeypatch.setattr(bot_cache.time, "monotonic", lambda: 0.0)
+    bot_id = uuid.uuid4()
+    bot_auth_cache._put("envelope", _entry(bot_id))
+    try:
+        await ConnectionManager()._handle_envelope({"kind": "bot_auth", "user_id": str(bot_id)})
+        assert "envelope" not in bot_auth_cache._entries
+    finally:
+        bot_auth_cache.invalidate_user(bot_id)
+
+
+async def test_cached_bot_skips_db_until_token_regenerated(db, client):
+    owner = await make_user(db, "botcache_owner")
+    family = await make_family(db, owner)
+    headers = auth(token_for(owner))
+    created = await client.post(
+        f"/families/{family.id}/bots",
+        json={"username": "botcache_bot", "display_name": "Кэш"},
+        headers=headers,
+    )
+    assert created.status_code == 201, created.text
+    bot_headers = auth(created.json()["token"])
+    url = f"/bot/families/{family.id}/channels"
+
+    assert (await client.get(url, headers=bot_headers)).status_code == 200
+
+    statements: list[str] = []
+
+    def _record(conn, cursor, statement, *args):
+        statements.append(statement)
+
+    sync_engine = db.bind.engine.sync_engine
+    event.listen(sync_engine, "before_cursor_execute", _record)
+    try:
+        assert (await client.get(url, headers=bot_headers)).status_code == 200
+    finally:
+        event.remove(sync_engine, "before_cursor_execute", _record)
+    # Ни токен, ни членство повторно не ищутся.
+    assert not any("token_hash" in s for s in statements)
+    assert not any(s.lstrip().startswith("SELECT memberships.") for s in statements)
+
+    regenerated = await client.post(
+        f"/families/{family.id}/bots/{created.json()['id']}/token", headers=headers
+    )
+    assert regenerated.status_code == 200, regenerated.text
+    assert (await client.get(url, headers=bot_headers)).status_code == 401
+    fresh = auth(regenerated.json()["token"])
+    assert (await client.get(url, headers=fresh)).status_code == 200
@@ -0,0 +1,176 @@
+"""Журнал событий ботов: seq в живой доставке, long-poll и фильтр видимости."""
+
+from __future__ import annotations
+
+import asyncio
+import json
+import uuid
+
+import pytest
+
+from app.core.permissions import Perm
+from app.models.chat import Chat
+from app.models.permission_override import ChatPermissionOverride
+from app.services import bot_events
+from app.services.bot_events import BroadcastRecorder, record
+from app.ws.manager import ConnectionManager
+
+from .conftest import auth, make_family, make_user, token_for
+
+pytestmark = pytest.mark.asyncio(loop_scope="session")
+
+
+class _Socket:
+    def __init__(self) -> None:
+        self.sent: list[dict] = []
+
+    async def send_text(self, text: str) -> None:
+        self.sent.append(json.loads(text))
+
+
+class _Recorder:
+    def __init__(self, seqs=None, wants=True, error=None) -> None:
+        self.seqs, self._wants, self.error = seqs or {}, wants, error
+        self.batches: list[list[tuple]] = []
+
+    async def wants(self, scope, target_id, payload):
+        return self._wants
+
+    async def record(self, events):
+        self.batches.append(events)
+        if self.error:
+            raise self.error
+        return [self.seqs for _ in events]
+
+    def invalidate(self):
+        pass
+
+
+async def test_people_get_event_at_once_bots_after_log_write_with_seq():
+    manager = ConnectionManager()
+    chat_id, bot_id = uuid.uuid4(), uuid.uuid4()
+    recorder = _Recorder({str(bot_id): 7})
+    manager.set_event_recorder(recorder)
+    bot_ws, human_ws = _Socket(), _Socket()
+    manager._chat_connections[chat_id] |= {bot_ws, human_ws}
+    manager.register_bot_socket(bot_ws, bot_id)
+    wake = asyncio.Event()
+    manager.watch_bot_events(bot_id, wake)
+
+    await manager.broadcast_to_chat(chat_id, {"type": "new_message", "text": "hi"})
+    # Рассылка не ждёт записи в журнал.
+    assert human_ws.sent == [{"type": "new_message", "text": "hi"}]
+    assert bot_ws.sent == [] and not wake.is_set()
+
+    await manager.flush_bot_events()
+    assert recorder.batches == [[("chat", chat_id, {"type": "new_message", "text": "hi"})]]
+    assert bot_ws.sent == [{"type": "new_message", "text": "hi", "seq": 7}]
+    assert human_ws.sent == [{"type": "new_message", "text": "hi"}]
+    assert wake.is_set()
+    await manager.stop()
+
+
+async def test_family_without_bots_skips_the_log():
+    manager = ConnectionManager()
+    family_id = uuid.uuid4()
+    recorder = _Recorder(wants=False)
+    manager.set_event_recorder(recorder)
+    ws = _Socket()
+    manager._family_connections[family_id].add(ws)
+    await manager.broadcast_to_family(family_id, {"type": "member_joined"})
+    assert ws.sent == [{"type": "member_joined"}]
+    assert manager._event_queue is None and recorder.batches == []
+
+
+async def test_recorder_failure_still_delivers_to_bots():
+    manager = ConnectionManager()
+    family_id, bot_id = uuid.uuid4(), uuid.uuid4()
+    manager.set_event_recorder(_Recorder(error=RuntimeError("db down")))
+    bot_ws = _Socket()
+    manager._family_connections[family_id].add(bot_ws)
+    manager.register_bot_socket(bot_ws, bot_id)
+    await manager.broadcast_to_family(family_id, {"type": "member_joined"})
+    await manager.flush_bot_events()
+    assert bot_ws.sent == [{"type": "member_joined"}]
+    await manager.stop()
+
+
+async def test_long_poll_returns_visible_events_in_seq_order(db, client):
+    owner = await make_user(db, "botevents_owner")
+    family = await make_family(db, owner)
+    created = await client.post(
+        f"/families/{family.id}/bots",
+        json={"username": "botevents_bot", "display_name": "Журнал"},
+        headers=auth(token_for(owner)),
+    )
+    assert created.status_code == 201, created.text
+    bot_user_id = uuid.UUID(created.json()["user_id"])
+    bot_headers = auth(created.json()["token"])
+
+    open_chat = Chat(family_id=family.id, name="open", created_by=owner.id)
+    hidden_chat = Chat(family_id=family.id, name="hidden", created_by=owner.id)
+    db.add_all([open_chat, hidden_chat])
+    await db.flush()
+    db.add(
+        ChatPermissionOverride(
+            chat_id=hidden_chat.id, user_id=bot_user_id, allow=0, deny=int(Perm.VIEW_CHANNEL)
+        )
+    )
+    await db.flush()
+
+    assert await record(db, "chat", open_chat.id, {"type": "new_message", "n": 1}) == {
+        bot_user_id: 1
+    }
+    await record(db, "chat", hidden_chat.id, {"type": "new_message", "n": 2})
+    await record(db, "family", family.id, {"type": "member_joined"})
+    await record(db, "user", bot_user_id, {"type": "interaction"})
+    assert await record(db, "family", family.id, {"type": "presence_update"}) == {}
+
+    lonely = await make_family(db, owner, name="Без ботов")
+    assert await record(db, "family", lonely.id, {"type": "member_joined"}) == {}
+
+    page = (await client.get("/bot/events", headers=bot_headers)).json()
+    assert [(e["type"], e["seq"]) for e in page["events"]] == [
+        ("new_message", 1),
+        ("member_joined", 3),
+        ("interaction", 4),
+    ]
+    assert page["next"] == 4 and page["truncated"] is False
+
+    page = (await client.get("/bot/events", params={"after": 4}, headers=bot_headers)).json()
+    assert page == {"events": [], "next": 4, "truncated": False}
+
+
+async def test_recorder_wants_only_scopes_with_bots(db, client, monkeypatch):
+    class _Session:
+        async def __aenter__(self):
+            return db
+
+        async def __aexit__(self, *exc):
+            return False
+
+    monkeypatch.setattr(bot_events, "AsyncSessionLocal", _Session)
+    owner = await make_user(db, "botscope_owner")
+    family = await make_family(db, owner)
+    lonely = await make_family(db, owner, name="Без ботов")
+    chat = Chat(family_id=family.id, name="general", created_by=owner.id)
+    quiet = Chat(family_id=lonely.id, name="general", created_by=owner.id)
+    db.add_all([chat, quiet])
+    await db.flush()
+    recorder = BroadcastRecorder()
+    assert not await recorder.wants("chat", chat.id, {"type": "new_message"})
+
+    created = await client.post(
+        f"/families/{family.id}/bots",
+        json={"username": "botscope_bot", "display_name": "Бот"},
+        headers=auth(token_for(owner)),
+    )
+    assert created.status_code == 201, created.text
+    # Кэш свежий — новый бот виден после сброса (его делает создание бота).
+    assert not await recorder.wants("family", family.id, {"type": "member_joined"})
+    recorder.invalidate()
+    assert await recorder.wants("family", family.id, {"type": "member_joined"})
+    assert await recorder.wants("chat", chat.id, {"type": "new_message"})
+    assert await recorder.wants("user", uuid.UUID(created.json()["user_id"]), {"type": "x"})
+    assert not await recorder.wants("chat", quiet.id, {"type": "new_message"})
+    assert not await recorder.wants("family", family.id, {"type": "presence_update"})
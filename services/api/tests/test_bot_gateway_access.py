@@ -0,0 +1,139 @@
+"""Bot gateway: подписки на чаты правятся по событиям, а не на каждом ping."""
+
+from __future__ import annotations
+
+import asyncio
+import uuid
+from types import SimpleNamespace
+
+import pytest
+
+from app.routers import bot_gateway
+from app.ws.manager import ConnectionManager
+
+pytestmark = pytest.mark.asyncio(loop_scope="session")
+
+
+def test_drain_coalesces_family_wide_events():
+    fam_a, fam_b, chat_1, chat_2 = (uuid.uuid4() for _ in range(4))
+    queue: asyncio.Queue = asyncio.Queue()
+    for item in [(fam_a, chat_2), (fam_b, None), (fam_b, chat_1), (fam_a, chat_1)]:
+        queue.put_nowait(item)
+
+    dirty = bot_gateway._drain(queue, (fam_a, chat_1))
+
+    assert dirty == {fam_a: {chat_1, chat_2}, fam_b: None}
+    assert queue.empty()
+
+
+async def test_chat_access_event_reaches_local_watchers_only_for_family():
+    manager = ConnectionManager()
+    fam, other = uuid.uuid4(), uuid.uuid4()
+    queue: asyncio.Queue = asyncio.Queue()
+    manager.watch_chat_access(fam, queue)
+
+    chat_id = uuid.uuid4()
+    await manager.chat_access_changed(fam, chat_id)
+    await manager.chat_access_changed(other)
+    await manager._handle_envelope({"kind": "chat_access", "id": str(fam), "chat_id": None})
+
+    assert [queue.get_nowait() for _ in range(queue.qsize())] == [(fam, chat_id), (fam, None)]
+    manager.unwatch_chat_access(fam, queue)
+    assert manager._chat_access_watchers == {}
+
+
+async def test_follower_applies_only_the_diff(monkeypatch):
+    fam = uuid.uuid4()
+    kept, lost, gained = uuid.uuid4(), uuid.uuid4(), uuid.uuid4()
+    visible = {fam: {kept, gained}}
+    calls: list[tuple[str, uuid.UUID]] = []
+
+    class _Session:
+        async def __aenter__(self):
+            return self
+
+        async def __aexit__(self, *exc):
+            return False
+
+        async def scalars(self, _query):
+            return SimpleNamespace(all=lambda: [SimpleNamespace(family_id=fam)])
+
+    async def _viewable(_db, memberships, only):
+        calls.append(("load", only))
+        return visible
+
+    async def _connect(cid, ws, family_id, user_id):
+        calls.append(("connect", cid))
+
+    monkeypatch.setattr(bot_gateway, "AsyncSessionLocal", _Session)
+    monkeypatch.setattr(bot_gateway, "_load_viewable_chats", _viewable)
+    monkeypatch.setattr(
+        bot_gateway,
+        "ws_manager",
+        SimpleNamespace(connect=_connect, disconnect=lambda cid, ws: calls.append(("disconnect", cid))),
+    )
+
+    registered = {fam: {kept, lost}}
+    queue: asyncio.Queue = asyncio.Queue()
+    task = asyncio.create_task(
+        bot_gateway._follow_chat_access(object(), uuid.uuid4(), queue, registered)
+    )
+    try:
+        queue.put_nowait((fam, None))
+        for _ in range(10):
+            await asyncio.sleep(0)
+    finally:
+        task.cancel()
+
+    assert calls == [("load", {fam: None}), ("connect", gained), ("disconnect", lost)]
+    assert registered == {fam: {kept, gained}}
+
+
+async def test_follower_requeues_batch_when_resync_fails(monkeypatch):
+    fam = uuid.uuid4()
+    chat_1, chat_2 = uuid.uuid4(), uuid.uuid4()
+    loads: list[dict] = []
+    failures = [RuntimeError("db down")]
+
+    class _Session:
+        async def __aenter__(self):
+            return self
+
+        async def __aexit__(self, *exc):
+            return False
+
+        async def scalars(self, _query):
+            if failures:
+                raise failures.pop()
+            return SimpleNamespace(all=lambda: [SimpleNamespace(family_id=fam)])
+
+    async def _viewable(_db, memberships, only):
+        loads.append(only)
+        return {fam: {chat_1}}
+
+    async def _connect(cid, ws, family_id, user_id):
+        pass
+
+    monkeypatch.setattr(bot_gateway, "_RESYNC_RETRY_SECONDS", 0)
+    monkeypatch.setattr(bot_gateway, "AsyncSessionLocal", _Session)
+    monkeypatch.setattr(bot_gateway, "_load_viewable_chats", _viewable)
+    monkeypatch.setattr(
+        bot_gateway, "ws_manager", SimpleNamespace(connect=_connect, disconnect=lambda cid, ws: None)
+    )
+
+    registered: dict = {}
+    queue: asyncio.Queue = asyncio.Queue()
+    queue.put_nowait((fam, chat_1))
+    queue.put_nowait((fam, chat_2))
+    task = asyncio.create_task(
+        bot_gateway._follow_chat_access(object(), uuid.uuid4(), queue, registered)
+    )
+    try:
+        for _ in range(10):
+            await asyncio.sleep(0)
+    finally:
+        task.cancel()
+
+    # Первая попытка упала — та же пачка пересчитана повтором.
+    assert loads == [{fam: {chat_1, chat_2}}]
+    assert registered == {fam: {chat_1}}
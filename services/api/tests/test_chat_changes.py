@@ -0,0 +1,155 @@
+"""Журнал изменений чата: свёртка дельты и /changes?since= для переподключения."""
+
+from __future__ import annotations
+
+import uuid
+from collections import namedtuple
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+
+import pytest
+from sqlalchemy import update
+
+from app.models.chat import Chat
+from app.models.chat_change import ChatChange
+from app.services.chat_changes import load_changes, prune_chat_changes
+
+from .conftest import auth, make_family, make_user, token_for
+
+pytestmark = pytest.mark.asyncio(loop_scope="session")
+
+_Row = namedtuple("_Row", "seq message_id kind")
+
+
+class _Log:
+    def __init__(self, rows: list[_Row]) -> None:
+        self.rows = rows
+
+    async def execute(self, _query):
+        return SimpleNamespace(all=lambda: list(self.rows))
+
+
+async def test_delta_folds_log_per_message():
+    born_and_gone, created, edited, reacted, removed = (uuid.uuid4() for _ in range(5))
+    log = _Log(
+        [
+            _Row(11, created, "new"),
+            _Row(12, born_and_gone, "new"),
+            _Row(13, created, "edit"),
+            _Row(14, edited, "reaction"),
+            _Row(15, edited, "edit"),
+            _Row(16, born_and_gone, "delete"),
+            _Row(17, reacted, "reaction"),
+            _Row(18, removed, "edit"),
+            _Row(19, removed, "delete"),
+        ]
+    )
+
+    delta = await load_changes(log, uuid.uuid4(), since=10, limit=100, head=19)
+
+    assert delta.new == [created]
+    assert delta.edited == [edited]
+    assert delta.reactions == [reacted]
+    assert delta.deleted == [removed]
+    assert (delta.seq, delta.has_more) == (19, False)
+
+
+async def test_delta_pages_by_limit_and_keeps_since_when_empty():
+    ids = [uuid.uuid4() for _ in range(3)]
+    log = _Log([_Row(i + 1, mid, "new") for i, mid in enumerate(ids)])
+
+    page = await load_changes(log, uuid.uuid4(), since=0, limit=2, head=3)
+    assert page.new == ids[:2] and page.seq == 2 and page.has_more
+
+    log.rows = []
+    empty = await load_changes(log, uuid.uuid4(), since=7, limit=2, head=7)
+    assert (empty.seq, empty.has_more, empty.new) == (7, False, [])
+
+
+async def test_pruned_log_requires_resync():
+    mid = uuid.uuid4()
+    # Записи 4–5 удалены по сроку: дельта от since=3 была бы неполной.
+    log = _Log([_Row(6, mid, "edit"), _Row(7, mid, "reaction")])
+    gap = await load_changes(log, uuid.uuid4(), since=3, limit=100, head=7)
+    assert (gap.seq, gap.resync_required, gap.edited) == (7, True, [])
+
+    log.rows = []
+    gone = await load_changes(log, uuid.uuid4(), since=3, limit=100, head=9)
+    assert (gone.seq, gone.resync_required) == (9, True)
+
+
+async def test_reconnecting_client_catches_up_from_seq(db, client):
+    owner = await make_user(db, "changes_owner")
+    family = await make_family(db, owner)
+    chat = Chat(family_id=family.id, name="general", created_by=owner.id)
+    db.add(chat)
+    await db.flush()
+    headers = auth(token_for(owner))
+    base = f"/families/{family.id}/chats/{chat.id}"
+
+    async def send(text: str) -> str:
+        resp = await client.post(f"{base}/messages", json={"text": text}, headers=headers)
+        assert resp.status_code == 201, resp.text
+        return resp.json()["id"]
+
+    kept, doomed = await send("первое"), await send("второе")
+    first = (await client.get(f"{base}/changes", params={"since": 0}, headers=headers)).json()
+    assert [m["id"] for m in first["new"]] == [kept, doomed]
+    since = first["seq"]
+    assert since == 2
+
+    # Клиент «отключился»: дальше всё происходит без него.
+    fresh = await send("третье")
+    assert (
+        await client.patch(f"{base}/messages/{kept}", json={"text": "первое!"}, headers=headers)
+    ).status_code == 200
+    assert (
+        await client.post(f"{base}/messages/{kept}/reactions", json={"emoji": "👍"}, headers=headers)
+    ).status_code == 204
+    assert (await client.delete(f"{base}/messages/{doomed}", headers=headers)).status_code == 204
+
+    delta = (await client.get(f"{base}/changes", params={"since": since}, headers=headers)).json()
+    assert delta["seq"] == 6 and delta["has_more"] is False
+    assert [m["id"] for m in delta["new"]] == [fresh]
+    assert [(m["id"], m["text"]) for m in delta["edited"]] == [(kept, "первое!")]
+    assert delta["deleted"] == [doomed]
+    assert delta["reactions"] == []  # реакция уже в отредактированном сообщении
+
+    again = (await client.get(f"{base}/changes", params={"since": 6}, headers=headers)).json()
+    assert again == {
+        "seq": 6,
+        "new": [],
+        "edited": [],
+        "deleted": [],
+        "reactions": [],
+        "has_more": False,
+        "resync_required": False,
+    }
+
+
+async def test_client_behind_retention_gets_resync_flag(db, client):
+    owner = await make_user(db, "changes_pruned")
+    family = await make_family(db, owner)
+    chat = Chat(family_id=family.id, name="general", created_by=owner.id)
+    db.add(chat)
+    await db.flush()
+    headers = auth(token_for(owner))
+    base = f"/families/{family.id}/chats/{chat.id}"
+    for text in ("старое", "тоже старое", "новое"):
+        resp = await client.post(f"{base}/messages", json={"text": text}, headers=headers)
+        assert resp.status_code == 201, resp.text
+
+    now = datetime.now(timezone.utc)
+    await db.execute(
+        update(ChatChange)
+        .where(ChatChange.chat_id == chat.id, ChatChange.seq <= 2)
+        .values(created_at=now - timedelta(days=90))
+    )
+    assert await prune_chat_changes(db, now - timedelta(days=30)) >= 2
+
+    stale = (await client.get(f"{base}/changes", params={"since": 1}, headers=headers)).json()
+    assert stale["resync_required"] is True and stale["seq"] == 3
+    assert stale["new"] == [] and stale["has_more"] is False
+
+    recent = (await client.get(f"{base}/changes", params={"since": 2}, headers=headers)).json()
+    assert recent["resync_required"] is False and len(recent["new"]) == 1
@@ -0,0 +1,115 @@
+"""Массовые операции галереи: загрузка пачкой и удаление одним запросом."""
+
+from __future__ import annotations
+
+import pytest
+
+from app.core import storage as storage_mod
+from app.core.storage import LocalStorage
+from app.services import jobs, storage_quota, storage_usage
+from app.services.storage_cleanup import STORAGE_DELETE_OBJECTS
+
+from .conftest import auth, make_family, make_user, token_for
+
+pytestmark = pytest.mark.asyncio(loop_scope="session")
+
+PNG_BYTES = bytes.fromhex(
+    "89504e470d0a1a0a0000000d49484452000000010000000108060000001f15c4"
+    "890000000a49444154789c6360000002000100ffff03000006000557bfabd400"
+    "00000049454e44ae426082"
+)
+
+
+@pytest.fixture(autouse=True)
+def _isolated_storage(tmp_path, monkeypatch):
+    monkeypatch.setattr(storage_usage, "_pending", {})
+    monkeypatch.setattr(storage_mod, "get_upload_root", lambda: tmp_path)
+    monkeypatch.setattr("app.core.uploads.get_upload_root", lambda: tmp_path)
+    monkeypatch.setattr(storage_quota.settings, "previews_enabled", False)
+
+
+async def test_local_delete_urls_skips_missing_and_records_usage(tmp_path, monkeypatch):
+    monkeypatch.setattr("app.core.storage._LOCAL_DELETE_CHUNK", 2)
+    (tmp_path / "fam").mkdir()
+    for name in ("a", "b", "c"):
+        (tmp_path / "fam" / f"{name}.bin").write_bytes(b"x" * 10)
+    urls = [f"/static/uploads/fam/{name}.bin" for name in ("a", "b", "c", "gone")]
+
+    deleted = await LocalStorage().delete_urls([(url, None) for url in urls] + [("https://x/y", 5)])
+
+    assert deleted == 3
+    assert not any((tmp_path / "fam").iterdir())
+    assert sum(b for b, _ in storage_usage._pending.values()) == -30
+    assert sum(n for _, n in storage_usage._pending.values()) == -3
+
+
+def _files(*names: str, data: bytes = PNG_BYTES):
+    return [("files", (name, data, "image/png")) for name in names]
+
+
+async def test_bulk_upload_then_bulk_delete(db, client, tmp_path):
+    owner = await make_user(db, "bulk_owner")
+    family = await make_family(db, owner)
+    headers = auth(token_for(owner))
+
+    resp = await client.post(
+        f"/families/{family.id}/gallery/bulk",
+        files=_files("a.png", "b.png", "c.png"),
+        headers=headers,
+    )
+    assert resp.status_code == 201, resp.text
+    items = resp.json()
+    assert [i["file_name"] for i in items] == ["a.png", "b.png", "c.png"]
+    assert len(list((tmp_path / str(family.id)).iterdir())) == 3
+    fam = (await client.get(f"/families/{family.id}/storage", headers=headers)).json()
+    assert fam["used_bytes"] == 3 * len(PNG_BYTES) and fam["objects"] == 3
+
+    resp = await client.post(
+        f"/families/{family.id}/gallery/bulk-delete",
+        json={"ids": [i["id"] for i in items[:2]]},
+        headers=headers,
+    )
+    assert resp.status_code == 204, resp.text
+    listed = (await client.get(f"/families/{family.id}/gallery", headers=headers)).json()
+    assert [i["id"] for i in listed] == [items[2]["id"]]
+    fam = (await client.get(f"/families/{family.id}/storage", headers=headers)).json()
+    assert fam["objects"] == 1
+
+    # Файлы удаляет задача — одна на пачку.
+    job = await jobs.claim_job(db)
+    assert job is not None and job.kind == STORAGE_DELETE_OBJECTS
+    assert await jobs.run_job(db, job) is True
+    assert len(list((tmp_path / str(family.id)).iterdir())) == 1
+
+
+async def test_bulk_upload_is_all_or_nothing(db, client, tmp_path):
+    owner = await make_user(db, "bulk_bad")
+    family = await make_family(db, owner)
+    headers = auth(token_for(owner))
+
+    resp = await client.post(
+        f"/families/{family.id}/gallery/bulk",
+        files=_files("ok.png") + [("files", ("fake.png", b"not a png", "image/png"))],
+        headers=headers,
+    )
+    assert resp.status_code == 415, resp.text
+    assert not any((tmp_path / str(family.id)).glob("*"))
+    assert (await client.get(f"/families/{family.id}/gallery", headers=headers)).json() == []
+
+
+async def test_bulk_upload_with_dedup_removes_written_bodies_on_failure(
+    db, client, tmp_path, monkeypatch
+):
+    monkeypatch.setattr(storage_quota.settings, "storage_dedup_enabled", True)
+    owner = await make_user(db, "bulk_dedup_bad")
+    family = await make_family(db, owner)
+    headers = auth(token_for(owner))
+
+    resp = await client.post(
+        f"/families/{family.id}/gallery/bulk",
+        files=_files("ok.png") + [("files", ("fake.png", b"not a png", "image/png"))],
+        headers=headers,
+    )
+    assert resp.status_code == 415, resp.text
+    assert [p for p in tmp_path.rglob("*") if p.is_file()] == []
+    assert (await client.get(f"/families/{family.id}/gallery", headers=headers)).json() == []
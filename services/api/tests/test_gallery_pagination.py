@@ -0,0 +1,97 @@
+"""Лента галереи: keyset-пагинация, фильтр по типу и таймлайн по месяцам."""
+
+from __future__ import annotations
+
+from datetime import datetime, timezone
+
+import pytest
+
+from app.models.gallery_item import GalleryItem, MediaType
+
+from .conftest import auth, make_family, make_user, token_for
+
+pytestmark = pytest.mark.asyncio(loop_scope="session")
+
+
+async def _seed(db, family, owner) -> list[GalleryItem]:
+    # Два файла с одинаковым временем — порядок внутри решает id.
+    stamps = [
+        datetime(2024, 1, 10, tzinfo=timezone.utc),
+        datetime(2024, 1, 20, tzinfo=timezone.utc),
+        datetime(2024, 3, 5, tzinfo=timezone.utc),
+        datetime(2024, 3, 5, tzinfo=timezone.utc),
+        datetime(2024, 3, 31, 23, 30, tzinfo=timezone.utc),
+    ]
+    items = [
+        GalleryItem(
+            family_id=family.id,
+            uploaded_by=owner.id,
+            media_type=MediaType.VIDEO if i == 1 else MediaType.IMAGE,
+            url=f"/static/uploads/{family.id}/{i}.png",
+            file_name=f"{i}.png",
+            created_at=ts,
+        )
+        for i, ts in enumerate(stamps)
+    ]
+    db.add_all(items)
+    await db.flush()
+    return items
+
+
+async def test_keyset_pages_cover_all_items_once(db, client):
+    owner = await make_user(db, "gal_pages")
+    family = await make_family(db, owner)
+    items = await _seed(db, family, owner)
+    headers = auth(token_for(owner))
+    url = f"/families/{family.id}/gallery"
+
+    seen: list[str] = []
+    params: dict = {"limit": 2}
+    while True:
+        page = (await client.get(url, params=params, headers=headers)).json()
+        if not page:
+            break
+        seen += [i["id"] for i in page]
+        params = {"limit": 2, "cursor": page[-1]["cursor"]}
+    expected = sorted(items, key=lambda i: (i.created_at, i.id), reverse=True)
+    assert seen == [str(i.id) for i in expected]
+
+    # Последний файл страницы удалён до запроса следующей — курсор не зависит
+    # от строки-якоря, следующая страница продолжает ленту, а не начинает заново.
+    first = (await client.get(url, params={"limit": 2}, headers=headers)).json()
+    resp = await client.delete(f"{url}/{first[-1]['id']}", headers=headers)
+    assert resp.status_code == 204, resp.text
+    after = (
+        await client.get(url, params={"limit": 2, "cursor": first[-1]["cursor"]}, headers=headers)
+    ).json()
+    assert [i["id"] for i in after] == [str(i.id) for i in expected[2:4]]
+    bad = await client.get(url, params={"cursor": "не-курсор"}, headers=headers)
+    assert bad.status_code == 400
+
+    videos = (await client.get(url, params={"media_type": "video"}, headers=headers)).json()
+    assert [v["id"] for v in videos] == [str(items[1].id)]
+
+    feb = (await client.get(url, params={"before": "2024-02-01T00:00:00Z"}, headers=headers)).json()
+    assert {i["id"] for i in feb} == {str(items[0].id), str(items[1].id)}
+
+
+async def test_timeline_counts_per_month(db, client):
+    owner = await make_user(db, "gal_timeline")
+    family = await make_family(db, owner)
+    await _seed(db, family, owner)
+    headers = auth(token_for(owner))
+
+    resp = await client.get(f"/families/{family.id}/gallery/timeline", headers=headers)
+    assert resp.status_code == 200, resp.text
+    assert resp.json() == [{"month": "2024-03-01", "count": 3}, {"month": "2024-01-01", "count": 2}]
+
+    images = await client.get(
+        f"/families/{family.id}/gallery/timeline", params={"media_type": "image"}, headers=headers
+    )
+    assert images.json() == [{"month": "2024-03-01", "count": 3}, {"month": "2024-01-01", "count": 1}]
+
+    stranger = await make_user(db, "gal_timeline_stranger")
+    resp = await client.get(
+        f"/families/{family.id}/gallery/timeline", headers=auth(token_for(stranger))
+    )
+    assert resp.status_code == 403
@@ -130,3 +130,34 @@ async def test_owner_can_always_send(db, client):
         headers=auth(token_for(owner)),
     )
     assert resp.status_code == 201, resp.text
+
+
+async def test_permissions_matrix_etag_revalidates(db, client):
+    """/me/permissions отдаёт ETag; тот же ETag → 304, новый override → 200."""
+    owner = await make_user(db, "matrix_owner")
+    member_user = await make_user(db, "matrix_member")
+    family = await make_family(db, owner)
+    await add_member(db, family.id, member_user)
+    chat = await _make_chat(db, family.id, owner)
+    headers = auth(token_for(member_user))
+    url = f"/families/{family.id}/me/permissions"
+
+    first = await client.get(url, headers=headers)
+    assert first.status_code == 200, first.text
+    etag = first.headers["etag"]
+    assert str(chat.id) in first.json()["chats"]
+
+    cached = await client.get(url, headers={**headers, "If-None-Match": etag})
+    assert cached.status_code == 304
+    assert cached.headers["etag"] == etag
+
+    db.add(
+        ChatPermissionOverride(
+            chat_id=chat.id, user_id=member_user.id, allow=0, deny=int(Perm.SEND_MESSAGES)
+        )
+    )
+    await db.flush()
+    changed = await client.get(url, headers={**headers, "If-None-Match": etag})
+    assert changed.status_code == 200
+    assert changed.headers["etag"] != etag
+    assert not changed.json()["chats"][str(chat.id)] & int(Perm.SEND_MESSAGES)
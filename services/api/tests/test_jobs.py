@@ -0,0 +1,164 @@
+"""Очередь фоновых задач и очистка хранилища после удаления семьи.
+
+S3-путь проверяется на in-process двойнике бакета (пагинация list_objects_v2
+по 1000 ключей, DeleteObjects) — без сети и без aioboto3.
+"""
+
+from __future__ import annotations
+
+import uuid
+from datetime import datetime, timezone
+
+import pytest
+
+from app.core import storage as storage_mod
+from app.core.storage import LocalStorage, S3Storage
+from app.models.background_job import JOB_DONE, JOB_FAILED, JOB_QUEUED, BackgroundJob
+from app.services import jobs, storage_usage
+from app.services.storage_cleanup import STORAGE_CLEANUP
+
+from .conftest import auth, make_family, make_user, token_for
+
+pytestmark = pytest.mark.asyncio(loop_scope="session")
+
+
+@pytest.fixture(autouse=True)
+def _clean_usage(monkeypatch):
+    monkeypatch.setattr(storage_usage, "_pending", {})
+
+
+class _FakeS3:
+    """Минимальный S3: бакет — dict, страницы листинга по 1000 ключей."""
+
+    def __init__(self, keys) -> None:
+        self.objects = dict.fromkeys(keys, b"x")
+        self.delete_calls: list[int] = []
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    def get_paginator(self, name):
+        assert name == "list_objects_v2"
+        fake = self
+
+        class _Paginator:
+            async def paginate(self, Bucket, Prefix):
+                keys = sorted(k for k in fake.objects if k.startswith(Prefix))
+                for i in range(0, len(keys), 1000):
+                    yield {"Contents": [{"Key": k} for k in keys[i : i + 1000]]}
+
+        return _Paginator()
+
+    async def delete_objects(self, Bucket, Delete):
+        objs = Delete["Objects"]
+        assert len(objs) <= 1000
+        self.delete_calls.append(len(objs))
+        for o in objs:
+            self.objects.pop(o["Key"], None)
+        return {}
+
+
+async def test_s3_delete_prefix_pages_and_batches(monkeypatch):
+    fam = uuid.uuid4()
+    other = uuid.uuid4()
+    fake = _FakeS3(
+        [f"{fam}/{i}.jpg" for i in range(2500)] + [f"{other}/keep.jpg", f"{fam}x/keep.jpg"]
+    )
+    s3 = S3Storage()
+    monkeypatch.setattr(s3, "_client", lambda: fake)
+    seen: list[int] = []
+
+    async def _progress(n: int) -> None:
+        seen.append(n)
+
+    assert await s3.delete_prefix(str(fam), on_progress=_progress) == 2500
+    assert fake.delete_calls == [1000, 1000, 500]
+    assert seen == [1000, 2000, 2500]
+    assert set(fake.objects) == {f"{other}/keep.jpg", f"{fam}x/keep.jpg"}
+    # Повтор (ретрай задачи) — no-op.
+    assert await s3.delete_prefix(f"{fam}/") == 0
+
+
+@pytest.mark.parametrize("prefix", ["", "/", "../etc", "a/../../b", "a\\b"])
+async def test_delete_prefix_rejects_unsafe_prefixes(prefix, monkeypatch):
+    s3 = S3Storage()
+    monkeypatch.setattr(s3, "_client", lambda: _FakeS3([]))
+    with pytest.raises(ValueError):
+        await s3.delete_prefix(prefix)
+
+
+async def test_local_delete_prefix(tmp_path, monkeypatch):
+    monkeypatch.setattr(storage_mod, "get_upload_root", lambda: tmp_path)
+    (tmp_path / "chat_files" / "c1" / "sub").mkdir(parents=True)
+    (tmp_path / "chat_files" / "c1" / "a.bin").write_bytes(b"1")
+    (tmp_path / "chat_files" / "c1" / "sub" / "b.bin").write_bytes(b"2")
+    (tmp_path / "chat_files" / "c2").mkdir()
+    (tmp_path / "chat_files" / "c2" / "keep.bin").write_bytes(b"3")
+
+    local = LocalStorage()
+    assert await local.delete_prefix("chat_files/c1/") == 2
+    assert not (tmp_path / "chat_files" / "c1").exists()
+    assert (tmp_path / "chat_files" / "c2" / "keep.bin").exists()
+    assert await local.delete_prefix("chat_files/c1/") == 0
+
+
+def test_retry_delay_is_exponential_and_capped(monkeypatch):
+    monkeypatch.setattr(jobs.settings, "job_retry_base_seconds", 30)
+    assert [jobs.retry_delay_seconds(n) for n in (1, 2, 3)] == [30, 60, 120]
+    assert jobs.retry_delay_seconds(50) == 3600
+
+
+async def test_family_delete_enqueues_cleanup_and_worker_removes_files(
+    db, client, tmp_path, monkeypatch
+):
+    monkeypatch.setattr(storage_mod, "get_upload_root", lambda: tmp_path)
+    owner = await make_user(db, "jobs_owner")
+    family = await make_family(db, owner)
+    (tmp_path / str(family.id)).mkdir()
+    (tmp_path / str(family.id) / "photo.jpg").write_bytes(b"img")
+
+    resp = await client.delete(f"/families/{family.id}", headers=auth(token_for(owner)))
+    assert resp.status_code == 204, resp.text
+    # Файлы не трогаются в запросе — только задача в очереди.
+    assert (tmp_path / str(family.id) / "photo.jpg").exists()
+
+    job = await jobs.claim_job(db)
+    assert job is not None and job.kind == STORAGE_CLEANUP
+    assert f"{family.id}/" in job.payload["prefixes"]
+    assert await jobs.run_job(db, job) is True
+    assert job.status == JOB_DONE
+    assert job.progress_done == job.progress_total == len(job.payload["prefixes"])
+    assert not (tmp_path / str(family.id)).exists()
+
+
+async def test_failing_job_is_retried_then_failed(db, monkeypatch):
+    calls: list[int] = []
+
+    async def _boom(ctx):
+        calls.append(ctx.job.attempts)
+        raise RuntimeError("boom")
+
+    monkeypatch.setitem(jobs._handlers, "test.boom", _boom)
+    job = await jobs.enqueue_job(db, "test.boom", {}, max_attempts=2)
+    job_id = job.id
+    await db.commit()
+
+    claimed = await jobs.claim_job(db)
+    assert claimed is not None and claimed.id == job_id
+    assert await jobs.run_job(db, claimed) is False
+    job = await db.get(BackgroundJob, job_id)
+    assert job.status == JOB_QUEUED and job.attempts == 1
+    assert job.run_after > datetime.now(timezone.utc)
+    assert "boom" in job.last_error
+
+    # Backoff: пока не подошло время — не берётся.
+    assert await jobs.claim_job(db) is None
+    job.run_after = datetime.now(timezone.utc)
+    await db.commit()
+    claimed = await jobs.claim_job(db)
+    assert await jobs.run_job(db, claimed) is False
+    job = await db.get(BackgroundJob, job_id)
+    assert job.status == JOB_FAILED and calls == [1, 2]
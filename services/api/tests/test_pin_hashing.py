@@ -0,0 +1,63 @@
+"""PBKDF2 вне event loop: пул потоков, ограниченная очередь, 503 при перегрузке."""
+
+from __future__ import annotations
+
+import asyncio
+
+import pytest
+
+from app.core import security
+from app.core.config import settings
+
+pytestmark = pytest.mark.asyncio(loop_scope="session")
+
+
+@pytest.fixture(autouse=True)
+def _fresh_pool(monkeypatch):
+    monkeypatch.setattr(security, "pin_hash_stats", security.PinHashStats())
+    security.shutdown_pin_hasher()
+    yield
+    security.shutdown_pin_hasher()
+
+
+async def test_async_hash_verify_roundtrip():
+    h = await security.hash_pin_async("1234")
+    assert await security.verify_pin_async("1234", h)
+    assert not await security.verify_pin_async("4321", h)
+    # Хэш совместим с синхронным путём (старые записи в БД, conftest).
+    assert security.verify_pin("1234", h)
+    await security.dummy_verify_async()
+    assert security.pin_hash_stats.calls == 4
+    assert security.pin_hash_stats.pending == 0
+
+
+async def test_loop_stays_responsive_while_hashing():
+    h = security.hash_pin("1234")
+    ticks = 0
+
+    async def ticker():
+        nonlocal ticks
+        while True:
+            await asyncio.sleep(0.001)
+            ticks += 1
+
+    t = asyncio.create_task(ticker())
+    try:
+        await asyncio.gather(*(security.verify_pin_async("1234", h) for _ in range(4)))
+    finally:
+        t.cancel()
+    # Синхронный verify не дал бы ticker'у ни одного шага до конца проверок.
+    assert ticks > 0
+
+
+async def test_rejects_when_queue_full(monkeypatch):
+    monkeypatch.setattr(settings, "pin_hash_max_pending", 2)
+    h = security.hash_pin("1234")
+    results = await asyncio.gather(
+        *(security.verify_pin_async("1234", h) for _ in range(4)),
+        return_exceptions=True,
+    )
+    busy = [r for r in results if isinstance(r, security.PinHasherBusy)]
+    assert len(busy) == 2
+    assert [r for r in results if r is True] == [True, True]
+    assert security.pin_hash_stats.rejected == 2
@@ -0,0 +1,103 @@
+"""Статистика админки из снимков и учёт объёма хранилища без обхода файлов."""
+
+from __future__ import annotations
+
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from app.core import storage as storage_mod
+from app.core.storage import LocalStorage
+from app.core.uploads import UPLOADS_URL_PREFIX
+from app.models.platform_stats import PlatformStatsSnapshot
+from app.services import storage_usage
+from app.services.storage_usage import usage_area
+
+from .conftest import auth, make_user, token_for
+
+pytestmark = pytest.mark.asyncio(loop_scope="session")
+
+
+@pytest.fixture(autouse=True)
+def _clean_pending(monkeypatch):
+    monkeypatch.setattr(storage_usage, "_pending", {})
+
+
+def test_usage_area_by_first_segment():
+    assert usage_area("chat_files/c1/a.bin") == "chat_files"
+    assert usage_area("avatars/u.png") == "avatars"
+    assert usage_area("3f1c0c1e-0000-0000-0000-000000000000/p.jpg") == "families"
+
+
+async def test_local_storage_accounts_save_and_delete(tmp_path, monkeypatch):
+    monkeypatch.setattr(storage_mod, "get_upload_root", lambda: tmp_path)
+    monkeypatch.setattr("app.core.uploads.get_upload_root", lambda: tmp_path)
+    local = LocalStorage()
+    await local.save("avatars/a.png", b"x" * 100)
+    await local.save("chat_files/c1/v.ogg", b"y" * 50)
+    await local.save("chat_files/c1/w.ogg", b"z" * 30)
+    assert storage_usage._pending == {"avatars": (100, 1), "chat_files": (80, 2)}
+
+    await local.delete_by_url(f"{UPLOADS_URL_PREFIX}avatars/a.png")
+    # Повторное удаление уже удалённого файла учёт не трогает.
+    await local.delete_by_url(f"{UPLOADS_URL_PREFIX}avatars/a.png")
+    await local.delete_prefix("chat_files/c1/")
+    assert storage_usage._pending == {"avatars": (0, 0), "chat_files": (0, 0)}
+
+
+async def test_scan_usage_matches_tracked_totals(tmp_path, monkeypatch):
+    monkeypatch.setattr(storage_mod, "get_upload_root", lambda: tmp_path)
+    local = LocalStorage()
+    await local.save("fam/p.jpg", b"1" * 10)
+    await local.save("avatars/a.png", b"2" * 7)
+    assert await local.scan_usage(usage_area) == storage_usage._pending
+
+
+async def test_local_overwrite_accounts_size_difference(tmp_path, monkeypatch):
+    monkeypatch.setattr(storage_mod, "get_upload_root", lambda: tmp_path)
+    local = LocalStorage()
+    await local.save("blobs/ab/cd/abcd", b"1" * 40)
+    await local.save("blobs/ab/cd/abcd", b"1" * 40)
+    await local.save("chat_files/c1/p.sm.webp", b"2" * 10)
+    await local.save("chat_files/c1/p.sm.webp", b"2" * 6)  # повтор превью
+    assert storage_usage._pending == {"blobs": (40, 1), "chat_files": (6, 1)}
+
+
+async def _developer(db, name: str):
+    dev = await make_user(db, name)
+    dev.is_developer = True
+    await db.flush()
+    return dev
+
+
+async def test_admin_stats_served_from_snapshots_with_deltas(db, client):
+    dev = await _developer(db, "stats_dev")
+    week_ago = datetime.now(timezone.utc) - timedelta(days=8)
+    db.add(
+        PlatformStatsSnapshot(
+            taken_at=week_ago,
+            users=0,
+            families=0,
+            messages=0,
+            banned_users=0,
+            uploads_bytes=0,
+            uploads_objects=0,
+        )
+    )
+    await db.flush()
+
+    resp = await client.get("/admin/stats", headers=auth(token_for(dev)))
+    assert resp.status_code == 200, resp.text
+    body = resp.json()
+    # Снимка «сейчас» не было — он снят на запросе и сохранён.
+    assert body["users"] >= 1
+    assert body["users_delta_7d"] == body["users"]
+    assert datetime.fromisoformat(body["delta_since"]) == week_ago
+
+    await make_user(db, "stats_late")
+    again = (await client.get("/admin/stats", headers=auth(token_for(dev)))).json()
+    assert again["users"] == body["users"]  # отдано из снимка, без COUNT
+    fresh = (
+        await client.get("/admin/stats?refresh=true", headers=auth(token_for(dev)))
+    ).json()
+    assert fresh["users"] == body["users"] + 1
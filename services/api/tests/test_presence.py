@@ -0,0 +1,282 @@
+"""Presence: grace-период, отложенная запись и подметание упавших инстансов.
+
+Юнит на фейковых сокетах, без БД. Redis-путь — на минимальном in-process
+двойнике, который несколько ConnectionManager делят как реплики.
+"""
+
+from __future__ import annotations
+
+import uuid
+from datetime import datetime, timezone
+
+import pytest
+
+from app.core import redis_client
+from app.ws import manager as manager_mod
+from app.ws import presence
+from app.ws.manager import ConnectionManager, presence_key
+from app.ws.presence import PresenceTracker, presence_snapshot_payload
+
+pytestmark = pytest.mark.asyncio(loop_scope="session")
+
+
+class _WS:
+    pass
+
+
+@pytest.fixture
+def tracker(monkeypatch):
+    monkeypatch.setattr(presence, "ws_manager", ConnectionManager())
+    t = PresenceTracker()
+    # Делаем вид, что фоновый цикл запущен: запись в БД только через flush().
+    t._task = object()  # type: ignore[assignment]
+    t.announced = []
+
+    async def _announce(user_id, online, last_seen_at):
+        t.announced.append((user_id, online))
+
+    monkeypatch.setattr(t, "_announce", _announce)
+    return t
+
+
+async def test_reconnect_within_grace_emits_nothing(tracker):
+    user = uuid.uuid4()
+    ws1, ws2 = _WS(), _WS()
+    await tracker.connect(user, ws1, was_online=False)
+    await tracker.disconnect(user, ws1)
+    await tracker.connect(user, ws2)
+    assert await tracker.process_due(force=True) == 0
+    assert tracker.announced == [(user, True)]
+
+
+async def test_offline_announced_after_grace(tracker, monkeypatch):
+    monkeypatch.setattr(presence.settings, "presence_grace_seconds", 0)
+    user, ws = uuid.uuid4(), _WS()
+    await tracker.connect(user, ws, was_online=False)
+    await tracker.disconnect(user, ws)
+    assert tracker.announced == [(user, True)]
+
+    assert await tracker.process_due() == 1
+    assert tracker.announced[-1] == (user, False)
+    online, seen = tracker._dirty[user]
+    assert online is False and seen is not None
+
+
+async def test_second_socket_keeps_user_online(tracker):
+    user, ws1, ws2 = uuid.uuid4(), _WS(), _WS()
+    await tracker.connect(user, ws1, was_online=False)
+    await tracker.connect(user, ws2)
+    await tracker.disconnect(user, ws1)
+    assert user not in tracker._pending_offline
+    assert tracker.announced == [(user, True)]
+
+
+async def test_snapshot_keeps_grace_users_online(tracker):
+    gone, away, ws = uuid.uuid4(), uuid.uuid4(), _WS()
+    await tracker.connect(gone, ws, was_online=False)
+    await tracker.disconnect(gone, ws)
+    snap = await tracker.snapshot({gone: (False, None), away: (True, None)})
+    # В grace — ещё online; «залипший» is_online из БД без сокета — offline.
+    assert snap[gone][0] is True
+    assert snap[away][0] is False
+
+
+class _Session:
+    def __init__(self, calls: list) -> None:
+        self.calls = calls
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    async def execute(self, stmt, params):
+        self.calls.append([p["is_online"] for p in params])
+
+    async def commit(self):
+        self.calls.append("commit")
+
+
+async def test_changes_coalesce_into_one_bulk_update(tracker, monkeypatch):
+    monkeypatch.setattr(presence.settings, "presence_grace_seconds", 0)
+    calls: list = []
+    monkeypatch.setattr(presence, "AsyncSessionLocal", lambda: _Session(calls))
+    users = [uuid.uuid4() for _ in range(5)]
+    sockets = [_WS() for _ in users]
+    for u, ws in zip(users, sockets):
+        await tracker.connect(u, ws, was_online=False)
+    await tracker.disconnect(users[0], sockets[0])
+    await tracker.process_due()
+
+    assert await tracker.flush() == 5
+    # Одна транзакция: пачка online и пачка offline, без UPDATE на каждое событие.
+    assert calls == [[True] * 4, [False], "commit"]
+    assert await tracker.flush() == 0
+
+
+# ── Redis: heartbeat, подметание, общий grace ───────────────────────────────
+
+
+class _Pipe:
+    def __init__(self, redis) -> None:
+        self._redis, self._ops = redis, []
+
+    def __getattr__(self, name):
+        def queue(*args, **kwargs):
+            self._ops.append((name, args, kwargs))
+            return self
+
+        return queue
+
+    async def execute(self):
+        return [await getattr(self._redis, n)(*a, **kw) for n, a, kw in self._ops]
+
+
+class _SharedRedis:
+    def __init__(self) -> None:
+        self.kv: dict[str, int] = {}
+        self.hashes: dict[str, dict[str, int]] = {}
+        self.zsets: dict[str, dict[str, float]] = {}
+
+    def pipeline(self, transaction=True):
+        return _Pipe(self)
+
+    async def incrby(self, key, n):
+        self.kv[key] = self.kv.get(key, 0) + n
+        return self.kv[key]
+
+    async def incr(self, key):
+        return await self.incrby(key, 1)
+
+    async def decr(self, key):
+        return await self.incrby(key, -1)
+
+    async def decrby(self, key, n):
+        return await self.incrby(key, -n)
+
+    async def expire(self, key, ttl):
+        return True
+
+    async def mget(self, keys):
+        return [str(self.kv[k]) if k in self.kv else None for k in keys]
+
+    async def delete(self, *keys):
+        return sum(
+            1 for k in keys if any(d.pop(k, None) is not None for d in (self.kv, self.hashes, self.zsets))
+        )
+
+    async def hincrby(self, key, field, n):
+        h = self.hashes.setdefault(key, {})
+        h[field] = h.get(field, 0) + n
+        return h[field]
+
+    async def hdel(self, key, field):
+        return int(self.hashes.get(key, {}).pop(field, None) is not None)
+
+    async def hgetall(self, key):
+        return {f: str(v) for f, v in self.hashes.get(key, {}).items()}
+
+    async def zadd(self, key, mapping):
+        z = self.zsets.setdefault(key, {})
+        added = sum(1 for m in mapping if m not in z)
+        z.update(mapping)
+        return added
+
+    async def zrem(self, key, member):
+        return int(self.zsets.get(key, {}).pop(member, None) is not None)
+
+    async def zrangebyscore(self, key, lo, hi):
+        return [m for m, score in self.zsets.get(key, {}).items() if score <= hi]
+
+    async def zmscore(self, key, members):
+        return [self.zsets.get(key, {}).get(m) for m in members]
+
+
+@pytest.fixture
+def shared_redis(monkeypatch):
+    fake = _SharedRedis()
+
+    async def _get():
+        return fake
+
+    monkeypatch.setattr(redis_client, "get_redis", _get)
+    return fake
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1_000_000.0]
+    monkeypatch.setattr(manager_mod.time, "time", lambda: now[0])
+    return now
+
+
+async def test_dead_instance_is_reaped_by_one_survivor(shared_redis, clock):
+    dead, alive, other = ConnectionManager(), ConnectionManager(), ConnectionManager()
+    gone, stays = uuid.uuid4(), uuid.uuid4()
+    assert await dead.register_presence_connection(None, gone, _WS())
+    await dead.register_presence_connection(None, stays, _WS())
+    await alive.register_presence_connection(None, stays, _WS())
+    for m in (dead, alive, other):
+        await m.heartbeat()
+
+    clock[0] += 30
+    await alive.heartbeat()
+    await other.heartbeat()
+    assert await alive.reap_dead_instances(20) == [gone]
+    assert await other.reap_dead_instances(20) == []
+    assert await alive.online_users([gone, stays]) == {stays}
+    assert shared_redis.kv[presence_key(stays)] == 1
+
+
+async def test_instance_reaped_while_alive_restores_its_share(shared_redis, clock):
+    slow, peer = ConnectionManager(), ConnectionManager()
+    user, ws = uuid.uuid4(), _WS()
+    await slow.register_presence_connection(None, user, ws)
+    await slow.heartbeat()
+    await peer.heartbeat()
+    clock[0] += 30
+    await peer.heartbeat()
+    assert await peer.reap_dead_instances(20) == [user]
+
+    await slow.heartbeat()  # «проснулся» — счётчики вернулись
+    assert await peer.online_users([user]) == {user}
+    assert await slow.unregister_presence_connection(None, user, ws) is True
+    assert presence_key(user) not in shared_redis.kv
+
+
+async def test_orphaned_grace_is_announced_by_another_instance(shared_redis, monkeypatch):
+    monkeypatch.setattr(presence, "ws_manager", ConnectionManager())
+    monkeypatch.setattr(presence.settings, "presence_grace_seconds", 0)
+    crashed, survivor = PresenceTracker(), PresenceTracker()
+    for t in (crashed, survivor):
+        t._task = object()  # type: ignore[assignment]
+        t.announced = []
+
+        async def _announce(user_id, online, last_seen_at, t=t):
+            t.announced.append((user_id, online))
+
+        monkeypatch.setattr(t, "_announce", _announce)
+
+    user, ws = uuid.uuid4(), _WS()
+    await crashed.connect(user, ws, was_online=False)
+    await crashed.disconnect(user, ws)
+    crashed._pending_offline.clear()  # инстанс упал, не дождавшись дедлайна
+
+    assert await survivor.process_due() == 1
+    assert survivor.announced == [(user, False)]
+    assert await crashed.process_due() == 0
+
+
+async def test_snapshot_payload_is_compact():
+    fam, on, off, never = uuid.uuid4(), uuid.uuid4(), uuid.uuid4(), uuid.uuid4()
+    seen = datetime(2026, 1, 1, tzinfo=timezone.utc)
+    payload = presence_snapshot_payload(
+        fam, {on: (True, seen), off: (False, seen), never: (False, None)}
+    )
+    assert payload == {
+        "type": "presence_snapshot",
+        "family_id": str(fam),
+        "online": [str(on)],
+        "last_seen_at": {str(off): seen.isoformat()},
+    }
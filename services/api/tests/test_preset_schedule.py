@@ -0,0 +1,211 @@
+"""Пресет-боты: момент следующего прогона (next_run_at) и поиск именинников."""
+
+from __future__ import annotations
+
+import asyncio
+from datetime import date, datetime, timedelta, timezone
+
+import pytest
+import pytest_asyncio
+from sqlalchemy import delete, func, select
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from app.models.chat import Chat
+from app.models.family import Family
+from app.models.membership import Membership
+from app.models.message import Message
+from app.models.preset_bot import PresetBot
+from app.models.user import User
+from app.services import preset_dispatcher
+from app.services.preset_bots import PRESET_HANDLERS, birthday_key, birthdays_on, next_run_at
+
+from .conftest import add_member, make_family, make_user
+
+pytestmark = pytest.mark.asyncio(loop_scope="session")
+
+MSK = {"hour": 9, "tz_offset_minutes": 180}
+
+
+def _utc(*args) -> datetime:
+    return datetime(*args, tzinfo=timezone.utc)
+
+
+def test_never_ran_is_due_today_even_if_hour_passed():
+    # 05:00 UTC = 08:00 МСК — час ещё не пробил.
+    assert next_run_at(MSK, None, _utc(2024, 5, 1, 5)) == _utc(2024, 5, 1, 6)
+    # 12:00 UTC = 15:00 МСК — пробил, прогона не было: момент уже в прошлом.
+    assert next_run_at(MSK, None, _utc(2024, 5, 1, 12)) == _utc(2024, 5, 1, 6)
+
+
+def test_ran_today_moves_to_tomorrow():
+    ran = _utc(2024, 5, 1, 6, 0, 30)
+    assert next_run_at(MSK, ran, _utc(2024, 5, 1, 12)) == _utc(2024, 5, 2, 6)
+
+
+def test_local_date_decides_not_utc_date():
+    # 22:30 UTC 1 мая = 01:30 МСК 2 мая: вчерашний прогон (1 мая по МСК)
+    # не мешает прогону 2 мая в 09:00 МСК.
+    ran = _utc(2024, 5, 1, 6)
+    assert next_run_at(MSK, ran, _utc(2024, 5, 1, 22, 30)) == _utc(2024, 5, 2, 6)
+    west = {"hour": 20, "tz_offset_minutes": -300}
+    assert next_run_at(west, None, _utc(2024, 5, 2, 3)) == _utc(2024, 5, 2, 1)
+
+
+def test_birthday_key_is_mmdd():
+    assert birthday_key(date(1990, 2, 9)) == 209
+    assert birthday_key(date(1990, 12, 31)) == 1231
+
+
+async def test_birthdays_found_per_family_in_one_query(db):
+    owner_a = await make_user(db, "bday_owner_a")
+    owner_b = await make_user(db, "bday_owner_b")
+    fam_a = await make_family(db, owner_a)
+    fam_b = await make_family(db, owner_b)
+    owner_a.birthday = date(1980, 5, 1)
+    owner_b.birthday = date(1985, 5, 2)
+    leapling = await make_user(db, "bday_leap", "Високосный")
+    leapling.birthday = date(2000, 2, 29)
+    await add_member(db, fam_b.id, leapling)
+    bot = await make_user(db, "bday_bot")
+    bot.birthday, bot.is_bot = date(2020, 5, 1), True
+    await add_member(db, fam_a.id, bot)
+    await db.flush()
+
+    # У семей разные «сегодня» (часовые пояса).
+    found = await birthdays_on(db, {fam_a.id: date(2024, 5, 1), fam_b.id: date(2024, 5, 2)})
+    assert found == {
+        fam_a.id: [("bday_owner_a", date(1980, 5, 1))],
+        fam_b.id: [("bday_owner_b", date(1985, 5, 2))],
+    }
+
+    # 29 февраля в невисокосный год празднуют 28-го.
+    assert (await birthdays_on(db, {fam_b.id: date(2023, 2, 28)}))[fam_b.id] == [
+        ("Високосный", date(2000, 2, 29))
+    ]
+    assert fam_b.id not in await birthdays_on(db, {fam_b.id: date(2024, 2, 28)})
+
+    text = await PRESET_HANDLERS["birthday"](
+        db, fam_a.id, {}, prefetched=[("Аня", date(2014, 5, 1))]
+    )
+    assert "Аня" in text
+
+
+# Шедулер ходит в БД своими сессиями и полагается на SKIP LOCKED между ними —
+# поэтому данные здесь коммитятся по-настоящему и удаляются в конце.
+MIDNIGHT_UTC = {"hour": 0, "tz_offset_minutes": 0}
+
+
+@pytest_asyncio.fixture(loop_scope="session")
+async def sessions(engine, monkeypatch):
+    factory = async_sessionmaker(engine, expire_on_commit=False)
+    monkeypatch.setattr(preset_dispatcher, "AsyncSessionLocal", factory)
+    yield factory
+    async with factory() as db:
+        owners = select(User.id).where(User.username.startswith("preset_"))
+        families = select(Membership.family_id).where(Membership.user_id.in_(owners))
+        await db.execute(delete(Family).where(Family.id.in_(families)))
+        await db.execute(delete(User).where(User.id.in_(owners)))
+        await db.commit()
+
+
+async def _seed_presets(sessions, name: str, keys: list[str]) -> tuple[Chat, list[PresetBot]]:
+    async with sessions() as db:
+        owner = await make_user(db, name)
+        family = await make_family(db, owner)
+        chat = Chat(family_id=family.id, name="daily", created_by=owner.id)
+        db.add(chat)
+        await db.flush()
+        presets = [
+            PresetBot(
+                family_id=family.id,
+                preset_key=key,
+                bot_user_id=owner.id,
+                enabled=True,
+                target_chat_id=chat.id,
+                config=MIDNIGHT_UTC,
+                next_run_at=datetime.now(timezone.utc) - timedelta(minutes=1),
+            )
+            for key in keys
+        ]
+        db.add_all(presets)
+        await db.commit()
+    return chat, presets
+
+
+async def test_dispatch_posts_exactly_once_with_bounded_concurrency(sessions, monkeypatch):
+    keys = [f"test_{i}" for i in range(5)]
+    running, peak = 0, 0
+
+    async def _handler(db, family_id, config):
+        nonlocal running, peak
+        running += 1
+        peak = max(peak, running)
+        await asyncio.sleep(0.05)
+        running -= 1
+        return "доброе утро"
+
+    for key in keys:
+        monkeypatch.setitem(PRESET_HANDLERS, key, _handler)
+    monkeypatch.setattr(preset_dispatcher, "_CLAIM_BATCH", 4)
+    monkeypatch.setattr(preset_dispatcher, "_CONCURRENCY", 2)
+    chat, presets = await _seed_presets(sessions, "preset_once", keys)
+
+    # Полная пачка из 4 и остаток из 1 — за один тик; хендлеров не больше 2 сразу.
+    assert await preset_dispatcher.dispatch_due_presets() == 5
+    assert peak == 2
+    assert await preset_dispatcher.dispatch_due_presets() == 0
+
+    async with sessions() as db:
+        posted = await db.scalar(
+            select(func.count()).select_from(Message).where(Message.chat_id == chat.id)
+        )
+        assert posted == 5
+        rows = (
+            await db.scalars(select(PresetBot).where(PresetBot.id.in_([p.id for p in presets])))
+        ).all()
+    now = datetime.now(timezone.utc)
+    for pb in rows:
+        assert pb.last_run_at is not None
+        assert pb.next_run_at == next_run_at(MIDNIGHT_UTC, pb.last_run_at, now) > now
+
+
+async def test_claim_skips_locked_rows_and_leases_the_rest(sessions):
+    _, (locked, free) = await _seed_presets(sessions, "preset_lease", ["test_a", "test_b"])
+    now = datetime.now(timezone.utc)
+
+    async with sessions() as holder:
+        # Другой инстанс держит строку — забор её пропускает, а не ждёт.
+        await holder.execute(
+            select(PresetBot.id).where(PresetBot.id == locked.id).with_for_update()
+        )
+        claimed, more = await preset_dispatcher._claim_due(now)
+        await holder.rollback()
+    assert [item[0] for item in claimed if item[0] in (locked.id, free.id)] == [free.id]
+    assert more is False
+
+    async with sessions() as db:
+        leased = await db.get(PresetBot, free.id)
+        assert leased.next_run_at == now + preset_dispatcher._LEASE
+    # Аренда держит забранный пресет, освободившийся — забирается.
+    claimed, _ = await preset_dispatcher._claim_due(now)
+    assert [item[0] for item in claimed if item[0] in (locked.id, free.id)] == [locked.id]
+
+
+async def test_failed_handler_retries_on_next_tick(sessions, monkeypatch):
+    async def _boom(db, family_id, config):
+        raise RuntimeError("upstream down")
+
+    monkeypatch.setitem(PRESET_HANDLERS, "test_fail", _boom)
+    chat, (preset,) = await _seed_presets(sessions, "preset_retry", ["test_fail"])
+    before = datetime.now(timezone.utc)
+
+    assert await preset_dispatcher.dispatch_due_presets() == 0
+    async with sessions() as db:
+        pb = await db.get(PresetBot, preset.id)
+        assert pb.last_run_at is None
+        assert before < pb.next_run_at <= datetime.now(timezone.utc) + timedelta(
+            seconds=preset_dispatcher._POLL_INTERVAL_SECONDS
+        )
+        assert await db.scalar(
+            select(func.count()).select_from(Message).where(Message.chat_id == chat.id)
+        ) == 0
@@ -0,0 +1,171 @@
+"""Превью картинок: blurhash, имена вариантов, рендер и фоновая задача.
+
+Рендер и задача требуют Pillow (опциональная зависимость) — без него
+пропускаются. Пул процессов в тестах не поднимается: render_image
+подменяется синхронным вызовом.
+"""
+
+from __future__ import annotations
+
+import io
+import uuid
+
+import pytest
+from sqlalchemy import func, select
+
+from app.core import storage as storage_mod
+from app.core.images import dominant_color, encode_blurhash, render_previews
+from app.services import jobs, previews, storage_usage
+from app.models.chat import Chat
+from app.models.chat_change import ChatChange
+from app.models.message import Message
+from app.services.previews import MEDIA_PREVIEWS, PREVIEW_SIZES, preview_urls, variant_url
+
+from .conftest import auth, make_family, make_user, token_for
+
+pytestmark = pytest.mark.asyncio(loop_scope="session")
+
+
+def _png(width: int, height: int) -> bytes:
+    image_mod = pytest.importorskip("PIL.Image")
+    img = image_mod.linear_gradient("L").resize((width, height)).convert("RGB")
+    buf = io.BytesIO()
+    img.save(buf, "PNG")
+    return buf.getvalue()
+
+
+def test_blurhash_layout_and_dc_colour():
+    red = [(255, 0, 0)] * 16
+    # Одна компонента: флаг размера «0», максимум AC «0», DC = #ff0000 в base83.
+    assert encode_blurhash(red, 4, 4, 1, 1) == "00TI:j"
+    h = encode_blurhash(red, 4, 4)
+    # 4×3: флаг, максимум AC, DC из 4 символов и 11 AC по 2.
+    assert len(h) == 28
+    assert h[0] == "L" and h[2:6] == "TI:j"
+
+
+def test_dominant_color_picks_most_frequent_bucket():
+    pixels = [(250, 10, 10)] * 5 + [(10, 10, 250)] * 3
+    assert dominant_color(pixels) == "#fa0a0a"
+
+
+def test_variant_urls_sit_next_to_original():
+    fam = uuid.uuid4()
+    url = f"/static/uploads/{fam}/abc.jpg"
+    assert variant_url(url, "s") == f"/static/uploads/{fam}/abc.s.webp"
+    assert variant_url(url, "xl") is None
+    assert variant_url("https://evil/x.jpg", "s") is None
+    assert preview_urls(url, {"sizes": ["s", "m"]}) == [
+        f"/static/uploads/{fam}/abc.s.webp",
+        f"/static/uploads/{fam}/abc.m.webp",
+    ]
+    assert preview_urls(url, None) == []
+
+
+def test_render_builds_only_downscaled_variants():
+    big = render_previews(_png(2000, 1000), PREVIEW_SIZES, 10**8)
+    assert (big["width"], big["height"]) == (2000, 1000)
+    assert set(big["variants"]) == {"s", "m"}
+    assert all(body[:4] == b"RIFF" and body[8:12] == b"WEBP" for body in big["variants"].values())
+    assert len(big["blurhash"]) == 28 and big["color"].startswith("#")
+
+    small = render_previews(_png(300, 200), PREVIEW_SIZES, 10**8)
+    assert small["variants"] == {}
+
+
+async def test_gallery_upload_gets_previews_from_job(db, client, tmp_path, monkeypatch):
+    data = _png(1600, 900)
+    monkeypatch.setattr(storage_usage, "_pending", {})
+    monkeypatch.setattr(storage_mod, "get_upload_root", lambda: tmp_path)
+    monkeypatch.setattr("app.core.uploads.get_upload_root", lambda: tmp_path)
+
+    async def _inline(payload: bytes) -> dict:
+        return render_previews(payload, PREVIEW_SIZES, 10**8)
+
+    monkeypatch.setattr(previews, "render_image", _inline)
+
+    owner = await make_user(db, "preview_owner")
+    family = await make_family(db, owner)
+    headers = auth(token_for(owner))
+    resp = await client.post(
+        f"/families/{family.id}/gallery",
+        files={"file": ("wide.png", data, "image/png")},
+        headers=headers,
+    )
+    assert resp.status_code == 201, resp.text
+    assert resp.json()["preview"] is None
+    url = resp.json()["url"]
+    # Варианта ещё нет — ?size= отдаёт оригинал.
+    pending = await client.get(f"{url}?size=s", headers=headers)
+    assert pending.status_code == 200 and pending.content == data
+
+    job = await jobs.claim_job(db)
+    assert job is not None and job.kind == MEDIA_PREVIEWS
+    assert await jobs.run_job(db, job) is True
+
+    listed = (await client.get(f"/families/{family.id}/gallery", headers=headers)).json()
+    preview = listed[0]["preview"]
+    assert preview["width"] == 1600 and preview["sizes"] == ["s", "m"]
+
+    small = await client.get(f"{url}?size=s", headers=headers)
+    assert small.status_code == 200
+    assert small.headers["content-type"].startswith("image/webp")
+    assert len(small.content) < len(data)
+    assert (await client.get(f"{url}?size=huge", headers=headers)).status_code == 400
+
+    resp = await client.delete(f"/families/{family.id}/gallery/{listed[0]['id']}", headers=headers)
+    assert resp.status_code == 204
+    assert not any(tmp_path.joinpath(str(family.id)).glob("*.webp"))
+
+
+async def test_message_previews_update_attachments_once(db, client, tmp_path, monkeypatch):
+    monkeypatch.setattr(storage_usage, "_pending", {})
+    monkeypatch.setattr(storage_mod, "get_upload_root", lambda: tmp_path)
+    monkeypatch.setattr("app.core.uploads.get_upload_root", lambda: tmp_path)
+
+    async def _inline(payload: bytes) -> dict:
+        return render_previews(payload, PREVIEW_SIZES, 10**8)
+
+    sent: list[dict] = []
+
+    async def _broadcast(chat_id, payload):
+        sent.append(payload)
+
+    monkeypatch.setattr(previews, "render_image", _inline)
+    monkeypatch.setattr(previews.ws_manager, "broadcast_to_chat", _broadcast)
+
+    owner = await make_user(db, "preview_chat_owner")
+    family = await make_family(db, owner)
+    chat = Chat(family_id=family.id, name="photos", created_by=owner.id)
+    db.add(chat)
+    await db.flush()
+    resp = await client.post(
+        f"/families/{family.id}/chats/{chat.id}/messages/attachments",
+        files=[
+            ("files", ("a.png", _png(800, 600), "image/png")),
+            ("files", ("b.png", _png(600, 800), "image/png")),
+        ],
+        data={"text": "отпуск"},
+        headers=auth(token_for(owner)),
+    )
+    assert resp.status_code == 201, resp.text
+    message_id = uuid.UUID(resp.json()["id"])
+    sent.clear()
+
+    job = await jobs.claim_job(db)
+    assert job is not None and job.kind == MEDIA_PREVIEWS
+    assert await jobs.run_job(db, job) is True
+
+    msg = await db.get(Message, message_id)
+    await db.refresh(msg)
+    assert msg.text == "отпуск" and not msg.edited
+    assert all(a["preview"]["sizes"] for a in msg.attachments)
+    edits = await db.scalar(
+        select(func.count())
+        .select_from(ChatChange)
+        .where(ChatChange.message_id == message_id, ChatChange.kind == "edit")
+    )
+    assert edits == 1
+    assert [e["type"] for e in sent] == ["message_attachments_updated"]
+    assert sent[0]["message_id"] == str(message_id)
+    assert sent[0]["attachments"] == msg.attachments
@@ -0,0 +1,234 @@
+"""SlidingWindowLimiter: точный и приближённый (интерполяция окон) режимы.
+
+Без REDIS_URL — in-memory путь; Redis-путь выполняет те же правила в Lua
+(тесты Redis пропускаются, если REDIS_URL не задан).
+"""
+
+from __future__ import annotations
+
+import asyncio
+import os
+import uuid
+
+import pytest
+import pytest_asyncio
+
+from app.core import rate_limit, redis_client
+from app.core.rate_limit import SlidingWindowLimiter
+
+pytestmark = pytest.mark.asyncio(loop_scope="session")
+
+
+class _Clock:
+    def __init__(self, now: float) -> None:
+        self.now = now
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    c = _Clock(1000.0)
+    monkeypatch.setattr(rate_limit.time, "monotonic", c)
+    return c
+
+
+async def test_exact_window_blocks_until_oldest_expires(clock):
+    lim = SlidingWindowLimiter(limit=3, window_seconds=10, name="t_exact")
+    assert [await lim.allow("k") for _ in range(4)] == [True, True, True, False]
+    clock.now += 10.5
+    assert await lim.allow("k") is True
+
+
+async def test_approximate_blocks_at_limit_within_window(clock):
+    lim = SlidingWindowLimiter(limit=3, window_seconds=10, name="t_approx", approximate=True)
+    assert [await lim.allow("k") for _ in range(4)] == [True, True, True, False]
+    assert await lim.count("k") == 3
+
+
+async def test_approximate_interpolates_previous_window(clock):
+    lim = SlidingWindowLimiter(limit=4, window_seconds=10, name="t_interp", approximate=True)
+    for _ in range(4):
+        assert await lim.allow("k")
+    # Середина следующего окна: вклад прошлого окна = 4 * 0.5 = 2.
+    clock.now = 1015.0
+    assert await lim.count("k") == 2
+    assert await lim.allow("k") is True
+    assert await lim.allow("k") is True
+    assert await lim.allow("k") is False
+    # Через окно прошлое полностью «выветрилось».
+    clock.now = 1030.0
+    assert await lim.count("k") == 0
+
+
+async def test_approximate_state_is_constant_per_key(clock):
+    lim = SlidingWindowLimiter(limit=1000, window_seconds=10, name="t_o1", approximate=True)
+    for _ in range(500):
+        await lim.allow("k")
+    assert lim._windows["k"][1] == 500
+    assert len(lim._windows) == 1
+    assert not lim._events
+
+
+async def test_reset_clears_both_modes(clock):
+    for approximate in (False, True):
+        lim = SlidingWindowLimiter(limit=1, window_seconds=10, name="t_reset", approximate=approximate)
+        assert await lim.allow("k")
+        assert not await lim.allow("k")
+        await lim.reset("k")
+        assert await lim.allow("k")
+
+
+async def test_hit_charges_cost_and_reports_retry_after(clock):
+    lim = SlidingWindowLimiter(limit=10, window_seconds=60, name="t_cost")
+    assert await lim.hit("k", cost=4) == (True, 0.0)
+    clock.now += 5
+    assert (await lim.hit("k", cost=4))[0]
+    # 8 из 10 занято: ещё 4 не влезают, пока не истечёт первая пачка (t=1000).
+    allowed, retry = await lim.hit("k", cost=4)
+    assert not allowed
+    assert retry == pytest.approx(55.0)
+    clock.now = 1060.5
+    assert (await lim.hit("k", cost=4))[0]
+
+
+async def test_exact_hit_keeps_one_entry_per_request(clock):
+    lim = SlidingWindowLimiter(limit=100, window_seconds=60, name="t_pairs")
+    for _ in range(3):
+        assert (await lim.hit("k", cost=20))[0]
+    assert len(lim._events["k"]) == 3
+    assert await lim.count("k") == 60
+    clock.now += 61
+    assert await lim.count("k") == 0
+
+
+async def test_approximate_hit_retry_after_matches_interpolation(clock):
+    lim = SlidingWindowLimiter(limit=10, window_seconds=60, name="t_acost", approximate=True)
+    assert (await lim.hit("k", cost=10))[0]
+    clock.now = 1020.0  # та же минута [960, 1020) закончилась → новое окно
+    allowed, retry = await lim.hit("k", cost=5)
+    # Оценка 10 * (1 - 0) = 10; чтобы влезло 5, прошлое окно должно
+    # «выветриться» наполовину — 30 с.
+    assert not allowed
+    assert retry == pytest.approx(30.0)
+    clock.now = 1050.0
+    assert (await lim.hit("k", cost=5))[0]
+
+
+async def test_denied_request_charges_no_bucket(clock):
+    from types import SimpleNamespace
+
+    from fastapi import HTTPException
+
+    from app.auth.rate_limit_deps import _enforce
+
+    user = SlidingWindowLimiter(limit=10, window_seconds=60, name="t_user")
+    family = SlidingWindowLimiter(limit=10, window_seconds=60, name="t_family")
+    assert (await family.hit("f", cost=8))[0]
+    assert await user.check("u", cost=5) == (True, 0.0)
+    assert await user.count("u") == 0
+
+    request = SimpleNamespace(headers={})
+    with pytest.raises(HTTPException) as exc:
+        await _enforce(request, "search_messages", [(user, "u"), (family, "f")], 0)
+    assert exc.value.status_code == 429
+    assert await user.count("u") == 0
+    assert await family.count("f") == 8
+
+
+async def test_search_quota_returns_429_with_retry_after(db, client, monkeypatch):
+    from app.core.rate_limit import route_user_limiter
+    from app.models.chat import Chat
+
+    from .conftest import auth, make_family, make_user, token_for
+
+    owner = await make_user(db, "quota_owner")
+    family = await make_family(db, owner)
+    chat = Chat(family_id=family.id, name="general", created_by=owner.id)
+    db.add(chat)
+    await db.flush()
+
+    # Бюджет на два поиска (вес search_messages = 10).
+    monkeypatch.setattr(route_user_limiter, "limit", 20)
+    url = f"/families/{family.id}/chats/{chat.id}/messages/search"
+    headers = auth(token_for(owner))
+    for _ in range(2):
+        resp = await client.get(url, params={"q": "hi"}, headers=headers)
+        assert resp.status_code == 200, resp.text
+    resp = await client.get(url, params={"q": "hi"}, headers=headers)
+    assert resp.status_code == 429, resp.text
+    assert int(resp.headers["retry-after"]) >= 1
+
+
+async def test_outsider_cannot_spend_family_quota(db, client):
+    from app.core.rate_limit import route_family_limiter
+    from app.models.chat import Chat
+
+    from .conftest import auth, make_family, make_user, token_for
+
+    owner = await make_user(db, "quota_victim")
+    outsider = await make_user(db, "quota_outsider")
+    family = await make_family(db, owner)
+    chat = Chat(family_id=family.id, name="general", created_by=owner.id)
+    db.add(chat)
+    await db.flush()
+
+    url = f"/families/{family.id}/chats/{chat.id}/messages/search"
+    resp = await client.get(url, params={"q": "hi"}, headers=auth(token_for(outsider)))
+    assert resp.status_code == 403, resp.text
+    assert await route_family_limiter.count(f"family:{family.id}") == 0
+
+
+@pytest_asyncio.fixture(loop_scope="session")
+async def redis_backend(monkeypatch):
+    url = os.environ.get("REDIS_URL")
+    if not url:
+        pytest.skip("REDIS_URL не задан")
+    import redis.asyncio as aioredis
+
+    r = aioredis.from_url(url, encoding="utf-8", decode_responses=True)
+
+    async def _get_redis():
+        return r
+
+    monkeypatch.setattr(redis_client, "get_redis", _get_redis)
+    yield r
+    await r.aclose()
+
+
+def _redis_limiter(limit: int, approximate: bool) -> SlidingWindowLimiter:
+    return SlidingWindowLimiter(
+        limit, 60, name=f"t_{uuid.uuid4().hex[:8]}", approximate=approximate
+    )
+
+
+@pytest.mark.parametrize("approximate", [False, True])
+async def test_redis_lua_charges_cost_and_reports_retry_after(redis_backend, approximate):
+    lim = _redis_limiter(5, approximate)
+    assert await lim.hit("k", cost=3) == (True, 0.0)
+    allowed, retry = await lim.hit("k", cost=3)
+    assert not allowed
+    assert retry > 0
+    assert await lim.count("k") == 3
+    assert await lim.record("k") == 4
+    await lim.reset("k")
+    assert await lim.count("k") == 0
+
+
+@pytest.mark.parametrize("approximate", [False, True])
+async def test_redis_concurrent_hits_never_overshoot(redis_backend, approximate):
+    lim = _redis_limiter(10, approximate)
+    results = await asyncio.gather(*(lim.hit("k", cost=1) for _ in range(25)))
+    assert sum(allowed for allowed, _ in results) == 10
+    await lim.reset("k")
+
+
+async def test_redis_reloads_scripts_after_noscript(redis_backend):
+    lim = _redis_limiter(10, approximate=False)
+    assert (await lim.hit("k", cost=2))[0]
+    # Рестарт Redis / SCRIPT FLUSH: EVALSHA получит NOSCRIPT и догрузит тело.
+    await redis_backend.script_flush()
+    assert (await lim.hit("k", cost=2))[0]
+    assert await lim.count("k") == 4
+    await lim.reset("k")
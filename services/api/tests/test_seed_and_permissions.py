@@ -17,6 +17,7 @@ from app.models.role import FamilyRole, MemberRole
 from app.services.roles import (
     effective_chat_permissions,
     effective_permissions,
+    effective_permissions_matrix,
 )
 
 from .conftest import add_member, grant_role, make_family, make_user, role_by_slug
@@ -208,3 +209,36 @@ async def test_member_override_beats_role_override(db):
 
     eff = await effective_chat_permissions(db, membership.id, chat.id)
     assert eff & bit, "member-override (allow) должен перебить role-override (deny)"
+
+
+async def test_permissions_matrix_matches_per_chat_calculation(db):
+    """Матрица прав (пачкой) совпадает с расчётом по одному чату."""
+    from app.models.chat import Chat
+
+    owner = await make_user(db, "owner_matrix")
+    member_user = await make_user(db, "member_matrix")
+    family = await make_family(db, owner)
+    membership = await add_member(db, family.id, member_user)
+
+    chats = [Chat(family_id=family.id, name=f"c{i}", created_by=owner.id) for i in range(3)]
+    db.add_all(chats)
+    await db.flush()
+
+    everyone = await role_by_slug(db, family.id, "everyone")
+    child = await role_by_slug(db, family.id, "child")
+    bit = int(Perm.SEND_VOICE)
+    db.add(ChatPermissionOverride(chat_id=chats[0].id, role_id=everyone.id, allow=bit, deny=0))
+    db.add(ChatPermissionOverride(chat_id=chats[0].id, role_id=child.id, allow=0, deny=bit))
+    db.add(ChatPermissionOverride(chat_id=chats[1].id, role_id=everyone.id, allow=0, deny=bit))
+    db.add(ChatPermissionOverride(chat_id=chats[1].id, user_id=member_user.id, allow=bit, deny=0))
+    await db.flush()
+
+    base, by_chat, by_channel = await effective_permissions_matrix(
+        db, membership, [c.id for c in chats], []
+    )
+    assert base == await effective_permissions(db, membership.id)
+    assert by_channel == {}
+    for chat in chats:
+        assert by_chat[chat.id] == await effective_chat_permissions(db, membership.id, chat.id)
+    assert not by_chat[chats[0].id] & bit
+    assert by_chat[chats[1].id] & bit
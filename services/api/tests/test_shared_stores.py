@@ -0,0 +1,99 @@
+"""WS-тикеты и pending-интеракции: одноразовость, TTL, общий стор между репликами.
+
+Redis-путь проверяется на минимальном in-process двойнике (SET с TTL + GETDEL),
+которого два независимых экземпляра стора делят так же, как реплики — Redis.
+"""
+
+from __future__ import annotations
+
+import time
+import uuid
+
+import pytest
+
+from app.core import interactions as interactions_mod
+from app.core import redis_client
+from app.core import ws_tickets as ws_tickets_mod
+from app.core.interactions import InteractionStore
+from app.core.ws_tickets import WsTicketStore
+
+pytestmark = pytest.mark.asyncio(loop_scope="session")
+
+
+class _SharedRedis:
+    def __init__(self) -> None:
+        self.data: dict[str, tuple[str, float]] = {}
+
+    async def set(self, key, value, ex=None, px=None):
+        ttl = ex if ex is not None else (px / 1000 if px is not None else 1e9)
+        self.data[key] = (value, time.monotonic() + ttl)
+
+    async def getdel(self, key):
+        value, exp = self.data.pop(key, (None, 0))
+        return value if exp > time.monotonic() else None
+
+
+@pytest.fixture
+def shared_redis(monkeypatch):
+    fake = _SharedRedis()
+
+    async def _get():
+        return fake
+
+    monkeypatch.setattr(redis_client, "get_redis", _get)
+    return fake
+
+
+def _ids() -> dict:
+    return {k: uuid.uuid4() for k in ("message_id", "chat_id", "family_id", "bot_id", "user_id")}
+
+
+async def test_ticket_is_one_shot_in_memory():
+    store = WsTicketStore()
+    uid = uuid.uuid4()
+    ticket, ttl = await store.issue(uid)
+    assert ttl == ws_tickets_mod.TICKET_TTL_SECONDS
+    assert await store.consume(ticket) == uid
+    assert await store.consume(ticket) is None
+
+
+async def test_ticket_gc_drops_only_expired_head(monkeypatch):
+    store = WsTicketStore()
+    now = [100.0]
+    monkeypatch.setattr(ws_tickets_mod.time, "monotonic", lambda: now[0])
+    old, _ = await store.issue(uuid.uuid4())
+    now[0] += 30
+    fresh, _ = await store.issue(uuid.uuid4())
+    now[0] += 40  # old истёк, fresh ещё жив
+    await store.issue(uuid.uuid4())
+    assert old not in store._tickets
+    assert fresh in store._tickets
+
+
+async def test_ticket_issued_on_one_replica_consumed_on_another(shared_redis):
+    a, b = WsTicketStore(), WsTicketStore()
+    uid = uuid.uuid4()
+    ticket, _ = await a.issue(uid)
+    assert await b.consume(ticket) == uid
+    assert await a.consume(ticket) is None
+    assert not a._tickets and not b._tickets
+
+
+async def test_interaction_roundtrip_across_replicas(shared_redis):
+    a, b = InteractionStore(), InteractionStore()
+    ids = _ids()
+    iid = await a.create(**ids, kind="modal", modal_custom_id="form")
+    pending = await b.consume(iid)
+    assert pending is not None
+    assert pending.id == iid and pending.kind == "modal" and pending.modal_custom_id == "form"
+    assert {k: getattr(pending, k) for k in ids} == ids
+    assert await a.consume(iid) is None
+
+
+async def test_interaction_expires_in_memory(monkeypatch):
+    store = InteractionStore()
+    now = [0.0]
+    monkeypatch.setattr(interactions_mod.time, "monotonic", lambda: now[0])
+    iid = await store.create(**_ids(), ttl=15)
+    now[0] = 16
+    assert await store.consume(iid) is None
@@ -0,0 +1,150 @@
+"""Учёт хранилища по семьям/пользователям и квоты на загрузку."""
+
+from __future__ import annotations
+
+import io
+
+import pytest
+from fastapi import UploadFile
+from sqlalchemy import select
+from starlette.datastructures import Headers
+
+from app.core import storage as storage_mod
+from app.models.background_job import BackgroundJob
+from app.models.chat import Chat
+from app.models.storage_object import StoredObject
+from app.services import storage_quota, storage_usage
+from app.services.storage_cleanup import STORAGE_CLEANUP
+from app.services.storage_quota import check_storage_quota, upload_size_hint
+
+from .conftest import auth, make_family, make_user, token_for
+
+pytestmark = pytest.mark.asyncio(loop_scope="session")
+
+PNG_BYTES = bytes.fromhex(
+    "89504e470d0a1a0a0000000d49484452000000010000000108060000001f15c4"
+    "890000000a49444154789c6360000002000100ffff03000006000557bfabd400"
+    "00000049454e44ae426082"
+)
+
+
+@pytest.fixture(autouse=True)
+def _isolated_storage(tmp_path, monkeypatch):
+    monkeypatch.setattr(storage_usage, "_pending", {})
+    monkeypatch.setattr(storage_mod, "get_upload_root", lambda: tmp_path)
+    monkeypatch.setattr("app.core.uploads.get_upload_root", lambda: tmp_path)
+
+
+class _Req:
+    def __init__(self, content_length: str | None) -> None:
+        self.headers = Headers({"content-length": content_length} if content_length else {})
+
+
+def test_size_hint_prefers_part_sizes_then_content_length():
+    a = UploadFile(io.BytesIO(b"x"), size=300)
+    b = UploadFile(io.BytesIO(b"x"), size=200)
+    assert upload_size_hint(_Req("9999"), [a, b]) == 500
+    unknown = UploadFile(io.BytesIO(b"x"))
+    assert upload_size_hint(_Req("9999"), [a, unknown]) == 9999
+    assert upload_size_hint(_Req("junk"), [unknown]) == 0
+    assert upload_size_hint(None, [unknown]) == 0
+
+
+async def test_unlimited_quota_skips_lookup(monkeypatch):
+    monkeypatch.setattr(storage_quota.settings, "family_storage_quota_bytes", 0)
+    monkeypatch.setattr(storage_quota.settings, "user_storage_quota_bytes", 0)
+    # Без квот в БД не ходим вовсе — db не нужен.
+    await check_storage_quota(None, family_id=None, user_id=None, incoming=10**12)
+
+
+async def _upload(client, family_id, user, name="pic.png", data=PNG_BYTES):
+    return await client.post(
+        f"/families/{family_id}/gallery",
+        files={"file": (name, data, "image/png")},
+        headers=auth(token_for(user)),
+    )
+
+
+async def test_usage_tracked_per_family_and_user(db, client):
+    owner = await make_user(db, "quota_owner")
+    family = await make_family(db, owner)
+    headers = auth(token_for(owner))
+
+    first = await _upload(client, family.id, owner)
+    assert first.status_code == 201, first.text
+    assert (await _upload(client, family.id, owner)).status_code == 201
+
+    fam = (await client.get(f"/families/{family.id}/storage", headers=headers)).json()
+    assert fam == {"used_bytes": 2 * len(PNG_BYTES), "objects": 2, "quota_bytes": None}
+    me = (await client.get("/me/storage", headers=headers)).json()
+    assert me["used_bytes"] == 2 * len(PNG_BYTES) and me["objects"] == 2
+
+    resp = await client.delete(
+        f"/families/{family.id}/gallery/{first.json()['id']}", headers=headers
+    )
+    assert resp.status_code == 204, resp.text
+    fam = (await client.get(f"/families/{family.id}/storage", headers=headers)).json()
+    assert fam["used_bytes"] == len(PNG_BYTES) and fam["objects"] == 1
+
+
+async def test_quota_rejects_before_storage_write(db, client, monkeypatch):
+    owner = await make_user(db, "quota_full")
+    family = await make_family(db, owner)
+    monkeypatch.setattr(storage_quota.settings, "family_storage_quota_bytes", len(PNG_BYTES) + 10)
+    assert (await _upload(client, family.id, owner)).status_code == 201
+
+    async def _must_not_write(*args, **kwargs):
+        raise AssertionError("storage.save called over quota")
+
+    monkeypatch.setattr(storage_quota.storage, "save", _must_not_write)
+    resp = await _upload(client, family.id, owner)
+    assert resp.status_code == 413, resp.text
+    assert "семьи" in resp.json()["detail"]
+
+    usage = (
+        await client.get(f"/families/{family.id}/storage", headers=auth(token_for(owner)))
+    ).json()
+    assert usage["quota_bytes"] == len(PNG_BYTES) + 10 and usage["objects"] == 1
+
+
+async def test_family_delete_releases_member_share(db, client):
+    owner = await make_user(db, "quota_leaver")
+    family = await make_family(db, owner)
+    other = await make_family(db, owner, name="Keep")
+    headers = auth(token_for(owner))
+    assert (await _upload(client, family.id, owner)).status_code == 201
+    assert (await _upload(client, other.id, owner)).status_code == 201
+
+    resp = await client.delete(f"/families/{family.id}", headers=headers)
+    assert resp.status_code == 204, resp.text
+    me = (await client.get("/me/storage", headers=headers)).json()
+    assert me == {"used_bytes": len(PNG_BYTES), "objects": 1, "quota_bytes": None}
+
+
+async def test_chat_delete_releases_attachments_and_queues_cleanup(db, client):
+    owner = await make_user(db, "quota_chat_owner")
+    family = await make_family(db, owner)
+    chat = Chat(family_id=family.id, name="temp", created_by=owner.id)
+    db.add(chat)
+    await db.flush()
+    headers = auth(token_for(owner))
+    msg = await client.post(
+        f"/families/{family.id}/chats/{chat.id}/messages/attachments",
+        files={"files": ("pic.png", PNG_BYTES, "image/png")},
+        headers=headers,
+    )
+    assert msg.status_code == 201, msg.text
+    assert (await _upload(client, family.id, owner)).status_code == 201
+
+    resp = await client.delete(f"/families/{family.id}/chats/{chat.id}", headers=headers)
+    assert resp.status_code == 204, resp.text
+    fam = (await client.get(f"/families/{family.id}/storage", headers=headers)).json()
+    assert fam["used_bytes"] == len(PNG_BYTES) and fam["objects"] == 1
+    left = await db.scalars(
+        select(StoredObject.key).where(StoredObject.key.startswith(f"chat_files/{chat.id}/"))
+    )
+    assert left.all() == []
+    payloads = await db.scalars(
+        select(BackgroundJob.payload).where(BackgroundJob.kind == STORAGE_CLEANUP)
+    )
+    assert {"prefixes": [f"chat_files/{chat.id}/"]} in payloads.all()
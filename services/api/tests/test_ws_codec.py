@@ -0,0 +1,83 @@
+"""Формат WS-кадров: выбор JSON/MessagePack и кодирование раз на формат."""
+
+from __future__ import annotations
+
+import json
+import uuid
+from types import SimpleNamespace
+
+import pytest
+
+from app.core.config import settings
+from app.ws import codec
+from app.ws.deflate import deflate_factory
+from app.ws.manager import ConnectionManager
+
+pytestmark = pytest.mark.asyncio(loop_scope="session")
+
+
+class _Socket:
+    def __init__(self) -> None:
+        self.text: list[str] = []
+        self.binary: list[bytes] = []
+
+    async def send_text(self, text: str) -> None:
+        self.text.append(text)
+
+    async def send_bytes(self, data: bytes) -> None:
+        self.binary.append(data)
+
+
+def _handshake(subprotocols=(), **query):
+    return SimpleNamespace(scope={"subprotocols": list(subprotocols)}, query_params=query)
+
+
+def test_negotiation_prefers_subprotocol_and_falls_back_to_json(monkeypatch):
+    pytest.importorskip("msgpack")
+    assert codec.negotiate(_handshake(["lentik.msgpack"])) == (codec.MSGPACK, "lentik.msgpack")
+    assert codec.negotiate(_handshake(format="msgpack")) == (codec.MSGPACK, None)
+    assert codec.negotiate(_handshake(["chat.v2"])) == (codec.JSON, None)
+
+    monkeypatch.setattr(settings, "ws_msgpack_enabled", False)
+    assert codec.negotiate(_handshake(["lentik.msgpack"])) == (codec.JSON, None)
+
+
+def test_without_msgpack_package_socket_stays_on_json(monkeypatch):
+    monkeypatch.setattr(codec, "_msgpack_packb", lambda: None)
+    assert codec.negotiate(_handshake(["lentik.msgpack"])) == (codec.JSON, None)
+
+
+def test_deflate_factory_uses_tuned_settings(monkeypatch):
+    monkeypatch.setattr(settings, "ws_deflate_window_bits", 11)
+    monkeypatch.setattr(settings, "ws_deflate_mem_level", 4)
+    factory = deflate_factory()
+    assert factory.server_max_window_bits == 11
+    assert factory.client_max_window_bits == 11
+    assert factory.compress_settings == {"memLevel": 4}
+
+
+async def test_broadcast_encodes_once_per_format(monkeypatch):
+    msgpack = pytest.importorskip("msgpack")
+    calls: list[str] = []
+    real_encode = codec.encode
+
+    def _counting(payload, fmt):
+        calls.append(fmt)
+        return real_encode(payload, fmt)
+
+    monkeypatch.setattr(codec, "encode", _counting)
+    manager = ConnectionManager()
+    chat_id = uuid.uuid4()
+    json_sockets = [_Socket() for _ in range(3)]
+    packed_sockets = [_Socket() for _ in range(2)]
+    for ws in json_sockets + packed_sockets:
+        manager._chat_connections[chat_id].add(ws)
+    for ws in packed_sockets:
+        codec._formats[ws] = codec.MSGPACK
+
+    payload = {"type": "new_message", "message": {"id": str(uuid.uuid4()), "text": "привет"}}
+    await manager.broadcast_to_chat(chat_id, payload)
+
+    assert sorted(calls) == [codec.JSON, codec.MSGPACK]
+    assert all(json.loads(ws.text[0]) == payload and not ws.binary for ws in json_sockets)
+    assert all(msgpack.unpackb(ws.binary[0]) == payload and not ws.text for ws in packed_sockets)
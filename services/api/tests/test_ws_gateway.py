@@ -0,0 +1,72 @@
+"""Мультиплекс-gateway: реестр подписок в ws_manager (юнит на фейковых сокетах)."""
+
+from __future__ import annotations
+
+import json
+import uuid
+
+import pytest
+
+from app.ws.manager import ConnectionManager
+
+pytestmark = pytest.mark.asyncio(loop_scope="session")
+
+
+class _WS:
+    def __init__(self) -> None:
+        self.sent: list[dict] = []
+        self.closed: int | None = None
+
+    async def send_text(self, text: str) -> None:
+        self.sent.append(json.loads(text))
+
+    async def close(self, code: int = 1000) -> None:
+        self.closed = code
+
+
+async def test_one_socket_receives_many_families_and_chats():
+    mgr = ConnectionManager()
+    ws, user = _WS(), uuid.uuid4()
+    fam_a, fam_b, chat_a = uuid.uuid4(), uuid.uuid4(), uuid.uuid4()
+    mgr.register_mux(ws)
+    mgr.mux_subscribe_family(ws, fam_a, user)
+    mgr.mux_subscribe_family(ws, fam_b, user)
+    mgr.mux_subscribe_chat(ws, fam_a, chat_a, user)
+
+    await mgr.broadcast_to_family(fam_b, {"type": "x", "n": 1})
+    await mgr.broadcast_to_chat(chat_a, {"type": "y", "n": 2})
+    assert [m["n"] for m in ws.sent] == [1, 2]
+
+    mgr.mux_unsubscribe_chat(ws, chat_a)
+    await mgr.broadcast_to_chat(chat_a, {"type": "y", "n": 3})
+    assert len(ws.sent) == 2
+
+
+async def test_kick_drops_only_that_family():
+    mgr = ConnectionManager()
+    ws, user = _WS(), uuid.uuid4()
+    fam_a, fam_b, chat_a = uuid.uuid4(), uuid.uuid4(), uuid.uuid4()
+    mgr.register_mux(ws)
+    mgr.mux_subscribe_chat(ws, fam_a, chat_a, user)
+    mgr.mux_subscribe_family(ws, fam_b, user)
+
+    await mgr.kick_user_from_family(fam_a, user)
+    assert ws.closed is None
+    assert ws.sent == [{"type": "family_removed", "family_id": str(fam_a)}]
+    assert fam_a not in mgr.mux_subscriptions(ws)
+
+    await mgr.broadcast_to_chat(chat_a, {"type": "leak"})
+    await mgr.broadcast_to_family(fam_b, {"type": "ok"})
+    assert ws.sent[-1] == {"type": "ok"}
+
+    mgr.unregister_mux(ws)
+    await mgr.broadcast_to_family(fam_b, {"type": "after"})
+    assert ws.sent[-1] == {"type": "ok"}
+
+
+async def test_legacy_socket_still_closed_on_kick():
+    mgr = ConnectionManager()
+    ws, user, fam = _WS(), uuid.uuid4(), uuid.uuid4()
+    await mgr.connect_family(fam, ws, user_id=user)
+    await mgr.kick_user_from_family(fam, user)
+    assert ws.closed == 4003
@@ -444,16 +444,15 @@ export default function AuditLogView({ familyId }: Props) {
 
   const load = useCallback(
     async (cursor?: string) => {
-      const before = cursor;
-      if (before) {
+      if (cursor) {
         setLoadingMore(true);
       } else {
         setLoading(true);
       }
       setError("");
       try {
-        const data = await getAuditLog(familyId, { limit: 50, before });
-        if (before) {
+        const data = await getAuditLog(familyId, { limit: 50, cursor });
+        if (cursor) {
           setItems((prev) => [...prev, ...data]);
         } else {
           setItems(data);
@@ -665,7 +664,7 @@ export default function AuditLogView({ familyId }: Props) {
                 className="ui-btn ui-btn-subtle inline-flex items-center gap-1.5"
                 disabled={loadingMore}
                 onClick={() =>
-                  void load(items[items.length - 1]?.created_at)
+                  void load(items[items.length - 1]?.cursor)
                 }
               >
                 {loadingMore ? (
@@ -1285,6 +1285,15 @@ export default function ChatView({
                   : m,
               ),
             );
+          } else if (d.type === "message_attachments_updated") {
+            // Готовы превью вложений: текст и пометка «изменено» не меняются.
+            setMessages((p) =>
+              p.map((m) =>
+                m.id === d.message_id
+                  ? normalizeMessage({ ...m, attachments: d.attachments })
+                  : m,
+              ),
+            );
           } else if (d.type === "message_deleted") {
             setMessages((p) => p.filter((m) => m.id !== d.message_id));
           } else if (d.type === "reaction_added") {
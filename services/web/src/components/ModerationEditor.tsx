@@ -38,6 +38,7 @@ export default function ModerationEditor({ familyId, canManage }: Props) {
   const [inviteMax, setInviteMax] = useState(0);
   const [slowmode, setSlowmode] = useState(0);
   const [maxLen, setMaxLen] = useState(0);
+  const [auditDays, setAuditDays] = useState(0);
   const [words, setWords] = useState<string[]>([]);
   const [wordDraft, setWordDraft] = useState("");
   const wordInputRef = useRef<HTMLInputElement>(null);
@@ -52,6 +53,7 @@ export default function ModerationEditor({ familyId, canManage }: Props) {
         setInviteMax(s.invite_max_active);
         setSlowmode(s.slowmode_default_seconds);
         setMaxLen(s.max_message_length);
+        setAuditDays(s.audit_retention_days ?? 0);
         setWords(s.banned_words ?? []);
       })
       .catch((e) => {
@@ -105,11 +107,13 @@ export default function ModerationEditor({ familyId, canManage }: Props) {
         slowmode_default_seconds: slowmode,
         banned_words: finalWords,
         max_message_length: Math.max(0, Math.floor(maxLen) || 0),
+        audit_retention_days: Math.max(0, Math.floor(auditDays) || 0),
       };
       const saved = await updateModeration(familyId, payload);
       setInviteMax(saved.invite_max_active);
       setSlowmode(saved.slowmode_default_seconds);
       setMaxLen(saved.max_message_length);
+      setAuditDays(saved.audit_retention_days ?? 0);
       setWords(saved.banned_words ?? []);
       setWordDraft("");
       void notify({ title: "Настройки модерации сохранены" });
@@ -253,6 +257,21 @@ export default function ModerationEditor({ familyId, canManage }: Props) {
         />
       </Field>
 
+      <Field
+        title="Срок хранения журнала аудита"
+        description="Через сколько дней записи журнала удаляются. 0 — срок по умолчанию для сервера; дольше него записи не хранятся."
+      >
+        <input
+          type="number"
+          min={0}
+          max={3650}
+          className="input-field max-w-[200px]"
+          value={auditDays}
+          onChange={(e) => setAuditDays(Number(e.target.value))}
+          disabled={disabled}
+        />
+      </Field>
+
       {canManage && (
         <div className="flex justify-end pt-2 border-t border-[color:var(--border-warm-dim)]">
           <button
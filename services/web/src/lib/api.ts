@@ -366,16 +366,26 @@ export type AuditLogEntry = {
   target_id: string | null;
   metadata: Record<string, unknown> | null;
   created_at: string;
+  /** Непрозрачный курсор: передать как `cursor`, чтобы получить записи старше. */
+  cursor: string;
 };
 
 export function getAuditLog(
   familyId: string,
-  opts?: { limit?: number; before?: string; action?: string },
+  opts?: {
+    limit?: number;
+    cursor?: string;
+    action?: string;
+    actionPrefix?: string;
+    actorId?: string;
+  },
 ) {
   const params = new URLSearchParams();
   if (opts?.limit) params.set("limit", String(opts.limit));
-  if (opts?.before) params.set("before", opts.before);
+  if (opts?.cursor) params.set("cursor", opts.cursor);
   if (opts?.action) params.set("action", opts.action);
+  if (opts?.actionPrefix) params.set("action_prefix", opts.actionPrefix);
+  if (opts?.actorId) params.set("actor_id", opts.actorId);
   const qs = params.toString();
   return request<AuditLogEntry[]>(
     `/families/${familyId}/audit-log${qs ? `?${qs}` : ""}`,
@@ -472,6 +482,7 @@ export type ModerationSettings = {
   slowmode_default_seconds: number;
   banned_words: string[];
   max_message_length: number;
+  audit_retention_days: number;
 };
 
 export function getModeration(familyId: string) {